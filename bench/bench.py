@@ -0,0 +1,442 @@
+"""
+Loopback benchmark for the TCP and UDP transfer paths.
+
+Starts a server (bench_server.py) and N concurrent clients (bench_client.py)
+as subprocesses on 127.0.0.1, sweeps the transfer parameters and writes
+one JSON document with MB/s, time-to-first-byte, p50/p99 per-file latency
+and peak RSS for every configuration, ready for regression comparison.
+
+Example:
+    python bench/bench.py --sizes 1K,1M,64M --pipes 1,4 --concurrency 1,4 \
+        --output bench_output.json
+
+With --netem the clients go through netem.py on --netem-host, one run per
+impairment spec, e.g. a throughput-under-loss curve:
+    python bench/bench.py --protocols udp --sizes 4M \
+        --netem "loss=0;loss=0.01;loss=0.05" --netem-seed 1
+
+--socket-profiles compares the sockopts.py profiles; server and clients
+of a run use the same profile, e.g. on a long fat path:
+    python bench/bench.py --protocols tcp --sizes 64M --netem "delay=50ms" \
+        --socket-profiles os,lan,wan-high-bdp,loopback
+
+--udp-modes compares the UDP download paths: threads (one socket per pipe,
+one file at a time), multiplex (streams over one socket) and offload
+(multiplex with GSO on the server and GRO on the client). UDP results
+carry the datagrams and send calls counted by the server, e.g.
+    python bench/bench.py --protocols udp --sizes 16M --buffer-sizes 1472 \
+        --udp-modes multiplex,offload
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import itertools
+import signal
+import subprocess
+import tempfile
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+# -----------------------------------HELPERS-----------------------------------#
+def parse_size(text):
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def parse_list(text, convert=int):
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def generate_resource(directory, size, content):
+    """
+    Create (or reuse) a resource of `size` bytes, written in 1 MB pieces so
+    multi-GB files never sit in memory.
+    """
+    name = f"bench_{size}.{'txt' if content == 'text' else 'bin'}"
+    path = os.path.join(directory, name)
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return name
+
+    piece = 1024 * 1024
+    line = b"2024-01-01 12:00:00 INFO transfer block ok bytes=1048576\n"
+    with open(path, "wb") as file:
+        remaining = size
+        while remaining > 0:
+            n = min(piece, remaining)
+            if content == "text":
+                file.write((line * (n // len(line) + 1))[:n])
+            else:
+                file.write(os.urandom(n))
+            remaining -= n
+    return name
+
+
+def fetch_stats(address, timeout=2):
+    try:
+        with urllib.request.urlopen(f"http://{address}/stats", timeout=timeout) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+def counter_total(stats, name):
+    if not stats:
+        return None
+    return sum(c["value"] for c in stats["counters"] if c["name"] == name)
+
+
+def peak_rss_kb(pid):
+    """
+    Peak RSS of a running process (Linux /proc), or None when unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def wait_for_server(protocol, host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if protocol == "tcp":
+                with socket.create_connection((host, port), timeout=0.5):
+                    return True
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.settimeout(0.5)
+                    sock.sendto(b"PING", (host, port))
+                    if sock.recvfrom(64)[0] == b"PONG":
+                        return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+# -----------------------------------RUNNER-----------------------------------#
+class BenchmarkRunner:
+    """
+    Runs one server per (protocol, buffer size) and the client sweep against it.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.host = args.host
+        self.next_port = args.base_port
+        self.workdir = tempfile.mkdtemp(prefix="socket_bench_")
+        self.proxy_runs = 0
+
+    def start_server(self, protocol, pipes, buffer_size, resources, socket_profile, udp_mode=None):
+        port = self.next_port
+        # TCP dùng thêm PORT + 1 làm data port, PORT + 2 cho metrics
+        self.next_port += 3
+        server_dir = tempfile.mkdtemp(prefix="server_", dir=self.workdir)
+        command = [
+            sys.executable,
+            os.path.join(BENCH_DIR, "bench_server.py"),
+            "--protocol", protocol,
+            "--host", self.host,
+            "--port", str(port),
+            "--resources", resources,
+            "--pipes", str(pipes),
+            "--buffer-size", str(buffer_size),
+            "--socket-profile", socket_profile,
+        ]
+        if protocol == "udp":
+            command += ["--metrics", f"{self.host}:{port + 2}"]
+            if udp_mode == "offload":
+                command.append("--offload")
+        process = subprocess.Popen(
+            command,
+            cwd=server_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        if not wait_for_server(protocol, self.host, port):
+            process.kill()
+            raise RuntimeError(f"{protocol} server did not start on port {port}")
+        return process, port
+
+    def start_proxy(self, protocol, port, spec):
+        """
+        Put netem.py in front of the server. TCP clients dial the advertised
+        data port on the proxy host, so both ports keep their numbers.
+        """
+        self.proxy_runs += 1
+        stats_path = os.path.join(self.workdir, f"netem_{self.proxy_runs}.json")
+        ports = [port, port + 1] if protocol == "tcp" else [port]
+        command = [sys.executable, os.path.join(BENCH_DIR, "netem.py"), "--spec", spec, "--stats", stats_path]
+        if self.args.netem_seed is not None:
+            command += ["--seed", str(self.args.netem_seed)]
+        for p in ports:
+            command += [f"--{protocol}", f"{self.args.netem_host}:{p}={self.host}:{p}"]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not wait_for_server(protocol, self.args.netem_host, port):
+            process.kill()
+            raise RuntimeError(f"netem proxy did not start on {self.args.netem_host}:{port}")
+        return process, stats_path
+
+    def stop_proxy(self, process, stats_path):
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        try:
+            with open(stats_path) as file:
+                return json.load(file)["links"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def run_clients(
+        self, protocol, host, port, files, pipes, block_size, buffer_size, timeout, concurrency, socket_profile,
+        udp_mode=None,
+    ):
+        processes = []
+        results = []
+        started = time.perf_counter()
+        for index in range(concurrency):
+            client_dir = tempfile.mkdtemp(prefix="client_", dir=self.workdir)
+            result_path = os.path.join(client_dir, "result.json")
+            command = [
+                sys.executable,
+                os.path.join(BENCH_DIR, "bench_client.py"),
+                "--protocol", protocol,
+                "--host", host,
+                "--port", str(port),
+                "--pipes", str(pipes),
+                "--block-size", str(block_size),
+                "--buffer-size", str(buffer_size),
+                "--timeout", str(timeout),
+                "--socket-profile", socket_profile,
+                "--result", result_path,
+            ] + (["--udp-mode", udp_mode] if udp_mode else []) + [f"{name}:{size}" for name, size in files]
+            processes.append(
+                (subprocess.Popen(command, cwd=client_dir), result_path)
+            )
+
+        for process, result_path in processes:
+            try:
+                process.wait(timeout=self.args.client_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            try:
+                with open(result_path) as file:
+                    results.append(json.load(file))
+            except (OSError, ValueError):
+                results.append({"transfers": [], "error": "client produced no result", "peak_rss_kb": None})
+        wall = time.perf_counter() - started
+        return results, wall
+
+    def summarize(self, config, results, wall, server_rss, stats_before=None, stats_after=None):
+        transfers = [t for result in results for t in result["transfers"]]
+        ok = [t for t in transfers if t["ok"]]
+        latencies = [t["latency"] for t in ok]
+        ttfbs = [t["ttfb"] for t in ok]
+        total_bytes = sum(t["bytes"] for t in ok)
+        client_rss = [r["peak_rss_kb"] for r in results if r.get("peak_rss_kb")]
+        return dict(
+            config,
+            files=len(transfers),
+            errors=len(transfers) - len(ok) + sum(1 for r in results if r.get("error")),
+            client_errors=[r["error"] for r in results if r.get("error")],
+            bytes=total_bytes,
+            wall_seconds=wall,
+            throughput_mbps=total_bytes / wall / 1e6 if wall else None,
+            ttfb_p50=percentile(ttfbs, 50),
+            ttfb_p99=percentile(ttfbs, 99),
+            latency_p50=percentile(latencies, 50),
+            latency_p99=percentile(latencies, 99),
+            client_peak_rss_kb=max(client_rss) if client_rss else None,
+            server_peak_rss_kb=server_rss,
+            **self.send_stats(stats_before, stats_after, wall),
+        )
+
+    def send_stats(self, before, after, wall):
+        """
+        Datagrams and send system calls of the UDP server during the run.
+        """
+        if not before or not after:
+            return {}
+        datagrams = counter_total(after, "datagrams_sent_total") - counter_total(before, "datagrams_sent_total")
+        calls = counter_total(after, "send_calls_total") - counter_total(before, "send_calls_total")
+        return dict(
+            datagrams_sent=datagrams,
+            send_calls=calls,
+            packets_per_s=datagrams / wall if wall else None,
+            datagrams_per_call=datagrams / calls if calls else None,
+        )
+
+    def run(self):
+        args = self.args
+        resources = os.path.abspath(args.data_dir or os.path.join(self.workdir, "resources"))
+        os.makedirs(resources, exist_ok=True)
+
+        sizes = parse_list(args.sizes, parse_size)
+        names = {size: generate_resource(resources, size, args.content) for size in sizes}
+
+        results = []
+        for protocol in parse_list(args.protocols, str):
+            if protocol == "tcp":
+                sweep_sizes = sizes
+                buffer_sizes = [512]
+                block_sizes = parse_list(args.block_sizes, parse_size)
+                timeouts = [None]
+                udp_modes = [None]
+            else:
+                sweep_sizes = [size for size in sizes if size <= parse_size(args.udp_max_size)]
+                buffer_sizes = parse_list(args.buffer_sizes, parse_size)
+                block_sizes = [0]
+                timeouts = parse_list(args.udp_timeouts, float)
+                udp_modes = parse_list(args.udp_modes, str)
+
+            pipes_list = parse_list(args.pipes)
+            # None = không qua proxy
+            netem_specs = args.netem.split(";") if args.netem is not None else [None]
+            for buffer_size, socket_profile, udp_mode in itertools.product(
+                buffer_sizes, parse_list(args.socket_profiles, str), udp_modes
+            ):
+                server, port = self.start_server(
+                    protocol, max(pipes_list), buffer_size, resources, socket_profile, udp_mode
+                )
+                metrics_address = f"{self.host}:{port + 2}" if protocol == "udp" else None
+                try:
+                    for spec, size, pipes, block_size, timeout, concurrency, repeat in itertools.product(
+                        netem_specs,
+                        sweep_sizes,
+                        pipes_list,
+                        block_sizes,
+                        timeouts,
+                        parse_list(args.concurrency),
+                        range(args.repeat),
+                    ):
+                        config = dict(
+                            protocol=protocol,
+                            size=size,
+                            pipes=pipes,
+                            block_size=block_size,
+                            buffer_size=buffer_size,
+                            timeout=timeout,
+                            concurrency=concurrency,
+                            repeat=repeat,
+                            netem=spec,
+                            socket_profile=socket_profile,
+                            udp_mode=udp_mode,
+                        )
+                        files = [(names[size], size)] * args.files_per_client
+                        host, proxy = self.host, None
+                        if spec is not None:
+                            host = args.netem_host
+                            proxy = self.start_proxy(protocol, port, spec)
+                        stats_before = fetch_stats(metrics_address) if metrics_address else None
+                        try:
+                            client_results, wall = self.run_clients(
+                                protocol, host, port, files, pipes, block_size, buffer_size,
+                                timeout or 2, concurrency, socket_profile, udp_mode,
+                            )
+                        finally:
+                            netem_stats = self.stop_proxy(*proxy) if proxy else None
+                        stats_after = fetch_stats(metrics_address) if metrics_address else None
+                        summary = self.summarize(
+                            config, client_results, wall, peak_rss_kb(server.pid), stats_before, stats_after
+                        )
+                        summary["netem_stats"] = netem_stats
+                        results.append(summary)
+                        print(
+                            f"[BENCH] {protocol} size={size} pipes={pipes} block={block_size} "
+                            f"buffer={buffer_size} conc={concurrency} netem={spec} sockets={socket_profile}"
+                            f"{f' mode={udp_mode}' if udp_mode else ''}: "
+                            f"{summary['throughput_mbps'] or 0:.2f} MB/s, "
+                            + (
+                                f"{summary['packets_per_s']:.0f} packets/s "
+                                f"({summary['datagrams_per_call']:.1f} per send call), "
+                                if summary.get("packets_per_s") and summary.get("datagrams_per_call")
+                                else ""
+                            )
+                            + f"errors={summary['errors']}",
+                            file=sys.stderr,
+                        )
+                finally:
+                    server.kill()
+                    server.wait()
+
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--protocols", default="tcp,udp")
+    parser.add_argument("--sizes", default="1K,64K,1M,16M", help="e.g. 1K,1M,2G")
+    parser.add_argument("--pipes", default="1,4", help="pipe counts to sweep")
+    parser.add_argument("--block-sizes", default="0", help="TCP block sizes, 0 = size/pipes")
+    parser.add_argument("--buffer-sizes", default="512", help="UDP datagram sizes")
+    parser.add_argument("--udp-timeouts", default="2", help="UDP client TIMEOUT values (s)")
+    parser.add_argument("--concurrency", default="1", help="concurrent clients")
+    parser.add_argument("--files-per-client", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--content", choices=("random", "text"), default="random")
+    parser.add_argument("--udp-max-size", default="16M", help="skip larger sizes for UDP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=17000)
+    parser.add_argument("--data-dir", default=None, help="reuse generated resources")
+    parser.add_argument("--netem", default=None, help="';'-separated netem.py specs to sweep")
+    parser.add_argument("--netem-host", default="127.0.0.2", help="loopback address of the proxy")
+    parser.add_argument("--netem-seed", default=None)
+    parser.add_argument("--socket-profiles", default="lan", help="sockopts.py profiles to sweep, e.g. os,lan,loopback")
+    parser.add_argument(
+        "--udp-modes", default="threads", help="UDP download paths to sweep: threads, multiplex, offload"
+    )
+    parser.add_argument("--client-timeout", type=float, default=600)
+    parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = BenchmarkRunner(args).run()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Download a list of files once and write per-file timings as JSON.
+
+Started as a subprocess by bench.py; the working directory is the
+download destination so each concurrent client has its own folder.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+sys.path.insert(0, os.path.abspath(CLIENT_DIR))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--protocol", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6969)
+    parser.add_argument("--pipes", type=int, default=4)
+    parser.add_argument("--block-size", type=int, default=0)
+    parser.add_argument("--buffer-size", type=int, default=512)
+    parser.add_argument("--timeout", type=float, default=2)
+    parser.add_argument("--socket-profile", default="lan", help="sockopts.py profile")
+    parser.add_argument(
+        "--udp-mode", choices=("threads", "multiplex", "offload"), default="threads", help="UDP download path"
+    )
+    parser.add_argument("--result", required=True, help="JSON output path")
+    parser.add_argument("--trace", default=None, help="Chrome trace output path")
+    parser.add_argument("--profile", default=None, help="cProfile output path")
+    parser.add_argument("files", nargs="+", help="name:size_bytes")
+    return parser.parse_args(argv)
+
+
+def transfer_record(stats, path, expected_size):
+    size = os.path.getsize(path) if os.path.exists(path) else -1
+    record = {
+        "file": stats["file"],
+        "bytes": expected_size,
+        "ok": size == expected_size,
+        "latency": stats["finished"] - stats["started"],
+        "ttfb": (stats["first_byte"] or stats["finished"]) - stats["started"],
+    }
+    # Xoá file đã tải để chạy lặp lại và không tốn đĩa với file lớn
+    if os.path.exists(path):
+        os.remove(path)
+    return record
+
+
+def run_tcp(args, files):
+    import clientCore
+    import session
+
+    client = clientCore.SocketClient()
+    client.HOST = args.host
+    client.PORT = args.port
+    client.PIPES = args.pipes
+    client.BLOCK_SIZE = args.block_size
+    client.SOCKET_PROFILE = args.socket_profile
+
+    client_session = session.ClientSession(client, args.host, args.port)
+    client_session.connect()
+    records = []
+    try:
+        for name, size in files:
+            needed = [{"name": name, "size": str(size), "size_bytes": size}]
+            client.receive_chunk(needed, 0, client_session)
+            path = os.path.join(os.getcwd(), "files_received", name)
+            records.append(transfer_record(client.last_transfer, path, size))
+    finally:
+        client_session.close()
+    return records
+
+
+def run_udp(args, files):
+    import clientUDP
+
+    client = clientUDP.SocketClientUDP(
+        HOST=args.host,
+        PORT=args.port,
+        DOWNLOAD_FOLDER="files_received_udp",
+        BUFFER_SIZE=args.buffer_size,
+        TIMEOUT=args.timeout,
+        PIPE=args.pipes,
+        SOCKET_PROFILE=args.socket_profile,
+        STORE_DIR=None,
+        OFFLOAD=args.udp_mode == "offload",
+    )
+    server_address = (args.host, args.port)
+    records = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client_socket:
+        client_socket.settimeout(args.timeout)
+        client.connect(client_socket, server_address)
+        if args.udp_mode == "threads":
+            for name, size in files:
+                client.download_file_parallel(client_socket, name, server_address)
+                path = os.path.join("files_received_udp", name)
+                records.append(transfer_record(client.last_transfer, path, size))
+            return records
+
+        # Các stream của 1 lần tải phải khác tên: file lặp lại đi ở lần tải sau
+        while files:
+            batch = dict(files)
+            for item in batch.items():
+                files.remove(item)
+            client.fetch_files(client_socket, list(batch), server_address)
+            for name, size in batch.items():
+                path = os.path.join("files_received_udp", name)
+                records.append(transfer_record(client.transfers[name], path, size))
+    return records
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = []
+    for item in args.files:
+        name, size = item.rsplit(":", 1)
+        files.append((name, int(size)))
+
+    # Client in log ra stdout/stderr rất nhiều: chuyển hết sang devnull
+    # Đo ở chế độ production: chỉ log WARNING trở lên
+    os.environ.setdefault("LOG_QUIET", "1")
+    devnull = open(os.devnull, "w")
+    sys.stdout = devnull
+    sys.stderr = devnull
+
+    import tracing
+
+    tracing.setup(args.trace)
+    run = run_tcp if args.protocol == "tcp" else run_udp
+
+    error = None
+    try:
+        if args.profile:
+            records = tracing.profile(run, args.profile, args, files)
+        else:
+            records = run(args, files)
+    except Exception as e:
+        records, error = [], repr(e)
+
+    with open(args.result, "w") as file:
+        json.dump(
+            {
+                "transfers": records,
+                "error": error,
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                if resource
+                else None,
+            },
+            file,
+        )
+
+
+if __name__ == "__main__":
+    main()
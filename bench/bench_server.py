@@ -0,0 +1,64 @@
+"""
+Start one server for the benchmark harness (see bench.py).
+
+Runs in its own process because server/ and client/ both ship a
+top-level `utils` module and cannot be imported side by side.
+"""
+
+import os
+import sys
+import argparse
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+sys.path.insert(0, os.path.abspath(SERVER_DIR))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--protocol", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6969)
+    parser.add_argument("--data-port", type=int, default=None)
+    parser.add_argument("--resources", required=True)
+    parser.add_argument("--pipes", type=int, default=4)
+    parser.add_argument("--buffer-size", type=int, default=512)
+    parser.add_argument("--metrics", default=None, help='metrics endpoint "host:port"')
+    parser.add_argument("--socket-profile", default="lan", help="sockopts.py profile")
+    parser.add_argument("--offload", action="store_true", help="UDP: send with GSO")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    resources = os.path.abspath(args.resources)
+    # Đo ở chế độ production: chỉ log WARNING trở lên
+    os.environ.setdefault("LOG_QUIET", "1")
+
+    if args.protocol == "tcp":
+        import serverCore
+
+        serverCore.SocketServer.HOST = args.host
+        serverCore.SocketServer.PORT = args.port
+        serverCore.SocketServer.DATA_PORT = args.data_port or args.port + 1
+        serverCore.SocketServer.PIPES = args.pipes
+        serverCore.SocketServer.RESOURCE_PATH = resources
+        serverCore.SocketServer.METRICS_ADDRESS = args.metrics
+        serverCore.SocketServer.SOCKET_PROFILE = args.socket_profile
+        serverCore.SocketServer().create_server()
+    else:
+        import serverUDP
+
+        server = serverUDP.SocketServerUDP(
+            HOST=args.host,
+            PORT=args.port,
+            RESOURCE_PATH=resources,
+            BUFFER_SIZE=args.buffer_size,
+            METRICS_ADDRESS=args.metrics,
+            SOCKET_PROFILE=args.socket_profile,
+            OFFLOAD=args.offload,
+        )
+        server.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Load generator: many simulated clients against one server, ramped in steps.
+
+Every simulated client is a coroutine speaking the real protocols through
+client/aioclient.py (LIST/OPEN/GET on TCP, CONNECT/SIZE/GET on UDP) and
+throws the received data away, so one process can hold thousands of them.
+A client connects, downloads a file picked from the mix, waits an
+exponential think time and repeats until the step ends.
+
+Per step the report has client-side throughput, request and error rates,
+p50/p95/p99 download latency, the server counters scraped from its
+/stats endpoint (bytes sent, requests) and, for a spawned server, its
+threads, open fds and RSS. The saturation point is the first step where
+more clients stop buying throughput, errors pass --max-error-rate or p99
+exceeds --max-p99.
+
+Example, against a server started here with generated files:
+    python bench/loadgen.py --spawn --protocol tcp --files 64K:8,1M:2 \
+        --concurrency 10,50,200,1000 --arrival-rate 200 --step-duration 20
+
+Against a running server with metrics on :9100:
+    python bench/loadgen.py --host 10.0.0.5 --port 6969 --metrics 10.0.0.5:9100 \
+        --files log.txt,rand.zip --concurrency 100,500,2000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+import collections
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import bench
+
+CLIENT_DIR = os.path.join(bench.BENCH_DIR, "..", "client")
+sys.path.insert(0, os.path.abspath(CLIENT_DIR))
+
+
+class NullPart:
+    """
+    aioclient part file that keeps nothing: the load generator measures
+    the server, not the client's disk.
+    """
+
+    def __init__(self, dest, name, size):
+        self.path = name
+
+    def write(self, offset, data):
+        pass
+
+    def commit(self):
+        return self.path
+
+    def discard(self):
+        pass
+
+
+Sample = collections.namedtuple("Sample", "finished latency bytes error")
+
+
+# -----------------------------------HELPERS-----------------------------------#
+def parse_mix(text):
+    """
+    "name[:weight],..." -> [(name, weight)]; with --spawn a name may be a
+    size such as 64K, which becomes a generated file.
+    """
+    mix = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.strip().partition(":")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def process_usage(pid):
+    """
+    Threads, open fds and RSS of a local process (Linux /proc).
+    """
+    usage = {"threads": None, "fds": None, "rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("Threads:"):
+                    usage["threads"] = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    usage["rss_kb"] = int(line.split()[1])
+        usage["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        pass
+    return usage
+
+
+def raise_fd_limit():
+    # Mỗi client TCP dùng 1 + PIPES fd: nâng soft limit lên bằng hard limit
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ValueError, OSError):
+        return soft
+
+
+# -----------------------------------RUNNER-----------------------------------#
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.samples = []
+        self.clients = []  # (task, stop event)
+        self.server = None
+        self.metrics_address = args.metrics
+
+        import aioclient
+
+        self.tcp_client = type("LoadTCPClient", (aioclient.AsyncTCPClient,), {"part_file": NullPart})
+        self.udp_client = type("LoadUDPClient", (aioclient.AsyncUDPClient,), {"part_file": NullPart})
+        self.mix = []  # [(name, size, weight)]
+
+    # ==============================================================================================
+    def spawn_server(self):
+        args = self.args
+        workdir = tempfile.mkdtemp(prefix="socket_load_")
+        resources = os.path.abspath(args.data_dir or os.path.join(workdir, "resources"))
+        os.makedirs(resources, exist_ok=True)
+        mix = []
+        for name, weight in parse_mix(args.files):
+            size = bench.parse_size(name)
+            mix.append((bench.generate_resource(resources, size, args.content), weight))
+        self.metrics_address = self.metrics_address or f"{args.host}:{args.port + 2}"
+        command = [
+            sys.executable,
+            os.path.join(bench.BENCH_DIR, "bench_server.py"),
+            "--protocol", args.protocol,
+            "--host", args.host,
+            "--port", str(args.port),
+            "--resources", resources,
+            "--pipes", str(args.pipes),
+            "--buffer-size", str(args.buffer_size),
+            "--metrics", self.metrics_address,
+        ]
+        self.server = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not bench.wait_for_server(args.protocol, args.host, args.port):
+            self.server.kill()
+            raise RuntimeError(f"{args.protocol} server did not start on port {args.port}")
+        return mix
+
+    def make_client(self):
+        args = self.args
+        if args.protocol == "tcp":
+            return self.tcp_client(
+                args.host, args.port, pipes=args.pipes, block_size=args.block_size, timeout=args.timeout
+            )
+        return self.udp_client(args.host, args.port, buffer_size=args.buffer_size, timeout=args.timeout)
+
+    async def resolve_sizes(self, mix):
+        """
+        Look the sizes up once so simulated clients skip the per-file LIST/SIZE.
+        """
+        client = self.make_client()
+        async with client:
+            sizes = await client.resource_sizes([name for name, _ in mix])
+        missing = [name for name, _ in mix if name not in sizes]
+        if missing:
+            raise RuntimeError(f"Not on the server: {', '.join(missing)}")
+        return [(name, sizes[name], weight) for name, weight in mix]
+
+    # ==============================================================================================
+    async def simulated_client(self, stop):
+        names = [(name, size) for name, size, _ in self.mix]
+        weights = [weight for _, _, weight in self.mix]
+        while not stop.is_set():
+            client = self.make_client()
+            try:
+                await client.connect()
+            except Exception as e:
+                self.samples.append(Sample(time.monotonic(), None, 0, f"connect:{type(e).__name__}"))
+                await asyncio.sleep(random.expovariate(1 / max(self.args.think_time, 0.1)))
+                continue
+            try:
+                while not stop.is_set():
+                    name, size = random.choices(names, weights)[0]
+                    started = time.monotonic()
+                    try:
+                        await client.download(name, None, size=size)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.samples.append(Sample(time.monotonic(), None, 0, type(e).__name__))
+                        # Phiên hỏng: kết nối lại như client thật
+                        break
+                    finished = time.monotonic()
+                    self.samples.append(Sample(finished, finished - started, size, None))
+                    if self.args.think_time:
+                        await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+            finally:
+                await client.close()
+
+    async def ramp_to(self, concurrency):
+        # Thêm client với tốc độ --arrival-rate client/s
+        interval = 1 / self.args.arrival_rate if self.args.arrival_rate else 0
+        while len(self.clients) < concurrency:
+            stop = asyncio.Event()
+            self.clients.append((asyncio.create_task(self.simulated_client(stop)), stop))
+            if interval:
+                await asyncio.sleep(interval)
+
+    async def stop_clients(self):
+        for task, stop in self.clients:
+            stop.set()
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in self.clients), return_exceptions=True)
+        self.clients = []
+
+    async def measure(self, concurrency):
+        await self.ramp_to(concurrency)
+        stats_before = (
+            await asyncio.to_thread(bench.fetch_stats, self.metrics_address) if self.metrics_address else None
+        )
+        usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        started = time.monotonic()
+        await asyncio.sleep(self.args.step_duration)
+        ended = time.monotonic()
+        stats_after = (
+            await asyncio.to_thread(bench.fetch_stats, self.metrics_address) if self.metrics_address else None
+        )
+        usage_after = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        return self.summarize(concurrency, started, ended, stats_before, stats_after, usage_before, usage_after)
+
+    def summarize(self, concurrency, started, ended, stats_before, stats_after, usage_before, usage_after):
+        window = [s for s in self.samples if started <= s.finished < ended]
+        ok = [s for s in window if s.error is None]
+        errors = collections.Counter(s.error for s in window if s.error is not None)
+        latencies = [s.latency for s in ok]
+        duration = ended - started
+        summary = {
+            "concurrency": concurrency,
+            "clients_running": sum(1 for task, _ in self.clients if not task.done()),
+            "seconds": duration,
+            "downloads": len(ok),
+            "errors": sum(errors.values()),
+            "error_types": dict(errors),
+            "error_rate": sum(errors.values()) / len(window) if window else 0.0,
+            "requests_per_second": len(ok) / duration,
+            "throughput_mbps": sum(s.bytes for s in ok) / duration / 1e6,
+            "latency_p50": bench.percentile(latencies, 50),
+            "latency_p95": bench.percentile(latencies, 95),
+            "latency_p99": bench.percentile(latencies, 99),
+            # CPU của chính load generator: gần 100% nghĩa là nó mới là nút cổ chai
+            "loadgen_cpu": (
+                (usage_after.ru_utime + usage_after.ru_stime - usage_before.ru_utime - usage_before.ru_stime)
+                / duration
+                if usage_before
+                else None
+            ),
+        }
+        server = {}
+        if stats_before and stats_after:
+            for name in ("bytes_sent_total", "requests_total", "retransmits_total"):
+                before, after = bench.counter_total(stats_before, name), bench.counter_total(stats_after, name)
+                server[name.replace("_total", "_per_second")] = (after - before) / duration
+            # Chỉ giữ gauge dạng số (bỏ bảng băng thông theo từng phiên)
+            gauges = stats_after.get("gauges") or {}
+            server.update({name: value for name, value in gauges.items() if isinstance(value, (int, float))})
+        if self.server is not None:
+            server.update(process_usage(self.server.pid))
+        summary["server"] = server or None
+        # Bỏ mẫu cũ để bộ nhớ không tăng theo số bước
+        self.samples = [s for s in self.samples if s.finished >= ended]
+        return summary
+
+    # ==============================================================================================
+    def find_saturation(self, steps):
+        """
+        First step that is past the knee of the curve, with the reason.
+        """
+        args = self.args
+        best = None
+        for step in steps:
+            if step["error_rate"] > args.max_error_rate:
+                return step["concurrency"], f"error rate {step['error_rate']:.1%}"
+            if args.max_p99 and step["latency_p99"] and step["latency_p99"] > args.max_p99:
+                return step["concurrency"], f"p99 latency {step['latency_p99']:.3f}s"
+            if best is not None and step["concurrency"] > best["concurrency"]:
+                gain = step["throughput_mbps"] / best["throughput_mbps"] - 1 if best["throughput_mbps"] else 0
+                if gain < args.min_gain:
+                    return step["concurrency"], (
+                        f"throughput +{gain:.1%} for {step['concurrency'] / best['concurrency']:.1f}x clients"
+                    )
+            if best is None or step["throughput_mbps"] > best["throughput_mbps"]:
+                best = step
+        return None, "not reached"
+
+    async def run_steps(self, names):
+        self.mix = await self.resolve_sizes(names)
+        steps = []
+        try:
+            for concurrency in bench.parse_list(self.args.concurrency):
+                step = await self.measure(concurrency)
+                steps.append(step)
+                print(
+                    f"[LOAD] {self.args.protocol} conc={concurrency}: "
+                    f"{step['throughput_mbps']:.2f} MB/s, {step['requests_per_second']:.1f} req/s, "
+                    f"p99={step['latency_p99'] or 0:.3f}s, errors={step['errors']}",
+                    file=sys.stderr,
+                )
+                if self.args.stop_at_saturation and self.find_saturation(steps)[0] is not None:
+                    break
+        finally:
+            await self.stop_clients()
+        return steps
+
+    def run(self):
+        args = self.args
+        fd_limit = raise_fd_limit()
+        names = self.spawn_server() if args.spawn else parse_mix(args.files)
+        try:
+            steps = asyncio.run(self.run_steps(names))
+        finally:
+            if self.server is not None:
+                self.server.kill()
+                self.server.wait()
+        saturation, reason = self.find_saturation(steps)
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "fd_limit": fd_limit,
+                "args": vars(args),
+            },
+            "mix": [{"name": n, "size": s, "weight": w} for n, s, w in self.mix],
+            "steps": steps,
+            "saturation": {"concurrency": saturation, "reason": reason},
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--protocol", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=17500)
+    parser.add_argument("--metrics", default=None, help='server metrics "host:port" (/stats is scraped)')
+    parser.add_argument("--spawn", action="store_true", help="start a local server (bench_server.py)")
+    parser.add_argument("--files", default="64K", help="file mix, name[:weight],... (sizes with --spawn)")
+    parser.add_argument("--content", choices=("random", "text"), default="random")
+    parser.add_argument("--data-dir", default=None, help="reuse generated resources")
+    parser.add_argument("--concurrency", default="1,10,50,100", help="simulated clients per step")
+    parser.add_argument("--arrival-rate", type=float, default=100, help="new clients per second (0 = at once)")
+    parser.add_argument("--step-duration", type=float, default=10, help="measured seconds per step")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between downloads (s)")
+    parser.add_argument("--pipes", type=int, default=1, help="TCP pipes per simulated client")
+    parser.add_argument("--block-size", type=int, default=1024 * 1024)
+    parser.add_argument("--buffer-size", type=int, default=512, help="UDP datagram size")
+    parser.add_argument("--timeout", type=float, default=10, help="per block / packet timeout (s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-p99", type=float, default=None, help="p99 latency limit (s)")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="throughput gain expected from a larger step")
+    parser.add_argument("--stop-at-saturation", action="store_true")
+    parser.add_argument("--output", default=None, help="JSON report (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Client in log cho mỗi file: chỉ giữ WARNING trở lên
+    os.environ.setdefault("LOG_QUIET", "1")
+    report = LoadGenerator(args).run()
+    print(
+        f"[LOAD] saturation: {report['saturation']['concurrency']} ({report['saturation']['reason']})",
+        file=sys.stderr,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Userspace network emulator: a UDP/TCP proxy that injects loss, duplication,
+reordering, delay/jitter and a bandwidth cap. Needs no root.
+
+UDP datagrams are impaired one by one. TCP is a byte stream, so only delay,
+jitter (without reordering bytes) and the bandwidth cap apply to it.
+
+The TCP client connects to the data port number the server advertises, on
+the same host as the control port. Proxy both ports on another loopback
+address with the same numbers:
+
+    python bench/netem.py --tcp 127.0.0.2:6969=127.0.0.1:6969 \
+        --tcp 127.0.0.2:6970=127.0.0.1:6970 --spec "delay=20ms,rate=10M"
+
+    python bench/netem.py --udp 127.0.0.1:12346=127.0.0.1:12345 \
+        --spec "loss=0.05,dup=0.01,reorder=0.02,delay=10ms,jitter=5ms" --seed 1
+
+Every random decision comes from one seeded generator per link direction,
+so a run with the same spec and seed drops the same packets.
+"""
+
+import sys
+import json
+import time
+import heapq
+import random
+import select
+import signal
+import socket
+import argparse
+import threading
+from collections import deque
+
+UNITS = {"K": 1000, "M": 1000**2, "G": 1000**3}
+
+
+# -----------------------------------SPEC-----------------------------------#
+def parse_duration(text):
+    text = text.strip().lower()
+    if text.endswith("ms"):
+        return float(text[:-2]) / 1000
+    if text.endswith("s"):
+        return float(text[:-1])
+    return float(text) / 1000  # mặc định là ms
+
+
+def parse_rate(text):
+    """
+    Bandwidth in bytes/s: "10M" = 10 MB/s, "500K" = 500 KB/s.
+    """
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+class Impairment:
+    """
+    What happens to traffic in one direction.
+
+    - loss / duplicate / reorder: probabilities in [0, 1].
+    - delay / jitter: seconds; each packet waits delay +- jitter.
+    - reorder_gap: extra delay of a reordered packet so later ones overtake it.
+    - rate: bandwidth cap in bytes/s (0 = unlimited).
+    - queue: bytes allowed to wait for the bandwidth cap before tail drop.
+    """
+
+    KEYS = {
+        "loss": float,
+        "dup": float,
+        "reorder": float,
+        "delay": parse_duration,
+        "jitter": parse_duration,
+        "gap": parse_duration,
+        "rate": parse_rate,
+        "queue": int,
+    }
+
+    def __init__(self, loss=0.0, dup=0.0, reorder=0.0, delay=0.0, jitter=0.0, gap=0.01, rate=0.0, queue=1 << 20):
+        self.loss = loss
+        self.duplicate = dup
+        self.reorder = reorder
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder_gap = gap
+        self.rate = rate
+        self.queue = queue
+
+    @classmethod
+    def parse(cls, text):
+        """
+        "loss=0.05,dup=0.01,reorder=0.02,delay=20ms,jitter=5ms,gap=10ms,rate=10M,queue=1048576"
+        """
+        options = {}
+        for item in (text or "").split(","):
+            if not item.strip():
+                continue
+            key, value = item.split("=", 1)
+            key = key.strip()
+            if key not in cls.KEYS:
+                raise ValueError(f"Unknown impairment '{key}', expected one of {sorted(cls.KEYS)}")
+            options[key] = cls.KEYS[key](value)
+        return cls(**options)
+
+    def describe(self):
+        return {
+            "loss": self.loss,
+            "dup": self.duplicate,
+            "reorder": self.reorder,
+            "delay": self.delay,
+            "jitter": self.jitter,
+            "gap": self.reorder_gap,
+            "rate": self.rate,
+            "queue": self.queue,
+        }
+
+
+class Link:
+    """
+    One direction of one proxied flow: decides the fate of each packet and
+    when it leaves.
+    """
+
+    def __init__(self, impairment, seed=None, name=""):
+        self.impairment = impairment
+        self.random = random.Random(seed)
+        self.name = name
+        self.next_free = 0.0  # thời điểm đường truyền rảnh (bandwidth cap)
+        self.last_departure = 0.0
+        self.stats = {"packets": 0, "bytes": 0, "dropped": 0, "duplicated": 0, "reordered": 0, "queue_drops": 0}
+
+    def jittered_delay(self):
+        imp = self.impairment
+        if not imp.jitter:
+            return imp.delay
+        return max(0.0, imp.delay + self.random.uniform(-imp.jitter, imp.jitter))
+
+    def transmit_time(self, nbytes, now):
+        """
+        Time the packet finishes serialising on the capped link, or None
+        when the queue in front of the cap is full.
+        """
+        imp = self.impairment
+        if not imp.rate:
+            return now
+        backlog = max(0.0, self.next_free - now) * imp.rate
+        if backlog + nbytes > imp.queue:
+            return None
+        self.next_free = max(now, self.next_free) + nbytes / imp.rate
+        return self.next_free
+
+    def schedule_datagram(self, nbytes, now):
+        """
+        Departure times for one datagram: [] if lost, two entries if duplicated.
+        """
+        imp = self.impairment
+        self.stats["packets"] += 1
+        if imp.loss and self.random.random() < imp.loss:
+            self.stats["dropped"] += 1
+            return []
+        sent = self.transmit_time(nbytes, now)
+        if sent is None:
+            self.stats["queue_drops"] += 1
+            return []
+        self.stats["bytes"] += nbytes
+
+        departure = sent + self.jittered_delay()
+        if imp.reorder and self.random.random() < imp.reorder:
+            self.stats["reordered"] += 1
+            departure += imp.reorder_gap
+        departures = [departure]
+        if imp.duplicate and self.random.random() < imp.duplicate:
+            self.stats["duplicated"] += 1
+            departures.append(departure + self.jittered_delay() * 0.1)
+        return departures
+
+    def schedule_stream(self, nbytes, now):
+        """
+        Departure time for a piece of a byte stream: never earlier than the
+        previous piece, so TCP data keeps its order.
+        """
+        self.stats["packets"] += 1
+        self.stats["bytes"] += nbytes
+        imp = self.impairment
+        sent = now
+        if imp.rate:
+            self.next_free = max(now, self.next_free) + nbytes / imp.rate
+            sent = self.next_free
+        departure = max(self.last_departure, sent + self.jittered_delay())
+        self.last_departure = departure
+        return departure
+
+
+# -----------------------------------UDP-----------------------------------#
+class UDPProxy:
+    """
+    Forwards datagrams between clients and one upstream server.
+    Every client address gets its own upstream socket, so replies can be
+    routed back to it.
+    """
+
+    def __init__(self, listen, upstream, forward, backward, seed=None):
+        self.listen = listen
+        self.upstream = upstream
+        self.forward_spec = forward
+        self.backward_spec = backward
+        self.seed = seed
+
+        self.flows = {}  # client addr -> (upstream socket, forward link, backward link)
+        self.by_socket = {}  # upstream socket -> client addr
+        self.heap = []
+        self.sequence = 0
+        self.stop_event = threading.Event()
+
+    def link_seed(self, direction):
+        if self.seed is None:
+            return None
+        return f"{self.seed}:{self.listen}:{len(self.flows)}:{direction}"
+
+    def flow(self, client_addr):
+        flow = self.flows.get(client_addr)
+        if flow is None:
+            upstream_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            upstream_socket.setblocking(False)
+            upstream_socket.connect(self.upstream)
+            flow = (
+                upstream_socket,
+                Link(self.forward_spec, self.link_seed("fwd"), f"udp {client_addr}->{self.upstream}"),
+                Link(self.backward_spec, self.link_seed("bwd"), f"udp {self.upstream}->{client_addr}"),
+            )
+            self.flows[client_addr] = flow
+            self.by_socket[upstream_socket] = client_addr
+        return flow
+
+    def enqueue(self, departures, send, data):
+        for departure in departures:
+            self.sequence += 1
+            heapq.heappush(self.heap, (departure, self.sequence, send, data))
+
+    def flush(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            _, _, send, data = heapq.heappop(self.heap)
+            try:
+                send(data)
+            except OSError:
+                pass
+
+    def serve(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listen_socket:
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listen_socket.bind(self.listen)
+            listen_socket.setblocking(False)
+            print(f"[STATUS] UDP proxy {self.listen} -> {self.upstream}", file=sys.stderr)
+
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                timeout = 0.2
+                if self.heap:
+                    timeout = max(0.0, min(timeout, self.heap[0][0] - now))
+                readable, _, _ = select.select([listen_socket] + list(self.by_socket), [], [], timeout)
+
+                now = time.monotonic()
+                for sock in readable:
+                    while True:
+                        try:
+                            data, addr = sock.recvfrom(65535)
+                        except (BlockingIOError, ConnectionRefusedError):
+                            break
+                        if sock is listen_socket:
+                            upstream_socket, forward, _ = self.flow(addr)
+                            self.enqueue(forward.schedule_datagram(len(data), now), upstream_socket.send, data)
+                        else:
+                            client_addr = self.by_socket[sock]
+                            _, _, backward = self.flows[client_addr]
+                            self.enqueue(
+                                backward.schedule_datagram(len(data), now),
+                                lambda payload, addr=client_addr: listen_socket.sendto(payload, addr),
+                                data,
+                            )
+                self.flush(time.monotonic())
+
+            for upstream_socket in self.by_socket:
+                upstream_socket.close()
+
+    def links(self):
+        return [link for _, forward, backward in self.flows.values() for link in (forward, backward)]
+
+
+# -----------------------------------TCP-----------------------------------#
+class TCPProxy:
+    """
+    Accepts connections and relays each one to the upstream server through
+    a delayed, rate-capped pipe per direction.
+    """
+
+    READ_SIZE = 16 * 1024
+
+    def __init__(self, listen, upstream, forward, backward, seed=None):
+        self.listen = listen
+        self.upstream = upstream
+        self.forward_spec = forward
+        self.backward_spec = backward
+        self.seed = seed
+        self.connections = 0
+        self.all_links = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def link_seed(self, index, direction):
+        if self.seed is None:
+            return None
+        return f"{self.seed}:{self.listen}:{index}:{direction}"
+
+    def serve(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listen_socket:
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listen_socket.bind(self.listen)
+            listen_socket.listen(64)
+            listen_socket.settimeout(0.2)
+            print(f"[STATUS] TCP proxy {self.listen} -> {self.upstream}", file=sys.stderr)
+
+            while not self.stop_event.is_set():
+                try:
+                    client_socket, addr = listen_socket.accept()
+                except socket.timeout:
+                    continue
+                try:
+                    upstream_socket = socket.create_connection(self.upstream, timeout=10)
+                except OSError:
+                    client_socket.close()
+                    continue
+                upstream_socket.settimeout(None)
+                client_socket.settimeout(None)
+                for sock in (client_socket, upstream_socket):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+                with self.lock:
+                    index = self.connections
+                    self.connections += 1
+                    forward = Link(self.forward_spec, self.link_seed(index, "fwd"), f"tcp {addr}->{self.upstream}")
+                    backward = Link(self.backward_spec, self.link_seed(index, "bwd"), f"tcp {self.upstream}->{addr}")
+                    self.all_links += [forward, backward]
+                self.relay(client_socket, upstream_socket, forward)
+                self.relay(upstream_socket, client_socket, backward)
+
+    def relay(self, source, destination, link):
+        """
+        Reader thread stamps each piece with its departure time; writer
+        thread sends it when due. EOF is forwarded as a half-close.
+        """
+        pending = deque()
+        condition = threading.Condition()
+
+        def reader():
+            while True:
+                try:
+                    data = source.recv(self.READ_SIZE)
+                except OSError:
+                    data = b""
+                with condition:
+                    departure = link.schedule_stream(len(data), time.monotonic()) if data else None
+                    pending.append((departure, data))
+                    condition.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with condition:
+                    while not pending:
+                        condition.wait()
+                    departure, data = pending.popleft()
+                if not data:
+                    try:
+                        destination.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                delay = departure - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    destination.sendall(data)
+                except OSError:
+                    try:
+                        source.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+    def links(self):
+        with self.lock:
+            return list(self.all_links)
+
+
+# -----------------------------------MAIN-----------------------------------#
+def parse_address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def parse_mapping(text):
+    """
+    "listen_host:port=upstream_host:port"
+    """
+    listen, upstream = text.split("=", 1)
+    return parse_address(listen), parse_address(upstream)
+
+
+def summarize(proxies):
+    totals = {}
+    for proxy in proxies:
+        for link in proxy.links():
+            for key, value in link.stats.items():
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--udp", action="append", default=[], metavar="LISTEN=UPSTREAM")
+    parser.add_argument("--tcp", action="append", default=[], metavar="LISTEN=UPSTREAM")
+    parser.add_argument("--spec", default="", help="impairment for both directions")
+    parser.add_argument("--forward", default=None, help="client -> server impairment (overrides --spec)")
+    parser.add_argument("--backward", default=None, help="server -> client impairment (overrides --spec)")
+    parser.add_argument("--seed", default=None, help="seed for reproducible runs")
+    parser.add_argument("--stats", default=None, help="write link counters as JSON on exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.udp and not args.tcp:
+        raise SystemExit("Nothing to proxy: give at least one --udp or --tcp mapping")
+
+    forward = Impairment.parse(args.forward if args.forward is not None else args.spec)
+    backward = Impairment.parse(args.backward if args.backward is not None else args.spec)
+
+    proxies = [UDPProxy(*parse_mapping(m), forward, backward, args.seed) for m in args.udp]
+    proxies += [TCPProxy(*parse_mapping(m), forward, backward, args.seed) for m in args.tcp]
+
+    stop_event = threading.Event()
+    for proxy in proxies:
+        proxy.stop_event = stop_event
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    threads = [threading.Thread(target=proxy.serve, daemon=True) for proxy in proxies]
+    for thread in threads:
+        thread.start()
+    try:
+        while not stop_event.wait(0.5):
+            if not any(thread.is_alive() for thread in threads):
+                break
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    report = {
+        "forward": forward.describe(),
+        "backward": backward.describe(),
+        "seed": args.seed,
+        "links": summarize(proxies),
+    }
+    if args.stats:
+        with open(args.stats, "w") as file:
+            json.dump(report, file, indent=2)
+    print(f"[STATUS] netem stopped: {json.dumps(report['links'])}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
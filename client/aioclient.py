@@ -0,0 +1,688 @@
+"""
+Asyncio client API for embedding the downloader in other programs.
+
+    async with AsyncTCPClient("127.0.0.1") as client:
+        await client.download_many(["a.zip", "b.txt"], "downloads")
+
+        async for progress in client.iter_download(names, "downloads"):
+            print(progress.name, progress.fraction)
+
+Nothing here reads stdin or prints: progress goes to callbacks or the
+async iterator, errors are raised, and every await can be cancelled.
+The wire protocols are the same as clientCore.py (TCP) and clientUDP.py (UDP).
+"""
+
+import os
+import abc
+import ast
+import math
+import time
+import zlib
+import socket
+import asyncio
+import threading
+import collections
+
+import compression
+import log
+import session
+import sockopts
+
+logger = log.get_logger(__name__)
+
+MESSAGE_SIZE = 1024
+
+
+class Progress(collections.namedtuple("Progress", "name done total finished error")):
+    """
+    One progress event: bytes written so far for a file.
+    error is the exception when the download failed, else None.
+    """
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+
+class PartFile:
+    """
+    Download target written at block offsets into "<name>.part" and renamed
+    when complete, so a failed or cancelled download never leaves a
+    truncated file under the final name.
+    """
+
+    def __init__(self, dest, name, size):
+        os.makedirs(dest, exist_ok=True)
+        self.path = os.path.join(dest, os.path.basename(name))
+        self.part_path = self.path + ".part"
+        self.lock = threading.Lock()
+        self.file = open(self.part_path, "wb")
+        self.file.truncate(size)
+
+    def write(self, offset, data):
+        with self.lock:
+            self.file.seek(offset)
+            self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.part_path, self.path)
+        return self.path
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+
+
+# ==================================================================================================
+class AsyncDownloader(abc.ABC):
+    """
+    download_many() and iter_download() on top of a subclass' download().
+    part_file is the target factory, (dest, name, size) -> object with
+    write(offset, data), commit() and discard().
+    """
+
+    part_file = PartFile
+
+    @abc.abstractmethod
+    async def connect(self):
+        """
+        Open the session with the server.
+        """
+
+    @abc.abstractmethod
+    async def close(self):
+        """
+        Close the session; downloads still running fail.
+        """
+
+    @abc.abstractmethod
+    async def resource_sizes(self, names):
+        """
+        {name: size} of the `names` the server has, looked up for all of
+        them at once and cached for the connection. Names left out are
+        looked up again by download() (missing, or older server).
+        """
+
+    @abc.abstractmethod
+    async def download(self, name, dest, size=None, progress=None):
+        """
+        Download one file into dest/name; returns the local path.
+        """
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def download_many(
+        self, names, dest, concurrency=8, progress=None, return_exceptions=False
+    ):
+        """
+        Download several files with at most `concurrency` in flight.
+
+        - names: file names, or (name, size) pairs to skip the size lookup.
+        - progress: callable receiving Progress events.
+        - return_exceptions: like asyncio.gather, failed files yield their
+          exception instead of cancelling the others.
+
+        Returns the local paths in the order of `names`.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        items = [item if isinstance(item, (tuple, list)) else (item, None) for item in names]
+        # Kích thước của mọi file chưa biết được hỏi 1 lần, không phải 1 round trip mỗi file
+        unknown = [name for name, size in items if size is None]
+        sizes = await self.resource_sizes(unknown) if unknown else {}
+
+        async def one(name, size):
+            async with semaphore:
+                return await self.download(name, dest, size=sizes.get(name, size), progress=progress)
+
+        return await asyncio.gather(
+            *(one(name, size) for name, size in items), return_exceptions=return_exceptions
+        )
+
+    async def iter_download(self, names, dest, concurrency=8):
+        """
+        Async iterator of Progress events while download_many() runs.
+        A failed file is reported with Progress.error; leaving the loop
+        early cancels the remaining downloads.
+        """
+        events = asyncio.Queue()
+        task = asyncio.create_task(
+            self.download_many(
+                names, dest, concurrency, progress=events.put_nowait, return_exceptions=True
+            )
+        )
+        try:
+            while not (task.done() and events.empty()):
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+
+def report(progress, name, done, total, finished=False, error=None):
+    if progress is not None:
+        progress(Progress(name, done, total, finished, error))
+
+
+async def open_connection(host, port, role, profile, overrides):
+    """
+    asyncio.open_connection on a socket tuned before connect().
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sockopts.apply(sock, role, profile, overrides)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    except BaseException:
+        sock.close()
+        raise
+    return await asyncio.open_connection(sock=sock)
+
+
+# ==================================================================================================
+class AsyncTCPClient(AsyncDownloader):
+    """
+    One control connection plus `pipes` data connections, shared by every
+    download of this client. Blocks of concurrent downloads are interleaved
+    on the pipes; each pipe returns blocks in request order, so a FIFO of
+    expected blocks per pipe is enough to route them back.
+    """
+
+    KEEPALIVE_INTERVAL = 20
+    # Số lần kết nối lại khi server trả BUSY trước khi báo lỗi ServerBusy
+    BUSY_RETRIES = 5
+
+    def __init__(
+        self,
+        host,
+        port=6969,
+        pipes=4,
+        block_size=4 * 1024 * 1024,
+        timeout=30,
+        compression_enabled=True,
+        window=None,
+        socket_profile=sockopts.DEFAULT_PROFILE,
+        socket_options=None,
+    ):
+        sockopts.validate(socket_profile, socket_options)
+        self.host = host
+        self.port = port
+        self.pipes = pipes
+        self.block_size = block_size
+        self.timeout = timeout
+        self.compression_enabled = compression_enabled
+        # Số block đang chờ tối đa của 1 file, giới hạn bộ nhớ đệm
+        self.window = window or 2 * pipes
+        self.socket_profile = socket_profile
+        self.socket_options = socket_options
+
+        self.codec = None
+        self.token = None
+        self.reader = None
+        self.writer = None
+        self.pipe_streams = []
+        self.expected = []  # pipe -> deque of (start, end, future)
+        self.tasks = []
+        self.control_lock = asyncio.Lock()
+        self.last_activity = time.monotonic()
+        self.error = None
+        # {tên: kích thước} của LIST gần nhất, giữ tới khi kết nối lại
+        self.resources = None
+        self.list_lock = asyncio.Lock()
+
+    # ==============================================================================================
+    async def connect(self):
+        self.error = None
+        self.resources = None
+        offer = ",".join(compression.available_codecs()) if self.compression_enabled else ""
+        backoff = session.Backoff()
+        while True:
+            self.reader, self.writer = await asyncio.wait_for(
+                open_connection(self.host, self.port, "control", self.socket_profile, self.socket_options),
+                self.timeout,
+            )
+            response = await self.request(f"OPEN\r\n{offer}")
+            if not response.startswith("BUSY"):
+                break
+            # Server quá tải: chờ ít nhất retry-after rồi thử lại
+            self.writer.close()
+            busy = session.ServerBusy.parse(response.split("\r\n"))
+            if backoff.attempt >= self.BUSY_RETRIES:
+                raise busy
+            delay = backoff.wait_time(busy.retry_after)
+            logger.info(f"{busy}, reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        data_port, codec, self.token = response.split("|")[:3]
+        self.codec = codec or None
+
+        for index in range(self.pipes):
+            reader, writer = await asyncio.wait_for(
+                open_connection(self.host, int(data_port), "data", self.socket_profile, self.socket_options),
+                self.timeout,
+            )
+            writer.write(f"PIPE\r\n{self.token}\r\n{index}".ljust(MESSAGE_SIZE).encode())
+            await writer.drain()
+            self.pipe_streams.append((reader, writer))
+            self.expected.append(collections.deque())
+
+        self.tasks = [asyncio.create_task(self.read_pipe(index)) for index in range(self.pipes)]
+        self.tasks.append(asyncio.create_task(self.keepalive()))
+        logger.info(f"Connected to {self.host}:{self.port} with {self.pipes} pipes (codec {self.codec})")
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.fail(ConnectionError("Client closed"))
+        for _, writer in self.pipe_streams + [(self.reader, self.writer)]:
+            if writer is not None:
+                writer.close()
+        self.pipe_streams = []
+        self.expected = []
+        self.writer = None
+
+    def fail(self, error):
+        """
+        Abort every block still expected: the session is unusable.
+        """
+        if self.error is None:
+            self.error = error
+        for expected in self.expected:
+            while expected:
+                _, _, future = expected.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    # ==============================================================================================
+    async def request(self, message):
+        """
+        One padded request and its padded reply on the control connection.
+        """
+        async with self.control_lock:
+            self.writer.write(message.ljust(MESSAGE_SIZE).encode())
+            await self.writer.drain()
+            response = await asyncio.wait_for(self.reader.readexactly(MESSAGE_SIZE), self.timeout)
+            self.last_activity = time.monotonic()
+            return response.decode().strip()
+
+    async def keepalive(self):
+        # PING khi rảnh để server không đóng phiên vì timeout
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_INTERVAL)
+            if time.monotonic() - self.last_activity >= self.KEEPALIVE_INTERVAL:
+                try:
+                    await self.request("PING\r\n")
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    logger.warning(f"Keepalive failed: {e}")
+                    self.fail(ConnectionError("Keepalive failed"))
+                    return
+
+    async def list_resources(self):
+        """
+        Returns {name: size} of the resources offered by the server.
+        """
+        response = await self.request("LIST\r\n")
+        return {os.path.basename(path): int(size) for path, size in ast.literal_eval(response)}
+
+    async def resource_sizes(self, names):
+        async with self.list_lock:
+            if self.resources is None or any(name not in self.resources for name in names):
+                # LIST lần đầu, hoặc lại khi có tên chưa thấy (file mới thêm trên server)
+                self.resources = await self.list_resources()
+            return {name: self.resources[name] for name in names if name in self.resources}
+
+    # ==============================================================================================
+    async def read_pipe(self, index):
+        reader, _ = self.pipe_streams[index]
+        expected = self.expected[index]
+        try:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                header = ast.literal_eval(line[:-2].decode().strip())
+                start, end = header[2], header[3]
+                if len(header) == 6:
+                    codec, length = header[4], header[5]
+                else:
+                    codec, length = compression.NO_COMPRESSION, end - start + 1
+                payload = await reader.readexactly(length)
+                if not expected or expected[0][:2] != (start, end):
+                    raise ConnectionError(f"Unexpected block {start}-{end} on pipe {index}")
+                _, _, future = expected.popleft()
+                # Future đã huỷ (download bị cancel/timeout): bỏ block
+                if not future.done():
+                    future.set_result((codec, payload))
+        except asyncio.CancelledError:
+            raise
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, SyntaxError) as e:
+            logger.error(f"Pipe {index} failed: {e}")
+            self.fail(ConnectionError(f"Pipe {index} failed: {e}"))
+
+    async def request_block(self, name, size, start, end):
+        if self.error is not None:
+            raise self.error
+        async with self.control_lock:
+            # Pipe ít block đang chờ nhất
+            pipe = min(range(self.pipes), key=lambda i: len(self.expected[i]))
+            future = asyncio.get_running_loop().create_future()
+            self.expected[pipe].append((start, end, future))
+            message = "GET\r\n" + str([name, size, start, end, pipe])
+            self.writer.write(message.ljust(MESSAGE_SIZE).encode())
+            await self.writer.drain()
+            self.last_activity = time.monotonic()
+        return future
+
+    async def fetch_block(self, part, name, size, start, end):
+        future = await self.request_block(name, size, start, end)
+        codec, payload = await asyncio.wait_for(future, self.timeout)
+        # Giải nén và ghi đĩa ngoài event loop
+        await asyncio.to_thread(self.store_block, part, start, end, codec, payload)
+        return end - start + 1
+
+    @staticmethod
+    def store_block(part, start, end, codec, payload):
+        data = compression.decompress(codec, payload)
+        if len(data) != end - start + 1:
+            raise ConnectionError(f"Block {start}-{end} has {len(data)} bytes")
+        part.write(start, data)
+
+    async def download(self, name, dest, size=None, progress=None):
+        """
+        Download one file into dest/name; returns the local path.
+        """
+        part = None
+        pending = set()
+        done_bytes = 0
+        try:
+            if size is None:
+                size = (await self.resource_sizes([name])).get(name)
+                if size is None:
+                    raise FileNotFoundError(name)
+            part = self.part_file(dest, name, size)
+
+            blocks = [
+                (start, min(start + self.block_size, size) - 1)
+                for start in range(0, size, self.block_size)
+            ]
+            for start, end in blocks:
+                while len(pending) >= self.window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        done_bytes += task.result()
+                    report(progress, name, done_bytes, size)
+                pending.add(asyncio.create_task(self.fetch_block(part, name, size, start, end)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    done_bytes += task.result()
+                report(progress, name, done_bytes, size)
+            path = part.commit()
+        except BaseException as e:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if part is not None:
+                part.discard()
+            if not isinstance(e, asyncio.CancelledError):
+                report(progress, name, done_bytes, size or 0, finished=True, error=e)
+            raise
+        report(progress, name, size, size, finished=True)
+        logger.info(f"Downloaded {name} ({size} bytes)", extra={"tag": "SUCCESS"})
+        return path
+
+
+# ==================================================================================================
+class DatagramQueue(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait(data)
+
+    def error_received(self, exc):
+        # ICMP port unreachable khi server tắt: để timeout xử lý
+        pass
+
+
+class AsyncUDPClient(AsyncDownloader):
+    """
+    UDP downloads with a window of `window` GETs in flight per file.
+    Each download has its own endpoint because data packets carry only
+    a sequence number; lost packets are re-requested with RESEND after
+    `timeout` seconds, at most `max_retries` times each.
+    """
+
+    def __init__(
+        self,
+        host,
+        port=12345,
+        buffer_size=512,
+        timeout=2,
+        window=32,
+        max_retries=10,
+        socket_profile=sockopts.DEFAULT_PROFILE,
+        socket_options=None,
+    ):
+        sockopts.validate(socket_profile, socket_options)
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.window = window
+        self.max_retries = max_retries
+        self.socket_profile = socket_profile
+        self.socket_options = socket_options
+        self.codec = None
+        self.transport = None
+        self.protocol = None
+        # {tên: kích thước} đã hỏi bằng OPEN, giữ tới khi kết nối lại; None: server không có OPEN
+        self.sizes = {}
+        self.next_id = 0
+        self.session_lock = asyncio.Lock()
+
+    async def open_endpoint(self):
+        transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            DatagramQueue, remote_addr=(self.host, self.port)
+        )
+        sockopts.apply(transport.get_extra_info("socket"), "datagram", self.socket_profile, self.socket_options)
+        return transport, protocol
+
+    async def connect(self):
+        self.sizes = {}
+        self.transport, self.protocol = await self.open_endpoint()
+        offer = ",".join(compression.available_codecs())
+        response = await self.request(self.transport, self.protocol, f"CONNECT|{offer}", b"WELCOME")
+        self.codec = response.decode(errors="ignore").partition("|")[2] or None
+        logger.info(f"Connected to {self.host}:{self.port} (codec {self.codec})")
+
+    async def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def request(self, transport, protocol, message, prefix):
+        """
+        Send `message` until a reply starting with `prefix` arrives.
+        An ERROR reply is raised right away (FileNotFoundError for a missing file).
+        """
+        for _ in range(self.max_retries):
+            transport.sendto(message.encode())
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    data = await asyncio.wait_for(protocol.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if data.startswith(prefix):
+                    return data
+                if data.startswith(b"ERROR|"):
+                    raise self.reply_error(data, message.partition("|")[2] or message)
+                if data.startswith(b"BUSY|"):
+                    # Server quá tải: chờ retry-after rồi gửi lại
+                    busy = session.ServerBusy.parse(data.decode(errors="ignore").split("|"))
+                    await asyncio.sleep(busy.retry_after)
+                    break
+        raise TimeoutError(f"No {prefix.decode()} reply from {self.host}:{self.port}")
+
+    def reply_error(self, data, subject):
+        reason = data.decode(errors="ignore").partition("|")[2]
+        if reason.startswith("File not found"):
+            return FileNotFoundError(subject)
+        return ConnectionError(f"{self.host}:{self.port} refused {subject}: {reason}")
+
+    async def list_resources(self):
+        async with self.session_lock:
+            response = await self.request(self.transport, self.protocol, "LIST", b"LIST|")
+        files = response.decode().split("|", 1)[1]
+        return [] if files == "NO_FILES" else files.split(",")
+
+    async def resource_sizes(self, names):
+        """
+        LIST has no sizes on UDP: OPEN|<id>|<name> of every name goes out in
+        one burst (multiplexed streams, serverUDP.open_stream) and the
+        OPENED|<id>|<size> replies are matched by id. Lost replies are asked
+        again, at most max_retries times; an older server answers ERROR and
+        download() falls back to SIZE.
+        """
+        async with self.session_lock:
+            if self.sizes is not None:
+                # Stream id chỉ có 16 bit: quá 65536 tên thì phần còn lại hỏi SIZE từng file
+                unknown = [name for name in dict.fromkeys(names) if name not in self.sizes][:0x10000]
+                # Id không lặp lại trong phiên: OPENED trễ của lần hỏi trước không bị nhận nhầm
+                wanted = {(self.next_id + index) % 0x10000: name for index, name in enumerate(unknown)}
+                self.next_id = (self.next_id + len(unknown)) % 0x10000
+                await self.open_streams(wanted)
+            sizes = self.sizes or {}
+            return {name: sizes[name] for name in names if sizes.get(name, -1) >= 0}
+
+    async def open_streams(self, wanted):
+        for _ in range(self.max_retries):
+            if not wanted:
+                return
+            for index, name in wanted.items():
+                self.transport.sendto(f"OPEN|{index}|{name}".encode())
+            deadline = time.monotonic() + self.timeout
+            while wanted and time.monotonic() < deadline:
+                try:
+                    data = await asyncio.wait_for(self.protocol.queue.get(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                fields = data.decode(errors="ignore").split("|")
+                if fields[0] == "OPENED" and int(fields[1]) in wanted:
+                    self.sizes[wanted.pop(int(fields[1]))] = int(fields[2])
+                elif fields[0] == "ERROR" and fields[1].startswith("Unknown command"):
+                    # Server cũ không có stream ghép kênh
+                    self.sizes = None
+                    return
+                elif fields[0] == "BUSY":
+                    await asyncio.sleep(session.ServerBusy.parse(fields).retry_after)
+                    break
+
+    # ==============================================================================================
+    async def download(self, name, dest, size=None, progress=None):
+        transport, protocol = await self.open_endpoint()
+        part = None
+        done_bytes = 0
+        try:
+            if size is None:
+                size = (await self.resource_sizes([name])).get(name)
+            if size is None:
+                # Không có trong cache (file thiếu hoặc server cũ): SIZE báo lỗi cụ thể
+                response = await self.request(transport, protocol, f"SIZE|{name}", b"SIZE|")
+                size = int(response.decode().split("|")[1])
+            part = self.part_file(dest, name, size)
+
+            payload_size = self.buffer_size - 20
+            total = math.ceil(size / payload_size)
+            codec_suffix = f"|{self.codec}" if self.codec else ""
+            outstanding = {}  # seq -> (sent at, retries)
+
+            def send(command, seq, retries=0):
+                transport.sendto(f"{command}|{name}|{seq}{codec_suffix}".encode())
+                outstanding[seq] = (time.monotonic(), retries)
+
+            next_seq = 0
+            received = 0
+            tick = self.timeout / 4
+            while received < total:
+                while next_seq < total and len(outstanding) < self.window:
+                    send("GET", next_seq)
+                    next_seq += 1
+
+                try:
+                    data = await asyncio.wait_for(protocol.queue.get(), tick)
+                except asyncio.TimeoutError:
+                    data = None
+
+                if data is not None and data.startswith(b"ERROR|"):
+                    # File bị xoá trên server giữa chừng: không chờ hết số lần gửi lại
+                    raise self.reply_error(data, name)
+                if data is not None and data.startswith(b"BUSY|"):
+                    # Server quá tải: chờ retry-after rồi gửi lại request bị từ chối
+                    fields = data.decode(errors="ignore").split("|")
+                    await asyncio.sleep(session.ServerBusy.parse(fields).retry_after)
+                    seq = int(fields[2]) if len(fields) > 2 and fields[2].isdigit() else None
+                    if seq in outstanding:
+                        send("RESEND", seq, outstanding[seq][1])
+                elif data is not None and data != b"EOF":
+                    if self.codec:
+                        seq, checksum, tag, payload = data.split(b":", 3)
+                    else:
+                        seq, checksum, payload = data.split(b":", 2)
+                    seq = int(seq)
+                    # Gói lặp hoặc đến trễ của seq đã nhận: bỏ qua
+                    if seq in outstanding:
+                        if zlib.crc32(payload) != int(checksum):
+                            send("RESEND", seq, outstanding[seq][1])
+                        else:
+                            chunk = payload
+                            if self.codec:
+                                chunk = compression.decompress(
+                                    compression.TAG_CODECS[tag.decode()], payload
+                                )
+                            part.write(seq * payload_size, chunk)
+                            del outstanding[seq]
+                            received += 1
+                            done_bytes += len(chunk)
+                            report(progress, name, done_bytes, size)
+
+                now = time.monotonic()
+                for seq, (sent, retries) in list(outstanding.items()):
+                    if now - sent >= self.timeout:
+                        if retries >= self.max_retries:
+                            raise TimeoutError(f"{name}: packet {seq} lost {retries} times")
+                        send("RESEND", seq, retries + 1)
+
+            path = part.commit()
+        except BaseException as e:
+            if part is not None:
+                part.discard()
+            if not isinstance(e, asyncio.CancelledError):
+                report(progress, name, done_bytes, size or 0, finished=True, error=e)
+            raise
+        finally:
+            transport.close()
+        report(progress, name, size, size, finished=True)
+        logger.info(f"Downloaded {name} ({size} bytes)", extra={"tag": "SUCCESS"})
+        return path
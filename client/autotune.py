@@ -0,0 +1,144 @@
+import time
+import threading
+
+import log
+
+logger = log.get_logger(__name__)
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class Autotuner:
+    """
+    Hill climbing over (pipes, block size) on the measured goodput.
+
+    An epoch lasts at least EPOCH seconds of transfer and BLOCKS_PER_PIPE
+    blocks per active pipe, so a measurement is never a fraction of one
+    block. At the end of each epoch the rate is compared with the best
+    setting so far: a move that gains more than GAIN is kept and tried
+    again, otherwise it is undone and the next move is tried. When no move
+    helps the best setting is held (and re-measured, so the baseline
+    follows the path) and the moves are probed again every PROBE_EVERY epochs.
+
+    Limits come from the server's OPEN reply. Idle time between files is
+    not counted, so the settings carry over from one file to the next.
+    """
+
+    EPOCH = 0.5
+    BLOCKS_PER_PIPE = 2
+    GAIN = 0.05
+    PROBE_EVERY = 20
+    MOVES = ("pipes_up", "block_up", "pipes_down", "block_down")
+
+    def __init__(self, pipes, block_size, max_pipes, min_block, max_block, tune_block=True):
+        self.lock = threading.Lock()
+        self.max_pipes = max(1, max_pipes)
+        self.min_block = max(1, min_block)
+        self.max_block = max(self.min_block, max_block)
+        self.pipes = clamp(pipes, 1, self.max_pipes)
+        self.block_size = clamp(block_size, self.min_block, self.max_block)
+        # BLOCK_SIZE cố định do người dùng chọn: chỉ điều chỉnh số pipe
+        self.tune_block = tune_block
+
+        self.best = None  # (rate, pipes, block_size)
+        self.trial = None  # move đang được đo
+        self.move_index = 0
+        self.failed = 0  # số move liên tiếp không cải thiện
+        self.idle_epochs = 0
+
+        self.bytes = 0
+        self.blocks = 0
+        self.active = 0.0
+        self.started = None
+
+    # ==============================================================================================
+    def start(self):
+        with self.lock:
+            self.started = time.monotonic()
+
+    def stop(self):
+        with self.lock:
+            if self.started is not None:
+                self.active += time.monotonic() - self.started
+                self.started = None
+
+    def record(self, nbytes):
+        with self.lock:
+            self.bytes += nbytes
+            self.blocks += 1
+
+    def settings(self):
+        with self.lock:
+            return self.pipes, self.block_size
+
+    def tick(self):
+        """
+        Close the epoch if EPOCH seconds of transfer have passed.
+        Returns True when the settings changed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = self.active + (now - self.started if self.started is not None else 0)
+            if elapsed < self.EPOCH or self.blocks < self.BLOCKS_PER_PIPE * self.pipes:
+                return False
+            rate = self.bytes / elapsed
+            self.bytes = 0
+            self.blocks = 0
+            self.active = 0.0
+            if self.started is not None:
+                self.started = now
+            before = (self.pipes, self.block_size)
+            self.evaluate(rate)
+            changed = (self.pipes, self.block_size) != before
+        if changed:
+            logger.debug(
+                f"Autotune: {rate / 1e6:.2f} MB/s -> {self.pipes} pipes, {self.block_size} byte blocks"
+            )
+        return changed
+
+    # ==============================================================================================
+    def evaluate(self, rate):
+        if self.trial is not None:
+            if rate > self.best[0] * (1 + self.GAIN):
+                # Giữ move này và thử tiếp cùng hướng
+                self.best = (rate, self.pipes, self.block_size)
+                self.failed = 0
+            else:
+                self.pipes, self.block_size = self.best[1:]
+                self.move_index = (self.move_index + 1) % len(self.MOVES)
+                self.failed += 1
+            self.trial = None
+        else:
+            # Đo lại điểm tốt nhất: đường truyền có thể đã thay đổi
+            self.best = (rate, self.pipes, self.block_size)
+
+        if self.failed >= len(self.MOVES):
+            self.idle_epochs += 1
+            if self.idle_epochs < self.PROBE_EVERY:
+                return
+            self.idle_epochs = 0
+            self.failed = 0
+
+        for _ in range(len(self.MOVES)):
+            candidate = self.apply(self.MOVES[self.move_index])
+            if candidate != (self.pipes, self.block_size):
+                self.trial = self.MOVES[self.move_index]
+                self.pipes, self.block_size = candidate
+                return
+            # Đã chạm giới hạn theo hướng này
+            self.move_index = (self.move_index + 1) % len(self.MOVES)
+            self.failed += 1
+
+    def apply(self, move):
+        pipes, block_size = self.pipes, self.block_size
+        if move == "pipes_up":
+            pipes = min(self.max_pipes, pipes + max(1, pipes // 2))
+        elif move == "pipes_down":
+            pipes = max(1, pipes - max(1, pipes // 3))
+        elif move == "block_up" and self.tune_block:
+            block_size = min(self.max_block, block_size * 2)
+        elif move == "block_down" and self.tune_block:
+            block_size = max(self.min_block, block_size // 2)
+        return pipes, block_size
@@ -1,11 +1,210 @@
 import sys
+import json
+import asyncio
+import argparse
+import log
+import tracing
 import utils
 import clientCore
 import signal
 import clientUDP
+import scheduler
+import sockopts
 
+logger = log.get_logger(__name__)
+
+# -------------------------------------------------------------------------------
+"""
+    Settings that can come from the command line or a JSON config file,
+    e.g. {"HOST": "10.0.0.5", "PIPES": 8, "DOWNLOAD_DIR": "out"}.
+    Command line flags win over the file.
+"""
+
+SETTINGS = (
+    # flag, config key, type, help
+    ("--host", "HOST", str, "server address"),
+    ("--port", "PORT", int, "server port (TCP default 6969, UDP default 12345)"),
+    ("--input", "INPUT_FILE", str, "file listing the names to download (default input.txt)"),
+    ("--dest", "DOWNLOAD_DIR", str, "download directory"),
+    ("--pipes", "PIPES", int, "TCP pipes / UDP threads per file"),
+    ("--block-size", "BLOCK_SIZE", int, "TCP block size in bytes"),
+    ("--buffer-size", "BUFFER_SIZE", int, "UDP datagram size (must match the server)"),
+    ("--timeout", "TIMEOUT", float, "UDP retransmit timeout (seconds)"),
+    ("--concurrency", "CONCURRENCY", int, "files downloaded at the same time (with FILE arguments)"),
+    ("--socket-profile", "SOCKET_PROFILE", str, "socket tuning: os, lan (default), wan-high-bdp or loopback"),
+    ("--store-dir", "STORE_DIR", str, "content store shared by the TCP and UDP clients ('' disables it)"),
+    ("--store-max-bytes", "STORE_MAX_BYTES", int, "size limit of the content store in bytes"),
+    ("--schedule", "SCHEDULE", str, "download order of the input file: fifo (default), smallest, priority or deadline"),
+)
+
+MODES = {"tcp": 1, "udp": 2}
+
+
+def load_config(path):
+    if not path:
+        return {}
+    with open(path, "r") as file:
+        config = json.load(file)
+    known = {key for _, key, _, _ in SETTINGS} | {
+        "SOCKET_OPTIONS",
+        "MIRRORS",
+        "SUBSCRIBE",
+        "VERIFY_BLOCKS",
+        "VERIFY_FILE",
+        "MULTIPLEX",
+        "OFFLOAD",
+    }
+    for key in config:
+        if key not in known:
+            logger.warning(f"Unknown config key {key} in {path}")
+    return config
+
+
+def flag_overrides(args):
+    return {
+        key: getattr(args, flag[2:].replace("-", "_"))
+        for flag, key, _, _ in SETTINGS
+        if getattr(args, flag[2:].replace("-", "_")) is not None
+    }
+
+
+# -------------------------------------------------------------------------------
+"""
+    Clients of the watch mode (input file re-read every few seconds).
+"""
+
+
+def tcp_client_task(config):
+    client = clientCore.SocketClient()
+    for key in (
+        "PORT",
+        "PIPES",
+        "BLOCK_SIZE",
+        "DOWNLOAD_DIR",
+        "SOCKET_PROFILE",
+        "SOCKET_OPTIONS",
+        "STORE_DIR",
+        "STORE_MAX_BYTES",
+        "MIRRORS",
+        "SUBSCRIBE",
+        "VERIFY_BLOCKS",
+        "VERIFY_FILE",
+        "SCHEDULE",
+    ):
+        if key in config:
+            setattr(client, key, config[key])
+    client.connect_to_server(config.get("INPUT_FILE", "input.txt"), config["HOST"])
+
+
+def udp_client_task(config):
+    options = {
+        "HOST": config["HOST"],
+        "INPUT_FILE": config.get("INPUT_FILE", "input.txt"),
+        "DOWNLOAD_FOLDER": config.get("DOWNLOAD_DIR", "files_received_udp"),
+    }
+    for key, option in (
+        ("PORT", "PORT"),
+        ("BUFFER_SIZE", "BUFFER_SIZE"),
+        ("TIMEOUT", "TIMEOUT"),
+        ("PIPES", "PIPE"),
+        ("SOCKET_PROFILE", "SOCKET_PROFILE"),
+        ("SOCKET_OPTIONS", "SOCKET_OPTIONS"),
+        ("STORE_DIR", "STORE_DIR"),
+        ("STORE_MAX_BYTES", "STORE_MAX_BYTES"),
+        ("MIRRORS", "MIRRORS"),
+        ("SUBSCRIBE", "SUBSCRIBE"),
+        ("MULTIPLEX", "MULTIPLEX"),
+        ("OFFLOAD", "OFFLOAD"),
+        ("SCHEDULE", "SCHEDULE"),
+    ):
+        if key in config:
+            options[option] = config[key]
+    clientUDP.SocketClientUDP(**options).start()
+
+
+"""
+    One-shot download of the FILE arguments with the asyncio client,
+    exit status 1 if any file failed.
+"""
+
+
+def download_task(mode, config, names):
+    import aioclient
+
+    if mode == "tcp":
+        options = {"port": config.get("PORT", 6969), "pipes": config.get("PIPES", 4)}
+        if config.get("BLOCK_SIZE"):
+            options["block_size"] = config["BLOCK_SIZE"]
+        for key, option in (("SOCKET_PROFILE", "socket_profile"), ("SOCKET_OPTIONS", "socket_options")):
+            if key in config:
+                options[option] = config[key]
+        client = aioclient.AsyncTCPClient(config["HOST"], **options)
+        dest = config.get("DOWNLOAD_DIR", "files_received")
+    else:
+        options = {"port": config.get("PORT", 12345)}
+        for key, option in (
+            ("BUFFER_SIZE", "buffer_size"),
+            ("TIMEOUT", "timeout"),
+            ("SOCKET_PROFILE", "socket_profile"),
+            ("SOCKET_OPTIONS", "socket_options"),
+        ):
+            if key in config:
+                options[option] = config[key]
+        client = aioclient.AsyncUDPClient(config["HOST"], **options)
+        dest = config.get("DOWNLOAD_DIR", "files_received_udp")
+
+    async def run():
+        async with client:
+            return await client.download_many(
+                names, dest, concurrency=config.get("CONCURRENCY", 4), return_exceptions=True
+            )
+
+    failed = 0
+    for name, result in zip(names, asyncio.run(run())):
+        if isinstance(result, BaseException):
+            failed += 1
+            logger.error(f"{name}: {result!r}")
+    return 1 if failed else 0
+
+
+def main(args=None):
+    args = args or parse_args([])
+    config = {**load_config(args.config), **flag_overrides(args)}
+    if args.mirror:
+        config["MIRRORS"] = list(config.get("MIRRORS", ())) + args.mirror
+    if args.no_subscribe:
+        config["SUBSCRIBE"] = False
+    if args.no_verify_file:
+        config["VERIFY_FILE"] = False
+    if args.no_multiplex:
+        config["MULTIPLEX"] = False
+    if args.udp_offload:
+        config["OFFLOAD"] = True
+    try:
+        if args.sockopt:
+            config["SOCKET_OPTIONS"] = sockopts.parse_overrides(args.sockopt, config.get("SOCKET_OPTIONS"))
+        sockopts.validate(config.get("SOCKET_PROFILE", sockopts.DEFAULT_PROFILE), config.get("SOCKET_OPTIONS"))
+        scheduler.Scheduler(config.get("SCHEDULE", scheduler.DEFAULT_POLICY))
+    except ValueError as e:
+        logger.error(e)
+        return 2
+
+    if args.files:
+        if not args.mode or "HOST" not in config:
+            logger.error("Downloading FILE arguments needs --mode and --host")
+            return 2
+        return download_task(args.mode, config, args.files)
+
+    if args.mode:
+        if "HOST" not in config:
+            logger.error("--mode needs --host (or HOST in the config file)")
+            return 2
+        if args.mode == "tcp":
+            tcp_client_task(config)
+        else:
+            udp_client_task(config)
+        return 0
 
-def main():
     # -----------------SETTINGS UP CONSOLE-----------------#
     utils.clearScreen()
 
@@ -13,7 +212,6 @@ def main():
     screenHeigh = 25
 
     TITLE = "SOCKET FILES TRANSFER"
-    filename = "input.txt"
 
     utils.clearScreen()
 
@@ -43,35 +241,92 @@ def main():
 
     # Select choice from menu
     if choice == 0:
-        print("Exiting...")
+        logger.info("Exiting...")
 
     if choice == 1:
-        print("Downloading file from server with input.txt with TCP")
-        c1 = clientCore.SocketClient()
-        server_ip = input("Enter server IP: ")
-        c1.connect_to_server(filename, server_ip)
+        logger.info("Downloading file from server with input.txt with TCP")
+        if "HOST" not in config:
+            config["HOST"] = input("Enter server IP: ")
+        tcp_client_task(config)
 
     if choice == 2:
-        print("Downloading file from server with input.txt with UDP")
-        server_ip = input("Enter server IP: ")
-        client = clientUDP.SocketClientUDP(HOST=server_ip)
-        client.start()
+        logger.info("Downloading file from server with input.txt with UDP")
+        if "HOST" not in config:
+            config["HOST"] = input("Enter server IP: ")
+        udp_client_task(config)
 
-        # try:
-        #     s1.connect_to_server("input.txt")
-        # except KeyboardInterrupt:
-        #     print("\n[INFO] Client terminated by user (Ctrl + C).")
+    return 0
 
-    # Press Ctrl + C to exit
-    def handle_exit(signal, frame):
-        print("\nCtrl+C detected. Exiting program...")
-        sys.exit(0)
 
-    signal.signal(signal.SIGINT, handle_exit)
+# -----------------SETTINGS UP CONSOLE-----------------#
 
 
-# -----------------SETTINGS UP CONSOLE-----------------#
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Socket file transfer client",
+        epilog="Without --mode the interactive menu is shown. With FILE arguments the "
+        "files are downloaded once and the client exits; otherwise --input is "
+        "watched for new names.",
+    )
+    parser.add_argument("--mode", choices=sorted(MODES), help="protocol, skips the interactive menu")
+    parser.add_argument("--config", metavar="FILE", help="JSON config file (keys like HOST, PORT, PIPES)")
+    for flag, _, type_, help_text in SETTINGS:
+        parser.add_argument(flag, type=type_, help=help_text)
+    parser.add_argument(
+        "--sockopt",
+        action="append",
+        metavar="ROLE.OPTION=VALUE",
+        help="override one socket option of the profile, e.g. data.rcvbuf=8M (repeatable)",
+    )
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        metavar="HOST[:PORT]",
+        help="another server with the same resources, blocks are shared among all of them (repeatable)",
+    )
+    parser.add_argument(
+        "--no-subscribe",
+        action="store_true",
+        help="do not ask the server to push catalog changes, recheck on the input interval instead",
+    )
+    parser.add_argument(
+        "--no-verify-file",
+        action="store_true",
+        help="TCP: skip the SHA-256 check of each downloaded file (blocks are still CRC checked)",
+    )
+    parser.add_argument(
+        "--no-multiplex",
+        action="store_true",
+        help="UDP: download new files one at a time instead of as streams sharing one socket",
+    )
+    parser.add_argument(
+        "--udp-offload",
+        action="store_true",
+        help="UDP: receive the multiplexed streams with GRO (Linux, falls back when unsupported)",
+    )
+    parser.add_argument("--log-level", help="DEBUG, INFO, WARNING or ERROR (default $LOG_LEVEL or INFO)")
+    parser.add_argument("--quiet", action="store_true", help="only log warnings and errors")
+    parser.add_argument("--log-file", metavar="FILE", help="also append log lines to FILE")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile, write stats to FILE and FILE.txt")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace (JSON) of the transfer stages to FILE")
+    parser.add_argument("--trace-sample", type=float, default=1.0, help="fraction of requests traced (default 1.0)")
+    parser.add_argument("files", nargs="*", metavar="FILE", help="names to download once, then exit")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    # Press Ctrl + C to exit
+    def handle_exit(signal, frame):
+        logger.info("Ctrl+C detected. Exiting program...")
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, handle_exit)
+
+    args = parse_args()
+    log.setup(level=args.log_level, quiet=args.quiet, log_file=args.log_file)
+    tracing.setup(args.trace, args.trace_sample)
+    if args.profile:
+        status = tracing.profile(main, args.profile, args)
+    else:
+        status = main(args)
+    sys.exit(status)
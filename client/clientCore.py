@@ -1,10 +1,34 @@
 import os
+import log
 import utils
+import session
+import autotune
+import sockopts
+import tracing
+import compression
+import contentstore
+import delta
+import mirrors
+import scheduler
+import subscription
 
 import socket
 import time
 import math
 import threading
+import collections
+import zlib
+
+logger = log.get_logger(__name__)
+# Dòng log cho từng chunk: chỉ ở mức DEBUG và tối đa 1 dòng/giây
+chunk_log = log.Throttle(logger)
+
+
+class DownloadFailed(Exception):
+    """
+    A file failed its integrity checks FILE_RETRIES times (corrupt blocks,
+    wrong SHA-256); it is skipped until the catalog reports it modified.
+    """
 
 
 class SocketClient:
@@ -15,11 +39,76 @@ class SocketClient:
     METADATA_SIZE = 1024
 
     CHUNK_SIZE = 1048576  # 1 MB
+    # Kích thước block cố định (0 = tự điều chỉnh, hoặc chia đều file cho các pipe nếu tắt AUTOTUNE)
+    BLOCK_SIZE = 0
+    # Tự điều chỉnh số pipe và kích thước block theo throughput đo được
+    AUTOTUNE = True
+    # Số block đang chờ trên mỗi pipe để server luôn có sẵn block kế tiếp
+    PIPE_DEPTH = 2
+    # Giới hạn mặc định khi server không gửi kèm trong OPEN (server cũ)
+    MAX_PIPES = 4
+    MIN_BLOCK_SIZE = 64 * 1024
+    MAX_BLOCK_SIZE = 16 * 1024 * 1024
+    # Kích thước block khởi đầu của autotuner
+    START_BLOCK_SIZE = 1024 * 1024
     HEADER_SIZE = 8
     DELIMETER_SIZE = 2  # for \r\n
     MESSAGE_SIZE = 1024
 
-    DOWNLOAD_DIR = "./"
+    # Thư mục lưu file tải về (tương đối so với thư mục hiện tại)
+    DOWNLOAD_DIR = "files_received"
+    # File đã có nhưng khác bản trên server (kích thước hoặc SHA-256): chỉ tải phần thay đổi (delta.py),
+    # False thì tải lại cả file
+    DELTA_SYNC = True
+    # Kiểm tra CRC-32 từng block (server có "crc"): block hỏng được tải lại riêng,
+    # tối đa BLOCK_RETRIES lần liên tiếp trước khi kết nối lại
+    VERIFY_BLOCKS = True
+    BLOCK_RETRIES = 3
+    # Số lần cả file hỏng (block hỏng BLOCK_RETRIES lần, sai SHA-256), tính qua các lần kết nối lại
+    # và tải lại, trước khi file bị bỏ qua cho tới khi server báo file đổi
+    FILE_RETRIES = 3
+    # So SHA-256 cả file với server (HASH) trước khi đổi tên file tạm
+    VERIFY_FILE = True
+    # Content store dùng chung với client UDP (xem contentstore.py); None = tắt
+    STORE_DIR = contentstore.DEFAULT_DIR
+    STORE_MAX_BYTES = contentstore.DEFAULT_MAX_BYTES
+
+    # Nhận thay đổi của catalog do server đẩy về (SUBSCRIBE) thay vì chỉ LIST 1 lần mỗi phiên
+    SUBSCRIBE = True
+
+    # Server khác có cùng resource ("host" hoặc "host:port"): các block được chia cho mọi nguồn
+    MIRRORS = ()
+
+    # Thứ tự tải các file trong input (fifo, smallest, priority, deadline - xem scheduler.py)
+    SCHEDULE = scheduler.DEFAULT_POLICY
+
+    # Profile tuỳ chỉnh socket (xem sockopts.py) và các option ghi đè theo role
+    SOCKET_PROFILE = sockopts.DEFAULT_PROFILE
+    SOCKET_OPTIONS = None
+
+    # Codec nén đã thương lượng với server trong OPEN (None nếu server không hỗ trợ)
+    codec = None
+    # Token của phiên pipe do server cấp trong OPEN
+    token = None
+    # Thống kê thời gian của lần tải gần nhất (dùng cho benchmark)
+    last_transfer = None
+    # Port dữ liệu của phiên, dùng khi mở thêm pipe
+    data_port = None
+    autotuner = None
+    # Tính năng server gửi kèm OPEN (vd "delta"); rỗng với server cũ
+    features = frozenset()
+    store = None
+    # SHA-256 của các file đã tải, dùng lại khi file không đổi (needs_update)
+    digests = None
+    # MirrorSet của phiên khi có MIRRORS
+    mirrors = None
+    scheduler = None
+    # File bị tạm dừng cho file gấp hơn: tên -> (kích thước, các khoảng byte chưa nhận)
+    paused = None
+    # Số lần hỏng của từng file chưa tải xong: tên -> số lần
+    failures = None
+    # File đã bị bỏ qua sau FILE_RETRIES lần hỏng
+    failed_files = None
 
     def connect_to_server(self, filename, server_ip):
         # def connect_to_server(self, filename):
@@ -31,24 +120,26 @@ class SocketClient:
         """
 
         self.HOST = server_ip
-        # self.DOWNLOAD_DIR = download_dir
 
-        # Connect to the main server port
-        server_address = (self.HOST, self.PORT)
-
-        main_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Phiên giữ kết nối (keep-alive, tự kết nối lại) tới main server port
+        client_session = session.ClientSession(self, self.HOST, self.PORT)
 
         try:
-            main_socket.connect(server_address)
+            client_session.connect()
         except Exception as e:
-            print(utils.setTextColor("red"), end="")
-            print(f"[ERROR] An error occurred: {e}")
-            print(utils.setTextColor("white"), end="")
+            logger.error(f"An error occurred: {e}")
             return
 
-        self.handle_server_connection(filename, main_socket)
+        if self.MIRRORS:
+            addresses = [mirrors.parse_address(mirror, self.PORT) for mirror in self.MIRRORS]
+            self.mirrors = mirrors.MirrorSet(self, client_session, addresses)
 
-        main_socket.close()
+        try:
+            self.handle_server_connection(filename, client_session)
+        finally:
+            if self.mirrors is not None:
+                self.mirrors.close()
+            client_session.close()
 
     # ==============================================================================================
     def save_resource_list_to_file(self, list_file, file_path="receiveList.txt"):
@@ -67,18 +158,14 @@ class SocketClient:
                     file_name = file_name.split("/")[-1]  # only save name of file
                     file.write(f"{file_name} {file_size}\n")
 
-            print(utils.setTextColor("green"), end="")
-            print(f"[STATUS] Saved resource list to {file_path}")
-            print(utils.setTextColor("white"), end="")
+            logger.info(f"Saved resource list to {file_path}")
         except Exception as e:
-            print(utils.setTextColor("red"), end="")
-            print(f"[ERROR] Could not write to {file_path}: {e}")
-            print(utils.setTextColor("white"), end="")
+            logger.error(f"Could not write to {file_path}: {e}")
 
-    def handle_server_connection(self, filename, main_socket):
+    def handle_server_connection(self, filename, client_session):
 
         # Receive a list of available resources from server can be downloaded
-        list_file = self.receive_resource_list(main_socket)
+        list_file = client_session.list_resources()
 
         # Remove the spaces
         list_file = list_file.strip()
@@ -90,46 +177,76 @@ class SocketClient:
         self.save_resource_list_to_file(list_file)  # chỉ dùng để test
         # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
 
-        print(utils.setTextColor("green"), end="")
-        print(f"[RESPONE] List of available resources:")
-        print(utils.setTextColor("white"), end="")
+        logger.info("List of available resources:", extra={"tag": "RESPONSE"})
 
         for file in list_file:
-            print(f"[LIST] |----------{file}----------|")
-        print("Press Enter to continue...")
-
-        # ------------------------------ đợi người dùng nhập thì bắt đầu tải ------------------------------
-        input()  # enter to continue
+            logger.info(f"|----------{file}----------|", extra={"tag": "LIST"})
 
-        # Create 4 pipes for data transfer
-        socket_list = self.create_pipes(main_socket)
+        catalog_changes = None
+        if self.SUBSCRIBE and "subscribe" in self.features:
+            catalog_changes = subscription.CatalogSubscription(
+                self, client_session.host, client_session.port, list_file
+            )
+            catalog_changes.start()
 
+        # Các pipe đã được mở sẵn trong phiên và dùng lại cho mọi file
         received_files = []
+        queue = self.get_scheduler(filename)
+        self.paused = {}
+        self.failed_files = set()
+
+        def urgent(current, left):
+            # File input vừa đổi: file mới gấp hơn thì tạm dừng file đang tải
+            if not queue.input_changed():
+                return False
+            entry = queue.more_urgent(self.parse_input_file(filename, received_files), current, left)
+            if entry is None:
+                return False
+            logger.info(f"Pausing {current} ({left} bytes left) for {entry['name']}", extra={"tag": "SCHEDULE"})
+            return True
 
         try:
             while True:
+                if catalog_changes is not None:
+                    modified, reset = catalog_changes.take()
+                    if reset:
+                        # Server không còn giữ các thay đổi bị lỡ: lấy lại toàn bộ danh sách
+                        list_file = eval(client_session.list_resources().strip())
+                        self.save_resource_list_to_file(list_file)
+                        catalog_changes.set_entries(list_file)
+                        modified = set(received_files) | self.failed_files
+                    # File đã tải nhưng bản trên server đổi: kiểm tra lại (delta sync)
+                    received_files = [name for name in received_files if name not in modified]
+                    # File đã bỏ qua vì hỏng: bản mới trên server thì thử lại
+                    self.failed_files -= modified
+
                 # Reupdate list of files needed to download
                 # KIỂM TRA LẠI CÁC FILE TRONG INPUT
-                needed_files = self.parse_input_file(filename, received_files)
+                needed_files = queue.order(
+                    self.parse_input_file(filename, received_files + list(self.failed_files))
+                )
 
                 num_downloaded_file = 0
+                num_failed = 0
+                preempted = False
 
                 cur_index = 0
                 while cur_index < len(needed_files):
 
-                    if utils.check_file_exist(needed_files[cur_index]["name"]):
+                    outdated = self.needs_update(needed_files[cur_index], client_session)
+
+                    if not outdated and utils.check_file_exist(needed_files[cur_index]["name"]):
 
                         # ------------------------------------------------------------
-                        print(utils.setTextColor("green"), end="")
 
                         str_file = needed_files[cur_index]["name"]
 
-                        print(f"[STATUS] File {str_file} has already been downloaded")
+                        logger.info(f"File {str_file} has already been downloaded")
 
-                        print(utils.setTextColor("white"), end="")
                         # ------------------------------------------------------------
 
                         received_files.append(needed_files[cur_index]["name"])
+                        queue.discard(str_file)
 
                         num_downloaded_file += 1
 
@@ -137,27 +254,70 @@ class SocketClient:
 
                         continue
 
-                    time.sleep(5)
+                    queue.start(needed_files[cur_index]["name"])
+
+                    # Cùng nội dung đã có trong content store: không cần tải
+                    if self.link_from_store(needed_files[cur_index], client_session):
+                        cur_index += self.check_file_integrity(
+                            cur_index, needed_files, received_files
+                        )
+                        continue
+
+                    if (
+                        outdated
+                        and self.DELTA_SYNC
+                        and "delta" in self.features
+                        and self.sync_file(needed_files, cur_index, client_session)
+                    ):
+                        self.add_to_store(needed_files[cur_index])
+                        cur_index += self.check_file_integrity(
+                            cur_index, needed_files, received_files
+                        )
+                        continue
 
                     # Receive the chunk from the server
-                    self.receive_chunk(
-                        needed_files, cur_index, main_socket, socket_list
-                    )
+                    try:
+                        received = self.receive_chunk(needed_files, cur_index, client_session, urgent)
+                    except DownloadFailed as e:
+                        # Hỏng quá FILE_RETRIES lần: bỏ qua file, tải tiếp các file khác
+                        self.give_up(needed_files[cur_index]["name"], e)
+                        num_failed += 1
+                        cur_index += 1
+                        continue
+                    if received is None:
+                        # Nhường cho file gấp hơn: xếp lại hàng đợi ngay, file này tải tiếp sau
+                        preempted = True
+                        break
+                    if not received:
+                        # Sai SHA-256: tải lại cả file (tối đa FILE_RETRIES lần)
+                        continue
+                    self.add_to_store(needed_files[cur_index], verified=self.VERIFY_FILE)
 
                     # Check file size to ensure file is transferred successfully
                     cur_index += self.check_file_integrity(
                         cur_index, needed_files, received_files
                     )
 
+                if preempted:
+                    continue
+
                 # Confirmation
                 if len(needed_files) != 0:
-                    self.confirm_download(len(needed_files), cur_index)
-
-                # Chờ 5 giây trước khi quét lại file input.txt
-                print("[INFO] Checking for updates in input.txt...")
-                time.sleep(5)
+                    queue.report()
+                    self.confirm_download(len(needed_files), cur_index - num_failed)
+
+                # Chờ 5 giây trước khi quét lại file input.txt (hoặc tới khi catalog đổi)
+                logger.info("Checking for updates in input.txt...", extra={"tag": "INFO"})
+                with tracing.span("sleep"):
+                    if catalog_changes is not None:
+                        catalog_changes.wait(self.INPUT_UPDATE_INTERVAL)
+                    else:
+                        time.sleep(5)
         except KeyboardInterrupt:
-            print("\n[INFO] Client terminated by user (Ctrl + C).")
+            logger.info("Client terminated by user (Ctrl + C).", extra={"tag": "INFO"})
+        finally:
+            if catalog_changes is not None:
+                catalog_changes.close()
 
     # ============================================================================================================
     def receive_resource_list(self, main_socket):
@@ -176,199 +336,662 @@ class SocketClient:
         # ---------- NHẬN CÁC FILE TRẢ VỀ ----------
         list_file = main_socket.recv(self.MESSAGE_SIZE).decode()
 
-        print(utils.setTextColor("white"), end="")
-        print(list_file)
+        logger.debug(list_file.strip())
         return list_file
 
     # ============================================================================================================
-    def create_pipes(self, main_socket):
-        # Receive the additional port numbers
-        message = "OPEN\r\n"
+    def create_pipes(self, main_socket, token=None, connect=True):
+        """
+        OPEN a pipe session: the server replies
+        "<data_port>|<codec>|<token>[|<max_pipes>|<min_block>|<max_block>[|<features>]]" and
+        every pipe connects to that single data port and introduces itself with
+        the token, without waiting for another reply.
+        - token: previous session token, the server re-attaches its pipes.
+        - connect: False to keep the existing pipe sockets (reused session).
+        """
+        # Gửi kèm danh sách codec để server chọn codec nén cho phiên này
+        message = "OPEN\r\n" + ",".join(compression.available_codecs())
+        if token:
+            message += f"\r\n{token}"
         message = message.ljust(self.MESSAGE_SIZE)
 
         main_socket.sendall(message.encode())
 
-        master_port = main_socket.recv(self.MESSAGE_SIZE).decode()
+        response = utils.recv_exact(main_socket, self.MESSAGE_SIZE).decode().strip()
+        if response.startswith("BUSY"):
+            # Server quá tải: ClientSession chờ retry-after rồi kết nối lại
+            raise session.ServerBusy.parse(response.split("\r\n"))
+        fields = response.split("|")
+        data_port, codec, token = fields[:3]
+        self.codec = codec or None
+        self.token = token
+        self.data_port = int(data_port)
+        if len(fields) >= 6:
+            self.MAX_PIPES, self.MIN_BLOCK_SIZE, self.MAX_BLOCK_SIZE = (int(f) for f in fields[3:6])
+        else:
+            # Server cũ chỉ có đúng PIPES chỗ cho pipe
+            self.MAX_PIPES = self.PIPES
+        self.features = frozenset(fields[6].split(",")) if len(fields) > 6 else frozenset()
+        if not connect:
+            return []
+        if self.codec:
+            logger.info(f"Negotiated compression: {self.codec}")
 
         # --------------------------------------------------------------
 
-        print(utils.setTextColor("green"), end="")
-        print(
-            f"[STATUS] We will connect to 4 streams of data at {self.HOST} by requesting on port {master_port} on the server"
+        logger.info(
+            f"We will connect to {self.PIPES} streams of data at {self.HOST} on data port {data_port} (session {token})"
         )
-        print(utils.setTextColor("white"), end="")
 
+        socket_list = self.connect_pipes(range(self.PIPES))
+        logger.info(f"Connected to server {self.HOST} with {self.PIPES} pipes")
+        return socket_list
+
+    def connect_pipes(self, indices):
+        """
+        Connect pipes `indices` of the current session to the data port.
+        """
         # ----------------------------------------------------
-        # Connect to master port to create 4 pipe
+        # Connect to the data port to create the pipes
         # ----------------------------------------------------
         socket_list = []
-        for i in range(self.PIPES):
+        for i in indices:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.HOST, int(master_port)))
+            # Đặt buffer trước connect() để window scale của pipe được thương lượng đúng
+            self.tune_socket(sock, "data")
+            sock.connect((self.HOST, self.data_port))
+            hello = f"PIPE\r\n{self.token}\r\n{i}".ljust(self.MESSAGE_SIZE)
+            sock.sendall(hello.encode())
             socket_list.append(sock)
-        print(f"[STATUS] Connected to server {self.HOST} on 4 new ports")
         return socket_list
 
+    def tune_socket(self, sock, role):
+        sockopts.apply(sock, role, self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
+
     # ============================================================================================================
-    def receive_chunk(self, needed_files, cur_index, main_socket, socket_list):
+    def needs_update(self, file_info, client_session):
         """
-        Receive a chunk from the server.
+        The file was downloaded before but the server copy differs: it lists
+        another size, or the same size with another SHA-256 (HASH). The
+        server digest is kept in file_info for link_from_store/verify_file.
         """
-        # Send the chunk message which client want to download from server
-        cur_file_size = needed_files[cur_index]["size_bytes"]
-
-        self.CHUNK_SIZE = math.ceil(cur_file_size / self.PIPES)
+        filename = file_info["name"]
+        path = os.path.join(self.DOWNLOAD_DIR, filename)
+        if not os.path.isfile(path):
+            return False
+        if os.path.getsize(path) != file_info["size_bytes"]:
+            return True
+        if "hash" not in self.features:
+            # Server cũ không có HASH: chỉ so được kích thước
+            return False
+        try:
+            file_info["sha256"] = client_session.file_hash(filename)[1]
+        except (OSError, ConnectionError, ValueError) as e:
+            logger.warning(f"Could not get the hash of {filename}, keeping the local copy: {e}")
+            return False
+        if self.digests is None:
+            self.digests = contentstore.DigestCache()
+        with tracing.span("verify", file=filename):
+            changed = self.digests.digest(path) != file_info["sha256"]
+        if changed:
+            logger.info(f"{filename} changed on the server (same size, another SHA-256)")
+        return changed
+
+    def sync_file(self, needed_files, cur_index, client_session):
+        """
+        Update an outdated local copy with the delta from the server.
+        Returns False when the caller should download the whole file instead.
+        """
+        filename = needed_files[cur_index]["name"]
+        path = os.path.join(os.getcwd(), self.DOWNLOAD_DIR, filename)
+        part_path = path + ".part"
+
+        self.last_transfer = {
+            "file": filename,
+            "bytes": needed_files[cur_index]["size_bytes"],
+            "started": time.perf_counter(),
+            "first_byte": None,
+            "finished": None,
+        }
+        try:
+            with tracing.span("delta", file=filename):
+                copied, literal = client_session.sync_file(filename, path, part_path)
+        except (OSError, ConnectionError, ValueError) as e:
+            logger.error(f"Delta sync of {filename} failed ({e}), downloading the whole file")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            if isinstance(e, (OSError, ConnectionError)):
+                # Luồng lệnh trên control connection bị cắt giữa chừng: mở lại phiên
+                client_session.reconnect()
+            return False
+
+        os.replace(part_path, path)
+        self.last_transfer["finished"] = time.perf_counter()
+        logger.info(f"Updated {filename}: {literal} bytes received, {copied} bytes reused from the old copy")
+        return True
+
+    def receive_delta(self, main_socket, filename, path, part_path):
+        """
+        Send the signatures of the local copy with DELTA and rebuild the
+        server version into part_path from the reply (see delta.py).
+        """
+        local_size = os.path.getsize(path)
+        block_size = delta.block_size_for(local_size)
+        with tracing.span("signatures", file=filename):
+            signature_blob = delta.signatures(path, block_size)
 
-        number_of_chunk = math.ceil(cur_file_size / self.CHUNK_SIZE)
+        message = f"DELTA\r\n{filename}\r\n{local_size}\r\n{block_size}\r\n{len(signature_blob)}"
+        main_socket.sendall(message.ljust(self.MESSAGE_SIZE).encode() + signature_blob)
 
-        threads_list = []
+        response = utils.recv_exact(main_socket, self.MESSAGE_SIZE).decode().strip().split("\r\n")
+        if response[0] != "DELTA":
+            raise ValueError(f"Server refused the delta: {' '.join(response[1:])}")
+        return delta.apply(path, lambda n: utils.recv_exact(main_socket, n), part_path)
 
-        # ============================================================
-        #                XỬ LÝ GỬI CÁC CHUNK DỮ LIỆU
-        # ============================================================
-        # lặp qua các chunk để gửi các request đến server và đăng ký id
-        for chunk in range(number_of_chunk):
-
-            start_offset = chunk * self.CHUNK_SIZE
-            end_offset = (chunk + 1) * self.CHUNK_SIZE - 1
-
-            if end_offset > cur_file_size - 1:
-                end_offset = cur_file_size - 1
-            # ------------------------- Send message to server -------------------------
-            """
-                Cấu trúc message:
-                - Tên file cần tải hiện tại
-                - kích thước file
-                - Offset bắt đầu
-                - Offset kết thúc
-            """
-            message = [
-                needed_files[cur_index]["name"],
-                cur_file_size,
-                start_offset,
-                end_offset,
-            ]
-
-            print(f"[REQUEST] Requesting chunk {message}")
-
-            # Make the message len MESSAGE_SIZE
-            # GIAO THỨC GET
-            message = ("GET\r\n" + str(message)).ljust(self.MESSAGE_SIZE)
-
-            # GỬI REQUEST
-            main_socket.sendall(message.encode())
-
-            # -----------------------------------------------------------
-
-            # Receive the chunk from server through 4 pipes
-            # Xác định pipes
-            id = start_offset // self.CHUNK_SIZE % self.PIPES  # ???????????
-
-            # đăng ký và thêm vào danh sách các luồng
-            t = threading.Thread(
-                target=self.handle_receive_chunk, args=(id, socket_list)
-            )
+    # ============================================================================================================
+    def get_store(self):
+        if self.store is None and self.STORE_DIR:
+            self.store = contentstore.ContentStore(self.STORE_DIR, self.STORE_MAX_BYTES)
+        return self.store
 
-            # bắt đầu tiến trình và ghi các chunk dữ liệu vào filename{id}
-            t.start()
-            threads_list.append(t)
+    def link_from_store(self, file_info, client_session):
+        """
+        Ask the server for the SHA-256 of the file (kept in file_info for
+        add_to_store) and link the content from the store when it is there.
+        Returns True when the file is in place without a transfer.
+        """
+        store = self.get_store()
+        if store is None or "hash" not in self.features:
+            return False
+        filename = file_info["name"]
+        if file_info.get("sha256") is not None:
+            # needs_update đã hỏi HASH cho file này
+            size, digest = file_info["size_bytes"], file_info["sha256"]
+        else:
+            try:
+                size, digest = client_session.file_hash(filename)
+            except (OSError, ConnectionError, ValueError) as e:
+                logger.error(f"Could not get the hash of {filename}: {e}")
+                return False
+            file_info["sha256"] = digest
+
+        path = os.path.join(os.getcwd(), self.DOWNLOAD_DIR, filename)
+        try:
+            if not store.link(digest, path, size):
+                return False
+        except OSError as e:
+            logger.error(f"Could not take {filename} from the content store: {e}")
+            return False
+        logger.info(f"{filename} is already in the content store, nothing to download")
+        return True
+
+    def add_to_store(self, file_info, verified=False):
+        store = self.get_store()
+        digest = file_info.get("sha256")
+        if store is None or digest is None:
+            return
+        path = os.path.join(os.getcwd(), self.DOWNLOAD_DIR, file_info["name"])
+        try:
+            with tracing.span("store.add", file=file_info["name"]):
+                store.add(digest, path, verified)
+        except OSError as e:
+            logger.error(f"Could not add {file_info['name']} to the content store: {e}")
 
-        # KHỞI CHẠY CÁC LUỒNG
-        for t in threads_list:
-            t.join()
-        print("[STATUS] All chunks has been received: 100%")
+    def receive_hash(self, main_socket, filename):
+        """
+        HASH\r\n<name> -> (size, sha256) of the server copy.
+        """
+        main_socket.sendall(f"HASH\r\n{filename}".ljust(self.MESSAGE_SIZE).encode())
+        response = utils.recv_exact(main_socket, self.MESSAGE_SIZE).decode().strip().split("\r\n")
+        if response[0] != "HASH":
+            raise ValueError(" ".join(response[1:]) or "no hash")
+        return int(response[1]), response[2]
 
-        # Concatenate those files
-        for id in range(self.PIPES):
-            received_dir = os.path.join(os.getcwd(), "files_received")
-            os.makedirs(received_dir, exist_ok=True)  # Tạo thư mục nếu chưa tồn
+    # ============================================================================================================
+    def receive_chunk(self, needed_files, cur_index, client_session, urgent=None):
+        """
+        Receive a file from the server through the session pipes.
+
+        Blocks are cut from the remaining byte ranges whenever a pipe has
+        room and written in place into "<name>.part". With AUTOTUNE the
+        number of pipes and the block size follow the autotuner. Blocks
+        that completed survive a reconnect and only the unfinished ranges
+        are requested again. With MIRRORS the ranges are first shared among
+        all servers that hold the same file (mirrors.py).
+
+        Returns False when VERIFY_FILE is on and the file does not match the
+        server SHA-256; the previous copy is then left untouched. Raises
+        DownloadFailed once the file failed FILE_RETRIES times (see
+        count_failure), reconnects for connection errors are not counted.
+
+        urgent(name, bytes_left) is asked between blocks whether a more
+        urgent file should go first (scheduler.py). The transfer then stops
+        once the blocks in flight arrive, the part file and the missing
+        ranges are kept in `paused` for the next call, and None is returned.
+        """
+        cur_file_size = needed_files[cur_index]["size_bytes"]
+        filename = needed_files[cur_index]["name"]
+        tuner = self.get_autotuner()
 
-            path = os.path.join(received_dir, needed_files[cur_index]["name"])
+        received_dir = os.path.join(os.getcwd(), self.DOWNLOAD_DIR)
+        os.makedirs(received_dir, exist_ok=True)  # Tạo thư mục nếu chưa tồn tại
 
-            with open(path, "ab") as file:
+        path = os.path.join(received_dir, filename)
+        part_path = path + ".part"
 
-                chunk_path = os.path.join(
-                    received_dir, f"{needed_files[cur_index]['name']}_{id}"
+        paused = self.paused.pop(filename, None) if self.paused else None
+        if paused is not None and paused[0] == cur_file_size and os.path.exists(part_path):
+            # Tiếp tục file bị tạm dừng: chỉ tải các khoảng còn thiếu
+            remaining = paused[1]
+            logger.info(f"Resuming {filename}, {sum(end - start + 1 for start, end in remaining)} bytes left")
+        else:
+            # Cấp phát trước file tạm để các pipe ghi thẳng vào đúng offset
+            with open(part_path, "wb") as file:
+                file.truncate(cur_file_size)
+            # Các khoảng byte (start, end) chưa nhận
+            remaining = [(0, cur_file_size - 1)] if cur_file_size else []
+
+        self.last_transfer = {
+            "file": filename,
+            "bytes": cur_file_size,
+            "started": time.perf_counter(),
+            "first_byte": None,
+            "finished": None,
+        }
+
+        if self.mirrors is not None and remaining:
+            # Phần các mirror không tải được thì tải tiếp từ server chính bên dưới
+            remaining = self.mirrors.download(needed_files[cur_index], remaining, part_path)
+
+        preempt = None
+        if urgent is not None:
+
+            def preempt():
+                return urgent(filename, sum(end - start + 1 for start, end in remaining))
+
+        while remaining:
+            try:
+                self.request_blocks(
+                    client_session, filename, cur_file_size, remaining, part_path, tuner, preempt
                 )
-                if os.path.exists(chunk_path):
-                    with open(chunk_path, "rb") as chunk_file:
-                        file.write(chunk_file.read())
-                    os.remove(chunk_path)
-                else:
-                    print(f"[ERROR] Chunk file not found: {chunk_path}")
-                # with open(f"{path}_{id}", "rb") as chunk_file:
+            except (OSError, ConnectionError, ValueError) as e:
+                if isinstance(e, ValueError):
+                    # Dữ liệu hỏng chứ không phải mất kết nối: kết nối lại có thể không giúp được
+                    self.count_failure(filename, e)
+                left = sum(end - start + 1 for start, end in remaining)
+                logger.error(
+                    f"Transfer of {filename} interrupted ({e}), {left} bytes left. Reconnecting..."
+                )
+                client_session.reconnect()
+            else:
+                if remaining:
+                    # Nhường pipe cho file gấp hơn: giữ file tạm và các khoảng còn thiếu
+                    self.paused[filename] = (cur_file_size, remaining)
+                    self.scheduler.pause(filename)
+                    return None
+
+        logger.info("All chunks has been received: 100%")
+        # Thời gian truyền không tính bước kiểm tra SHA-256 của cả file
+        self.last_transfer["finished"] = time.perf_counter()
+
+        if self.VERIFY_FILE and not self.verify_file(needed_files[cur_index], part_path, client_session):
+            os.remove(part_path)
+            self.count_failure(filename, "SHA-256 mismatch")
+            return False
+
+        # Các block đã được ghi thẳng vào file tạm: merge chỉ còn là đổi tên
+        with tracing.span("merge", file=filename):
+            os.replace(part_path, path)
+        if self.failures:
+            self.failures.pop(filename, None)
+        return True
+
+    def count_failure(self, filename, reason):
+        """
+        Count one failed attempt at `filename` (blocks corrupted BLOCK_RETRIES
+        times, wrong SHA-256). The count survives reconnects and re-downloads;
+        raises DownloadFailed at FILE_RETRIES.
+        """
+        if self.failures is None:
+            self.failures = {}
+        failures = self.failures[filename] = self.failures.get(filename, 0) + 1
+        if failures >= self.FILE_RETRIES:
+            del self.failures[filename]
+            raise DownloadFailed(f"{filename} failed {failures} times, last: {reason}")
+
+    def give_up(self, filename, error):
+        """
+        Skip a file that kept failing until the catalog reports a new version.
+        """
+        logger.error(f"Giving up on {filename}: {error}", extra={"tag": "FAIL"})
+        part_path = os.path.join(os.getcwd(), self.DOWNLOAD_DIR, filename + ".part")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if self.paused:
+            self.paused.pop(filename, None)
+        if self.failed_files is not None:
+            self.failed_files.add(filename)
+        if self.scheduler is not None:
+            self.scheduler.discard(filename)
+
+    def verify_file(self, file_info, part_path, client_session):
+        """
+        Compare the downloaded file with the server SHA-256 (kept in
+        file_info for add_to_store). True when it matches or the server
+        has no HASH.
+        """
+        filename = file_info["name"]
+        if file_info.get("sha256") is None:
+            if "hash" not in self.features:
+                return True
+            try:
+                file_info["sha256"] = client_session.file_hash(filename)[1]
+            except (OSError, ConnectionError, ValueError) as e:
+                logger.warning(f"Could not get the hash of {filename}, not verified: {e}")
+                return True
+        with tracing.span("verify", file=filename):
+            digest = contentstore.file_digest(part_path)
+        if digest != file_info["sha256"]:
+            logger.error(
+                f"{filename} does not match the server SHA-256 ({digest} != {file_info['sha256']})",
+                extra={"tag": "FAIL"},
+            )
+            del file_info["sha256"]
+            return False
+        return True
 
-                #     # đọc dữ liệu từ chunk_file vừa mở
-                #     # ghi dữ liệu vừa đọc vào cuối file đã mở
+    def get_autotuner(self):
+        """
+        Autotuner of this client, created once the server limits are known;
+        None when AUTOTUNE is off.
+        """
+        if not self.AUTOTUNE:
+            return None
+        if self.autotuner is None:
+            self.autotuner = autotune.Autotuner(
+                self.PIPES,
+                self.BLOCK_SIZE or self.START_BLOCK_SIZE,
+                self.MAX_PIPES,
+                self.MIN_BLOCK_SIZE,
+                self.MAX_BLOCK_SIZE,
+                tune_block=not self.BLOCK_SIZE,
+            )
+        return self.autotuner
+
+    def get_scheduler(self, input_file):
+        if self.scheduler is None:
+            self.scheduler = scheduler.Scheduler(self.SCHEDULE, input_file)
+        return self.scheduler
 
-                #     file.write(chunk_file.read())
+    def block_settings(self, file_size, tuner):
+        """
+        (pipes, block size) for the next blocks of a file.
+        """
+        if tuner is None:
+            return self.PIPES, self.BLOCK_SIZE or max(1, math.ceil(file_size / self.PIPES))
+        pipes, block_size = tuner.settings()
+        # File nhỏ: chia đủ để các pipe cùng chạy, nhưng không nhỏ hơn MIN_BLOCK_SIZE
+        block_size = min(block_size, max(self.MIN_BLOCK_SIZE, math.ceil(file_size / pipes)))
+        return pipes, block_size
+
+    def request_blocks(
+        self, client_session, filename, file_size, remaining, part_path, tuner, preempt=None
+    ):
+        """
+        Keep PIPE_DEPTH blocks in flight on every active pipe until
+        `remaining` is empty and the pipes delivered everything.
+        Raises ConnectionError if any pipe failed, ValueError if the data was
+        bad (a block corrupted BLOCK_RETRIES times, an unexpected block);
+        undelivered ranges are put back into `remaining` so the caller can
+        reconnect and resume.
+        Once preempt() returns True no new block is requested: the call
+        returns when the blocks in flight arrived, `remaining` not empty.
+        """
+        # ============================================================
+        #                XỬ LÝ GỬI CÁC CHUNK DỮ LIỆU
+        # ============================================================
+        condition = threading.Condition()
+        in_flight = {}  # pipe id -> deque các block (start, end) theo thứ tự gửi
+        state = {
+            "done": False,
+            "received": file_size - sum(e - s + 1 for s, e in remaining),
+            "failed": [],  # block sai CRC, chờ được yêu cầu lại
+            "retries": {},  # (start, end) -> số lần sai CRC liên tiếp
+        }
+        errors = []
+        threads = {}
+        pipes = self.PIPES
+        checksum = self.VERIFY_BLOCKS and "crc" in self.features
+        pausing = False
+
+        def ready():
+            if errors or state["failed"] or not any(in_flight.values()):
+                return True
+            return bool(remaining) and not pausing and any(
+                len(in_flight.get(id, ())) < self.PIPE_DEPTH for id in range(pipes)
+            )
 
-                # # xóa chunk_file vừa tạo
-                # os.remove(f"{path}_{id}")
+        if tuner is not None:
+            tuner.start()
+        try:
+            while True:
+                with condition:
+                    if state["failed"]:
+                        remaining.extend(state["failed"])
+                        remaining.sort()
+                        state["failed"].clear()
+                    if errors or ((pausing or not remaining) and not any(in_flight.values())):
+                        break
+                    pipes, block_size = self.block_settings(file_size, tuner)
+                    self.CHUNK_SIZE = block_size
+                if preempt is not None and not pausing and remaining and preempt():
+                    pausing = True
+                client_session.ensure_pipes(pipes)
+
+                requests = []
+                with condition:
+                    for id in range(pipes):
+                        expected = in_flight.setdefault(id, collections.deque())
+                        while remaining and not pausing and len(expected) < self.PIPE_DEPTH:
+                            start, end = remaining[0]
+                            block_end = min(end, start + block_size - 1)
+                            if block_end == end:
+                                remaining.pop(0)
+                            else:
+                                remaining[0] = (block_end + 1, end)
+                            expected.append((start, block_end))
+                            requests.append((id, start, block_end))
+
+                        # Luồng nhận phải chạy trước để server không bị chặn khi gửi
+                        if expected and id not in threads:
+                            threads[id] = threading.Thread(
+                                target=self.handle_receive_chunk,
+                                args=(
+                                    id,
+                                    client_session.socket_list[id],
+                                    expected,
+                                    part_path,
+                                    filename,
+                                    file_size,
+                                    condition,
+                                    state,
+                                    errors,
+                                    tuner,
+                                ),
+                            )
+                            threads[id].start()
+
+                for id, start_offset, end_offset in requests:
+                    # ------------------------- Send message to server -------------------------
+                    """
+                        Cấu trúc message:
+                        - Tên file cần tải hiện tại
+                        - kích thước file
+                        - Offset bắt đầu
+                        - Offset kết thúc
+                        - Id của pipe sẽ nhận chunk
+                        - "crc": xin CRC-32 của block trong header (server có "crc")
+                    """
+                    message = [filename, file_size, start_offset, end_offset, id]
+                    if checksum:
+                        message.append("crc")
+
+                    chunk_log.debug("request", "Requesting chunk %s", message, tag="REQUEST")
+
+                    # GIAO THỨC GET
+                    client_session.send_request("GET\r\n" + str(message))
+
+                # Chờ tới khi có pipe còn chỗ (hoặc hết epoch để autotuner đánh giá)
+                with condition:
+                    condition.wait_for(ready, timeout=tuner.EPOCH if tuner else None)
+                if tuner is not None:
+                    tuner.tick()
+        except OSError as e:
+            with condition:
+                errors.append(e)
+        finally:
+            if tuner is not None:
+                tuner.stop()
+            with condition:
+                state["done"] = True
+                condition.notify_all()
+            if errors:
+                # Đóng pipe để các luồng nhận thoát ra thay vì chờ hết timeout
+                client_session.close_sockets()
+            for t in threads.values():
+                t.join()
+            # Block chưa nhận được trả lại để tải tiếp sau khi kết nối lại
+            for expected in in_flight.values():
+                remaining.extend(expected)
+                expected.clear()
+            remaining.extend(state["failed"])
+            remaining.sort()
+
+        if errors:
+            if isinstance(errors[0], ValueError):
+                raise errors[0]
+            raise ConnectionError(errors[0])
 
     # ============================================================
     #                XỬ LÝ NHẬN DỮ LIỆU TỪ CÁC CHUNK
     # ============================================================
     def handle_receive_chunk(
-        self,
-        id,
-        socket_list,
+        self, id, sock, expected, part_path, filename, file_size, condition, state, errors, tuner
     ):
-        # Khởi tạo path và thư mục nhận dữ liệu
-        received_dir = os.path.join(os.getcwd(), "files_received")
-        os.makedirs(received_dir, exist_ok=True)  # Tạo thư mục nếu chưa tồn tại
-        # -----------------------------------------------------
-
-        data = socket_list[id].recv(
-            self.MESSAGE_SIZE + self.DELIMETER_SIZE + self.CHUNK_SIZE
-        )
-
-        if data:
-            # giải mã message
-            message, chunk_data = data.split(b"\r\n", 1)
-            filename, file_size, start_offset, end_offset = eval(message.strip())
-
-            # Progress bar
-            print(
-                f"Downloading file {filename} part {id} .... {int(utils.count_files_with_prefix(received_dir, filename) / self.PIPES * 100)}%"
-            )
-
-            print(f"[RESPOND] Received chunk {message.strip()}")
-
-            # ---------------------------------------------------------------------
-            # Thêm các tệp vào folder disc
-            with open(os.path.join(received_dir, f"{filename}_{id}"), "wb") as file:
-                file.write(chunk_data)
+        """
+        Receive the blocks sent on pipe `id` (in request order, as queued in
+        `expected`) and write each one at its offset in the part file.
+        """
+        try:
+            with open(part_path, "r+b") as file:
+                while True:
+                    with condition:
+                        condition.wait_for(lambda: expected or state["done"])
+                        if not expected:
+                            return
+                        expected_start, expected_end = expected[0]
+
+                    with tracing.span("recv", pipe=id):
+                        message = utils.recv_line(sock, self.MESSAGE_SIZE)
+                    if self.last_transfer["first_byte"] is None:
+                        with condition:
+                            if self.last_transfer["first_byte"] is None:
+                                self.last_transfer["first_byte"] = time.perf_counter()
+                    with tracing.span("parse"):
+                        header = eval(message.strip())
+                    start_offset, end_offset = header[2:4]
+
+                    if (start_offset, end_offset) != (expected_start, expected_end):
+                        raise ValueError(
+                            f"Unexpected chunk {start_offset}-{end_offset} on pipe {id}"
+                        )
+
+                    if len(header) >= 6:
+                        # Header có nén: [name, size, start, end, codec, payload_len[, crc32]]
+                        used_codec, payload_len = header[4], header[5]
+                        with tracing.span("recv", pipe=id, bytes=payload_len):
+                            payload = utils.recv_exact(sock, payload_len)
+                        with tracing.span("decompress", codec=used_codec):
+                            chunk_data = compression.decompress(used_codec, payload)
+                    else:
+                        with tracing.span("recv", pipe=id, bytes=end_offset - start_offset + 1):
+                            chunk_data = utils.recv_exact(sock, end_offset - start_offset + 1)
+
+                    if len(header) > 6:
+                        with tracing.span("checksum"):
+                            valid = zlib.crc32(chunk_data) == header[6]
+                        if not valid:
+                            # Luồng dữ liệu vẫn đúng vị trí: chỉ tải lại block này
+                            self.refetch_block(id, expected, condition, state)
+                            continue
+
+                    # ---------------------------------------------------------------------
+                    # Ghi chunk vào đúng vị trí trong file tạm
+                    with tracing.span("disk.write", bytes=len(chunk_data)):
+                        file.seek(start_offset)
+                        file.write(chunk_data)
+
+                    if tuner is not None:
+                        tuner.record(len(chunk_data))
+                    with condition:
+                        expected.popleft()
+                        state["retries"].pop((start_offset, end_offset), None)
+                        state["received"] += len(chunk_data)
+                        done = int(state["received"] * 100 / file_size)
+                        condition.notify_all()
+
+                    # Progress bar
+                    chunk_log.debug(
+                        ("progress", id), "Downloading file %s part %s .... %s%%", filename, id, done
+                    )
+                    chunk_log.debug("respond", "Received chunk %s", message.strip(), tag="RESPOND")
+        except (OSError, ConnectionError, ValueError) as e:
+            with condition:
+                errors.append(e)
+                condition.notify_all()
 
-            # ---------------------------------------------------------------------
+    def refetch_block(self, id, expected, condition, state):
+        """
+        Queue the block at the head of `expected` to be requested again after
+        a CRC mismatch; raises ValueError once it failed BLOCK_RETRIES times.
+        """
+        with condition:
+            block = expected.popleft()
+            retries = state["retries"][block] = state["retries"].get(block, 0) + 1
+            state["failed"].append(block)
+            condition.notify_all()
+        logger.warning(f"Block {block[0]}-{block[1]} failed its CRC check on pipe {id} ({retries}x), fetching it again")
+        if retries >= self.BLOCK_RETRIES:
+            raise ValueError(f"Block {block[0]}-{block[1]} corrupted {retries} times")
 
     def check_file_integrity(self, cur_index, needed_files, received_files):
 
-        received_dir = os.path.join(os.getcwd(), "files_received")
+        received_dir = os.path.join(os.getcwd(), self.DOWNLOAD_DIR)
         path = os.path.join(received_dir, needed_files[cur_index]["name"])
 
         if utils.get_file_size(path) == needed_files[cur_index]["size_bytes"]:
-            print(utils.setTextColor("green"), end="")
-            print(
-                f"[SUCCESS] File {needed_files[cur_index]} has been downloaded successfully"
+            logger.info(
+                f"File {needed_files[cur_index]} has been downloaded successfully",
+                extra={"tag": "SUCCESS"},
             )
-            print(utils.setTextColor("white"), end="")
             received_files.append(needed_files[cur_index]["name"])
+            if self.scheduler is not None:
+                self.scheduler.finish(needed_files[cur_index]["name"])
             return 1
         else:
-            print(utils.setTextColor("green"), end="")
-            print(
-                f"[FAIL] File {needed_files[cur_index]} has been downloaded unsuccessfully"
+            logger.error(
+                f"File {needed_files[cur_index]} has been downloaded unsuccessfully",
+                extra={"tag": "FAIL"},
             )
-            print(
-                f"[DETAIL] Expected file size: {needed_files[cur_index]['size_bytes']} bytes"
+            logger.error(
+                f"Expected file size: {needed_files[cur_index]['size_bytes']} bytes",
+                extra={"tag": "DETAIL"},
             )
-            print(
-                f"[DETAIL] Received file size: {utils.get_file_size(needed_files[cur_index]['name'])} bytes"
+            logger.error(
+                f"Received file size: {utils.get_file_size(needed_files[cur_index]['name'])} bytes",
+                extra={"tag": "DETAIL"},
             )
-            print(utils.setTextColor("red"), end="")
-            print(f"id: {cur_index} bytes")
-            print(utils.setTextColor("white"), end="")
+            logger.error(f"id: {cur_index} bytes", extra={"tag": "DETAIL"})
             return 0
 
     # ============================================================================================================
@@ -377,9 +1000,7 @@ class SocketClient:
         Confirm the download current status. (file after reload)
 
         """
-        print(utils.setTextColor("green"), end="")
-        print(f"Downloads successfully {num_downloaded_file}/{num_needed_file} files")
-        print(utils.setTextColor("white"), end="")
+        logger.info(f"Downloads successfully {num_downloaded_file}/{num_needed_file} files")
 
     # ============================================================================================================
 
@@ -392,39 +1013,37 @@ class SocketClient:
             received_files (list): A list of file names already received.
 
         Returns:
-            list: A list of dictionaries with keys 'name', 'size', and 'size_bytes'.
+            list: A list of dictionaries with keys 'name', 'size', and 'size_bytes',
+            plus 'priority' and 'deadline' when the line has them (see scheduler.py).
         """
         data = []
 
         try:
-            with open(file_path, "r+") as file:
-                for line in file:
-                    line = line.strip()
-                    if line:
-                        with open("receiveList.txt", "r+") as recvfile:
-                            for recvline in recvfile:
-                                if recvline:
-                                    parts = recvline.split()
-                                    # Split the line into components
-                                    if len(parts) == 2:
-                                        name, size = parts
-
-                                        # Parse size in bytes
-                                        size_bytes = int(size)
-
-                                        # Check if the file has already been received
-                                        if name not in received_files and name == line:
-                                            # Append the data as a dictionary
-                                            data.append(
-                                                {
-                                                    "name": name,
-                                                    "size": size,
-                                                    "size_bytes": size_bytes,
-                                                }
-                                            )
+            for line, options in self.get_scheduler(file_path).read_input():
+                if line:
+                    with open("receiveList.txt", "r+") as recvfile:
+                        for recvline in recvfile:
+                            if recvline:
+                                parts = recvline.split()
+                                # Split the line into components
+                                if len(parts) == 2:
+                                    name, size = parts
+
+                                    # Parse size in bytes
+                                    size_bytes = int(size)
+
+                                    # Check if the file has already been received
+                                    if name not in received_files and name == line:
+                                        # Append the data as a dictionary
+                                        data.append(
+                                            {
+                                                "name": name,
+                                                "size": size,
+                                                "size_bytes": size_bytes,
+                                                **options,
+                                            }
+                                        )
         except Exception as e:
-            print(utils.setTextColor("red"), end="")
-            print(f"[ERROR] An error occurred: {e}")
-            print(utils.setTextColor("white"), end="")
+            logger.error(f"An error occurred: {e}")
 
         return data
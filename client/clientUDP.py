@@ -1,12 +1,36 @@
 import socket
 import os
+import math
 import zlib
+import base64
+import secrets
 import threading
+import logging
+import compression
+import contentstore
+import delta
+import log
+import mirrors
+import multiplex
+import scheduler
+import session
+import sockopts
+import tracing
 import time
 from tqdm import tqdm
 
+logger = log.get_logger(__name__)
+
 
 class SocketClientUDP:
+    # Số datagram DSIG gửi đi cùng lúc khi tải chữ ký lên server
+    DELTA_WINDOW = 16
+    DELTA_RETRIES = 10
+    # Số lần timeout liên tiếp trước khi luồng chuyển sang mirror khác
+    FAILOVER_TIMEOUTS = 4
+    # Gia hạn đăng ký SUBSCRIBE (server giữ 60 giây)
+    SUBSCRIBE_RENEW = 20
+
     # *********************************************************************************************** #
     """============================================================
         args:
@@ -17,6 +41,17 @@ class SocketClientUDP:
             BUFFER_SIZE: thông tin nhận được
             TIMEOUT: thời gian chờ ACK
             PIPE: số thread
+            SOCKET_PROFILE: profile tuỳ chỉnh socket (os, lan, wan-high-bdp, loopback)
+            SOCKET_OPTIONS: option ghi đè theo role, vd {"datagram": {"rcvbuf": 8388608}}
+            DELTA_SYNC: file đã có nhưng khác bản trên server (kích thước hoặc SHA-256) thì chỉ tải phần
+                thay đổi, False thì tải lại cả file
+            STORE_DIR: content store dùng chung với client TCP, None = tắt
+            STORE_MAX_BYTES: dung lượng tối đa của content store
+            SUBSCRIBE: nhận thay đổi của catalog do server đẩy về thay vì hỏi lại kích thước mỗi vòng
+            MIRRORS: server khác có cùng resource ("host" hoặc "host:port"), các luồng được chia cho mọi nguồn
+            MULTIPLEX: tải các file mới cùng lúc trên 1 socket (multiplex.py) thay vì lần lượt từng file
+            OFFLOAD: nhận các loạt datagram của stream bằng UDP GRO (Linux), tự tắt nếu không hỗ trợ
+            SCHEDULE: thứ tự tải các file trong input: fifo, smallest, priority, deadline (scheduler.py)
     ============================================================"""
 
     def __init__(
@@ -28,6 +63,16 @@ class SocketClientUDP:
         BUFFER_SIZE=512,
         TIMEOUT=5,
         PIPE=1,
+        SOCKET_PROFILE=sockopts.DEFAULT_PROFILE,
+        SOCKET_OPTIONS=None,
+        DELTA_SYNC=True,
+        STORE_DIR=contentstore.DEFAULT_DIR,
+        STORE_MAX_BYTES=contentstore.DEFAULT_MAX_BYTES,
+        SUBSCRIBE=True,
+        MIRRORS=None,
+        MULTIPLEX=True,
+        OFFLOAD=False,
+        SCHEDULE=scheduler.DEFAULT_POLICY,
     ):
         self.HOST = HOST
         self.PORT = PORT
@@ -36,7 +81,18 @@ class SocketClientUDP:
         self.BUFFER_SIZE = BUFFER_SIZE
         self.TIMEOUT = TIMEOUT
         self.PIPE = PIPE
+        sockopts.validate(SOCKET_PROFILE, SOCKET_OPTIONS)
+        self.SOCKET_PROFILE = SOCKET_PROFILE
+        self.SOCKET_OPTIONS = SOCKET_OPTIONS
+        self.DELTA_SYNC = DELTA_SYNC
         os.makedirs(self.DOWNLOAD_FOLDER, exist_ok=True)
+        self.store = contentstore.ContentStore(STORE_DIR, STORE_MAX_BYTES) if STORE_DIR else None
+        self.digests = contentstore.DigestCache()  # SHA-256 của các file đã tải (update_file)
+        self.MIRRORS = [mirrors.parse_address(mirror, PORT) for mirror in MIRRORS or ()]
+        self.SUBSCRIBE = SUBSCRIBE
+        self.MULTIPLEX = MULTIPLEX
+        self.OFFLOAD = OFFLOAD
+        self.scheduler = scheduler.Scheduler(SCHEDULE, INPUT_FILE)
 
         self.CODE = {
             "LIST": "LIST",
@@ -44,8 +100,22 @@ class SocketClientUDP:
             "SIZE": "SIZE",
             "CONNECT": "CONNECT",
             "RESEND": "RESEND",
+            "PING": "PING",
+            "DSIG": "DSIG",
+            "HASH": "HASH",
+            "SUBSCRIBE": "SUBSCRIBE",
         }
         self.lock = threading.Lock()  # Đảm bảo thread an toàn
+        self.codec = None  # codec nén thương lượng lúc CONNECT
+        self.last_transfer = None  # thống kê thời gian của lần tải gần nhất
+        self.transfers = {}  # thống kê từng file của lần tải ghép kênh gần nhất
+
+        # Thay đổi catalog nhận qua SUBSCRIBE (luồng follow_catalog)
+        self.catalog_changed = threading.Event()
+        self.catalog_modified = set()  # tên có nội dung đổi hoặc bị xoá
+        self.catalog_reset = False
+        self.subscribed = False
+        self.stopped = threading.Event()
 
     # *********************************************************************************************** #
     """ ============================================================
@@ -65,19 +135,16 @@ class SocketClientUDP:
     """ ============================================================
         Hàm lấy các file muốn tải 
 
-        Args:
-            file_path: Đường dẫn file input 
-
         Returns:
-            file_list: Danh sách tập tin tại file input dưới dạng list
+            entries: Các dòng của file input dưới dạng list dict {"name", và
+            "priority"/"deadline" nếu dòng có ghi (scheduler.py)}
     ============================================================ """
 
     def get_input_file_list(self):
         try:
-            with open(self.INPUT_FILE, "r") as f:
-                return [line.strip() for line in f if line.strip()]
+            return [{"name": name, **options} for name, options in self.scheduler.read_input()]
         except FileNotFoundError:
-            print(f"Error: Input file '{self.INPUT_FILE}' not found.")
+            logger.error(f"Input file '{self.INPUT_FILE}' not found.")
             return []
 
     # *********************************************************************************************** #
@@ -99,15 +166,15 @@ class SocketClientUDP:
             response, _ = client_socket.recvfrom(self.BUFFER_SIZE)
             files = response.decode().split("|", 1)[1]
             if files == "NO_FILES":
-                print("No files available on server.")
+                logger.info("No files available on server.")
                 return []
             file_list = files.split(",")
-            print("Available files on server:")
+            logger.info("Available files on server:")
             for file in file_list:
-                print(f"- {file}")
+                logger.info(f"- {file}")
             return file_list
         except socket.timeout:
-            print("Error: Server not responding.")
+            logger.error("Server not responding.")
             return []
 
     # *********************************************************************************************** #
@@ -131,16 +198,16 @@ class SocketClientUDP:
         try:
             response, _ = client_socket.recvfrom(self.BUFFER_SIZE)
             if response.decode() == "EXISTS":
-                print(f"File '{file_name}' exists on server.")
+                logger.info(f"File '{file_name}' exists on server.")
                 return True
             elif response.decode() == "NOT_FOUND":
-                print(f"File '{file_name}' does not exist on server.")
+                logger.info(f"File '{file_name}' does not exist on server.")
                 return False
             else:
-                print("Error: Unexpected response from server.")
+                logger.error("Unexpected response from server.")
                 return False
         except socket.timeout:
-            print("Error: Server not responding.")
+            logger.error("Server not responding.")
             return False
 
     # *********************************************************************************************** #
@@ -157,10 +224,10 @@ class SocketClientUDP:
     def check_file_downloaded(self, file_name):
         file_path = os.path.join(self.DOWNLOAD_FOLDER, file_name)
         if os.path.exists(file_path):
-            print(f"File '{file_name}' already exists in '{self.DOWNLOAD_FOLDER}'.")
+            logger.info(f"File '{file_name}' already exists in '{self.DOWNLOAD_FOLDER}'.")
             return True
         else:
-            print(f"File '{file_name}' does not exist in '{self.DOWNLOAD_FOLDER}'.")
+            logger.info(f"File '{file_name}' does not exist in '{self.DOWNLOAD_FOLDER}'.")
             return False
 
     # *********************************************************************************************** #
@@ -172,31 +239,58 @@ class SocketClientUDP:
             client_socket: socket udp 
             file_name: tên tập tin 
             server_address: Địa_chi server
+            target_path: nơi ghi file (mặc định DOWNLOAD_FOLDER/file_name)
+            use_mirrors: chia các luồng cho cả MIRRORS (tắt với file chỉ server chính có)
     ============================================================ """
 
-    def download_file_parallel(self, client_socket, file_name, server_address):
+    def download_file_parallel(self, client_socket, file_name, server_address, target_path=None, use_mirrors=True):
         # Gửi thông điệp SIZE để nhận về list size
         client_socket.sendto(
             f"{self.CODE['SIZE']}|{file_name}".encode(), server_address
         )
         size_data, _ = client_socket.recvfrom(self.BUFFER_SIZE)
         if not size_data.startswith(b"SIZE|"):
-            print("Error: Unable to fetch file size.")
-            return
+            logger.error("Unable to fetch file size.")
+            return False
 
         # Thể hiện size, file
         total_size = int(size_data.decode().split("|")[1])
-        print(f"Starting download for {file_name}. Total size: {total_size} bytes")
+        logger.info(f"Starting download for {file_name}. Total size: {total_size} bytes")
+
+        # Thời điểm bắt đầu / nhận byte đầu tiên / hoàn tất (dùng cho benchmark)
+        self.last_transfer = {
+            "file": file_name,
+            "bytes": total_size,
+            "started": time.perf_counter(),
+            "first_byte": None,
+            "finished": None,
+        }
 
-        # Tính toán size cho 1 luồng
-        chunk_size = (total_size // self.PIPE) + 1
+        # Các nguồn có cùng file; mỗi nguồn nhận ít nhất 1 luồng
+        sources = [server_address]
+        if use_mirrors and self.MIRRORS:
+            sources = self.sources_for(client_socket, file_name, server_address, total_size)
+        pipes = max(self.PIPE, len(sources))
+
+        # Tính toán size cho 1 luồng, làm tròn lên bội số payload của 1 datagram
+        # để các luồng không tải chồng lên nhau
+        payload_size = self.BUFFER_SIZE - 20
+        chunk_size = math.ceil(math.ceil(total_size / pipes) / payload_size) * payload_size
+        chunk_size = max(chunk_size, payload_size)
         threads = []
-        results = [None] * self.PIPE
+        results = [None] * pipes
 
         # Progress bars cho mỗi luồng
         progress_bars = [
-            tqdm(total=chunk_size, desc=f"Pipe {i+1}", unit="B", unit_scale=True)
-            for i in range(self.PIPE)
+            # Quiet mode (chỉ WARNING trở lên) thì tắt luôn progress bar
+            tqdm(
+                total=chunk_size,
+                desc=f"Pipe {i+1}",
+                unit="B",
+                unit_scale=True,
+                disable=not logger.isEnabledFor(logging.INFO),
+            )
+            for i in range(pipes)
         ]
 
         """ ============================================================
@@ -214,43 +308,87 @@ class SocketClientUDP:
 
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
                 sock.settimeout(self.TIMEOUT)
+                # Buffer nhận lớn để chứa cả đợt datagram server gửi liên tiếp
+                sockopts.apply(sock, "datagram", self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
                 downloaded_data = []
                 seq_num = start_byte // (self.BUFFER_SIZE - 20)
 
+                # codec gửi kèm mỗi GET vì socket của luồng khác địa chỉ với socket CONNECT
+                codec_suffix = f"|{self.codec}" if self.codec else ""
+                # Server mất kết nối -> giãn dần RESEND, khi server trở lại thì tải tiếp từ seq_num
+                backoff = session.Backoff(initial=0.1, maximum=self.TIMEOUT)
+                # Luồng tải từ 1 nguồn, chuyển sang nguồn kế tiếp khi nguồn này ngừng trả lời
+                source = thread_id % len(sources)
+                timeouts = 0
+
+                request = self.CODE["GET"]
                 while start_byte < end_byte:
                     try:
                         sock.sendto(
-                            f"{self.CODE['GET']}|{file_name}|{seq_num}".encode(),
-                            server_address,
+                            f"{request}|{file_name}|{seq_num}{codec_suffix}".encode(),
+                            sources[source],
                         )
-                        data, _ = sock.recvfrom(self.BUFFER_SIZE)
+                        # Bỏ qua gói cũ (bị lặp hoặc đến trễ), chỉ gửi lại khi timeout
+                        # hoặc sai checksum, để mỗi gói đến muộn không sinh thêm một request
+                        while True:
+                            # dư thêm vài byte cho tag codec trong header
+                            with tracing.span("recv", pipe=thread_id):
+                                data, _ = sock.recvfrom(self.BUFFER_SIZE + 64)
+                            if data == b"EOF" or data.startswith(b"BUSY|"):
+                                break
+                            if self.codec:
+                                seq_received, checksum, tag, payload = data.split(b":", 3)
+                            else:
+                                seq_received, checksum, payload = data.split(b":", 2)
+                            if int(seq_received) == seq_num:
+                                break
 
                         if data == b"EOF":
                             break
-
-                        seq_received, checksum, chunk = data.split(b":", 2)
-                        if int(seq_received) == seq_num and self.calculate_checksum(
-                            chunk
-                        ) == int(checksum):
+                        if data.startswith(b"BUSY|"):
+                            # Server quá tải: giãn request, không tính là nguồn mất kết nối
+                            busy = session.ServerBusy.parse(data.decode(errors="ignore").split("|"))
+                            with tracing.span("backoff", seq=seq_num):
+                                backoff.sleep(busy.retry_after)
+                            continue
+
+                        with tracing.span("checksum"):
+                            valid = self.calculate_checksum(payload) == int(checksum)
+                        if valid:
+                            chunk = payload
+                            if self.codec:
+                                with tracing.span("decompress"):
+                                    chunk = compression.decompress(
+                                        compression.TAG_CODECS[tag.decode()], payload
+                                    )
                             downloaded_data.append(chunk)
+                            if self.last_transfer["first_byte"] is None:
+                                with self.lock:
+                                    if self.last_transfer["first_byte"] is None:
+                                        self.last_transfer["first_byte"] = time.perf_counter()
                             progress_bars[thread_id].update(len(chunk))
                             start_byte += len(chunk)
                             seq_num += 1
+                            request = self.CODE["GET"]
+                            backoff.reset()
+                            timeouts = 0
                         else:
-                            sock.sendto(
-                                f"{self.CODE['RESEND']}|{file_name}|{seq_num}".encode(),
-                                server_address,
-                            )
+                            request = self.CODE["RESEND"]
                     except socket.timeout:
-                        sock.sendto(
-                            f"{self.CODE['RESEND']}|{file_name}|{seq_num}".encode(),
-                            server_address,
-                        )
+                        timeouts += 1
+                        if len(sources) > 1 and timeouts >= self.FAILOVER_TIMEOUTS:
+                            failed, source = sources[source], (source + 1) % len(sources)
+                            logger.warning(f"Pipe {thread_id + 1}: {failed} not responding, switching to {sources[source]}")
+                            timeouts = 0
+                            backoff.reset()
+                        with tracing.span("backoff", seq=seq_num):
+                            backoff.sleep()
+                        request = self.CODE["RESEND"]
 
                 results[thread_id] = b"".join(downloaded_data)
 
         # Tạo 4 luồng thread
-        for i in range(self.PIPE):
+        for i in range(pipes):
             start_byte = i * chunk_size
             end_byte = min(start_byte + chunk_size, total_size)
             thread = threading.Thread(
@@ -264,63 +402,573 @@ class SocketClientUDP:
             thread.join()
 
         # kết hợp 4 luồng thành 1 file hoàn chỉnh
-        with open(os.path.join(self.DOWNLOAD_FOLDER, file_name), "wb") as f:
-            for chunk_data in results:
-                if chunk_data:
-                    f.write(chunk_data)
+        # Ghi ra file mới rồi đổi tên: file cũ có thể là hardlink tới content store
+        target_path = target_path or os.path.join(self.DOWNLOAD_FOLDER, file_name)
+        with tracing.span("merge", file=file_name):
+            with open(target_path + ".part", "wb") as f:
+                for chunk_data in results:
+                    if chunk_data:
+                        f.write(chunk_data)
+            os.replace(target_path + ".part", target_path)
 
         for pb in progress_bars:
             pb.close()
 
-        print(f"File {file_name} downloaded successfully to {self.DOWNLOAD_FOLDER}")
+        self.last_transfer["finished"] = time.perf_counter()
+
+        logger.info(f"File {file_name} downloaded successfully to {self.DOWNLOAD_FOLDER}")
+        return True
 
     # *********************************************************************************************** #
 
     """ ============================================================
-        Hàm chạy client
+        Hỏi kích thước file trên server.
+
+        Args:
+            client_socket: socket udp
+            server_address: Địa chỉ server
+            file_name: Tên file
+
+        Returns:
+            size: Kích thước (bytes), None nếu server không trả lời hoặc báo lỗi.
     ============================================================ """
 
-    def start(self):
+    def remote_size(self, client_socket, server_address, file_name):
+        client_socket.sendto(f"{self.CODE['SIZE']}|{file_name}".encode(), server_address)
+        try:
+            # bỏ qua các datagram trễ còn sót lại từ lần tải trước
+            for _ in range(16):
+                response, _ = client_socket.recvfrom(self.BUFFER_SIZE + 64)
+                if response.startswith(b"SIZE|"):
+                    return int(response.decode().split("|")[1])
+                if response.startswith(b"ERROR|"):
+                    return None
+        except socket.timeout:
+            pass
+        return None
+
+    # *********************************************************************************************** #
+
+    """ ============================================================
+        Hỏi SHA-256 của file trên server.
+
+        Args:
+            client_socket: socket udp
+            server_address: Địa chỉ server
+            file_name: Tên file
+
+        Returns:
+            (size, sha256), None nếu server không trả lời hoặc không hỗ trợ HASH.
+    ============================================================ """
+
+    def remote_hash(self, client_socket, server_address, file_name):
+        client_socket.sendto(f"{self.CODE['HASH']}|{file_name}".encode(), server_address)
         try:
-            while True:
-                file_list = self.get_input_file_list()
-                if not file_list:
-                    print("No files to download. Waiting 5 seconds...")
-                    time.sleep(5)
+            # bỏ qua các datagram trễ còn sót lại từ lần tải trước
+            for _ in range(16):
+                response, _ = client_socket.recvfrom(self.BUFFER_SIZE + 64)
+                if response.startswith(b"HASH|"):
+                    _, size, digest = response.decode().split("|")
+                    return int(size), digest
+                if response.startswith(b"ERROR|"):
+                    return None
+        except socket.timeout:
+            pass
+        return None
+
+    """ ============================================================
+        Các nguồn có cùng file với server chính: mirror phải trả lời
+        CONNECT với cùng codec, cùng kích thước và cùng SHA-256 (khi cả
+        hai server hỗ trợ HASH).
+
+        Args:
+            client_socket: socket udp
+            file_name: tên tập tin
+            server_address: Địa chỉ server chính
+            total_size: Kích thước trên server chính
+
+        Returns:
+            sources: Danh sách địa chỉ, server chính đứng đầu.
+    ============================================================ """
+
+    def sources_for(self, client_socket, file_name, server_address, total_size):
+        sources = [server_address]
+        digest = self.remote_hash(client_socket, server_address, file_name)
+        offer = ",".join(compression.available_codecs())
+        for mirror in self.MIRRORS:
+            client_socket.sendto(f"{self.CODE['CONNECT']}|{offer}".encode(), mirror)
+            try:
+                # bỏ qua các datagram trễ còn sót lại từ lần tải trước
+                for _ in range(16):
+                    response, _ = client_socket.recvfrom(self.BUFFER_SIZE + 64)
+                    if response.startswith((b"WELCOME", b"BUSY|")):
+                        break
+            except (socket.timeout, ConnectionError):
+                logger.warning(f"Mirror {mirror} not responding, skipping it")
+                continue
+            welcome, _, codec = response.decode(errors="ignore").partition("|")
+            if welcome == "BUSY":
+                logger.warning(f"Mirror {mirror} is busy, skipping it")
+                continue
+            if welcome != "WELCOME" or (codec or None) != self.codec:
+                logger.warning(f"Mirror {mirror} does not use codec {self.codec}, skipping it")
+                continue
+            if self.remote_size(client_socket, mirror, file_name) != total_size:
+                logger.warning(f"Mirror {mirror} does not have {file_name} ({total_size} bytes), skipping it")
+                continue
+            if digest is not None:
+                mirror_digest = self.remote_hash(client_socket, mirror, file_name)
+                if mirror_digest is not None and mirror_digest != digest:
+                    logger.warning(f"Mirror {mirror} has another version of {file_name}, skipping it")
                     continue
+            sources.append(mirror)
+        if len(sources) > 1:
+            logger.info(f"Downloading {file_name} from {len(sources)} sources")
+        return sources
 
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client_socket:
-                    client_socket.settimeout(self.TIMEOUT)
-                    server_address = (self.HOST, self.PORT)
+    """ ============================================================
+        Lấy file từ content store nếu đã có cùng nội dung (kể cả do
+        client TCP tải về), nếu không thì tải về rồi thêm vào store.
 
-                    client_socket.sendto(
-                        f"{self.CODE['CONNECT']}".encode(), server_address
-                    )
-                    try:
-                        response, _ = client_socket.recvfrom(self.BUFFER_SIZE)
+        Args:
+            client_socket: socket udp
+            file_name: tên tập tin
+            server_address: Địa chỉ server
+    ============================================================ """
+
+    def fetch_file(self, client_socket, file_name, server_address):
+        path = os.path.join(self.DOWNLOAD_FOLDER, file_name)
+        self.scheduler.start(file_name)
+        remote = None
+        if self.store is not None:
+            remote = self.remote_hash(client_socket, server_address, file_name)
+        if remote is not None:
+            size, digest = remote
+            try:
+                if self.store.link(digest, path, size):
+                    logger.info(f"{file_name} is already in the content store, nothing to download")
+                    self.scheduler.finish(file_name)
+                    return
+            except OSError as e:
+                logger.error(f"Could not take {file_name} from the content store: {e}")
+
+        if not self.download_file_parallel(client_socket, file_name, server_address):
+            return
+        if remote is not None:
+            try:
+                with tracing.span("store.add", file=file_name):
+                    self.store.add(remote[1], path)
+            except OSError as e:
+                logger.error(f"Could not add {file_name} to the content store: {e}")
+        self.scheduler.finish(file_name)
+
+    """ ============================================================
+        Tải nhiều file cùng lúc bằng các stream ghép kênh trên 1 socket
+        (multiplex.py). Server cũ không hỗ trợ OPEN/MGET thì tắt
+        MULTIPLEX và tải lần lượt từng file.
+
+        Args:
+            client_socket: socket udp
+            file_names: các file chưa có trong DOWNLOAD_FOLDER
+            server_address: Địa chỉ server
+    ============================================================ """
 
-                        if response.decode() == "WELCOME":
+    def fetch_files(self, client_socket, file_names, server_address):
+        if self.MULTIPLEX:
+            started = time.perf_counter()
+            multiplexer = multiplex.Multiplexer(self, client_socket, server_address)
+
+            def more_files():
+                # File mới thêm vào input trong lúc tải: mở stream ngay, theo thứ tự của scheduler
+                if not self.scheduler.input_changed():
+                    return []
+                entries = [
+                    entry
+                    for entry in self.get_input_file_list()
+                    if entry["name"] not in file_names
+                    and not os.path.exists(os.path.join(self.DOWNLOAD_FOLDER, entry["name"]))
+                ]
+                return [entry["name"] for entry in self.scheduler.order(entries)]
+
+            try:
+                with tracing.span("multiplex", files=len(file_names)):
+                    results = multiplexer.download(file_names, self.DOWNLOAD_FOLDER, more_files)
+            except multiplex.NotSupported:
+                logger.info("Server does not support multiplexed streams, downloading one file at a time")
+                self.MULTIPLEX = False
+            else:
+                self.transfers = multiplexer.transfers
+                failed = [name for name, ok in results.items() if not ok]
+                logger.info(
+                    f"{len(results) - len(failed)}/{len(results)} files downloaded "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+                return
+        for file_name in file_names:
+            self.fetch_file(client_socket, file_name, server_address)
 
-                            list_files = self.list_files(client_socket, server_address)
-                            print("Number of files on server:", len(list_files))
+    """ ============================================================
+        Xếp các file cần tải theo SCHEDULE (scheduler.py). Với smallest
+        thì hỏi kích thước các file chưa biết bằng SIZE (sizes=False khi
+        tải ghép kênh: OPENED đã trả về kích thước).
 
-                            print("Connected to server.")
+        Args:
+            client_socket: socket udp
+            server_address: Địa chỉ server
+            entries: các dict của get_input_file_list
 
-                            for file_name in file_list:
-                                # nếu chưa tồn tại thì mởi tải file
-                                if self.check_file_downloaded(file_name) == False:
-                                    self.download_file_parallel(
-                                        client_socket, file_name, server_address
-                                    )
+        Returns:
+            names: tên các file theo thứ tự tải
+    ============================================================ """
 
-                    except socket.timeout:
-                        print("Error: Server timeout.")
+    def schedule(self, client_socket, server_address, entries, sizes=True):
+        if sizes and self.scheduler.policy == "smallest":
+            for entry in entries:
+                job = self.scheduler.jobs.get(entry["name"])
+                if job is None or job.size is None:
+                    entry["size_bytes"] = self.remote_size(client_socket, server_address, entry["name"])
+        return [entry["name"] for entry in self.scheduler.order(entries)]
+
+    # *********************************************************************************************** #
+
+    """ ============================================================
+        Cập nhật file đã tải khi bản trên server khác kích thước, hoặc
+        cùng kích thước nhưng khác SHA-256 (HASH): gửi chữ ký các block
+        của bản cũ, tải bản delta server tính được và dựng lại file
+        (delta.py). Lỗi hoặc tắt DELTA_SYNC thì tải lại toàn bộ file.
+
+        Args:
+            client_socket: socket udp
+            file_name: tên tập tin
+            server_address: Địa chỉ server
+    ============================================================ """
+
+    def update_file(self, client_socket, file_name, server_address):
+        path = os.path.join(self.DOWNLOAD_FOLDER, file_name)
+        remote = self.remote_hash(client_socket, server_address, file_name)
+        if remote is not None:
+            size, digest = remote
+        else:
+            # Server cũ không có HASH: chỉ so được kích thước
+            size, digest = self.remote_size(client_socket, server_address, file_name), None
+        if size is None:
+            logger.warning(f"Could not get the size of {file_name} from the server, not checking it for updates")
+            return
+        local_size = os.path.getsize(path)
+        if size == local_size:
+            if digest is None:
+                logger.debug(f"{file_name} has the server size and the server has no HASH, keeping it")
+                return
+            with tracing.span("verify", file=file_name):
+                local_digest = self.digests.digest(path)
+            if local_digest == digest:
+                logger.debug(f"{file_name} is up to date (SHA-256 {digest[:12]})")
+                return
+            change = f"same size, SHA-256 {local_digest[:12]} -> {digest[:12]}"
+        else:
+            change = f"{local_size} -> {size} bytes"
+
+        if not self.DELTA_SYNC:
+            logger.info(f"{file_name} changed on the server ({change}), downloading it again")
+            self.fetch_file(client_socket, file_name, server_address)
+            return
+        logger.info(f"{file_name} changed on the server ({change}), fetching the difference")
+        try:
+            with tracing.span("delta", file=file_name):
+                copied, literal = self.sync_file(client_socket, file_name, server_address)
+        except (OSError, ValueError) as e:
+            logger.error(f"Delta sync of {file_name} failed ({e}), downloading the whole file")
+            self.fetch_file(client_socket, file_name, server_address)
+            return
+        logger.info(f"Updated {file_name}: {literal} bytes received, {copied} bytes reused from the old copy")
+
+    def sync_file(self, client_socket, file_name, server_address):
+        path = os.path.join(self.DOWNLOAD_FOLDER, file_name)
+        local_size = os.path.getsize(path)
+        block_size = delta.block_size_for(local_size)
+        with tracing.span("signatures", file=file_name):
+            signature_blob = delta.signatures(path, block_size)
 
-                print("All files processed. Rechecking input in 5 seconds...")
-                time.sleep(5)
+        reply = self.upload_signatures(client_socket, server_address, file_name, local_size, block_size, signature_blob)
+        delta_name = reply.split("|")[2]
+
+        # Bản delta được tải như 1 file thường (song song, có RESEND)
+        delta_path = path + ".delta"
+        part_path = path + ".part"
+        try:
+            self.download_file_parallel(
+                client_socket, delta_name, server_address, target_path=delta_path, use_mirrors=False
+            )
+            with open(delta_path, "rb") as stream:
+                result = delta.apply(path, delta.file_reader(stream), part_path)
+            os.replace(part_path, path)
+            return result
+        finally:
+            for leftover in (delta_path, part_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    """ ============================================================
+        Gửi chữ ký lên server theo cửa sổ DELTA_WINDOW datagram.
+
+        DSIG|upload_id|file|local_size|block_size|index|count|<base64>,
+        mỗi phần được xác nhận bằng DSACK; phần cuối nhận về
+        DELTA|upload_id|@delta/<id>|<delta_size>|<file_size>.
+
+        Returns:
+            reply: Câu trả lời DELTA của server.
+    ============================================================ """
+
+    def upload_signatures(self, client_socket, server_address, file_name, local_size, block_size, signature_blob):
+        upload_id = secrets.token_hex(4)
+        header = f"{self.CODE['DSIG']}|{upload_id}|{file_name}|{local_size}|{block_size}|"
+        # Datagram phải vừa BUFFER_SIZE của server: chừa chỗ cho index|count|
+        room = (self.BUFFER_SIZE - len(header) - 24) * 3 // 4
+        step = max(1, room // delta.SIGNATURE.size) * delta.SIGNATURE.size
+        parts = [signature_blob[i : i + step] for i in range(0, len(signature_blob), step)] or [b""]
+        count = len(parts)
+
+        pending = set(range(count))
+        retries = 0
+        while True:
+            # Đã được xác nhận hết mà chưa có DELTA: gửi lại phần cuối để server trả lời lại
+            window = sorted(pending)[: self.DELTA_WINDOW] or [count - 1]
+            for index in window:
+                client_socket.sendto(
+                    f"{header}{index}|{count}|".encode() + base64.b64encode(parts[index]), server_address
+                )
+            try:
+                while pending.intersection(window) or not pending:
+                    response, _ = client_socket.recvfrom(self.BUFFER_SIZE + 64)
+                    fields = response.decode(errors="ignore").split("|")
+                    if fields[0] == "DELTA" and fields[1] == upload_id:
+                        return response.decode()
+                    if fields[0] == "ERROR":
+                        raise ValueError(f"Server refused the delta: {fields[1]}")
+                    if fields[0] == "DSACK" and fields[1] == upload_id:
+                        pending.discard(int(fields[2]))
+                        retries = 0
+            except socket.timeout:
+                retries += 1
+                if retries > self.DELTA_RETRIES:
+                    raise TimeoutError(f"No reply to DSIG for {file_name}")
+
+    # *********************************************************************************************** #
+
+    """ ============================================================
+        Hàm CONNECT tới server, thử lại với backoff tăng dần cho tới khi
+        nhận được WELCOME.
+
+        Args:
+            client_socket: socket udp
+            server_address: Địa chỉ server
+    ============================================================ """
+
+    def connect(self, client_socket, server_address):
+        backoff = session.Backoff()
+        while True:
+            # CONNECT kèm danh sách codec để thương lượng nén
+            offer = ",".join(compression.available_codecs())
+            client_socket.sendto(
+                f"{self.CODE['CONNECT']}|{offer}".encode(), server_address
+            )
+            try:
+                response, _ = client_socket.recvfrom(self.BUFFER_SIZE)
+                welcome, _, codec = response.decode(errors="ignore").partition("|")
+
+                if welcome == "WELCOME":
+                    self.codec = codec or None
+                    logger.info("Connected to server.")
+
+                    list_files = self.list_files(client_socket, server_address)
+                    logger.info(f"Number of files on server: {len(list_files)}")
+                    return
+                if welcome == "BUSY":
+                    # Server quá tải: chờ ít nhất retry-after server yêu cầu
+                    busy = session.ServerBusy.parse(response.decode(errors="ignore").split("|"))
+                    delay = backoff.sleep(busy.retry_after)
+                    logger.warning(f"Server busy. Retried in {delay:.1f}s")
+                    continue
+            except socket.timeout:
+                pass
+
+            delay = backoff.sleep()
+            logger.error(f"Server timeout. Retried in {delay:.1f}s")
+
+    # *********************************************************************************************** #
+    """ ============================================================
+        Hàm keep-alive: gửi PING và chờ PONG.
+
+        Args:
+            client_socket: socket udp
+            server_address: Địa chỉ server
+
+        Returns:
+            alive: True nếu server còn trả lời.
+    ============================================================ """
+
+    def keepalive(self, client_socket, server_address):
+        client_socket.sendto(f"{self.CODE['PING']}".encode(), server_address)
+        try:
+            # bỏ qua các datagram trễ còn sót lại từ lần tải trước
+            for _ in range(16):
+                response, _ = client_socket.recvfrom(self.BUFFER_SIZE + 64)
+                if response == b"PONG":
+                    return True
+        except socket.timeout:
+            pass
+        return False
+
+    # *********************************************************************************************** #
+
+    """ ============================================================
+        Luồng nhận thay đổi catalog: SUBSCRIBE|[version] trên socket
+        riêng, gia hạn mỗi SUBSCRIBE_RENEW giây. Server đẩy về
+        CHANGE|<version>|<op>|<name>|<size>; version bị nhảy (mất
+        datagram) thì SUBSCRIBE lại ngay với version cuối đã nhận để
+        server gửi lại phần bị lỡ. Server cũ trả lời ERROR thì dừng.
+
+        Args:
+            server_address: Địa chỉ server
+    ============================================================ """
+
+    def follow_catalog(self, server_address):
+        version = None
+        renew_at = 0.0
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(1)
+            while not self.stopped.is_set():
+                if time.monotonic() >= renew_at:
+                    since = "" if version is None else version
+                    sock.sendto(f"{self.CODE['SUBSCRIBE']}|{since}".encode(), server_address)
+                    renew_at = time.monotonic() + self.SUBSCRIBE_RENEW
+                try:
+                    data, _ = sock.recvfrom(self.BUFFER_SIZE + 64)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    # ICMP port unreachable: server chưa chạy lại
+                    time.sleep(1)
+                    continue
+
+                fields = data.decode(errors="ignore").split("|")
+                if fields[0] == "ERROR":
+                    logger.info("Server does not push catalog changes")
+                    return
+                if fields[0] == "SUBSCRIBED":
+                    if version is None:
+                        version = int(fields[1])
+                        logger.info(f"Subscribed to catalog changes (version {version})")
+                    self.subscribed = True
+                elif fields[0] == "RESET":
+                    version = int(fields[1])
+                    with self.lock:
+                        self.catalog_reset = True
+                    self.catalog_changed.set()
+                elif fields[0] == "CHANGE" and version is not None:
+                    change_version, op, name, size = int(fields[1]), fields[2], fields[3], fields[4]
+                    if change_version > version + 1:
+                        renew_at = 0.0
+                        continue
+                    if change_version <= version:
+                        continue
+                    version = change_version
+                    if op != "added":
+                        with self.lock:
+                            self.catalog_modified.add(name)
+                    logger.info(f"Catalog: {name} {op} ({size} bytes)")
+                    self.catalog_changed.set()
+
+    """ ============================================================
+        Chờ tới khi catalog đổi (tối đa `timeout` giây).
+
+        Returns:
+            modified: Tên file cần kiểm tra lại, None = kiểm tra mọi file
+            (không có SUBSCRIBE hoặc server đã mất các thay đổi cũ).
+    ============================================================ """
+
+    def wait_catalog_changes(self, timeout):
+        if not self.subscribed:
+            time.sleep(timeout)
+            return None
+        if self.catalog_changed.wait(timeout):
+            self.catalog_changed.clear()
+        with self.lock:
+            modified, reset = self.catalog_modified, self.catalog_reset
+            self.catalog_modified, self.catalog_reset = set(), False
+        return None if reset else modified
+
+    # *********************************************************************************************** #
+
+    """ ============================================================
+        Hàm chạy client
+
+        Giữ 1 socket cho cả phiên: CONNECT và LIST chỉ thực hiện lại khi
+        server không còn trả lời PING.
+    ============================================================ """
+
+    def start(self):
+        server_address = (self.HOST, self.PORT)
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client_socket:
+                client_socket.settimeout(self.TIMEOUT)
+                sockopts.apply(client_socket, "datagram", self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
+                connected = False
+                # File đã tải cần hỏi lại server (None = tất cả): với SUBSCRIBE chỉ các file server báo đổi
+                modified = None
+
+                if self.SUBSCRIBE:
+                    threading.Thread(target=self.follow_catalog, args=(server_address,), daemon=True).start()
+
+                while True:
+                    if not connected:
+                        self.connect(client_socket, server_address)
+                        connected = True
+                        modified = None
+                    elif not self.keepalive(client_socket, server_address):
+                        logger.info("Server stopped responding. Reconnecting...")
+                        connected = False
+                        continue
+
+                    entries = self.get_input_file_list()
+                    file_list = [entry["name"] for entry in entries]
+                    if not file_list:
+                        logger.info("No files to download. Waiting 5 seconds...")
+                        with tracing.span("sleep"):
+                            changes = self.wait_catalog_changes(5)
+                        # Chưa kiểm tra được file nào: gộp với các thay đổi trước đó
+                        modified = None if modified is None or changes is None else modified | changes
+                        continue
+
+                    # nếu chưa tồn tại thì mởi tải file: cùng lúc qua stream ghép kênh,
+                    # hoặc từng file với các luồng riêng khi tải từ nhiều mirror
+                    multiplexed = self.MULTIPLEX and not self.MIRRORS
+                    missing = self.schedule(
+                        client_socket,
+                        server_address,
+                        [entry for entry in entries if not self.check_file_downloaded(entry["name"])],
+                        sizes=not multiplexed,
+                    )
+                    if missing and multiplexed:
+                        self.fetch_files(client_socket, missing, server_address)
+                    else:
+                        for file_name in missing:
+                            self.fetch_file(client_socket, file_name, server_address)
+
+                    for file_name in file_list:
+                        # đã có nhưng server có bản khác (kích thước hoặc SHA-256) thì cập nhật bằng delta
+                        if file_name not in missing and (modified is None or file_name in modified):
+                            self.update_file(client_socket, file_name, server_address)
+
+                    self.scheduler.report()
+                    logger.info("All files processed. Rechecking input in 5 seconds...")
+                    with tracing.span("sleep"):
+                        modified = self.wait_catalog_changes(5)
         except KeyboardInterrupt:
-            print("Client stopped by user (Ctrl + C).")
+            logger.info("Client stopped by user (Ctrl + C).")
             return
+        finally:
+            self.stopped.set()
 
     # *********************************************************************************************** #
 
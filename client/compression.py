@@ -0,0 +1,100 @@
+import os
+import zlib
+
+# ------------------------------ OPTIONAL CODECS ------------------------------#
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+NO_COMPRESSION = "none"
+
+# Các định dạng đã được nén sẵn -> nén thêm chỉ tốn CPU
+INCOMPRESSIBLE_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst", ".lz4",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".mp3", ".mp4", ".mkv", ".avi", ".mov", ".webm", ".ogg", ".flac",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".jar", ".apk",
+}
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Thứ tự ưu tiên khi thương lượng: codec đứng trước được chọn trước
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+if lz4_frame is not None:
+    CODECS["lz4"] = (lz4_frame.compress, lz4_frame.decompress)
+CODECS["zlib"] = (lambda data: zlib.compress(data, 6), zlib.decompress)
+
+# Tag 1 ký tự dùng trong header datagram UDP (giới hạn BUFFER_SIZE)
+WIRE_TAGS = {NO_COMPRESSION: "-", "zlib": "z", "zstd": "s", "lz4": "l"}
+TAG_CODECS = {tag: codec for codec, tag in WIRE_TAGS.items()}
+
+
+def available_codecs():
+    """
+    List the codecs usable in this process, most preferred first.
+    """
+    return list(CODECS)
+
+
+def negotiate(offered):
+    """
+    Pick the first locally supported codec from the peer's offer.
+    - offered: comma separated codec names (or a list of names).
+    """
+    if isinstance(offered, str):
+        offered = [name.strip() for name in offered.split(",")]
+    for name in available_codecs():
+        if name in offered:
+            return name
+    return NO_COMPRESSION
+
+
+def is_compressible(filename):
+    """
+    Check whether a resource is worth compressing based on its extension.
+    """
+    return os.path.splitext(filename)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS
+
+
+def compress(codec, data):
+    if codec == NO_COMPRESSION:
+        return data
+    return CODECS[codec][0](data)
+
+
+def decompress(codec, data):
+    if codec == NO_COMPRESSION:
+        return data
+    return CODECS[codec][1](data)
+
+
+def compress_block(codec, filename, data):
+    """
+    Compress one block for the wire.
+
+    Returns:
+        (codec, payload): codec is NO_COMPRESSION when the file type is
+        incompressible or the compressed block would not be smaller.
+    """
+    if codec == NO_COMPRESSION or not is_compressible(filename):
+        return NO_COMPRESSION, data
+    payload = compress(codec, data)
+    if len(payload) >= len(data):
+        return NO_COMPRESSION, data
+    return codec, payload
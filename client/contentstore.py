@@ -0,0 +1,217 @@
+"""
+Content-addressed store of downloaded files, keyed by the SHA-256 the
+server advertises (HASH request).
+
+Both clients share one store (DEFAULT_DIR, relative to the working
+directory), so a file already fetched by the TCP client, or under another
+name, is put in place without any transfer. An object is linked into the
+download directory with, in order of preference:
+
+    - reflink (FICLONE, Linux on btrfs/XFS): copy-on-write, the copies
+      stay independent.
+    - hardlink: same inode, no extra space. Downloads are always written
+      to a new file and renamed, so a later update does not touch the store.
+    - plain copy: other file system or no link support.
+
+Objects are checked against their hash when they are added. The store is
+kept under max_bytes by dropping the least recently used objects; the last
+use is kept on a separate "<digest>.used" file because touching the object
+would also change the mtime of every hardlinked download.
+"""
+
+import os
+import errno
+import shutil
+import hashlib
+import secrets
+import threading
+
+import log
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = log.get_logger(__name__)
+
+DEFAULT_DIR = ".content_store"
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024 * 1024
+FICLONE = 0x40049409
+READ_SIZE = 1024 * 1024
+USED_SUFFIX = ".used"
+TMP_SUFFIX = ".tmp"
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(READ_SIZE)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+class DigestCache:
+    """
+    SHA-256 of local files, reused until the size or mtime of the file
+    changes, so an unchanged download is not read again on every check.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # path -> (size, mtime_ns, hex digest)
+
+    def digest(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            return entry[2]
+        digest = file_digest(path)
+        with self.lock:
+            self.entries[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+
+def reflink(src, dst):
+    """
+    Copy-on-write clone of src; raises OSError where unsupported.
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+
+
+def place(src, dst):
+    """
+    Put a copy of src at dst with the cheapest method available.
+    Returns the method used.
+    """
+    for method, func in (("reflink", reflink), ("hardlink", os.link)):
+        try:
+            func(src, dst)
+            return method
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class ContentStore:
+    def __init__(self, root=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def object_path(self, digest):
+        digest = digest.lower()
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Not a SHA-256 digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def touch(self, object_path):
+        with open(object_path + USED_SUFFIX, "a"):
+            pass
+        os.utime(object_path + USED_SUFFIX)
+
+    # ==============================================================================================
+    def link(self, digest, dest_path, size=None):
+        """
+        Put the object `digest` at dest_path.
+        Returns False when the store does not have it (or it has another size).
+        """
+        object_path = self.object_path(digest)
+        try:
+            if size is not None and os.path.getsize(object_path) != size:
+                logger.warning(f"Content store object {digest} has the wrong size, dropping it")
+                self.remove(object_path)
+                return False
+            os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+            tmp_path = f"{dest_path}.{secrets.token_hex(4)}{TMP_SUFFIX}"
+            method = place(object_path, tmp_path)
+        except FileNotFoundError:
+            # Không có hoặc vừa bị client khác loại bỏ
+            return False
+        os.replace(tmp_path, dest_path)
+        self.touch(object_path)
+        logger.debug(f"{dest_path} taken from the content store ({method})")
+        return True
+
+    def add(self, digest, path, verified=False):
+        """
+        Store the downloaded file `path` under `digest`.
+        Returns False when the content does not match the digest.
+        - verified: the caller already checked the digest of `path`.
+        """
+        object_path = self.object_path(digest)
+        actual = digest.lower() if verified else file_digest(path)
+        if actual != digest.lower():
+            logger.warning(f"{path} does not match the server SHA-256 ({actual} != {digest})")
+            return False
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{secrets.token_hex(4)}{TMP_SUFFIX}"
+            place(path, tmp_path)
+            # rename nguyên tử: client TCP và UDP có thể thêm cùng object một lúc
+            os.replace(tmp_path, object_path)
+        self.touch(object_path)
+        self.evict()
+        return True
+
+    # ==============================================================================================
+    def objects(self):
+        """
+        (last_used, size, path) of every object.
+        """
+        result = []
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith((USED_SUFFIX, TMP_SUFFIX)):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    continue
+                try:
+                    used = os.path.getmtime(path + USED_SUFFIX)
+                except FileNotFoundError:
+                    used = 0
+                result.append((used, size, path))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.objects())
+
+    def evict(self):
+        """
+        Drop the least recently used objects until the store fits max_bytes.
+        Downloads linked to an evicted object keep their content.
+        """
+        objects = sorted(self.objects())
+        total = sum(size for _, size, _ in objects)
+        for _, size, path in objects:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+            logger.debug(f"Evicted {os.path.basename(path)} ({size} bytes) from the content store")
+
+    def remove(self, object_path):
+        for path in (object_path, object_path + USED_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,283 @@
+"""
+Download of one file from several servers holding the same resources.
+
+The primary server and every mirror have their own SocketClient (pipes,
+codec, autotuner) and ClientSession. A file is only fetched from the
+sources whose catalog lists it with the same size, and the same SHA-256
+when both servers offer HASH.
+
+The byte ranges to download are cut into segments that the sources pull
+from a shared queue, so a faster source simply takes more of them. Each
+segment is sized for about SEGMENT_SECONDS at the source's measured rate
+and written straight into the shared .part file by request_blocks().
+
+- A source that fails puts its undelivered ranges back in the queue and
+  reconnects; after MAX_FAILURES failures in a row it is left out.
+- Once the queue is empty, an idle source also fetches the segment of a
+  source that has taken SLOW_FACTOR times longer than expected. The first
+  copy to finish wins and the other source is interrupted; both write the
+  same bytes, so the overlap is harmless.
+"""
+
+import copy
+import time
+import threading
+
+import log
+import session
+
+logger = log.get_logger(__name__)
+
+MB = 1024 * 1024
+
+
+def parse_address(text, default_port):
+    """
+    "host" or "host:port" -> (host, port).
+    """
+    host, sep, port = str(text).strip().rpartition(":")
+    if not sep:
+        return port, default_port
+    return host, int(port)
+
+
+class Source:
+    def __init__(self, client, client_session):
+        self.client = client
+        self.session = client_session
+        self.name = f"{client_session.host}:{client_session.port}"
+        self.rate = None  # bytes/s, trung bình trượt
+        self.failures = 0
+        self.interrupted = False  # pipe bị cắt vì nguồn khác đã tải xong segment
+        self.bytes = 0  # byte tải được trong file hiện tại
+
+    def record(self, nbytes, seconds):
+        rate = nbytes / max(seconds, 1e-6)
+        self.rate = rate if self.rate is None else 0.5 * self.rate + 0.5 * rate
+        self.bytes += nbytes
+
+
+class Segment:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.owners = {}  # Source -> thời điểm bắt đầu
+        self.expected = None  # thời gian dự kiến (giây) theo tốc độ của nguồn đầu tiên
+        self.done = False
+
+    @property
+    def size(self):
+        return self.end - self.start + 1
+
+
+# ==================================================================================================
+class MirrorSet:
+    SEGMENT_SECONDS = 2.0
+    MIN_SEGMENT = 1 * MB
+    START_SEGMENT = 4 * MB
+    MAX_SEGMENT = 64 * MB
+    SLOW_FACTOR = 3
+    MAX_FAILURES = 3
+    # Mirror không kết nối được thì bỏ qua nhanh thay vì thử lại lâu như server chính
+    MIRROR_RETRIES = 1
+
+    def __init__(self, client, client_session, addresses):
+        self.sources = [Source(client, client_session)]
+        for host, port in addresses:
+            mirror = copy.copy(client)
+            mirror.HOST, mirror.PORT = host, port
+            mirror.autotuner = None
+            mirror.mirrors = None
+            mirror_session = session.ClientSession(mirror, host, port)
+            mirror_session.MAX_RETRIES = self.MIRROR_RETRIES
+            try:
+                mirror_session.connect()
+            except (OSError, ConnectionError) as e:
+                logger.warning(f"Mirror {host}:{port} unavailable: {e}")
+                mirror_session.close()
+                continue
+            self.sources.append(Source(mirror, mirror_session))
+            logger.info(f"Using mirror {host}:{port}")
+
+        self.condition = threading.Condition()
+        self.queue = []  # các khoảng (start, end) chưa giao cho nguồn nào
+        self.active = []  # Segment đang tải
+
+    def close(self):
+        for source in self.sources[1:]:
+            source.session.close()
+
+    # ==============================================================================================
+    def sources_for(self, file_info):
+        """
+        Sources that serve the same content as the primary server.
+        """
+        primary = self.sources[0]
+        name, size = file_info["name"], file_info["size_bytes"]
+        digest = file_info.get("sha256")
+        if digest is None and "hash" in primary.client.features:
+            try:
+                digest = primary.session.file_hash(name)[1]
+            except (OSError, ConnectionError, ValueError):
+                digest = None
+
+        matching = [primary]
+        for source in self.sources[1:]:
+            if source.failures >= self.MAX_FAILURES:
+                continue
+            try:
+                catalog = eval(source.session.list_resources().strip())
+                sizes = {path.split("/")[-1]: entry_size for path, entry_size in catalog}
+                if sizes.get(name) != size:
+                    logger.warning(f"Mirror {source.name} does not have {name} ({size} bytes), skipping it")
+                    continue
+                if digest is not None and "hash" in source.client.features:
+                    if source.session.file_hash(name)[1] != digest:
+                        logger.warning(f"Mirror {source.name} has another version of {name}, skipping it")
+                        continue
+            except (OSError, ConnectionError, ValueError, SyntaxError) as e:
+                logger.warning(f"Could not check {name} on mirror {source.name}: {e}")
+                continue
+            matching.append(source)
+        return matching
+
+    def download(self, file_info, remaining, part_path):
+        """
+        Fetch the ranges in `remaining` from every matching source.
+        Returns the ranges no source could deliver (empty on success).
+        """
+        sources = self.sources_for(file_info)
+        if len(sources) < 2:
+            return remaining
+
+        filename, file_size = file_info["name"], file_info["size_bytes"]
+        primary = self.sources[0]
+        primary.failures = 0
+        with self.condition:
+            self.queue = sorted(remaining)
+            self.active = []
+        for source in sources:
+            source.bytes = 0
+            source.client.last_transfer = primary.client.last_transfer
+
+        threads = [
+            threading.Thread(
+                target=self.run_source,
+                args=(source, filename, file_size, part_path),
+                name=f"mirror-{source.name}",
+            )
+            for source in sources
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        total = sum(source.bytes for source in sources) or 1
+        logger.info(
+            f"{filename} from {len(sources)} sources: "
+            + ", ".join(
+                f"{source.name} {source.bytes * 100 / total:.0f}% ({(source.rate or 0) / 1e6:.1f} MB/s)"
+                for source in sources
+            )
+        )
+        with self.condition:
+            left = self.queue + [(segment.start, segment.end) for segment in self.active if not segment.done]
+            self.queue, self.active = [], []
+        return sorted(left)
+
+    # ==============================================================================================
+    def run_source(self, source, filename, file_size, part_path):
+        while True:
+            with self.condition:
+                segment = self.next_segment(source)
+                while segment is None:
+                    # Chờ đoạn đang tải xong hoặc trở nên chậm
+                    self.condition.wait(0.2)
+                    segment = self.next_segment(source)
+                if segment is False:
+                    return
+                segment.owners[source] = time.monotonic()
+                if segment.expected is None:
+                    segment.expected = segment.size / source.rate if source.rate else self.SEGMENT_SECONDS
+
+            ranges = [(segment.start, segment.end)]
+            started = time.monotonic()
+            error = None
+            try:
+                source.client.request_blocks(
+                    source.session, filename, file_size, ranges, part_path, source.client.get_autotuner()
+                )
+            except (OSError, ConnectionError, ValueError) as e:
+                error = e
+
+            with self.condition:
+                del segment.owners[source]
+                if error is None and not segment.done:
+                    segment.done = True
+                    source.record(segment.size, time.monotonic() - started)
+                    source.failures = 0
+                    # Nguồn chậm đang tải cùng segment: cắt pipe của nó để nhận việc khác
+                    for other in segment.owners:
+                        other.interrupted = True
+                        other.session.interrupt()
+                elif error is not None and not segment.done and not segment.owners:
+                    # Trả phần chưa nhận lại hàng đợi cho các nguồn khác
+                    self.queue = sorted(self.queue + ranges)
+                if not segment.owners and segment in self.active:
+                    self.active.remove(segment)
+                interrupted, source.interrupted = source.interrupted, False
+                if error is not None and not interrupted:
+                    source.failures += 1
+                self.condition.notify_all()
+
+            if error is not None or interrupted:
+                if not interrupted:
+                    logger.warning(f"Source {source.name} failed on {filename}: {error}")
+                if source.failures >= self.MAX_FAILURES:
+                    logger.warning(f"Leaving out source {source.name} after {source.failures} failures")
+                    with self.condition:
+                        self.condition.notify_all()
+                    return
+                try:
+                    source.session.reconnect()
+                except ConnectionError as e:
+                    logger.warning(f"Leaving out source {source.name}: {e}")
+                    with self.condition:
+                        source.failures = self.MAX_FAILURES
+                        self.condition.notify_all()
+                    return
+
+    def next_segment(self, source):
+        """
+        Next segment for `source` (condition held): a new piece of the queue,
+        a copy of a straggler's segment, False when there is nothing left
+        to do and None to keep waiting.
+        """
+        if self.queue:
+            start, end = self.queue[0]
+            rate = source.rate
+            size = self.START_SEGMENT if rate is None else int(rate * self.SEGMENT_SECONDS)
+            size = max(self.MIN_SEGMENT, min(self.MAX_SEGMENT, size))
+            segment_end = min(end, start + size - 1)
+            if segment_end == end:
+                self.queue.pop(0)
+            else:
+                self.queue[0] = (segment_end + 1, end)
+            segment = Segment(start, segment_end)
+            self.active.append(segment)
+            return segment
+
+        pending = [segment for segment in self.active if not segment.done]
+        if not pending:
+            return False
+        now = time.monotonic()
+        for segment in pending:
+            if source in segment.owners or len(segment.owners) != 1:
+                continue
+            started = next(iter(segment.owners.values()))
+            if now - started > self.SLOW_FACTOR * segment.expected:
+                owner = next(iter(segment.owners))
+                logger.info(f"{owner.name} is slow on {segment.start}-{segment.end}, also fetching it from {source.name}")
+                return segment
+        return None
@@ -0,0 +1,434 @@
+"""
+Several files downloaded at once over one UDP socket (multiplexed streams).
+
+Every file is a stream with a 16-bit id chosen by the client:
+
+    OPEN|<id>|<file>[|hash]                  -> OPENED|<id>|<size>[|<sha256>]  (size -1: no such file)
+    MGET|<id>|<file>|<codec>|<seq>|<count>   -> <count> data datagrams, or MERR|<id>|<reason>
+
+A data datagram is HEADER (marker, stream id, seq, CRC-32 of the payload,
+codec tag) followed by the payload, so the replies of every stream are told
+apart on the one socket. The OPENs of the whole list go out together: a list
+of small files costs one round trip of setup instead of a SIZE exchange (and
+a set of pipe sockets) per file.
+
+The client asks for every datagram, so it also does the flow control:
+
+- STREAM_WINDOW: datagrams of one stream in flight at most. Streams are
+  served round robin, a large file does not hold back the small ones;
+  each round starts with the most urgent stream for the client scheduler
+  (scheduler.py), which also sets the order in which streams are opened.
+- A congestion window shared by every stream (AIMD): +1/cwnd for each
+  datagram received, halved when datagrams time out or the server is BUSY.
+- A datagram not received RTO seconds after its request is asked again;
+  RTO follows the measured round trip time.
+
+With the client OFFLOAD option the socket turns UDP_GRO on for the
+download (Linux): the kernel may deliver a whole MGET batch in one
+recvmsg, which sockopts.recv_segments() cuts back into datagrams.
+"""
+
+import os
+import time
+import socket
+import struct
+import logging
+import collections
+
+import compression
+import log
+import session
+import sockopts
+import tracing
+from tqdm import tqdm
+
+logger = log.get_logger(__name__)
+
+MARKER = 0xFF
+HEADER = struct.Struct("!BHIIc")  # marker, stream id, seq, crc32, tag codec
+
+
+class NotSupported(Exception):
+    """
+    The server does not know OPEN/MGET (older server).
+    """
+
+
+class Stream:
+    def __init__(self, stream_id, name, path):
+        self.id = stream_id
+        self.name = name
+        self.path = path
+        self.size = None  # từ OPENED
+        self.digest = None
+        self.count = 0  # số datagram của file
+        self.received = None  # bytearray: 1 nếu đã nhận datagram seq
+        self.done_count = 0
+        self.next_seq = 0  # seq nhỏ nhất chưa từng được hỏi
+        self.lost = collections.deque()  # seq cần hỏi lại
+        self.inflight = 0
+        self.file = None
+        self.opened_at = 0.0  # thời điểm gửi OPEN, None khi đã có OPENED
+        self.open_tries = 0
+
+    @property
+    def finished(self):
+        return self.size is not None and self.done_count == self.count
+
+    def has_work(self):
+        return self.size is not None and (self.lost or self.next_seq < self.count)
+
+
+# ==================================================================================================
+class Multiplexer:
+    STREAM_WINDOW = 64
+    MAX_STREAMS = 64  # stream mở cùng lúc
+    BATCH = 32  # datagram tối đa mỗi MGET
+    INITIAL_WINDOW = 16
+    MIN_WINDOW = 2
+    MAX_WINDOW = 1024
+    MIN_RTO = 0.05
+    OPEN_RETRIES = 5
+    # Không nhận được gì lâu hơn thì bỏ các stream còn lại (lần quét input sau sẽ tải lại)
+    STALL_TIMEOUT = 30
+
+    def __init__(self, client, client_socket, server_address):
+        self.client = client
+        self.sock = client_socket
+        self.server_address = server_address
+        self.payload_size = client.BUFFER_SIZE - 20
+        self.codec = client.codec or compression.NO_COMPRESSION
+        self.cwnd = float(self.INITIAL_WINDOW)
+        self.srtt = None
+        self.rto = client.TIMEOUT
+        self.inflight = collections.OrderedDict()  # (stream, seq) -> (thời điểm hỏi, đã hỏi lại)
+        self.last_loss = 0.0
+        self.next_id = 0
+        self.streams = {}
+        self.transfers = {}  # tên -> thống kê thời gian như SocketClientUDP.last_transfer
+        self.gro = False
+        self.scheduler = client.scheduler
+        self.backoff = session.Backoff(initial=0.1, maximum=client.TIMEOUT)
+
+    def new_id(self):
+        while True:
+            self.next_id = (self.next_id + 1) % 65536
+            if self.next_id not in self.streams:
+                return self.next_id
+
+    # ==============================================================================================
+    def download(self, names, target_dir, more=None):
+        """
+        Download `names` into target_dir. more() may return names added in
+        the meantime, they are queued by the rank of the client scheduler.
+        Returns {name: True/False}; raises NotSupported with an older server.
+        """
+        queue = collections.deque(names)
+        results = {}
+        last_received = time.monotonic()
+        progress = tqdm(
+            total=0, desc="Streams", unit="B", unit_scale=True, disable=not logger.isEnabledFor(logging.INFO)
+        )
+        timeout = self.sock.gettimeout()
+        if self.client.OFFLOAD:
+            self.gro = sockopts.enable_gro(self.sock)
+            if not self.gro:
+                logger.debug("UDP_GRO not supported, receiving one datagram per call")
+        try:
+            while queue or self.streams:
+                added = [name for name in more() if name not in self.transfers] if more else ()
+                added = [name for name in added if name not in queue]
+                if added:
+                    queue = collections.deque(sorted([*queue, *added], key=self.scheduler.rank))
+                    self.reorder()
+                opened = False
+                while queue and len(self.streams) < self.MAX_STREAMS:
+                    opened = True
+                    name = queue.popleft()
+                    stream = Stream(self.new_id(), name, os.path.join(target_dir, name))
+                    self.streams[stream.id] = stream
+                    self.transfers[name] = {
+                        "file": name,
+                        "bytes": None,
+                        "started": time.perf_counter(),
+                        "first_byte": None,
+                        "finished": None,
+                    }
+                    self.scheduler.start(name)
+                    self.send_open(stream)
+                if opened:
+                    self.reorder()
+
+                self.check_timeouts(results)
+                self.pump()
+
+                self.sock.settimeout(max(self.MIN_RTO / 2, min(self.rto, 0.2)))
+                try:
+                    if self.gro:
+                        datagrams, _ = sockopts.recv_segments(self.sock)
+                    else:
+                        datagrams = [self.sock.recvfrom(self.client.BUFFER_SIZE + 64)[0]]
+                except socket.timeout:
+                    if time.monotonic() - last_received > self.STALL_TIMEOUT:
+                        logger.error("Server stopped responding, giving up the remaining streams")
+                        for stream in list(self.streams.values()):
+                            self.close_stream(stream, results, False)
+                        for name in queue:
+                            results[name] = False
+                        queue.clear()
+                    continue
+                except ConnectionError:
+                    # ICMP port unreachable: server đang khởi động lại, các request sẽ được hỏi lại
+                    continue
+                last_received = time.monotonic()
+
+                for data in datagrams:
+                    if data[:1] == bytes((MARKER,)) and len(data) >= HEADER.size:
+                        nbytes = self.handle_data(data, results)
+                        if nbytes:
+                            progress.update(nbytes)
+                    else:
+                        self.handle_control(data.decode(errors="ignore").split("|"), results, progress)
+        finally:
+            self.sock.settimeout(timeout)
+            if self.gro:
+                # Socket của phiên còn dùng cho SIZE/PING...: tắt để không nhận gộp các câu trả lời
+                sockopts.enable_gro(self.sock, False)
+            progress.close()
+            for stream in list(self.streams.values()):
+                self.close_stream(stream, results, False)
+        return results
+
+    def reorder(self):
+        """
+        Keep self.streams in scheduler order: pump() serves them in this order.
+        """
+        self.streams = dict(sorted(self.streams.items(), key=lambda item: self.scheduler.rank(item[1].name)))
+
+    # ==============================================================================================
+    def send_open(self, stream):
+        flag = "|hash" if self.client.store is not None else ""
+        self.sock.sendto(f"OPEN|{stream.id}|{stream.name}{flag}".encode(), self.server_address)
+        stream.opened_at = time.monotonic()
+        stream.open_tries += 1
+
+    def pump(self):
+        """
+        Send MGETs while the shared window has room, one batch per stream per round.
+        """
+        streams = [stream for stream in self.streams.values() if stream.has_work()]
+        while streams and len(self.inflight) < int(self.cwnd):
+            waiting = []
+            for stream in streams:
+                room = min(int(self.cwnd) - len(self.inflight), self.STREAM_WINDOW - stream.inflight)
+                if room <= 0:
+                    continue
+                while stream.lost and stream.received[stream.lost[0]]:
+                    stream.lost.popleft()  # đến trễ sau khi đã bị coi là mất
+                if stream.lost:
+                    # Hỏi lại lẻ từng datagram, không kéo theo các seq đã nhận
+                    first, count, resend = stream.lost.popleft(), 1, True
+                elif stream.next_seq < stream.count:
+                    # Chờ đủ chỗ cho cả 1 loạt thay vì hỏi từng datagram mỗi khi 1 chỗ trống ra:
+                    # loạt lớn = ít MGET hơn và server gửi được bằng 1 lần GSO
+                    want = min(self.BATCH, stream.count - stream.next_seq, max(1, int(self.cwnd) // 2))
+                    if room < want and stream.inflight:
+                        continue
+                    first = stream.next_seq
+                    count = min(room, self.BATCH, stream.count - first)
+                    stream.next_seq += count
+                    resend = False
+                else:
+                    continue
+                self.send_mget(stream, first, count, resend)
+                if stream.has_work():
+                    waiting.append(stream)
+            streams = waiting
+
+    def send_mget(self, stream, first, count, resend):
+        self.sock.sendto(
+            f"MGET|{stream.id}|{stream.name}|{self.codec}|{first}|{count}".encode(), self.server_address
+        )
+        now = time.monotonic()
+        for seq in range(first, first + count):
+            self.inflight[(stream.id, seq)] = (now, resend)
+        stream.inflight += count
+
+    def check_timeouts(self, results):
+        now = time.monotonic()
+        lost = 0
+        while self.inflight:
+            (stream_id, seq), (sent, _) = next(iter(self.inflight.items()))
+            if now - sent < self.rto:
+                break
+            del self.inflight[(stream_id, seq)]
+            stream = self.streams.get(stream_id)
+            if stream is not None:
+                stream.inflight -= 1
+                stream.lost.append(seq)
+                lost += 1
+        if lost:
+            self.on_loss(now)
+
+        for stream in list(self.streams.values()):
+            if stream.opened_at is not None and now - stream.opened_at > self.client.TIMEOUT:
+                if stream.open_tries >= self.OPEN_RETRIES:
+                    logger.error(f"No reply to OPEN for {stream.name}")
+                    self.close_stream(stream, results, False)
+                else:
+                    self.send_open(stream)
+
+    def on_loss(self, now):
+        # Giảm cửa sổ tối đa 1 lần mỗi RTO cho cả đợt datagram mất cùng lúc
+        if now - self.last_loss > self.rto:
+            self.cwnd = max(self.MIN_WINDOW, self.cwnd / 2)
+            self.rto = min(self.client.TIMEOUT, self.rto * 2)
+            self.last_loss = now
+
+    # ==============================================================================================
+    def handle_data(self, data, results):
+        """
+        Returns the number of bytes written (0 for a duplicate or damaged datagram).
+        """
+        _, stream_id, seq, checksum, tag = HEADER.unpack_from(data)
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.received is None or seq >= stream.count or stream.received[seq]:
+            return 0  # trùng, đến trễ hoặc của stream đã đóng
+
+        entry = self.inflight.pop((stream_id, seq), None)
+        if entry is not None:
+            stream.inflight -= 1
+            if not entry[1]:
+                # Chỉ đo RTT trên datagram chưa hỏi lại (Karn)
+                self.update_rtt(time.monotonic() - entry[0])
+
+        payload = data[HEADER.size :]
+        with tracing.span("checksum"):
+            valid = self.client.calculate_checksum(payload) == checksum
+        if not valid:
+            stream.lost.append(seq)
+            return 0
+        if not payload:
+            logger.error(f"{stream.name} got shorter on the server, giving up this download")
+            self.close_stream(stream, results, False)
+            return 0
+
+        chunk = payload
+        codec = compression.TAG_CODECS.get(tag.decode(errors="ignore"))
+        if codec != compression.NO_COMPRESSION:
+            with tracing.span("decompress"):
+                chunk = compression.decompress(codec, payload)
+        with tracing.span("write", stream=stream_id):
+            stream.file.seek(seq * self.payload_size)
+            stream.file.write(chunk)
+        stream.received[seq] = 1
+        stream.done_count += 1
+        transfer = self.transfers[stream.name]
+        if transfer["first_byte"] is None:
+            transfer["first_byte"] = time.perf_counter()
+        self.cwnd = min(self.MAX_WINDOW, self.cwnd + 1 / self.cwnd)
+        self.backoff.reset()
+        if stream.finished:
+            self.close_stream(stream, results, True)
+        return len(chunk)
+
+    def update_rtt(self, rtt):
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        self.rto = max(self.MIN_RTO, min(self.client.TIMEOUT, 4 * self.srtt))
+
+    def handle_control(self, fields, results, progress):
+        kind = fields[0]
+        if kind == "OPENED":
+            stream = self.streams.get(int(fields[1]))
+            if stream is None or stream.opened_at is None:
+                return
+            stream.opened_at = None
+            self.open_stream(stream, int(fields[2]), fields[3] if len(fields) > 3 else None, results, progress)
+        elif kind == "MERR":
+            stream = self.streams.get(int(fields[1]))
+            if stream is not None:
+                logger.error(f"{stream.name}: {fields[2]}")
+                self.close_stream(stream, results, False)
+        elif kind == "BUSY":
+            # Server quá tải: thu nhỏ cửa sổ và chờ, các datagram bị bỏ sẽ được hỏi lại khi hết RTO
+            busy = session.ServerBusy.parse(fields)
+            self.on_loss(time.monotonic())
+            with tracing.span("backoff"):
+                self.backoff.sleep(busy.retry_after)
+        elif kind == "ERROR" and fields[-1].startswith("Unknown command"):
+            self.drain()
+            raise NotSupported(fields[-1])
+
+    def drain(self):
+        """
+        Drop the replies still queued (one ERROR per OPEN sent), so the
+        per-file download that follows does not read them as its own.
+        """
+        self.sock.settimeout(min(self.rto, 0.2))
+        try:
+            while True:
+                self.sock.recvfrom(self.client.BUFFER_SIZE + 64)
+        except (socket.timeout, ConnectionError):
+            pass
+
+    def open_stream(self, stream, size, digest, results, progress):
+        if size < 0:
+            logger.error(f"File {stream.name} not found on the server")
+            self.close_stream(stream, results, False)
+            return
+        stream.digest = digest
+        if digest is not None:
+            try:
+                if self.client.store.link(digest, stream.path, size):
+                    logger.info(f"{stream.name} is already in the content store, nothing to download")
+                    self.close_stream(stream, results, True, linked=True)
+                    return
+            except OSError as e:
+                logger.error(f"Could not take {stream.name} from the content store: {e}")
+
+        stream.size = size
+        if self.scheduler.policy == "smallest":
+            self.scheduler.set_size(stream.name, size)
+            self.reorder()
+        stream.count = -(-size // self.payload_size)
+        stream.received = bytearray(stream.count)
+        # Ghi ra file mới rồi đổi tên: file cũ có thể là hardlink tới content store
+        stream.file = open(stream.path + ".part", "wb")
+        stream.file.truncate(size)
+        progress.total += size
+        progress.refresh()
+        logger.info(f"Starting download for {stream.name}. Total size: {size} bytes")
+        if stream.finished:
+            self.close_stream(stream, results, True)
+
+    def close_stream(self, stream, results, ok, linked=False):
+        self.streams.pop(stream.id, None)
+        for key in [key for key in self.inflight if key[0] == stream.id]:
+            del self.inflight[key]
+        if stream.file is not None:
+            stream.file.close()
+            stream.file = None
+            if ok:
+                os.replace(stream.path + ".part", stream.path)
+            elif os.path.exists(stream.path + ".part"):
+                os.remove(stream.path + ".part")
+        if ok and not linked and stream.digest is not None:
+            ok = self.add_to_store(stream)
+        results[stream.name] = ok
+        self.transfers[stream.name].update(bytes=stream.size, finished=time.perf_counter())
+        if ok:
+            self.scheduler.finish(stream.name)
+        if ok and not linked:
+            logger.info(f"File {stream.name} downloaded successfully")
+
+    def add_to_store(self, stream):
+        try:
+            with tracing.span("store.add", file=stream.name):
+                if self.client.store.add(stream.digest, stream.path):
+                    return True
+        except OSError as e:
+            logger.error(f"Could not add {stream.name} to the content store: {e}")
+            return True
+        # Nội dung không khớp SHA-256 của server: bỏ để tải lại
+        os.remove(stream.path)
+        return False
@@ -0,0 +1,268 @@
+"""
+Order in which the clients download the names of the input file, so a
+large file listed first does not hold back every small one behind it.
+
+A line of the input file is a name, optionally followed by annotations:
+
+    big.zip
+    report.pdf priority=10
+    cat.png deadline=30          (seconds after the line was first read)
+    dog.png deadline=18:30       (a time of day, HH:MM[:SS])
+
+Policies (SCHEDULE option of both clients):
+
+- fifo: the order in which the names were first read (the old behaviour).
+- smallest: smallest file first, ties in fifo order.
+- priority: higher priority first (default 0), ties in fifo order.
+- deadline: earliest deadline first, names without one after them by
+  priority.
+
+The clients look at the input file again while they download. A name that
+ranks before the file being downloaded preempts it when more than
+PREEMPT_BYTES of that file are left: the TCP client pauses the transfer
+between blocks and resumes it afterwards from the ranges still missing;
+the multiplexed UDP client opens a stream for it next to the running ones
+and serves the streams in policy order.
+
+Every job records when it was first queued, started and finished; report()
+logs the queue wait and the completion time (queued -> finished) of each
+file, with p50/p95/max over the files of the round.
+"""
+
+import os
+import time
+import datetime
+
+import log
+
+logger = log.get_logger(__name__)
+
+POLICIES = ("fifo", "smallest", "priority", "deadline")
+DEFAULT_POLICY = "fifo"
+
+# Chỉ tạm dừng file còn lớn hơn mức này (file nhỏ thì tải xong luôn còn nhanh hơn)
+PREEMPT_BYTES = 8 * 1024 * 1024
+# Khoảng thời gian tối thiểu giữa 2 lần stat() file input trong lúc tải
+CHECK_INTERVAL = 0.5
+
+
+def parse_line(line):
+    """
+    "name [priority=N] [deadline=S|HH:MM[:SS]]" -> (name, {"priority": .., "deadline": ..}).
+    Tokens after the name that are not known annotations stay part of the name.
+    """
+    words = line.split()
+    options = {}
+    while len(words) > 1:
+        key, sep, value = words[-1].partition("=")
+        if not sep or key not in ("priority", "deadline"):
+            break
+        try:
+            options[key] = int(value) if key == "priority" else parse_deadline(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid annotation {words[-1]!r} in the input file")
+        words.pop()
+    return " ".join(words), options
+
+
+def parse_deadline(text):
+    """
+    Seconds after the name was queued (float), or a time of day as
+    ("at", epoch seconds).
+    """
+    if ":" not in text:
+        return float(text)
+    parts = [int(part) for part in text.split(":")]
+    if len(parts) not in (2, 3):
+        raise ValueError(text)
+    moment = datetime.datetime.combine(datetime.date.today(), datetime.time(*parts))
+    return ("at", moment.timestamp())
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+class Job:
+    def __init__(self, name, order):
+        self.name = name
+        self.order = order  # thứ tự lần đầu đọc được (fifo)
+        self.size = None
+        self.priority = 0
+        self.deadline = None  # epoch giây
+        self.queued = time.monotonic()
+        self.queued_at = time.time()
+        self.started = None
+        self.finished = None
+        self.finished_at = None
+        self.preempted = 0
+
+    def update(self, entry):
+        if entry.get("size_bytes") is not None:
+            self.size = entry["size_bytes"]
+        self.priority = entry.get("priority", 0)
+        deadline = entry.get("deadline")
+        if isinstance(deadline, tuple):
+            self.deadline = deadline[1]
+        elif deadline is not None:
+            self.deadline = self.queued_at + deadline
+        else:
+            self.deadline = None
+
+
+# ==================================================================================================
+class Scheduler:
+    def __init__(self, policy=DEFAULT_POLICY, input_file=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown schedule {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.input_file = input_file
+        self.jobs = {}  # tên -> Job chưa xong, giữ qua các lần đọc lại input
+        self.done = []  # Job đã xong, chưa được report()
+        self.next_order = 0
+        self.stamp = None  # mtime của file input lúc đọc gần nhất
+        self.last_check = 0.0
+
+    # ==============================================================================================
+    def read_input(self):
+        """
+        [(name, options)] of the input file, in file order.
+        Raises OSError like open().
+        """
+        stamp = os.stat(self.input_file).st_mtime_ns
+        with open(self.input_file, "r") as file:
+            entries = [parse_line(line.strip()) for line in file if line.strip()]
+        self.stamp = stamp
+        return entries
+
+    def input_changed(self):
+        """
+        True when the input file was modified since read_input(); stat()
+        at most once per CHECK_INTERVAL, so it can be polled while downloading.
+        """
+        now = time.monotonic()
+        if self.input_file is None or now - self.last_check < CHECK_INTERVAL:
+            return False
+        self.last_check = now
+        try:
+            return os.stat(self.input_file).st_mtime_ns != self.stamp
+        except OSError:
+            return False
+
+    # ==============================================================================================
+    def job(self, entry):
+        job = self.jobs.get(entry["name"])
+        if job is None:
+            job = self.jobs[entry["name"]] = Job(entry["name"], self.next_order)
+            self.next_order += 1
+        job.update(entry)
+        return job
+
+    def key(self, job):
+        if self.policy == "smallest":
+            return (job.size is None, job.size or 0, job.order)
+        if self.policy == "priority":
+            return (-job.priority, job.order)
+        if self.policy == "deadline":
+            return (job.deadline is None, job.deadline or 0, -job.priority, job.order)
+        return (job.order,)
+
+    def order(self, entries):
+        """
+        Sort `entries` (dicts with "name" and optionally "size_bytes",
+        "priority", "deadline") by the policy. Names seen for the first time
+        are queued now.
+        """
+        return sorted(entries, key=lambda entry: self.key(self.job(entry)))
+
+    def rank(self, name):
+        """
+        Sort key of a queued name, for callers that interleave several files.
+        """
+        job = self.jobs.get(name)
+        return self.key(job) if job is not None else (float("inf"),)
+
+    def more_urgent(self, entries, current, left):
+        """
+        The first of `entries` that should preempt the download of
+        `current` (with `left` bytes to go), or None.
+        """
+        if left <= PREEMPT_BYTES or current not in self.jobs:
+            return None
+        ranked = self.order(entries)
+        if ranked and ranked[0]["name"] != current and self.rank(ranked[0]["name"]) < self.rank(current):
+            return ranked[0]
+        return None
+
+    # ==============================================================================================
+    def start(self, name):
+        job = self.jobs.get(name)
+        if job is not None and job.started is None:
+            job.started = time.monotonic()
+
+    def pause(self, name):
+        job = self.jobs.get(name)
+        if job is not None:
+            job.preempted += 1
+
+    def discard(self, name):
+        """
+        Drop a name that needed no download (already in place).
+        """
+        self.jobs.pop(name, None)
+
+    def set_size(self, name, size):
+        job = self.jobs.get(name)
+        if job is not None:
+            job.size = size
+
+    def finish(self, name):
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return
+        job.finished = time.monotonic()
+        job.finished_at = time.time()
+        if job.started is None:
+            job.started = job.finished
+        self.done.append(job)
+
+    def report(self):
+        """
+        Log the queue wait and completion time of the files finished since
+        the last report. Returns them as a list of dicts. A failed download
+        stays queued, its wait goes on until it succeeds.
+        """
+        stats = [
+            {
+                "file": job.name,
+                "wait": job.started - job.queued,
+                "completion": job.finished - job.queued,
+                "preempted": job.preempted,
+                "missed_deadline": job.deadline is not None and job.finished_at > job.deadline,
+            }
+            for job in self.done
+        ]
+        self.done = []
+        if not stats:
+            return stats
+        for item in stats:
+            logger.info(
+                f"{item['file']}: waited {item['wait']:.2f}s, completed {item['completion']:.2f}s after queued"
+                + (f", preempted {item['preempted']}x" if item["preempted"] else "")
+                + (" (missed its deadline)" if item["missed_deadline"] else ""),
+                extra={"tag": "SCHEDULE"},
+            )
+        waits = [item["wait"] for item in stats]
+        completions = [item["completion"] for item in stats]
+        logger.info(
+            f"{len(stats)} files ({self.policy}): "
+            f"queue wait p50 {percentile(waits, 50):.2f}s p95 {percentile(waits, 95):.2f}s max {max(waits):.2f}s, "
+            f"completion p50 {percentile(completions, 50):.2f}s p95 {percentile(completions, 95):.2f}s "
+            f"max {max(completions):.2f}s",
+            extra={"tag": "SCHEDULE"},
+        )
+        return stats
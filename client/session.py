@@ -0,0 +1,273 @@
+import random
+import socket
+import threading
+import time
+
+import log
+import utils
+
+logger = log.get_logger(__name__)
+
+
+class ServerBusy(ConnectionError):
+    """
+    The server is overloaded and asked to come back after retry_after seconds (BUSY reply).
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+    @classmethod
+    def parse(cls, fields):
+        """
+        From the fields of a BUSY reply: ["BUSY", "<retry_after>", ...].
+        """
+        try:
+            return cls(float(fields[1]))
+        except (IndexError, ValueError):
+            return cls(Backoff.INITIAL)
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter: INITIAL, 2*INITIAL, ... capped at MAXIMUM.
+    """
+
+    INITIAL = 0.5
+    MAXIMUM = 30
+
+    def __init__(self, initial=None, maximum=None):
+        self.initial = initial or self.INITIAL
+        self.maximum = maximum or self.MAXIMUM
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * (2**self.attempt))
+        self.attempt += 1
+        # jitter để nhiều client không kết nối lại cùng một lúc
+        return delay * random.uniform(0.5, 1.0)
+
+    def wait_time(self, minimum=0):
+        """
+        - minimum: retry-after asked by the server, spread by jitter above it.
+        """
+        return max(self.next_delay(), minimum * random.uniform(1.0, 1.5))
+
+    def sleep(self, minimum=0):
+        delay = self.wait_time(minimum)
+        time.sleep(delay)
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ClientSession:
+    """
+    Persistent TCP session: one control socket plus a pool of warm pipes.
+
+    - Keeps the connection alive with PING while idle, so the server's
+      control timeout never closes a session between files.
+    - Reconnects with exponential backoff; a control-only failure re-OPENs
+      with the previous token so the server re-attaches the same pipes.
+    - A BUSY reply (server overloaded) waits at least its retry-after.
+    """
+
+    KEEPALIVE_INTERVAL = 20
+    CONNECT_TIMEOUT = 10
+    PIPE_TIMEOUT = 30
+    MAX_RETRIES = 8
+
+    def __init__(self, client, host, port):
+        self.client = client
+        self.host = host
+        self.port = port
+
+        self.main_socket = None
+        self.socket_list = []
+        self.token = None
+
+        # Khoá cho mỗi cặp request/response trên control socket
+        self.lock = threading.RLock()
+        self.last_activity = time.monotonic()
+        self.closed = threading.Event()
+        self.backoff = Backoff()
+        self.keepalive_thread = None
+
+    # ==============================================================================================
+    def connect(self):
+        """
+        Open the control connection and the pipes, retrying with backoff.
+        """
+        retries = 0
+        while not self.closed.is_set():
+            try:
+                self.open_control()
+                self.open_pipes(reuse=False)
+                self.backoff.reset()
+                self.start_keepalive()
+                return
+            except OSError as e:
+                retries += 1
+                self.close_sockets()
+                if retries > self.MAX_RETRIES:
+                    raise ConnectionError(
+                        f"Could not reach {self.host}:{self.port} after {retries} attempts"
+                    ) from e
+                delay = self.backoff.sleep(getattr(e, "retry_after", 0))
+                logger.info(f"Connection failed ({e}), retried in {delay:.1f}s")
+
+    def open_control(self):
+        main_socket = socket.create_connection(
+            (self.host, self.port), timeout=self.CONNECT_TIMEOUT
+        )
+        main_socket.settimeout(self.PIPE_TIMEOUT)
+        self.client.tune_socket(main_socket, "control")
+        with self.lock:
+            self.main_socket = main_socket
+            self.touch()
+
+    def open_pipes(self, reuse):
+        """
+        OPEN the pipe session; with reuse=True the previous token is sent and
+        the existing pipe sockets are kept.
+        """
+        with self.lock:
+            token = self.token if reuse else None
+            socket_list = self.client.create_pipes(
+                self.main_socket, token=token, connect=not reuse
+            )
+            if not reuse:
+                for sock in socket_list:
+                    sock.settimeout(self.PIPE_TIMEOUT)
+                self.socket_list = socket_list
+            self.token = self.client.token
+            self.touch()
+
+    def ensure_pipes(self, count):
+        """
+        Open more pipes in the current session until there are `count`.
+        """
+        with self.lock:
+            if len(self.socket_list) >= count:
+                return
+            socket_list = self.client.connect_pipes(range(len(self.socket_list), count))
+            for sock in socket_list:
+                sock.settimeout(self.PIPE_TIMEOUT)
+            self.socket_list.extend(socket_list)
+            logger.info(f"Session now uses {len(self.socket_list)} pipes")
+
+    def reconnect(self, pipes_ok=False):
+        """
+        Re-establish the session after an error.
+        - pipes_ok: only the control connection failed, keep the warm pipes.
+        """
+        with self.lock:
+            if self.main_socket is not None:
+                self.main_socket.close()
+                self.main_socket = None
+            if not pipes_ok:
+                self.close_sockets()
+
+            retries = 0
+            while not self.closed.is_set():
+                try:
+                    self.open_control()
+                    self.open_pipes(reuse=pipes_ok)
+                    self.backoff.reset()
+                    logger.info(f"Reconnected to {self.host}:{self.port}")
+                    return
+                except OSError as e:
+                    retries += 1
+                    pipes_ok = False
+                    self.close_sockets()
+                    if retries > self.MAX_RETRIES:
+                        raise ConnectionError(
+                            f"Could not reconnect to {self.host}:{self.port}"
+                        ) from e
+                    delay = self.backoff.sleep(getattr(e, "retry_after", 0))
+                    logger.info(f"Reconnect failed ({e}), retried in {delay:.1f}s")
+
+    # ==============================================================================================
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def list_resources(self):
+        with self.lock:
+            list_file = self.client.receive_resource_list(self.main_socket)
+            self.touch()
+            return list_file
+
+    def sync_file(self, filename, path, part_path):
+        with self.lock:
+            result = self.client.receive_delta(self.main_socket, filename, path, part_path)
+            self.touch()
+            return result
+
+    def file_hash(self, filename):
+        with self.lock:
+            result = self.client.receive_hash(self.main_socket, filename)
+            self.touch()
+            return result
+
+    def send_request(self, message):
+        """
+        Send one fixed-size control message that has no reply (GET).
+        """
+        with self.lock:
+            self.main_socket.sendall(message.ljust(self.client.MESSAGE_SIZE).encode())
+            self.touch()
+
+    def ping(self):
+        with self.lock:
+            self.main_socket.sendall("PING\r\n".ljust(self.client.MESSAGE_SIZE).encode())
+            response = utils.recv_exact(self.main_socket, self.client.MESSAGE_SIZE)
+            self.touch()
+            return response.decode().strip() == "PONG"
+
+    # ==============================================================================================
+    def start_keepalive(self):
+        if self.keepalive_thread is not None and self.keepalive_thread.is_alive():
+            return
+        self.keepalive_thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+        self.keepalive_thread.start()
+
+    def keepalive_loop(self):
+        while not self.closed.wait(1):
+            if time.monotonic() - self.last_activity < self.KEEPALIVE_INTERVAL:
+                continue
+            try:
+                if not self.ping():
+                    raise ConnectionError("Unexpected keep-alive response")
+            except (OSError, ConnectionError) as e:
+                if self.closed.is_set():
+                    return
+                logger.info(f"Keep-alive failed ({e}), reconnecting...")
+                try:
+                    self.reconnect(pipes_ok=True)
+                except ConnectionError as e:
+                    logger.error(e)
+
+    def interrupt(self):
+        """
+        Wake the threads blocked on the pipes; reconnect() before using them again.
+        """
+        for sock in list(self.socket_list):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close_sockets(self):
+        for sock in self.socket_list:
+            sock.close()
+        self.socket_list = []
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.main_socket is not None:
+                self.main_socket.close()
+                self.main_socket = None
+            self.close_sockets()
@@ -0,0 +1,136 @@
+import os
+import socket
+import threading
+
+import log
+import session
+import utils
+
+logger = log.get_logger(__name__)
+
+
+class CatalogSubscription:
+    """
+    Catalog changes pushed by the server on a dedicated connection (SUBSCRIBE).
+
+    Every change updates receiveList.txt right away and wakes wait(), so the
+    download loop reacts to a new or modified resource without polling the
+    server. The connection is re-opened with backoff and the last version
+    seen, so changes made while it was down are still delivered; a RESET
+    from the server (changes no longer kept) asks the caller to LIST again.
+    """
+
+    # Server gửi NOOP mỗi 20 giây: không nhận được gì lâu hơn thì coi như mất kết nối
+    READ_TIMEOUT = 60
+
+    def __init__(self, client, host, port, entries, list_path="receiveList.txt"):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.list_path = list_path
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.closed = threading.Event()
+        self.catalog = {}  # tên -> kích thước
+        self.modified = set()  # tên có nội dung đổi hoặc bị xoá, chưa được lấy bằng take()
+        self.reset = False
+        self.version = None
+        self.sock = None
+        self.thread = None
+        self.set_entries(entries)
+
+    def set_entries(self, entries):
+        """
+        Start over from a full LIST reply: list of (path, size).
+        """
+        with self.lock:
+            self.catalog = {path.split("/")[-1]: size for path, size in entries}
+
+    # ==============================================================================================
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="catalog-subscription", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.closed.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for a catalog change.
+        """
+        if self.changed.wait(timeout):
+            self.changed.clear()
+            return True
+        return False
+
+    def take(self):
+        """
+        (names modified or removed since the last call, True if the catalog must be listed again).
+        """
+        with self.lock:
+            modified, reset = self.modified, self.reset
+            self.modified, self.reset = set(), False
+            return modified, reset
+
+    # ==============================================================================================
+    def run(self):
+        backoff = session.Backoff()
+        while not self.closed.is_set():
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.READ_TIMEOUT)
+                self.client.tune_socket(self.sock, "control")
+                self.sock.sendall(f"SUBSCRIBE\r\n{self.version or ''}".ljust(self.client.MESSAGE_SIZE).encode())
+                while not self.closed.is_set():
+                    message = utils.recv_exact(self.sock, self.client.MESSAGE_SIZE).decode().strip()
+                    self.handle(message.split("\r\n"))
+                    backoff.reset()
+            except (OSError, ConnectionError, ValueError) as e:
+                if self.closed.is_set():
+                    break
+                delay = backoff.sleep(getattr(e, "retry_after", 0))
+                logger.info(f"Catalog subscription lost ({e}), resubscribed after {delay:.1f}s")
+            finally:
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+
+    def handle(self, fields):
+        kind = fields[0]
+        if kind == "SUBSCRIBED":
+            if self.version is None:
+                self.version = int(fields[1])
+            logger.info(f"Subscribed to catalog changes (version {fields[1]})")
+        elif kind == "CHANGE":
+            version, op, name, size = int(fields[1]), fields[2], fields[3].split("/")[-1], int(fields[4])
+            with self.lock:
+                if op == "removed":
+                    self.catalog.pop(name, None)
+                else:
+                    self.catalog[name] = size
+                if op != "added":
+                    self.modified.add(name)
+                self.version = version
+                self.save()
+            logger.info(f"Catalog: {name} {op} ({size} bytes)", extra={"tag": "LIST"})
+            self.changed.set()
+        elif kind == "BUSY":
+            raise session.ServerBusy.parse(fields)
+        elif kind == "RESET":
+            with self.lock:
+                self.version = int(fields[1])
+                self.reset = True
+            self.changed.set()
+        elif kind != "NOOP":
+            raise ValueError(f"Unexpected subscription message {kind!r}")
+
+    def save(self):
+        # Ghi file tạm rồi đổi tên: vòng lặp tải có thể đang đọc receiveList.txt
+        tmp_path = self.list_path + ".tmp"
+        self.client.save_resource_list_to_file(list(self.catalog.items()), tmp_path)
+        os.replace(tmp_path, self.list_path)
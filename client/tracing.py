@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import atexit
+import random
+import pstats
+import cProfile
+import threading
+
+import log
+
+logger = log.get_logger(__name__)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args, sampled):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.sampled = sampled
+
+    def __enter__(self):
+        local = self.tracer.local
+        local.stack = getattr(local, "stack", 0) + 1
+        local.sampled = self.sampled
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ended = time.perf_counter()
+        local = self.tracer.local
+        local.stack -= 1
+        if self.sampled:
+            self.tracer.record(self.name, self.started, ended, self.args)
+        return False
+
+    def set(self, **args):
+        """
+        Attach values known only after the work (bytes read, codec...).
+        """
+        self.args.update(args)
+
+
+class Tracer:
+    """
+    Opt-in spans exported as a Chrome trace (chrome://tracing, ui.perfetto.dev).
+
+    - Disabled by default: span() returns a shared no-op context manager.
+    - sample: fraction of root spans recorded; nested spans follow their
+      root, so a sampled request is always complete.
+    - Events are kept in memory (at most MAX_EVENTS) and written by export().
+    """
+
+    MAX_EVENTS = 1_000_000
+
+    def __init__(self):
+        self.enabled = False
+        self.sample = 1.0
+        self.path = None
+        self.events = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.epoch = time.perf_counter()
+
+    def configure(self, path=None, sample=1.0):
+        self.path = path
+        self.sample = sample
+        self.enabled = path is not None
+        if self.enabled:
+            logger.info(f"Tracing {self.sample:.0%} of requests to {self.path}")
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NOOP
+        local = self.local
+        if getattr(local, "stack", 0):
+            sampled = local.sampled
+        else:
+            sampled = self.sample >= 1.0 or random.random() < self.sample
+        return Span(self, name, args, sampled)
+
+    def record(self, name, started, ended, args):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (started - self.epoch) * 1e6,
+            "dur": (ended - started) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            if len(self.events) < self.MAX_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def export(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            events = list(self.events)
+            dropped = self.dropped
+        # Tên luồng để trace viewer hiển thị thay cho thread id
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": {"name": thread.name},
+            }
+            for thread in threading.enumerate()
+        ]
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "traceEvents": metadata + events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"dropped_events": dropped},
+                },
+                file,
+            )
+        logger.info(f"Trace with {len(events)} spans written to {path}")
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def setup(path=None, sample=None):
+    """
+    Enable tracing, from the arguments or $TRACE_FILE / $TRACE_SAMPLE.
+    The trace is written when the process exits.
+    """
+    path = path or os.environ.get("TRACE_FILE")
+    if sample is None:
+        sample = float(os.environ.get("TRACE_SAMPLE", "1"))
+    if path:
+        tracer.configure(path, sample)
+        atexit.register(tracer.export)
+
+
+def _after_fork():
+    # Mỗi tiến trình con (worker của serverPool) ghi file riêng "<path>.<pid>"
+    if tracer.enabled:
+        tracer.path = f"{tracer.path}.{os.getpid()}"
+        tracer.events = []
+        tracer.lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def profile(func, output, *args, **kwargs):
+    """
+    Run func under cProfile, including the threads it starts. Writes the
+    raw stats to <output> and the top functions to <output>.txt.
+    """
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def start_thread_profiler(frame, event, arg):
+        # Gọi ở sự kiện đầu tiên của mỗi luồng mới: thay bằng profiler riêng của luồng
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(start_thread_profiler)
+    profilers[0].enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                try:
+                    stats.add(profiler)
+                except TypeError:
+                    # Luồng chưa ghi nhận được lời gọi nào
+                    pass
+        stats.dump_stats(output)
+        with open(f"{output}.txt", "w") as file:
+            stats.stream = file
+            stats.sort_stats("cumulative").print_stats(40)
+            stats.sort_stats("tottime").print_stats(20)
+        logger.info(
+            f"Profile of {len(profilers)} threads written to {output} (summary in {output}.txt)"
+        )
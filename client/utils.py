@@ -113,3 +113,33 @@ def standardize_str(s, n):
     while len(s) < n:
         s += " "
     return s
+
+
+def recv_exact(sock, n):
+    """
+    Receive exactly n bytes from a stream socket.
+    """
+    buffer = bytearray()
+    while len(buffer) < n:
+        data = sock.recv(min(n - len(buffer), 1048576))
+        if not data:
+            raise ConnectionError("Connection closed while receiving data")
+        buffer += data
+    return bytes(buffer)
+
+
+def recv_line(sock, limit=1024, delimiter=b"\r\n"):
+    """
+    Receive one header line (without the delimiter) from a stream socket.
+    Dùng MSG_PEEK để không đọc lấn sang phần dữ liệu phía sau.
+    """
+    while True:
+        peeked = sock.recv(limit + len(delimiter), socket.MSG_PEEK)
+        if not peeked:
+            raise ConnectionError("Connection closed while receiving header")
+        index = peeked.find(delimiter)
+        if index >= 0:
+            line = recv_exact(sock, index + len(delimiter))
+            return line[:-len(delimiter)]
+        if len(peeked) >= limit + len(delimiter):
+            raise ValueError("Header line exceeds the message size")
@@ -0,0 +1,115 @@
+"""
+Admission control of the TCP server, so a burst of clients slows down or
+turns away the extra work instead of degrading every session.
+
+- max_sessions: control connections served at the same time. A connection
+  over the limit waits up to queue_timeout seconds for a free slot; at most
+  max_queued connections wait, the others (and the ones whose wait runs
+  out) are answered "BUSY\r\n<retry_after>" and closed.
+- max_inflight_bytes: bytes of blocks read (or being read) from disk and
+  not sent yet, over every session. A GET waits for room before its block
+  is read, so the memory held by blocks stays bounded whatever the number
+  of pipes.
+- max_queued_requests (PipeSession): GET requests of one session waiting
+  for their pipe sender. Over it the control loop stops reading, and TCP
+  flow control holds the client back.
+
+0 means no limit. In the pre-fork server the session limits apply to each
+worker and max_inflight_bytes is shared out between the workers. So are
+the bandwidth caps of ratelimit.py: GLOBAL_RATE is shared out, CLIENT_RATE
+is a per-worker cap.
+"""
+
+import time
+import threading
+
+ADMITTED = "admitted"
+QUEUED = "queued"
+REJECTED = "rejected"
+
+
+class Admission:
+    def __init__(self, max_sessions=0, max_queued=0, queue_timeout=10, max_inflight_bytes=0):
+        self.max_sessions = max_sessions
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_inflight_bytes = max_inflight_bytes
+        self.condition = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.inflight = 0
+
+    def has_slot(self):
+        return not self.max_sessions or self.active < self.max_sessions
+
+    # ==============================================================================================
+    def admit(self):
+        """
+        Called by the accept loop for a new connection: ADMITTED (it holds a
+        slot), QUEUED (call wait() from its thread) or REJECTED.
+        """
+        with self.condition:
+            if self.has_slot() and not self.queued:
+                self.active += 1
+                return ADMITTED
+            if self.queued < self.max_queued:
+                self.queued += 1
+                return QUEUED
+            return REJECTED
+
+    def wait(self, stop=None):
+        """
+        Wait for a slot for a QUEUED connection. Returns False when the wait
+        ran out (or stop() became true) and the connection must be rejected.
+        """
+        with self.condition:
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while not self.has_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (stop is not None and stop()):
+                        return False
+                    # Chờ từng lát ngắn để còn kiểm tra cờ dừng của server
+                    self.condition.wait(min(1, remaining))
+                self.active += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def leave(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    # ==============================================================================================
+    def reserve(self, nbytes):
+        """
+        Block until `nbytes` more may be held in memory. A block larger than
+        the whole budget only waits for the others to finish.
+        Returns the amount to pass to release().
+        """
+        if not self.max_inflight_bytes:
+            return 0
+        nbytes = min(nbytes, self.max_inflight_bytes)
+        with self.condition:
+            while self.inflight and self.inflight + nbytes > self.max_inflight_bytes:
+                self.condition.wait()
+            self.inflight += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        if not nbytes:
+            return
+        with self.condition:
+            self.inflight -= nbytes
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "active": self.active,
+                "queued": self.queued,
+                "inflight_bytes": self.inflight,
+                "max_sessions": self.max_sessions,
+                "max_inflight_bytes": self.max_inflight_bytes,
+            }
@@ -0,0 +1,172 @@
+import os
+import hashlib
+import threading
+import collections
+import time
+
+
+def scan(directory):
+    """
+    {path: (size, mtime_ns)} of every file under `directory`.
+    """
+    stats = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            file_path = os.path.join(root, file)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue  # bị xoá giữa lúc quét
+            stats[file_path] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+class Catalog:
+    """
+    Index of the resources served by a server.
+
+    - auto_refresh=True: rescan the directory on every read (single process).
+    - auto_refresh=False: keep the snapshot until refresh() is called, so
+      pre-forked workers all serve the catalog built by the parent.
+
+    Every rescan that finds a difference records one change per file
+    ("added", "removed" or "modified", with the new size) under a new
+    version number; subscribers follow them with changes_since() and
+    wait_changes(). watch() rescans in the background for them.
+    """
+
+    # Số thay đổi được giữ lại cho subscriber kết nối lại với version cũ
+    HISTORY = 1024
+
+    def __init__(self, resource_path, auto_refresh=True):
+        self.resource_path = resource_path
+        self.auto_refresh = auto_refresh
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        # Một lần quét tại một thời điểm, để kết quả cũ không ghi đè kết quả mới
+        self.refresh_lock = threading.Lock()
+        self.entries = []
+        self.stats = None
+        self.version = 0
+        self.changes = collections.deque(maxlen=self.HISTORY)  # (version, op, name, size)
+        self.watcher = None
+        self.hashes = HashCache()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Rescan the resource directory.
+        """
+        with self.refresh_lock:
+            stats = scan(self.resource_path)
+            self.apply_scan(stats)
+
+    def apply_scan(self, stats):
+        with self.lock:
+            if self.stats is not None:
+                changes = []
+                for path, (size, mtime) in stats.items():
+                    old = self.stats.get(path)
+                    if old is None:
+                        changes.append(("added", path, size))
+                    elif old != (size, mtime):
+                        changes.append(("modified", path, size))
+                for path in self.stats.keys() - stats.keys():
+                    changes.append(("removed", path, 0))
+                for op, path, size in changes:
+                    self.version += 1
+                    self.changes.append((self.version, op, self.name(path), size))
+                if changes:
+                    self.changed.notify_all()
+            self.stats = stats
+            self.entries = [(path, size) for path, (size, _) in stats.items()]
+
+    def name(self, path):
+        return os.path.relpath(path, self.resource_path).replace(os.sep, "/")
+
+    def list_entries(self):
+        """
+        Return the catalog as a list of (path, size) tuples.
+        """
+        if self.auto_refresh:
+            self.refresh()
+        with self.lock:
+            return list(self.entries)
+
+    # ==============================================================================================
+    def watch(self, interval):
+        """
+        Rescan every `interval` seconds in the background (started once).
+        """
+        with self.lock:
+            if self.watcher is not None:
+                return
+            self.watcher = threading.Thread(target=self.run_watcher, args=(interval,), name="catalog", daemon=True)
+        self.watcher.start()
+
+    def run_watcher(self, interval):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+    def changes_since(self, version):
+        """
+        Changes after `version`, or None when they are no longer in the
+        history (the subscriber must LIST again).
+        """
+        with self.lock:
+            if version == self.version:
+                return []
+            if version > self.version or not self.changes or self.changes[0][0] > version + 1:
+                return None
+            return [change for change in self.changes if change[0] > version]
+
+    def wait_changes(self, version, timeout):
+        """
+        Wait up to `timeout` seconds for a version newer than `version`.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def digest(self, path):
+        """
+        SHA-256 (hex) of the resource at `path`.
+        """
+        return self.hashes.digest(path)
+
+
+class HashCache:
+    """
+    SHA-256 of resource files, computed on first request and reused until
+    the size or mtime of the file changes.
+    """
+
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # path -> (size, mtime_ns, hex digest)
+
+    def digest(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            return entry[2]
+
+        # Băm ngoài lock: file lớn không chặn các yêu cầu khác
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            while True:
+                data = file.read(self.READ_SIZE)
+                if not data:
+                    break
+                sha.update(data)
+        with self.lock:
+            self.entries[path] = (stat.st_size, stat.st_mtime_ns, sha.hexdigest())
+        return sha.hexdigest()
@@ -0,0 +1,246 @@
+import os
+import zlib
+import hashlib
+import threading
+
+import log
+
+logger = log.get_logger(__name__)
+
+# ------------------------------ OPTIONAL CODECS ------------------------------#
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+NO_COMPRESSION = "none"
+
+# Dung lượng tối đa của cache block đã nén trên đĩa (0 = không giới hạn)
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Các định dạng đã được nén sẵn -> nén thêm chỉ tốn CPU
+INCOMPRESSIBLE_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst", ".lz4",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".mp3", ".mp4", ".mkv", ".avi", ".mov", ".webm", ".ogg", ".flac",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".jar", ".apk",
+}
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Thứ tự ưu tiên khi thương lượng: codec đứng trước được chọn trước
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+if lz4_frame is not None:
+    CODECS["lz4"] = (lz4_frame.compress, lz4_frame.decompress)
+CODECS["zlib"] = (lambda data: zlib.compress(data, 6), zlib.decompress)
+
+# Tag 1 ký tự dùng trong header datagram UDP (giới hạn BUFFER_SIZE)
+WIRE_TAGS = {NO_COMPRESSION: "-", "zlib": "z", "zstd": "s", "lz4": "l"}
+TAG_CODECS = {tag: codec for codec, tag in WIRE_TAGS.items()}
+
+
+def available_codecs():
+    """
+    List the codecs usable in this process, most preferred first.
+    """
+    return list(CODECS)
+
+
+def negotiate(offered):
+    """
+    Pick the first locally supported codec from the peer's offer.
+    - offered: comma separated codec names (or a list of names).
+    """
+    if isinstance(offered, str):
+        offered = [name.strip() for name in offered.split(",")]
+    for name in available_codecs():
+        if name in offered:
+            return name
+    return NO_COMPRESSION
+
+
+def is_compressible(filename):
+    """
+    Check whether a resource is worth compressing based on its extension.
+    """
+    return os.path.splitext(filename)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS
+
+
+def compress(codec, data):
+    if codec == NO_COMPRESSION:
+        return data
+    return CODECS[codec][0](data)
+
+
+def decompress(codec, data):
+    if codec == NO_COMPRESSION:
+        return data
+    return CODECS[codec][1](data)
+
+
+def compress_block(codec, filename, data):
+    """
+    Compress one block for the wire.
+
+    Returns:
+        (codec, payload): codec is NO_COMPRESSION when the file type is
+        incompressible or the compressed block would not be smaller.
+    """
+    if codec == NO_COMPRESSION or not is_compressible(filename):
+        return NO_COMPRESSION, data
+    payload = compress(codec, data)
+    if len(payload) >= len(data):
+        return NO_COMPRESSION, data
+    return codec, payload
+
+
+class CompressionCache:
+    """
+    On-disk cache of compressed blocks.
+
+    An entry is named "<file>.<version>.<codec>.<start>.<length>": the
+    version (size, mtime) of the resource is part of the name, so a
+    modified resource never serves stale blocks, and the first block cached
+    for a new version removes the blocks of the older ones.
+
+    The cache is kept under max_bytes by dropping the least recently used
+    entries (the mtime of an entry is its last use). Each pre-fork worker
+    keeps its own running total and scans the directory when it goes over,
+    so the limit is only exceeded by what the other workers added since.
+    """
+
+    # Block nhỏ hơn ngưỡng này nén trực tiếp, không ghi xuống đĩa
+    MIN_CACHED_BLOCK = 64 * 1024
+    # Khi vượt max_bytes thì dọn xuống mức này, để không phải quét lại sau mỗi block
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir="./.compressed_cache/", max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.versions = {}  # file id -> version đã dọn các bản cũ
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total = sum(size for _, size, _ in self.entries())
+        if self.max_bytes and self.total > self.max_bytes:
+            with self.lock:
+                self.evict()
+
+    def _key(self, file_path, codec, start_offset, length):
+        stat = os.stat(file_path)
+        file_id = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+        version = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+        return file_id, version, f"{file_id}.{version}.{codec}.{start_offset}.{length}"
+
+    def get_block(self, codec, file_path, start_offset, data):
+        """
+        Return (codec, payload) for a block, compressing at most once per version.
+        """
+        filename = os.path.basename(file_path)
+        if codec == NO_COMPRESSION or not is_compressible(filename):
+            return NO_COMPRESSION, data
+        if len(data) < self.MIN_CACHED_BLOCK:
+            return compress_block(codec, filename, data)
+
+        file_id, version, key = self._key(file_path, codec, start_offset, len(data))
+        cached_path = os.path.join(self.cache_dir, key)
+        raw_marker = cached_path + ".raw"
+
+        # utime ghi lại lần dùng cuối cho LRU; FileNotFoundError: chưa có hoặc vừa bị loại bỏ
+        try:
+            os.utime(raw_marker)
+            return NO_COMPRESSION, data
+        except FileNotFoundError:
+            pass
+        try:
+            with open(cached_path, "rb") as file:
+                payload = file.read()
+            os.utime(cached_path)
+            return codec, payload
+        except FileNotFoundError:
+            pass
+
+        used_codec, payload = compress_block(codec, filename, data)
+
+        # Ghi vào file tạm rồi đổi tên để các thread khác không đọc file dở dang
+        with self.lock:
+            if self.versions.get(file_id) != version:
+                self.drop_versions(file_id, version)
+            target = cached_path if used_codec != NO_COMPRESSION else raw_marker
+            tmp_path = f"{target}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as file:
+                    if used_codec != NO_COMPRESSION:
+                        file.write(payload)
+                os.replace(tmp_path, target)
+                self.total += len(payload) if used_codec != NO_COMPRESSION else 0
+            except OSError as e:
+                logger.error(f"Could not write compression cache: {e}")
+            if self.max_bytes and self.total > self.max_bytes:
+                self.evict()
+
+        return used_codec, payload
+
+    # ==============================================================================================
+    def entries(self):
+        """
+        (last_used, size, path) of every entry.
+        """
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, path))
+        return result
+
+    def drop_versions(self, file_id, version):
+        """
+        Remove the blocks of the other versions of a file (lock held).
+        """
+        prefix, current = f"{file_id}.", f"{file_id}.{version}."
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and not name.startswith(current) and not name.endswith(".tmp"):
+                self.total -= self.remove(os.path.join(self.cache_dir, name))
+        self.versions[file_id] = version
+
+    def evict(self):
+        """
+        Drop the least recently used entries down to LOW_WATER * max_bytes (lock held).
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.LOW_WATER
+        for _, size, path in entries:
+            if total <= target:
+                break
+            total -= self.remove(path)
+        logger.debug(f"Compression cache evicted down to {total} bytes")
+        self.total = total
+
+    @staticmethod
+    def remove(path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
@@ -0,0 +1,257 @@
+"""
+rsync style delta transfer of an updated resource.
+
+The receiver describes its old copy with one signature per block (weak
+Adler-32 + truncated BLAKE2b). The sender scans the new version with a
+rolling Adler-32, so matches are found at any byte offset, and answers with
+an instruction stream:
+
+    b"C" + >QQ (old offset, length)      copy bytes from the old copy
+    b"L" + >I (length) + data            literal bytes of the new version
+    b"E" + >Q (new size) + sha256        end, checked by the receiver
+
+The receiver rebuilds the new version from its old copy and the stream;
+a size or SHA-256 mismatch (e.g. a weak + strong hash collision) raises
+ValueError and the caller falls back to a full download.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+
+MIN_BLOCK = 2 * 1024
+MAX_BLOCK = 64 * 1024
+STRONG_SIZE = 8
+MOD = 65521
+
+SIGNATURE = struct.Struct(">I8s")
+COPY = struct.Struct(">QQ")
+LITERAL = struct.Struct(">I")
+END = struct.Struct(">Q32s")
+
+# Sau SEARCH_LIMIT byte không khớp liên tiếp chỉ thử khớp ở đầu mỗi block,
+# để file thay đổi hoàn toàn không phải trượt từng byte bằng Python. Cứ sau
+# RESYNC_STRIDES bước nhảy lại trượt từng byte qua 1 block (đủ mọi độ lệch),
+# nên dữ liệu cũ sau một đoạn chèn lớn vẫn được tìm lại.
+SEARCH_LIMIT = 1024 * 1024
+RESYNC_STRIDES = 16
+LITERAL_CHUNK = 256 * 1024
+FLUSH_SIZE = 64 * 1024
+
+
+def block_size_for(size):
+    """
+    Power of two close to sqrt(size): 64 MB -> 8 KB blocks, 1 GB -> 32 KB.
+    """
+    block = MIN_BLOCK
+    while block < MAX_BLOCK and block * block < size:
+        block *= 2
+    return block
+
+
+def strong(data):
+    return hashlib.blake2b(data, digest_size=STRONG_SIZE).digest()
+
+
+def signatures(path, block_size):
+    """
+    Signatures of every block of `path`, the last one may be shorter.
+    """
+    out = bytearray()
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            out += SIGNATURE.pack(zlib.adler32(block), strong(block))
+    return bytes(out)
+
+
+# ==================================================================================================
+class Output:
+    """
+    Buffers instructions and merges copies of consecutive old blocks.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.buffer = bytearray()
+        self.run = None  # [offset, length] của lệnh copy đang gộp
+        self.copied = 0
+        self.literal_bytes = 0
+
+    def copy(self, offset, length):
+        if self.run is not None and self.run[0] + self.run[1] == offset:
+            self.run[1] += length
+        else:
+            self.close_run()
+            self.run = [offset, length]
+        self.copied += length
+
+    def literal(self, data, start, end):
+        if start >= end:
+            return
+        self.close_run()
+        for offset in range(start, end, LITERAL_CHUNK):
+            piece = data[offset : min(end, offset + LITERAL_CHUNK)]
+            self.put(b"L" + LITERAL.pack(len(piece)) + piece)
+        self.literal_bytes += end - start
+
+    def close_run(self):
+        if self.run is not None:
+            self.put(b"C" + COPY.pack(*self.run))
+            self.run = None
+
+    def put(self, instruction):
+        self.buffer += instruction
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write(bytes(self.buffer))
+            self.buffer.clear()
+
+    def finish(self, size, digest):
+        self.close_run()
+        self.put(b"E" + END.pack(size, digest))
+        self.flush()
+
+
+def encode(path, old_size, block_size, signature_blob, write):
+    """
+    Scan the new version at `path` against the receiver's signatures and pass
+    the instruction stream to `write` in pieces of about FLUSH_SIZE bytes.
+
+    Returns (copied_bytes, literal_bytes).
+    """
+    if not MIN_BLOCK <= block_size <= MAX_BLOCK:
+        raise ValueError(f"Delta block size {block_size} out of range")
+    if len(signature_blob) % SIGNATURE.size:
+        raise ValueError("Truncated delta signatures")
+    count = len(signature_blob) // SIGNATURE.size
+    if count != -(-old_size // block_size):
+        raise ValueError(f"{count} signatures do not cover {old_size} bytes")
+
+    # weak -> {strong -> offset trong bản cũ}; block cuối ngắn hơn được so riêng ở cuối file
+    table = {}
+    tail = None
+    for index, (weak, strong_hash) in enumerate(SIGNATURE.iter_unpack(signature_blob)):
+        offset = index * block_size
+        if offset + block_size > old_size:
+            tail = (weak, strong_hash, offset, old_size - offset)
+        else:
+            table.setdefault(weak, {}).setdefault(strong_hash, offset)
+
+    out = Output(write)
+    n = block_size
+    period = (RESYNC_STRIDES + 1) * n
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        try:
+            digest = hashlib.sha256(data).digest()
+            pos = 0
+            literal = 0  # đầu đoạn literal chưa gửi
+            end = size - n
+            weak = None
+            while pos <= end:
+                if weak is None:
+                    weak = zlib.adler32(data[pos : pos + n])
+                    a, b = weak & 0xFFFF, weak >> 16
+                matches = table.get(weak)
+                if matches is not None:
+                    offset = matches.get(strong(data[pos : pos + n]))
+                    if offset is not None:
+                        out.literal(data, literal, pos)
+                        out.copy(offset, n)
+                        pos += n
+                        literal = pos
+                        weak = None
+                        continue
+                run = pos - literal - SEARCH_LIMIT
+                if run >= 0 and run % period >= n:
+                    pos += n
+                    weak = None
+                    continue
+                if pos == end:
+                    break
+                # Trượt cửa sổ 1 byte: bỏ data[pos], thêm data[pos + n]
+                removed, added = data[pos], data[pos + n]
+                a = (a - removed + added) % MOD
+                b = (b - n * removed + a - 1) % MOD
+                weak = (b << 16) | a
+                pos += 1
+
+            if tail is not None:
+                weak, strong_hash, offset, length = tail
+                start = size - length
+                if (
+                    start >= literal
+                    and zlib.adler32(data[start:size]) == weak
+                    and strong(data[start:size]) == strong_hash
+                ):
+                    out.literal(data, literal, start)
+                    out.copy(offset, length)
+                    literal = size
+            out.literal(data, literal, size)
+            out.finish(size, digest)
+        finally:
+            if size:
+                data.close()
+    return out.copied, out.literal_bytes
+
+
+# ==================================================================================================
+def apply(old_path, read, new_path):
+    """
+    Rebuild the new version into `new_path` from `old_path` and the
+    instruction stream; read(n) must return exactly n bytes.
+
+    Returns (copied_bytes, literal_bytes).
+    """
+    digest = hashlib.sha256()
+    copied = literal = 0
+    with open(old_path, "rb") as old, open(new_path, "wb") as new:
+        while True:
+            op = read(1)
+            if op == b"C":
+                offset, length = COPY.unpack(read(COPY.size))
+                old.seek(offset)
+                while length:
+                    piece = old.read(min(length, LITERAL_CHUNK))
+                    if not piece:
+                        raise ValueError("Delta copies past the end of the local file")
+                    new.write(piece)
+                    digest.update(piece)
+                    length -= len(piece)
+                    copied += len(piece)
+            elif op == b"L":
+                (length,) = LITERAL.unpack(read(LITERAL.size))
+                piece = read(length)
+                new.write(piece)
+                digest.update(piece)
+                literal += length
+            elif op == b"E":
+                size, expected = END.unpack(read(END.size))
+                if new.tell() != size or digest.digest() != expected:
+                    raise ValueError("Rebuilt file does not match the server version")
+                return copied, literal
+            else:
+                raise ValueError(f"Unknown delta instruction {op!r}")
+
+
+def file_reader(file):
+    """
+    read(n) over a regular file that fails on a truncated stream.
+    """
+
+    def read(n):
+        data = file.read(n)
+        if len(data) != n:
+            raise ValueError("Truncated delta stream")
+        return data
+
+    return read
@@ -0,0 +1,260 @@
+"""
+Disk reads of the resources on a small pool of threads, so the network
+threads never wait for storage.
+
+- Reads queued at the same time for adjacent or overlapping ranges of one
+  file are coalesced into a single pread (up to MAX_COALESCE bytes) and
+  split back: the blocks of one session's pipes, or two clients on the
+  same part of a file, cost one sequential read instead of several seeks.
+- Every read is followed by a posix_fadvise hint: SEQUENTIAL for the file
+  and WILLNEED for the READAHEAD bytes after it, so the kernel reads ahead
+  in the background while the block is being sent.
+- Small reads (UDP datagrams) go through a cache of WINDOW sized pieces of
+  the files: one disk read serves hundreds of datagrams, and the next
+  window is loaded in the background once a reader is half way through
+  the current one. Windows are dropped after WINDOW_TTL seconds so an
+  updated resource is picked up.
+
+posix_fadvise and pread are skipped where the platform lacks them.
+"""
+
+import os
+import time
+import threading
+import collections
+from concurrent.futures import Future
+
+import log
+import tracing
+
+logger = log.get_logger(__name__)
+
+MB = 1024 * 1024
+
+IO_THREADS = 4
+MAX_COALESCE = 32 * MB
+READAHEAD = 8 * MB
+WINDOW = 256 * 1024
+WINDOW_TTL = 1.0
+CACHE_BYTES = 32 * MB
+
+HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+
+def advise(fd, offset, length, advice):
+    if not HAS_FADVISE:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def pread(path, offset, length, readahead=0):
+    with open(path, "rb", buffering=0) as file:
+        fd = file.fileno()
+        if HAS_FADVISE:
+            advise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if hasattr(os, "pread"):
+            data = os.pread(fd, length, offset)
+        else:
+            file.seek(offset)
+            data = file.read(length)
+        if readahead and HAS_FADVISE and len(data) == length:
+            # Kernel đọc trước phần kế tiếp trong nền trong lúc block này đang được gửi
+            advise(fd, offset + length, readahead, os.POSIX_FADV_WILLNEED)
+        return data
+
+
+class Read:
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.future = Future()
+
+    @property
+    def end(self):
+        return self.offset + self.length
+
+
+# ==================================================================================================
+class DiskIO:
+    def __init__(
+        self,
+        threads=IO_THREADS,
+        readahead=READAHEAD,
+        window=WINDOW,
+        cache_bytes=CACHE_BYTES,
+        metrics=None,
+    ):
+        self.readahead = readahead
+        self.window = window
+        self.cache_bytes = cache_bytes
+        self.metrics = metrics
+        self.condition = threading.Condition()
+        self.pending = collections.deque()  # Read chưa được luồng nào lấy
+
+        self.lock = threading.Lock()
+        self.windows = collections.OrderedDict()  # (path, index) -> (data, thời điểm đọc), LRU
+        self.cached_bytes = 0
+        self.loading = {}  # (path, index) -> Future của window đang đọc
+        self.stats = collections.Counter()
+
+        self.threads = [
+            threading.Thread(target=self.run, name=f"diskio-{index}", daemon=True) for index in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    # ==============================================================================================
+    def submit(self, path, offset, length):
+        """
+        Read `length` bytes at `offset` on the disk threads.
+        Returns a Future of the bytes (shorter at the end of the file).
+        """
+        read = Read(path, offset, length)
+        with self.condition:
+            self.pending.append(read)
+            self.condition.notify()
+        return read.future
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                batch = self.take_batch()
+            self.execute(batch)
+
+    def take_batch(self):
+        """
+        The oldest queued read plus every queued read of the same file that
+        touches the growing range (condition held).
+        """
+        first = self.pending.popleft()
+        batch = [first]
+        start, end = first.offset, first.end
+        merged = True
+        while merged:
+            merged = False
+            for read in list(self.pending):
+                if read.path != first.path or read.offset > end or read.end < start:
+                    continue
+                if max(end, read.end) - min(start, read.offset) > MAX_COALESCE:
+                    continue
+                self.pending.remove(read)
+                batch.append(read)
+                start, end = min(start, read.offset), max(end, read.end)
+                merged = True
+        return batch
+
+    def execute(self, batch):
+        start = min(read.offset for read in batch)
+        end = max(read.end for read in batch)
+        started = time.perf_counter()
+        try:
+            with tracing.span("disk.read", bytes=end - start, requests=len(batch)):
+                data = pread(batch[0].path, start, end - start, self.readahead)
+        except OSError as e:
+            for read in batch:
+                read.future.set_exception(e)
+            return
+        if self.metrics is not None:
+            self.metrics.observe("disk_read_seconds", time.perf_counter() - started)
+        with self.lock:
+            self.stats["reads"] += 1
+            self.stats["bytes"] += len(data)
+            self.stats["coalesced"] += len(batch) - 1
+
+        if len(batch) == 1:
+            batch[0].future.set_result(data)
+            return
+        view = memoryview(data)
+        for read in batch:
+            read.future.set_result(bytes(view[read.offset - start : read.end - start]))
+
+    # ==============================================================================================
+    def cached(self, path, offset, length):
+        """
+        The bytes from the window cache, or None when they are not in memory
+        (never touches the disk). A hit in the second half of a window
+        starts loading the next one.
+        """
+        index = offset // self.window
+        if (offset + length - 1) // self.window != index:
+            return None
+        key = (path, index)
+        with self.lock:
+            entry = self.windows.get(key)
+            if entry is None or time.monotonic() - entry[1] > WINDOW_TTL:
+                self.stats["misses"] += 1
+                return None
+            self.windows.move_to_end(key)
+            self.stats["hits"] += 1
+            data = entry[0]
+            prefetch = (
+                len(data) == self.window
+                and offset - index * self.window >= self.window // 2
+                and (path, index + 1) not in self.windows
+                and (path, index + 1) not in self.loading
+            )
+        if prefetch:
+            self.load_window(path, index + 1)
+        start = offset - index * self.window
+        return data[start : start + length]
+
+    def fetch(self, path, offset, length):
+        """
+        Future of a small read, served by loading the whole window around it.
+        """
+        index = offset // self.window
+        if (offset + length - 1) // self.window != index:
+            # Nằm vắt qua 2 window (hiếm): đọc thẳng
+            return self.submit(path, offset, length)
+        window_future = self.load_window(path, index)
+        result = Future()
+        start = offset - index * self.window
+
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(future.result()[start : start + length])
+
+        window_future.add_done_callback(done)
+        return result
+
+    def load_window(self, path, index):
+        key = (path, index)
+        with self.lock:
+            future = self.loading.get(key)
+            if future is not None:
+                return future
+            future = self.loading[key] = self.submit(path, index * self.window, self.window)
+        future.add_done_callback(lambda done: self.store_window(key, done))
+        return future
+
+    def store_window(self, key, future):
+        with self.lock:
+            self.loading.pop(key, None)
+            if future.exception() is not None:
+                return
+            data = future.result()
+            old = self.windows.pop(key, None)
+            if old is not None:
+                self.cached_bytes -= len(old[0])
+            self.windows[key] = (data, time.monotonic())
+            self.cached_bytes += len(data)
+            while self.cached_bytes > self.cache_bytes and self.windows:
+                _, (evicted, _) = self.windows.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                **self.stats,
+                "pending": len(self.pending),
+                "cached_bytes": self.cached_bytes,
+                "windows": len(self.windows),
+            }
@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+ROOT = "socket"
+
+# Tag hiển thị theo level, giữ định dạng "[STATUS] ..." quen thuộc
+TAGS = {
+    logging.DEBUG: "DEBUG",
+    logging.INFO: "STATUS",
+    logging.WARNING: "WARNING",
+    logging.ERROR: "ERROR",
+    logging.CRITICAL: "ERROR",
+}
+
+COLORS = {
+    "ERROR": "\033[91m",
+    "FAIL": "\033[91m",
+    "WARNING": "\033[93m",
+    "STATUS": "\033[92m",
+    "SUCCESS": "\033[92m",
+}
+RESET = "\033[97m"
+
+_listener = None
+_lock = threading.Lock()
+
+
+class TagFormatter(logging.Formatter):
+    """
+    "[TAG] message", the tag comes from extra={"tag": ...} or the level.
+    Colours are added here, in the writer thread, never by the caller.
+    """
+
+    def __init__(self, color=False, timestamps=False):
+        super().__init__()
+        self.color = color
+        self.timestamps = timestamps
+
+    def format(self, record):
+        tag = getattr(record, "tag", None) or TAGS.get(record.levelno, record.levelname)
+        line = f"[{tag}] {record.getMessage()}"
+        if self.timestamps:
+            line = f"{self.formatTime(record)} {record.processName}/{record.threadName} {line}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        if self.color and tag in COLORS:
+            line = f"{COLORS[tag]}{line}{RESET}"
+        return line
+
+
+def setup(level=None, quiet=False, stream=None, log_file=None, color=None):
+    """
+    Route every "socket.*" logger through a queue to one background writer.
+
+    - level: name or number, defaults to $LOG_LEVEL or INFO.
+    - quiet: production mode, only warnings and errors (or $LOG_QUIET=1).
+    - log_file: also append plain lines (with timestamps) to this file.
+    - color: ANSI colours on the console, defaults to stream.isatty().
+    """
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+
+        level = level or os.environ.get("LOG_LEVEL", "INFO")
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        if quiet or os.environ.get("LOG_QUIET"):
+            level = max(level, logging.WARNING)
+
+        stream = stream or sys.stdout
+        if color is None:
+            color = hasattr(stream, "isatty") and stream.isatty()
+        console = logging.StreamHandler(stream)
+        console.setFormatter(TagFormatter(color=color))
+        handlers = [console]
+        if log_file:
+            file_handler = logging.FileHandler(log_file)
+            file_handler.setFormatter(TagFormatter(timestamps=True))
+            handlers.append(file_handler)
+
+        records = queue.SimpleQueue()
+        root = logging.getLogger(ROOT)
+        root.handlers = [logging.handlers.QueueHandler(records)]
+        root.setLevel(level)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, *handlers)
+        _listener.start()
+
+
+def shutdown():
+    """
+    Flush queued records; call before os._exit().
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _drain_before_fork():
+    # Ghi hết record đang chờ, nếu không tiến trình con sẽ ghi lại chúng lần nữa
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # Luồng ghi log không tồn tại trong tiến trình con sau fork()
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers)
+        _listener.start()
+
+
+atexit.register(shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(
+        before=_drain_before_fork,
+        after_in_parent=_restart_after_fork,
+        after_in_child=_restart_after_fork,
+    )
+
+
+def get_logger(name):
+    if _listener is None:
+        setup()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class Throttle:
+    """
+    Rate-limited debug lines for per-chunk events: at most one record per
+    key every `interval` seconds, with the number of skipped lines.
+    Arguments are %-formatted only when the line is written, so a
+    disabled or throttled line costs one isEnabledFor() call.
+    """
+
+    def __init__(self, logger, interval=1.0):
+        self.logger = logger
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.state = {}  # key -> (last emitted, suppressed)
+
+    def debug(self, key, message, *args, tag=None):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        now = time.monotonic()
+        with self.lock:
+            last, suppressed = self.state.get(key, (0.0, 0))
+            if now - last < self.interval:
+                self.state[key] = (last, suppressed + 1)
+                return
+            self.state[key] = (now, 0)
+        if suppressed:
+            message = f"{message} (+{suppressed} similar)"
+        self.logger.debug(message, *args, extra={"tag": tag})
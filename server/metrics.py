@@ -0,0 +1,277 @@
+import os
+import json
+import bisect
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import log
+
+logger = log.get_logger(__name__)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (upper bounds in seconds), cheap enough for the hot path.
+    """
+
+    # 50us .. ~13s, x2 mỗi bucket
+    BOUNDS = tuple(50e-6 * 2**i for i in range(19))
+
+    def __init__(self, bounds=None):
+        self.bounds = bounds or self.BOUNDS
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th observation.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in self.bounds] + ["+Inf"], self.buckets)),
+        }
+
+
+class Registry:
+    """
+    Counters, histograms and gauges of one server process.
+
+    - inc(name, value, **labels): monotonically increasing counter.
+    - observe(name, seconds, **labels): latency histogram.
+    - gauge(name, callback): value computed when a snapshot is taken,
+      so nothing is maintained on the hot path.
+    - time(name, **labels): context manager around observe().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # name -> callback
+        self.started = time.time()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def time(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def gauge(self, name, callback):
+        self.gauges[name] = callback
+
+    # ==============================================================================================
+    def snapshot(self):
+        """
+        Plain dict of every metric, ready for json.dumps.
+        """
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in self.histograms.items()
+            ]
+        gauges = {}
+        for name, callback in list(self.gauges.items()):
+            try:
+                gauges[name] = callback()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "counters": counters,
+            "histograms": histograms,
+            "gauges": gauges,
+        }
+
+    def prometheus(self):
+        """
+        Text exposition format; gauges that are not numbers are skipped.
+        """
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                bounds = [str(b) for b in histogram.bounds] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.buckets):
+                    cumulative += count
+                    bucket_labels = labels + (("le", bound),)
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        for name, callback in list(self.gauges.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            if isinstance(value, (int, float)):
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+# ==================================================================================================
+class MetricsExporter:
+    """
+    Exposes a Registry without touching the serving threads.
+
+    - address "host:port": HTTP, GET /metrics (Prometheus text) or /stats (JSON).
+    - address "unix:/path.sock": every connection receives one JSON snapshot.
+    - snapshot_path: JSON snapshot rewritten every `interval` seconds.
+    """
+
+    def __init__(self, registry, address=None, snapshot_path=None, interval=10):
+        self.registry = registry
+        self.address = address
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.http_server = None
+        self.unix_socket = None
+
+    def start(self):
+        if self.address:
+            if self.address.startswith("unix:"):
+                self.start_unix(self.address[len("unix:") :])
+            else:
+                host, port = self.address.rsplit(":", 1)
+                self.start_http(host, int(port))
+        if self.snapshot_path:
+            threading.Thread(target=self.snapshot_loop, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        if self.unix_socket is not None:
+            self.unix_socket.close()
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    # ==============================================================================================
+    def start_http(self, host, port):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/stats"):
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                elif self.path.startswith("/metrics"):
+                    body = registry.prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((host, port), Handler)
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics available at http://{host}:{port}/metrics and /stats")
+
+    def start_unix(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.unix_socket.bind(path)
+        self.unix_socket.listen()
+
+        def serve():
+            while not self.stop_event.is_set():
+                try:
+                    conn, _ = self.unix_socket.accept()
+                except OSError:
+                    return
+                with conn:
+                    try:
+                        conn.sendall(json.dumps(self.registry.snapshot()).encode())
+                    except OSError:
+                        pass
+
+        threading.Thread(target=serve, daemon=True).start()
+        logger.info(f"Metrics available on unix socket {path}")
+
+    def snapshot_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        # Ghi ra file tạm rồi replace để người đọc không thấy file ghi dở
+        temp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(self.registry.snapshot(), file)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Could not write metrics snapshot {self.snapshot_path}: {e}")
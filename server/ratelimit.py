@@ -0,0 +1,340 @@
+import time
+import itertools
+import threading
+from collections import deque
+
+
+class TokenBucket:
+    """
+    Token bucket in bytes.
+
+    - rate: bytes per second (0 = unlimited).
+    - burst: bucket capacity, defaults to one second worth of tokens.
+
+    A grant may drive the bucket negative (debt) so one large slice never
+    stalls forever; the next grant waits until the debt is repaid.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self):
+        return not self.rate or self.tokens >= 0
+
+    def wait_time(self):
+        """
+        Seconds until the bucket is out of debt.
+        """
+        if self.ready():
+            return 0
+        return -self.tokens / self.rate
+
+    def consume(self, nbytes):
+        if self.rate:
+            self.tokens -= nbytes
+
+
+class RateMeter:
+    """
+    Achieved rate over a sliding window.
+    """
+
+    WINDOW = 5.0
+
+    def __init__(self):
+        self.samples = deque()
+        self.window_bytes = 0
+        self.total_bytes = 0
+        self.started = time.monotonic()
+
+    def add(self, nbytes, now):
+        self.samples.append((now, nbytes))
+        self.window_bytes += nbytes
+        self.total_bytes += nbytes
+        self.prune(now)
+
+    def prune(self, now):
+        while self.samples and now - self.samples[0][0] > self.WINDOW:
+            self.window_bytes -= self.samples.popleft()[1]
+
+    def rate(self, now):
+        self.prune(now)
+        span = min(self.WINDOW, max(now - self.started, 1e-3))
+        return self.window_bytes / span
+
+
+class BandwidthScheduler:
+    """
+    Shares the server's send bandwidth between clients and sessions.
+
+    - global_rate: cap for the whole server (bytes/s, 0 = unlimited).
+    - client_rate: cap per client IP (bytes/s, 0 = unlimited).
+    - Sessions waiting for bandwidth are served by weighted fair queuing:
+      each grant gets a virtual finish tag start + nbytes / weight and the
+      smallest tag among the sessions whose client bucket allows it wins.
+    - client_weights: {client IP: weight} (default 1), the weight of every
+      session of that client.
+
+    The bucket and meter of a client are dropped with its last session.
+    Every session that sends through acquire()/try_acquire() is registered
+    (meter, weight) and stays until forget() or prune_idle(): the TCP server
+    forgets a session when it ends, the UDP server, whose sessions are only
+    client addresses, calls prune_idle() every PRUNE_INTERVAL seconds.
+
+    Every pre-fork worker (serverPool.py) has its own scheduler: the
+    parent divides global_rate between the workers, but client_rate is a
+    per-worker cap. A session stays on one worker, so it holds for a
+    client with one session; a client whose sessions land on W workers
+    may get up to W x client_rate.
+    """
+
+    def __init__(self, global_rate=0, client_rate=0, burst=None, client_weights=None):
+        self.global_rate = global_rate
+        self.client_rate = client_rate
+        self.burst = burst
+        self.client_weights = dict(client_weights or {})
+        self.global_bucket = TokenBucket(global_rate, burst)
+        self.client_buckets = {}
+
+        self.condition = threading.Condition()
+        self.virtual_time = 0.0
+        self.last_finish = {}  # session -> virtual finish tag
+        self.weights = {}  # session -> weight
+        self.session_clients = {}  # session -> client
+        self.waiting = []  # (finish, seq, client, session) của các luồng đang chờ
+        self.sequence = itertools.count()
+
+        self.session_meters = {}
+        self.client_meters = {}
+        self.global_meter = RateMeter()
+
+    @property
+    def limited(self):
+        return bool(self.global_rate or self.client_rate)
+
+    def weight(self, client, session):
+        """
+        WFQ weight of a session, from the weight of its client.
+        """
+        with self.condition:
+            weight = self.weights.get(session)
+            if weight is None:
+                weight = self.weights[session] = max(self.client_weights.get(client, 1.0), 1e-6)
+                self.session_clients[session] = client
+            return weight
+
+    def client_bucket(self, client):
+        bucket = self.client_buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.burst)
+            self.client_buckets[client] = bucket
+        return bucket
+
+    # ==============================================================================================
+    def tag(self, client, session, nbytes):
+        start = max(self.virtual_time, self.last_finish.get(session, 0.0))
+        finish = start + nbytes / self.weight(client, session)
+        self.last_finish[session] = finish
+        return finish
+
+    def eligible_head(self):
+        """
+        Smallest-tag waiter whose client bucket has tokens, or None.
+        """
+        for entry in sorted(self.waiting):
+            if self.client_bucket(entry[2]).ready():
+                return entry
+        return None
+
+    def grant(self, entry, nbytes, now):
+        self.waiting.remove(entry)
+        self.virtual_time = max(self.virtual_time, entry[0] - nbytes / self.weight(entry[2], entry[3]))
+        self.global_bucket.consume(nbytes)
+        self.client_bucket(entry[2]).consume(nbytes)
+        self.record(entry[2], entry[3], nbytes, now)
+
+    def acquire(self, client, session, nbytes):
+        """
+        Block until `nbytes` may be sent for this client/session.
+        """
+        with self.condition:
+            now = time.monotonic()
+            if not self.limited:
+                self.record(client, session, nbytes, now)
+                return
+
+            entry = (self.tag(client, session, nbytes), next(self.sequence), client, session)
+            self.waiting.append(entry)
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                head = self.eligible_head()
+                if head is entry and self.global_bucket.ready():
+                    self.grant(entry, nbytes, now)
+                    self.condition.notify_all()
+                    return
+                self.condition.wait(self.next_wakeup())
+
+    def try_acquire(self, client, session, nbytes):
+        """
+        Non-blocking variant for the single-threaded UDP loop.
+        """
+        with self.condition:
+            now = time.monotonic()
+            if self.limited:
+                self.refill(now)
+                if not (self.global_bucket.ready() and self.client_bucket(client).ready()):
+                    return False
+                self.global_bucket.consume(nbytes)
+                self.client_bucket(client).consume(nbytes)
+            self.record(client, session, nbytes, now)
+            return True
+
+    def refill(self, now):
+        self.global_bucket.refill(now)
+        for bucket in self.client_buckets.values():
+            bucket.refill(now)
+
+    def next_wakeup(self):
+        waits = [self.global_bucket.wait_time()]
+        waits += [bucket.wait_time() for bucket in self.client_buckets.values()]
+        waits = [w for w in waits if w > 0]
+        # Không bucket nào nợ: đang chờ lượt WFQ, lượt trước sẽ notify
+        return max(0.001, min(waits)) if waits else 0.05
+
+    # ==============================================================================================
+    def record(self, client, session, nbytes, now):
+        self.weight(client, session)
+        self.session_meters.setdefault(session, RateMeter()).add(nbytes, now)
+        self.client_meters.setdefault(client, RateMeter()).add(nbytes, now)
+        self.global_meter.add(nbytes, now)
+
+    def forget(self, session):
+        """
+        Drop the state of a finished session.
+        """
+        with self.condition:
+            self.drop_session(session)
+            self.drop_idle_clients()
+
+    def prune_idle(self, idle=60):
+        """
+        Forget sessions that have not sent anything for `idle` seconds.
+        """
+        with self.condition:
+            now = time.monotonic()
+            for session, meter in list(self.session_meters.items()):
+                if not meter.samples or now - meter.samples[-1][0] > idle:
+                    self.drop_session(session)
+            self.drop_idle_clients()
+
+    def drop_session(self, session):
+        self.session_meters.pop(session, None)
+        self.last_finish.pop(session, None)
+        self.weights.pop(session, None)
+        self.session_clients.pop(session, None)
+
+    def drop_idle_clients(self):
+        """
+        Forget the clients without a session left (condition held). A bucket
+        still in debt is kept until it is repaid, so reconnecting does not
+        skip the wait.
+        """
+        active = set(self.session_clients.values())
+        for client in set(self.client_buckets) | set(self.client_meters):
+            if client in active:
+                continue
+            bucket = self.client_buckets.get(client)
+            if bucket is not None:
+                bucket.refill(time.monotonic())
+                if not bucket.ready():
+                    continue
+                del self.client_buckets[client]
+            self.client_meters.pop(client, None)
+
+    def snapshot(self):
+        """
+        Per-session / per-client achieved rates (bytes/s) and byte totals.
+        """
+        with self.condition:
+            now = time.monotonic()
+            return {
+                "global": {
+                    "rate_bps": self.global_meter.rate(now),
+                    "bytes": self.global_meter.total_bytes,
+                    "cap_bps": self.global_rate,
+                },
+                "clients": {
+                    str(client): {
+                        "rate_bps": meter.rate(now),
+                        "bytes": meter.total_bytes,
+                        "cap_bps": self.client_rate,
+                    }
+                    for client, meter in self.client_meters.items()
+                },
+                "sessions": {
+                    str(session): {
+                        "rate_bps": meter.rate(now),
+                        "bytes": meter.total_bytes,
+                        "weight": self.weights.get(session, 1.0),
+                    }
+                    for session, meter in self.session_meters.items()
+                },
+            }
+
+
+class FairQueue:
+    """
+    Weighted fair queue of pending requests for the UDP loop.
+    Requests are pushed per session; pop() returns the request with the
+    smallest virtual finish tag whose client is allowed to send.
+    """
+
+    def __init__(self):
+        self.queues = {}  # session -> deque of (start, finish, client, item)
+        self.last_finish = {}
+        self.virtual_time = 0.0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, client, session, item, cost, weight=1.0):
+        start = max(self.virtual_time, self.last_finish.get(session, 0.0))
+        finish = start + cost / weight
+        self.last_finish[session] = finish
+        self.queues.setdefault(session, deque()).append((start, finish, client, item, cost))
+        self.size += 1
+
+    def pop(self, allowed):
+        """
+        - allowed(client, session, cost): grants bandwidth for the request or returns False.
+        """
+        heads = sorted(
+            (queue[0][1], session) for session, queue in self.queues.items() if queue
+        )
+        for _, session in heads:
+            start, _, client, item, cost = self.queues[session][0]
+            if allowed(client, session, cost):
+                self.queues[session].popleft()
+                self.size -= 1
+                self.virtual_time = max(self.virtual_time, start)
+                if not self.queues[session]:
+                    del self.queues[session]
+                    self.prune()
+                return item
+        return None
+
+    def prune(self):
+        # Quên các phiên đã hết request và không còn đi trước virtual time
+        for session in list(self.last_finish):
+            if session not in self.queues and self.last_finish[session] <= self.virtual_time:
+                del self.last_finish[session]
@@ -1,5 +1,11 @@
+import argparse
+import json
+import log
+import tracing
 import serverCore
+import serverPool
 import serverUDP
+import sockopts
 import signal
 import sys
 import threading
@@ -9,28 +15,134 @@ import threading
 # -------------------------------------------------------------------------------
 
 stop_event = threading.Event()
+logger = log.get_logger(__name__)
 
 
 def handle_exit(signal, frame):
-    print("\n[STATUS] Ctrl+C detected. Stopping all servers...")
+    logger.info("Ctrl+C detected. Stopping all servers...")
     stop_event.set()  # Signal threads to stop
     sys.exit(0)
 
 
+# -------------------------------------------------------------------------------
+"""
+    Settings that can come from the command line or a JSON config file.
+    Config keys are the SocketServer / SocketServerUDP attribute names
+    (same format as the pre-fork server's reloadable config), e.g.
+    {"HOST": "0.0.0.0", "PORT": 7000, "RESOURCE_PATH": "/srv/files"}.
+    Command line flags win over the file.
+"""
+
+SETTINGS = (
+    # flag, config key, type, help
+    ("--host", "HOST", str, "bind address"),
+    ("--port", "PORT", int, "control port (TCP default 6969, UDP default 12345)"),
+    ("--data-port", "DATA_PORT", int, "TCP data port shared by the pipes"),
+    ("--resources", "RESOURCE_PATH", str, "directory of the files to serve"),
+    ("--pipes", "PIPES", int, "TCP pipes of clients that do not pick a pipe"),
+    ("--max-pipes", "MAX_PIPES", int, "TCP pipes per session advertised to clients"),
+    ("--min-block-size", "MIN_BLOCK_SIZE", int, "smallest TCP block advertised to clients"),
+    ("--max-block-size", "MAX_BLOCK_SIZE", int, "largest TCP block advertised to clients"),
+    ("--buffer-size", "BUFFER_SIZE", int, "UDP datagram size"),
+    ("--timeout", "TIMEOUT", float, "UDP socket timeout (seconds)"),
+    ("--global-rate", "GLOBAL_RATE", int, "server bandwidth limit in bytes/s (0 = unlimited)"),
+    ("--client-rate", "CLIENT_RATE", int, "per client bandwidth limit in bytes/s, per worker (0 = unlimited)"),
+    ("--metrics", "METRICS_ADDRESS", str, 'metrics endpoint, "host:port" or "unix:/path.sock"'),
+    ("--metrics-file", "METRICS_FILE", str, "JSON metrics snapshot file"),
+    ("--workers", "WORKERS", int, "worker processes of the pre-fork server"),
+    ("--socket-profile", "SOCKET_PROFILE", str, "socket tuning: os, lan (default), wan-high-bdp or loopback"),
+    ("--max-sessions", "MAX_SESSIONS", int, "clients served at the same time (0 = unlimited)"),
+    ("--max-queued", "MAX_QUEUED", int, "TCP connections waiting for a slot / UDP requests waiting for bandwidth"),
+    ("--queue-timeout", "QUEUE_TIMEOUT", float, "longest wait of a queued connection or request (seconds)"),
+    ("--max-inflight-bytes", "MAX_INFLIGHT_BYTES", int, "TCP block bytes held in memory at once (0 = unlimited)"),
+    ("--retry-after", "RETRY_AFTER", float, "seconds a rejected client is told to wait (BUSY reply)"),
+    ("--io-threads", "IO_THREADS", int, "threads reading resources from disk"),
+    ("--readahead", "READAHEAD", int, "bytes the kernel is asked to read ahead after each read"),
+    ("--compression-cache-bytes", "COMPRESSION_CACHE_BYTES", int, "TCP compressed block cache size (0 = unlimited)"),
+)
+
+TCP_KEYS = serverPool.PreforkServer.CONFIG_KEYS + ("METRICS_INTERVAL", "SESSION_LINGER", "SEND_SLICE")
+UDP_KEYS = (
+    "HOST",
+    "PORT",
+    "RESOURCE_PATH",
+    "BUFFER_SIZE",
+    "TIMEOUT",
+    "GLOBAL_RATE",
+    "CLIENT_RATE",
+    "CLIENT_WEIGHTS",
+    "METRICS_ADDRESS",
+    "METRICS_FILE",
+    "METRICS_INTERVAL",
+    "SOCKET_PROFILE",
+    "SOCKET_OPTIONS",
+    "MAX_SESSIONS",
+    "MAX_QUEUED",
+    "QUEUE_TIMEOUT",
+    "RETRY_AFTER",
+    "IO_THREADS",
+    "READAHEAD",
+    "OFFLOAD",
+)
+
+MODES = {"tcp": 1, "udp": 2, "prefork": 3}
+
+
+def load_config(path):
+    if not path:
+        return {}
+    with open(path, "r") as file:
+        config = json.load(file)
+    known = set(TCP_KEYS + UDP_KEYS + ("WORKERS", "USE_REUSEPORT"))
+    for key in config:
+        if key not in known:
+            logger.warning(f"Unknown config key {key} in {path}")
+    return config
+
+
+def parse_weights(items, base=None):
+    """
+    ["10.0.0.5=4", ...] -> {"10.0.0.5": 4.0, ...}, on top of the config file weights.
+    """
+    weights = dict(base or {})
+    for item in items:
+        client, _, weight = item.partition("=")
+        try:
+            value = float(weight)
+        except ValueError:
+            value = 0
+        if not client.strip() or value <= 0:
+            raise ValueError(f"Invalid --client-weight {item!r}, expected IP=WEIGHT with WEIGHT > 0")
+        weights[client.strip()] = value
+    return weights
+
+
+def flag_overrides(args):
+    return {
+        key: getattr(args, flag[2:].replace("-", "_"))
+        for flag, key, _, _ in SETTINGS
+        if getattr(args, flag[2:].replace("-", "_")) is not None
+    }
+
+
 # -------------------------------------------------------------------------------
 """
     Task for running the TCP server.
 """
 
 
-def tcp_server_task():
+def tcp_server_task(config):
+    # Áp config lên class trước khi khởi tạo (catalog đọc RESOURCE_PATH trong __init__)
+    for key in TCP_KEYS:
+        if key in config:
+            setattr(serverCore.SocketServer, key, config[key])
     s1 = serverCore.SocketServer()
     try:
         s1.create_server()  # Run TCP server
     except Exception as e:
-        print(f"[ERROR] TCP server error: {e}")
+        logger.error(f"TCP server error: {e}")
     finally:
-        print("[STATUS] TCP server shutting down...")
+        logger.info("TCP server shutting down...")
 
 
 """
@@ -38,50 +150,101 @@ def tcp_server_task():
 """
 
 
-def udp_server_task():
-    server = serverUDP.SocketServerUDP()
+def udp_server_task(config):
+    server = serverUDP.SocketServerUDP(**{key: config[key] for key in UDP_KEYS if key in config})
     try:
         server.start()  # Run UDP server
     except Exception as e:
-        print(f"[ERROR] UDP server error: {e}")
+        logger.error(f"UDP server error: {e}")
     finally:
-        print("[STATUS] UDP server shutting down...")
+        logger.info("UDP server shutting down...")
 
 
-# -------------------------------------------------------------------------------
+"""
+    Task for running the multi-process TCP server.
+    Chạy trên main thread vì tiến trình cha cần nhận signal (SIGHUP để reload).
+    SIGHUP đọc lại file --config, các flag dòng lệnh vẫn được giữ.
+"""
 
 
-def main():
-    # Register signal handler for Ctrl+C
-    signal.signal(signal.SIGINT, handle_exit)
+def tcp_prefork_server_task(config, config_path=None, overrides=None):
+    pool = serverPool.PreforkServer(
+        workers=config.get("WORKERS"),
+        config_path=config_path,
+        use_reuseport=config.get("USE_REUSEPORT"),
+        overrides=overrides,
+    )
+    try:
+        pool.start()
+    except Exception as e:
+        logger.error(f"Pre-fork TCP server error: {e}")
+    finally:
+        logger.info("Pre-fork TCP server shutting down...")
+
+
+# -------------------------------------------------------------------------------
+
 
+def choose_mode():
     print("0. Exit")
     print("1. Download file from server with input.txt using TCP")
     print("2. Download file from server with input.txt using UDP")
+    print("3. Download file from server with input.txt using TCP (multi-process)")
 
     print("\nChoose your option: ", end="")
     try:
-        choice = int(input())
+        return int(input())
     except ValueError:
-        print("[ERROR] Invalid input. Please enter a number.")
+        logger.error("Invalid input. Please enter a number.")
         sys.exit(1)
 
+
+def main(args=None):
+    args = args or parse_args([])
+    # Register signal handler for Ctrl+C
+    signal.signal(signal.SIGINT, handle_exit)
+
+    file_config = load_config(args.config)
+    overrides = flag_overrides(args)
+    try:
+        if args.sockopt:
+            overrides["SOCKET_OPTIONS"] = sockopts.parse_overrides(args.sockopt, file_config.get("SOCKET_OPTIONS"))
+        if args.client_weight:
+            overrides["CLIENT_WEIGHTS"] = parse_weights(args.client_weight, file_config.get("CLIENT_WEIGHTS"))
+        config = {**file_config, **overrides}
+        sockopts.validate(config.get("SOCKET_PROFILE", sockopts.DEFAULT_PROFILE), config.get("SOCKET_OPTIONS"))
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(2)
+    if args.reuseport:
+        config["USE_REUSEPORT"] = True
+    if args.udp_offload:
+        config["OFFLOAD"] = True
+
+    # Không có --mode thì giữ menu tương tác như cũ
+    choice = MODES[args.mode] if args.mode else choose_mode()
+
     if choice == 0:
-        print("Exiting...")
+        logger.info("Exiting...")
         sys.exit(0)
 
     elif choice == 1:
-        print("Starting TCP server...")
-        tcp_thread = threading.Thread(target=tcp_server_task, daemon=True)
+        logger.info("Starting TCP server...")
+        tcp_thread = threading.Thread(target=tcp_server_task, args=(config,), daemon=True)
         tcp_thread.start()
 
     elif choice == 2:
-        print("Starting UDP server...")
-        udp_thread = threading.Thread(target=udp_server_task, daemon=True)
+        logger.info("Starting UDP server...")
+        udp_thread = threading.Thread(target=udp_server_task, args=(config,), daemon=True)
         udp_thread.start()
 
+    elif choice == 3:
+        logger.info("Starting multi-process TCP server...")
+        tcp_prefork_server_task(config, args.config, overrides)
+        sys.exit(0)
+
     else:
-        print("[ERROR] Invalid choice.")
+        logger.error("Invalid choice.")
         sys.exit(1)
 
     # Keep the main thread running until Ctrl+C is detected
@@ -89,5 +252,44 @@ def main():
         stop_event.wait(1)  # Wait for the signal to stop
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Socket file transfer server")
+    parser.add_argument("--mode", choices=sorted(MODES), help="start this server without the interactive menu")
+    parser.add_argument("--config", metavar="FILE", help="JSON config file (keys are SocketServer attribute names)")
+    for flag, _, type_, help_text in SETTINGS:
+        parser.add_argument(flag, type=type_, help=help_text)
+    parser.add_argument(
+        "--sockopt",
+        action="append",
+        metavar="ROLE.OPTION=VALUE",
+        help="override one socket option of the profile, e.g. data.rcvbuf=8M (repeatable)",
+    )
+    parser.add_argument(
+        "--client-weight",
+        action="append",
+        metavar="IP=WEIGHT",
+        help="bandwidth share of a client's sessions when rates are limited, default 1 (repeatable)",
+    )
+    parser.add_argument("--reuseport", action="store_true", help="pre-fork workers bind with SO_REUSEPORT")
+    parser.add_argument(
+        "--udp-offload",
+        action="store_true",
+        help="UDP: send batches of datagrams with GSO (Linux, detected at startup)",
+    )
+    parser.add_argument("--log-level", help="DEBUG, INFO, WARNING or ERROR (default $LOG_LEVEL or INFO)")
+    parser.add_argument("--quiet", action="store_true", help="only log warnings and errors")
+    parser.add_argument("--log-file", metavar="FILE", help="also append log lines to FILE")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile, write stats to FILE and FILE.txt")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace (JSON) of the transfer stages to FILE")
+    parser.add_argument("--trace-sample", type=float, default=1.0, help="fraction of requests traced (default 1.0)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    log.setup(level=args.log_level, quiet=args.quiet, log_file=args.log_file)
+    tracing.setup(args.trace, args.trace_sample)
+    if args.profile:
+        tracing.profile(main, args.profile, args)
+    else:
+        main(args)
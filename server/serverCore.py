@@ -1,21 +1,218 @@
 import utils
+import admission
+import catalog
+import compression
+import delta
+import diskio
+import log
+import metrics
+import ratelimit
+import sockopts
+import tracing
+import os
+import queue
 import socket
+import secrets
 import threading
+import time
+import zlib
+
+logger = log.get_logger(__name__)
+# Dòng log cho từng chunk: chỉ ở mức DEBUG và tối đa 1 dòng/giây
+chunk_log = log.Throttle(logger)
+
+
+class PipeSession:
+    """
+    Data pipes of one client session, identified by the token returned by OPEN.
+    Pipes connect to the shared data port and are attached here by index.
+
+    Each pipe has its own sender thread: blocks of one pipe go out in
+    request order, different pipes send in parallel. At most max_queued
+    requests wait for their sender (0 = no limit), submit() blocks beyond.
+    """
+
+    def __init__(self, token, pipes, codec=None, client=None, max_queued=0):
+        self.token = token
+        self.codec = codec
+        self.client = client  # IP của client, dùng cho token bucket theo client
+        self.pipes = [None] * pipes
+        self.send_locks = [threading.Lock() for _ in range(pipes)]
+        self.senders = [None] * pipes  # hàng đợi việc của luồng gửi mỗi pipe
+        self.max_queued = max_queued
+        self.queued = 0  # việc đã nhận, chưa được luồng gửi lấy ra
+        self.condition = threading.Condition()
+        self.linger_timer = None
+
+    def attach(self, index, pipe_conn):
+        with self.condition:
+            if self.pipes[index] is not None:
+                self.pipes[index].close()
+            self.pipes[index] = pipe_conn
+            self.condition.notify_all()
+
+    def get_pipe(self, index, timeout=10):
+        """
+        Wait until pipe `index` has connected (the client does not wait for an ack).
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pipes[index] is not None, timeout):
+                raise TimeoutError(f"Pipe {index} of session {self.token} never connected")
+            return self.pipes[index]
+
+    def submit(self, index, func, *args):
+        """
+        Run func(*args) on the sender thread of pipe `index`.
+        """
+        with self.condition:
+            # Backpressure: control loop ngừng đọc GET, TCP giữ client lại
+            self.condition.wait_for(lambda: not self.max_queued or self.queued < self.max_queued)
+            self.queued += 1
+            jobs = self.senders[index]
+            if jobs is None:
+                jobs = self.senders[index] = queue.SimpleQueue()
+                threading.Thread(
+                    target=self.run_sender, args=(jobs,), name=f"pipe-{self.token}-{index}", daemon=True
+                ).start()
+            jobs.put((func, args))
+
+    def run_sender(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            with self.condition:
+                self.queued -= 1
+                self.condition.notify_all()
+            func, args = job
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Session {self.token}: {e}")
+
+    def close(self):
+        with self.condition:
+            for pipe_conn in self.pipes:
+                if pipe_conn is not None:
+                    pipe_conn.close()
+            self.pipes = [None] * len(self.pipes)
+            for jobs in self.senders:
+                if jobs is not None:
+                    jobs.put(None)
+            self.senders = [None] * len(self.senders)
+            self.queued = 0
+            self.condition.notify_all()
 
 
 class SocketServer:
     HOST = socket.gethostbyname(socket.gethostname())
     PORT = 6969
+    # Port dữ liệu chung cho mọi pipe, pipe tự giới thiệu bằng token của phiên
+    DATA_PORT = 6970
+    # Thời gian giữ pipe sau khi control connection đóng để client kết nối lại dùng tiếp
+    SESSION_LINGER = 30
     HEADER_SIZE = 8
+    # Số pipe của client cũ (suy ra pipe từ offset); client mới tự chọn tới MAX_PIPES
     PIPES = 4
+    # Giới hạn gửi cho client trong OPEN để client tự điều chỉnh số pipe và kích thước block
+    MAX_PIPES = 16
+    MIN_BLOCK_SIZE = 64 * 1024
+    MAX_BLOCK_SIZE = 16 * 1024 * 1024
     RESOURCE_PATH = "./resources/"
     MESSAGE_SIZE = 1024
 
-    CODE = {"LIST": "LIST", "OPEN": "OPEN", "GET": "GET"}
+    # Giới hạn băng thông (bytes/s, 0 = không giới hạn) và kích thước mỗi lần gửi
+    GLOBAL_RATE = 0
+    CLIENT_RATE = 0
+    # {client IP: trọng số} khi chia băng thông giữa các phiên (mặc định 1)
+    CLIENT_WEIGHTS = None
+    SEND_SLICE = 64 * 1024
+
+    # Dung lượng tối đa của cache block đã nén (.compressed_cache/, LRU; 0 = không giới hạn)
+    COMPRESSION_CACHE_BYTES = compression.CACHE_MAX_BYTES
+
+    # Metrics: "host:port" (HTTP /metrics, /stats) hoặc "unix:/path.sock"; None = tắt
+    METRICS_ADDRESS = None
+    # File JSON ghi lại snapshot mỗi METRICS_INTERVAL giây; None = tắt
+    METRICS_FILE = None
+    METRICS_INTERVAL = 10
+
+    # Profile tuỳ chỉnh socket (xem sockopts.py) và các option ghi đè theo role
+    SOCKET_PROFILE = sockopts.DEFAULT_PROFILE
+    SOCKET_OPTIONS = None
+
+    # Admission control (xem admission.py, 0 = không giới hạn): số phiên phục vụ cùng lúc,
+    # số kết nối được chờ tối đa QUEUE_TIMEOUT giây, byte block đang giữ trong bộ nhớ và
+    # số GET chờ gửi của mỗi phiên. Kết nối bị từ chối nhận BUSY kèm số giây nên chờ.
+    MAX_SESSIONS = 128
+    MAX_QUEUED = 64
+    QUEUE_TIMEOUT = 10
+    MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+    MAX_QUEUED_REQUESTS = 64
+    RETRY_AFTER = 2
+
+    # Luồng đọc đĩa (xem diskio.py) và số byte kernel được gợi ý đọc trước sau mỗi block
+    IO_THREADS = diskio.IO_THREADS
+    READAHEAD = diskio.READAHEAD
+
+    CODE = {
+        "LIST": "LIST",
+        "OPEN": "OPEN",
+        "GET": "GET",
+        "PIPE": "PIPE",
+        "PING": "PING",
+        "DELTA": "DELTA",
+        "HASH": "HASH",
+        "SUBSCRIBE": "SUBSCRIBE",
+    }
+    # Tính năng gửi kèm OPEN (trường thứ 7) để client biết server hỗ trợ gì
+    FEATURES = ("delta", "hash", "subscribe", "crc")
+
+    # SUBSCRIBE: chu kỳ quét thư mục resource và chu kỳ gửi NOOP để phát hiện client đã mất
+    CATALOG_POLL = 0.2
+    SUBSCRIBE_HEARTBEAT = 20
 
     def __init__(self):
-        print("[STATUS] Initializing the server...")
+        logger.info("Initializing the server...")
+        sockopts.validate(self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
         self.stop_event = threading.Event()
+        # draining: ngừng nhận kết nối mới nhưng để các phiên đang chạy hoàn tất
+        self.draining = threading.Event()
+        self.compression_cache = compression.CompressionCache(max_bytes=self.COMPRESSION_CACHE_BYTES)
+        self.catalog = catalog.Catalog(self.RESOURCE_PATH)
+        self.sessions = {}  # token -> PipeSession
+        self.scheduler = ratelimit.BandwidthScheduler(
+            self.GLOBAL_RATE, self.CLIENT_RATE, client_weights=self.CLIENT_WEIGHTS
+        )
+        self.sessions_lock = threading.Lock()
+        self.admission = admission.Admission(
+            self.MAX_SESSIONS, self.MAX_QUEUED, self.QUEUE_TIMEOUT, self.MAX_INFLIGHT_BYTES
+        )
+
+        self.metrics = metrics.Registry()
+        self.metrics.gauge("active_sessions", lambda: len(self.sessions))
+        self.metrics.gauge("active_pipes", self.count_pipes)
+        self.metrics.gauge("bandwidth", self.scheduler.snapshot)
+        self.metrics.gauge("admission", self.admission.snapshot)
+        self.disk = diskio.DiskIO(self.IO_THREADS, self.READAHEAD, metrics=self.metrics)
+        self.metrics.gauge("disk", self.disk.snapshot)
+        self.metrics_exporter = None
+
+    def count_pipes(self):
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        return sum(1 for session in sessions for pipe_conn in session.pipes if pipe_conn is not None)
+
+    def start_metrics(self):
+        if self.METRICS_ADDRESS is None and self.METRICS_FILE is None:
+            return
+        self.metrics_exporter = metrics.MetricsExporter(
+            self.metrics, self.METRICS_ADDRESS, self.METRICS_FILE, self.METRICS_INTERVAL
+        )
+        try:
+            self.metrics_exporter.start()
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint {self.METRICS_ADDRESS}: {e}")
 
     def create_server(self):
         """
@@ -30,121 +227,460 @@ class SocketServer:
 
             """
             try:
+                self.tune_socket(server_socket, "control")
                 # Bind the socket to the address
                 server_socket.bind((self.HOST, self.PORT))
+                data_socket = self.create_data_socket()
             except Exception as e:
-                print(f"[ERROR] {e}")
+                logger.error(e)
                 return
 
-            try:
+            self.serve_forever(server_socket, data_socket)
+
+    def create_data_socket(self):
+        """
+        Bind the shared data port that every pipe connects to.
+        """
+        data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Buffer phải đặt trước listen() để kernel chọn window scale của các pipe
+        self.tune_socket(data_socket, "data")
+        data_socket.bind((self.HOST, self.DATA_PORT))
+        data_socket.listen()
+        return data_socket
+
+    def tune_socket(self, sock, role):
+        sockopts.apply(sock, role, self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
+
+    def serve_forever(self, server_socket, data_socket):
+        """
+        Accept clients on an already bound socket.
+        Dùng chung cho chế độ 1 tiến trình và các worker của serverPool.
+        """
+        data_thread = threading.Thread(
+            target=self.serve_data_port, args=(data_socket,), daemon=True
+        )
+        data_thread.start()
+        self.start_metrics()
+
+        try:
+            # Tham số hàng đợi (số kết nối mặc định được phép kêt nối) phụ thuộc vào hệ thống
+            server_socket.listen()
+
+            logger.info(f"Server listening on {self.HOST}:{self.PORT}")
+
+            # Timeout ngắn để vòng lặp kiểm tra được cờ dừng/drain
+            server_socket.settimeout(1)
+
+            """
+            SERVER LUÔN CHẠY ĐỂ LẮNG NGHE CÁC KẾT NỐI TỪ CLIENT
+            """
+            while not self.stop_event.is_set() and not self.draining.is_set():
+                # ----------------------------------------------------------------------------------
                 """
-                SERVER LUÔN CHẠY ĐỂ LẮNG NGHE CÁC KẾT NỐI TỪ CLIENT
+                    Chấp nhận kết nối từ một client
+                        - master: Một socket mới dành riêng để giao tiếp với client.
+                        - addr: Địa chỉ của client (bao gồm IP và cổng).
                 """
-                while not self.stop_event.is_set():
-                    # ----------------------------------------------------------------------------------
-                    # Listen for incoming connections
+                try:
+                    master, addr = server_socket.accept()
+                except socket.timeout:
+                    continue
 
-                    # Tham số hàng đợi (số kết nối mặc định được phép kêt nối) phụ thuộc vào hệ thống
-                    server_socket.listen()
+                # Quá tải: trả BUSY ngay, không tạo thread cho kết nối này
+                admitted = self.admission.admit()
+                if admitted == admission.REJECTED:
+                    self.reject(master, addr)
+                    continue
 
-                    print(f"[STATUS] Server listening on {self.HOST}:{self.PORT}")
+                # Đặt timeout (thời gian chờ tối đa) cho kết nối với client là 100 giây
+                # Nếu sau thời gian này không có hoạt động, kết nối sẽ tự động đóng
+                master.settimeout(100)
+                # Socket được accept không kế thừa TCP_NODELAY trên mọi hệ điều hành
+                self.tune_socket(master, "control")
 
-                    """
-                        Chấp nhận kết nối từ một client
-                            - master: Một socket mới dành riêng để giao tiếp với client.
-                            - addr: Địa chỉ của client (bao gồm IP và cổng).
-                    """
-                    master, addr = server_socket.accept()
+                logger.info(f"Connected by {addr}" + (" (queued)" if admitted == admission.QUEUED else ""))
 
-                    # Đặt timeout (thời gian chờ tối đa) cho kết nối với client là 100 giây
-                    # Nếu sau thời gian này không có hoạt động, kết nối sẽ tự động đóng
-                    master.settimeout(100)
+                # ----------------------------------------------------------------------------------
 
-                    print("[STATUS] Connected by", addr)
+                # Tạo các thread để xử lý các kết nối từ client
 
-                    # ----------------------------------------------------------------------------------
+                client_thread = threading.Thread(
+                    target=self.handle_client_connection, args=(master, addr, admitted)
+                )
 
-                    # Tạo các thread để xử lý các kết nối từ client
+                client_thread.start()
 
-                    client_thread = threading.Thread(
-                        target=self.handle_client_connection, args=(master, addr)
-                    )
+        except Exception as e:
+            logger.error(e)
 
-                    client_thread.start()
+        finally:
+            logger.info("Server shutting down...")
+            server_socket.close()
+            data_socket.close()
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.stop()
 
-            except Exception as e:
-                print(f"[ERROR] {e}")
+    def serve_data_port(self, data_socket):
+        """
+        Accept pipe connections on the data port and route them to their session.
+        """
+        logger.info(f"Data port listening on {self.HOST}:{self.DATA_PORT}")
+        data_socket.settimeout(1)
+        while not self.stop_event.is_set() and not self.draining.is_set():
+            try:
+                pipe_conn, addr = data_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.tune_socket(pipe_conn, "data")
+            threading.Thread(
+                target=self.attach_pipe, args=(pipe_conn, addr), daemon=True
+            ).start()
 
-            finally:
-                print("[STATUS] Server shutting down...")
-                server_socket.close()
+    def attach_pipe(self, pipe_conn, addr):
+        """
+        Read the pipe hello "PIPE\r\n<token>\r\n<index>" and attach it to the session.
+        """
+        try:
+            pipe_conn.settimeout(10)
+            hello = utils.recv_exact(pipe_conn, self.MESSAGE_SIZE).decode().strip()
+            code, token, index = hello.split("\r\n")[:3]
+            with self.sessions_lock:
+                session = self.sessions.get(token)
+            if code != self.CODE["PIPE"] or session is None:
+                logger.error(f"Rejected pipe from {addr}: unknown session")
+                pipe_conn.close()
+                return
+            session.attach(int(index), pipe_conn)
+            logger.info(f"Pipe {index} of session {token} connected from {addr}")
+        except Exception as e:
+            logger.error(f"Pipe handshake from {addr} failed: {e}")
+            pipe_conn.close()
+
+    def reject(self, master, addr):
+        """
+        Answer "BUSY\r\n<retry_after>" and close. The client may already have
+        sent its request: read it first, closing with unread data would reset
+        the connection and the client could lose the reply.
+        """
+        self.metrics.inc("connections_rejected_total")
+        logger.warning(f"Server busy, rejected {addr} (retry after {self.RETRY_AFTER}s)")
+        try:
+            master.sendall(utils.standardize_str(f"BUSY\r\n{self.RETRY_AFTER}", self.MESSAGE_SIZE).encode())
+            master.shutdown(socket.SHUT_WR)
+            master.setblocking(False)
+            master.recv(self.MESSAGE_SIZE)
+        except OSError:
+            pass
+        finally:
+            master.close()
+
+    def handle_client_connection(self, master, addr, admitted=admission.ADMITTED):
+        if admitted == admission.QUEUED:
+            started = time.monotonic()
+            if not self.admission.wait(lambda: self.stop_event.is_set() or self.draining.is_set()):
+                self.reject(master, addr)
+                return
+            self.metrics.observe("admission_wait_seconds", time.monotonic() - started)
+        try:
+            self.serve_client(master, addr)
+        finally:
+            self.admission.leave()
 
-    def handle_client_connection(self, master, addr):
-        pipes_list = []
+    def serve_client(self, master, addr):
+        session = None
 
         while not self.stop_event.is_set():
             try:
-                data = master.recv(self.MESSAGE_SIZE)
-                if not data:
-                    break
+                data = utils.recv_exact(master, self.MESSAGE_SIZE)
                 data = data.decode().strip()
                 message = data.split("\r\n")[0]
+                self.metrics.inc("requests_total", opcode=message if message in self.CODE else "unknown")
 
                 if message == self.CODE["LIST"]:
                     self.send_resources_list(master)
                 elif message == self.CODE["OPEN"]:
-                    pipes_list = self.create_pipes(master)
+                    lines = data.split("\r\n")
+                    offered = lines[1].strip() if len(lines) > 1 else ""
+                    token = lines[2].strip() if len(lines) > 2 else ""
+                    session = self.create_pipes(master, offered, token)
                 elif message == self.CODE["GET"]:
                     payload = data.split("\r\n")[1]
-                    self.send_chunk(master, payload, addr, pipes_list)
+                    self.send_chunk(master, payload, addr, session)
+                elif message == self.CODE["DELTA"]:
+                    self.send_delta(master, data.split("\r\n")[1:], session)
+                elif message == self.CODE["HASH"]:
+                    self.send_hash(master, data.split("\r\n")[1])
+                elif message == self.CODE["SUBSCRIBE"]:
+                    # Từ đây kết nối chỉ dùng để đẩy thay đổi của catalog
+                    self.send_catalog_changes(master, data.split("\r\n")[1:])
+                    break
+                elif message == self.CODE["PING"]:
+                    # Keep-alive: trả lời để client biết phiên còn sống
+                    master.sendall(utils.standardize_str("PONG", self.MESSAGE_SIZE).encode())
             except socket.timeout:
-                print("[STATUS] Connection timed out.")
+                logger.info("Connection timed out.")
+                break
+            except ConnectionError:
+                logger.info(f"Client {addr} disconnected")
                 break
             except Exception as e:
-                print(f"[ERROR] {e}")
+                logger.error(e)
                 break
 
+        master.close()
+        if session is not None:
+            self.release_session(session)
+
     def send_resources_list(self, master):
-        list_file = utils.list_all_file_in_directory(self.RESOURCE_PATH)
+        list_file = self.catalog.list_entries()
         list_file = utils.standardize_str(str(list_file), self.MESSAGE_SIZE)
         master.sendall(f"{list_file}".encode())
 
-    def create_pipes(self, master):
-        master_port = utils.find_free_port(self.HOST)
-
-        master.sendall(f"{master_port}".encode())
-
-        master_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        master_socket.bind((self.HOST, master_port))
-        pipes_list = []
-        for _ in range(self.PIPES):
-            master_socket.listen(1)
-            pipe_conn, addr = master_socket.accept()
-            pipe_conn.settimeout(10)
-            print(f"[STATUS] Listening on master port {addr}")
-            pipes_list.append(pipe_conn)
-        return pipes_list
-
-    def send_chunk(self, master, message, addr, pipes_list):
-        if not message:
-            print("[STATUS] Client disconnected")
+    def create_pipes(self, master, offered="", token=""):
+        """
+        Register a pipe session and negotiate block compression.
+        - offered: codecs proposed by the client in the OPEN request.
+        - token: token of a previous session whose pipes the client wants to reuse.
+
+        Reply: "<data_port>|<codec>|<token>|<max_pipes>|<min_block>|<max_block>|<features>"
+        (codec rỗng nếu client không đề nghị nén; client cũ chỉ đọc 3 trường đầu).
+        The client connects its pipes to the data port right away, so the
+        session is set up in a single round trip.
+        """
+        codec = compression.negotiate(offered) if offered else None
+
+        with self.sessions_lock:
+            session = self.sessions.get(token) if token else None
+            if session is not None and session.linger_timer is not None:
+                session.linger_timer.cancel()
+                session.linger_timer = None
+            if session is None:
+                token = secrets.token_hex(8)
+                session = PipeSession(
+                    token, max(self.PIPES, self.MAX_PIPES), codec, master.getpeername()[0], self.MAX_QUEUED_REQUESTS
+                )
+                self.sessions[token] = session
+            session.codec = codec
+
+        response = (
+            f"{self.DATA_PORT}|{codec or ''}|{session.token}"
+            f"|{self.MAX_PIPES}|{self.MIN_BLOCK_SIZE}|{self.MAX_BLOCK_SIZE}|{','.join(self.FEATURES)}"
+        )
+        master.sendall(utils.standardize_str(response, self.MESSAGE_SIZE).encode())
+        return session
+
+    def send_delta(self, master, fields, session):
+        """
+        DELTA\r\n<name>\r\n<local_size>\r\n<block_size>\r\n<signature_bytes>
+        followed by the signatures of the client's copy (see delta.py).
 
-        print(f"[REQUEST] Received request for chunk {message.strip()} from {addr}")
+        Reply: "DELTA\r\n<size>" then the instruction stream on the control
+        connection, or "ERROR\r\n<reason>" when the resource is missing.
+        """
+        filename, local_size, block_size, signature_size = fields[0], *(int(f) for f in fields[1:4])
+        if signature_size > (local_size // delta.MIN_BLOCK + 1) * delta.SIGNATURE.size:
+            raise ValueError(f"Delta signatures of {signature_size} bytes for a {local_size} byte file")
+        with tracing.span("recv.signatures", bytes=signature_size):
+            signature_blob = utils.recv_exact(master, signature_size)
+
+        file_path = self.resource_path(filename)
+        if file_path is None or not os.path.isfile(file_path):
+            master.sendall(utils.standardize_str(f"ERROR\r\n{filename} not found", self.MESSAGE_SIZE).encode())
+            return
+        size = os.path.getsize(file_path)
+        master.sendall(utils.standardize_str(f"DELTA\r\n{size}", self.MESSAGE_SIZE).encode())
+
+        def write(piece):
+            if session is not None:
+                self.scheduler.acquire(session.client, session.token, len(piece))
+            master.sendall(piece)
+            self.metrics.inc("bytes_sent_total", len(piece))
+
+        with tracing.span("server.delta", file=filename) as delta_span:
+            copied, literal = delta.encode(file_path, local_size, block_size, signature_blob, write)
+            delta_span.set(copied=copied, literal=literal)
+        self.metrics.inc("delta_syncs_total")
+        self.metrics.inc("delta_literal_bytes_total", literal)
+        self.metrics.inc("delta_copied_bytes_total", copied)
+        logger.info(f"Delta of {filename}: {literal} bytes sent, {copied} bytes reused from the client copy")
+
+    def resource_path(self, filename):
+        """
+        Path of a requested resource, None when the client-supplied name
+        points outside RESOURCE_PATH.
+        """
+        return utils.resource_file(self.RESOURCE_PATH, filename)
 
-        t = threading.Thread(target=self.handle_send_chunk, args=(message, pipes_list))
-        t.start()
-        t.join()
+    def send_hash(self, master, filename):
+        """
+        HASH\r\n<name> -> "HASH\r\n<size>\r\n<sha256>", or "ERROR\r\n<reason>".
+        The client uses the hash as key of its content store.
+        """
+        file_path = self.resource_path(filename)
+        if file_path is None or not os.path.isfile(file_path):
+            response = f"ERROR\r\n{filename} not found"
+        else:
+            with tracing.span("server.hash", file=filename):
+                digest = self.catalog.digest(file_path)
+            response = f"HASH\r\n{os.path.getsize(file_path)}\r\n{digest}"
+        master.sendall(utils.standardize_str(response, self.MESSAGE_SIZE).encode())
+
+    def send_catalog_changes(self, master, fields):
+        """
+        SUBSCRIBE\r\n[<version>]: reply "SUBSCRIBED\r\n<version>", then push
+        every catalog change on this connection as it is found:
 
-    def handle_send_chunk(self, message, pipes_list):
+            CHANGE\r\n<version>\r\n<added|removed|modified>\r\n<name>\r\n<size>
+            RESET\r\n<version>    changes since <version> are lost, LIST again
+            NOOP\r\n<version>     heartbeat every SUBSCRIBE_HEARTBEAT seconds
 
-        filename, file_size, start_offset, end_offset = eval(message.strip())
+        A client that reconnects with its last version gets the changes it missed.
+        """
+        self.catalog.watch(self.CATALOG_POLL)
+        since = fields[0].strip() if fields else ""
+        version = int(since) if since else self.catalog.version
+
+        last_sent = time.monotonic()
+
+        def send(message):
+            nonlocal last_sent
+            master.sendall(utils.standardize_str(message, self.MESSAGE_SIZE).encode())
+            last_sent = time.monotonic()
+
+        send(f"SUBSCRIBED\r\n{self.catalog.version}")
+        logger.info(f"Client {master.getpeername()} subscribed to catalog changes from version {version}")
+        while not self.stop_event.is_set() and not self.draining.is_set():
+            changes = self.catalog.changes_since(version)
+            if changes is None:
+                version = self.catalog.version
+                send(f"RESET\r\n{version}")
+                continue
+            for version, op, name, size in changes:
+                send(f"CHANGE\r\n{version}\r\n{op}\r\n{name}\r\n{size}")
+                self.metrics.inc("catalog_changes_pushed_total", op=op)
+            if changes:
+                continue
+            # Chờ từng giây để còn kiểm tra được cờ dừng/drain
+            if self.catalog.wait_changes(version, 1) == version:
+                if time.monotonic() - last_sent >= self.SUBSCRIBE_HEARTBEAT:
+                    send(f"NOOP\r\n{version}")
+
+    def release_session(self, session):
+        """
+        Keep the pipes for SESSION_LINGER seconds so a reconnecting client can reuse them.
+        """
 
-        with open(self.RESOURCE_PATH + filename, "rb") as file:
-            file.seek(start_offset)
-            chunk = file.read(end_offset - start_offset + 1)
+        rate = self.scheduler.snapshot()["sessions"].get(session.token)
+        if rate:
+            logger.info(
+                f"Session {session.token}: {rate['bytes']} bytes sent, "
+                f"{rate['rate_bps'] / 1e6:.2f} MB/s over the last {ratelimit.RateMeter.WINDOW:.0f}s"
+            )
+
+        def expire():
+            with self.sessions_lock:
+                if self.sessions.get(session.token) is session:
+                    del self.sessions[session.token]
+            self.scheduler.forget(session.token)
+            session.close()
+
+        with self.sessions_lock:
+            session.linger_timer = threading.Timer(self.SESSION_LINGER, expire)
+            session.linger_timer.daemon = True
+            session.linger_timer.start()
+
+    def send_chunk(self, master, message, addr, session):
+        if not message:
+            logger.info("Client disconnected")
+
+        chunk_log.debug("request", "Received request for chunk %s from %s", message.strip(), addr, tag="REQUEST")
+
+        with tracing.span("parse"):
+            request = eval(message.strip())
+
+        # Client gửi kèm id pipe (phần tử thứ 5); client cũ thì suy ra từ offset
+        if len(request) > 4:
+            id = request[4]
+        else:
+            chunk_size = request[3] - request[2] + 1
+            id = (request[2] // chunk_size) % self.PIPES
+
+        # Chờ tới khi tổng byte block đang giữ trong bộ nhớ còn chỗ (control loop ngừng đọc GET)
+        filename, _, start_offset, end_offset = request[:4]
+        file_path = self.resource_path(filename)
+        if file_path is None:
+            raise ValueError(f"GET of {filename!r} outside the resource directory")
+        started = time.perf_counter()
+        reserved = self.admission.reserve(end_offset - start_offset + 1)
+        self.metrics.observe("inflight_wait_seconds", time.perf_counter() - started)
+        try:
+            # Đọc đĩa ngay trên luồng disk, song song với các block trước đó đang được gửi
+            read = self.disk.submit(file_path, start_offset, end_offset - start_offset + 1)
+            # Không chờ gửi xong: vòng lặp control đọc tiếp GET cho các pipe khác
+            session.submit(id, self.handle_send_chunk, message, request, id, session, read, reserved)
+        except Exception:
+            self.admission.release(reserved)
+            raise
+
+    def handle_send_chunk(self, message, request, id, session, read, reserved):
+        try:
+            with tracing.span("server.block", token=session.token) as block_span:
+                self.send_block(message, request, id, session, read, block_span)
+        finally:
+            self.admission.release(reserved)
+
+    def send_block(self, message, request, id, session, read, block_span):
+        filename, file_size, start_offset, end_offset = request[:4]
+        file_path = self.resource_path(filename)
+        codec = session.codec
+        block_span.set(file=filename, start=start_offset, end=end_offset)
+
+        started = time.perf_counter()
+        with tracing.span("disk.wait"):
+            chunk = read.result()
+        self.metrics.observe("disk_wait_seconds", time.perf_counter() - started)
+
+        # Client xin checksum (phần tử thứ 6 của GET là "crc"): CRC-32 của block chưa nén
+        checksum = len(request) > 5 and request[5] == "crc"
+
+        if codec is None and not checksum:
             data = f"{message}\r\n".encode() + chunk
-
-            self.CHUNK_SIZE = end_offset - start_offset + 1
-            id = (start_offset // self.CHUNK_SIZE) % self.PIPES
-            pipes_list[id].sendall(data)
-            print(f"[RESPOND] Sent chunk {message.strip()} to {pipes_list[id]}")
+        else:
+            # Header mở rộng: thêm codec thực tế và độ dài payload trên đường truyền
+            if codec is None:
+                used_codec, payload = compression.NO_COMPRESSION, chunk
+            else:
+                with tracing.span("compress", codec=codec) as compress_span:
+                    used_codec, payload = self.compression_cache.get_block(
+                        codec, file_path, start_offset, chunk
+                    )
+                    compress_span.set(used=used_codec, ratio=len(payload) / max(1, len(chunk)))
+            header = [
+                filename,
+                file_size,
+                start_offset,
+                end_offset,
+                used_codec,
+                len(payload),
+            ]
+            if checksum:
+                with tracing.span("checksum"):
+                    header.append(zlib.crc32(chunk))
+            data = f"{header}\r\n".encode() + payload
+
+        pipe_conn = session.get_pipe(id)
+        started = time.perf_counter()
+        with tracing.span("send", pipe=id, bytes=len(data)), session.send_locks[id]:
+            # Gửi từng lát nhỏ để scheduler chia băng thông công bằng giữa các phiên
+            view = memoryview(data)
+            for offset in range(0, len(view), self.SEND_SLICE):
+                piece = view[offset : offset + self.SEND_SLICE]
+                self.scheduler.acquire(session.client, session.token, len(piece))
+                pipe_conn.sendall(piece)
+        self.metrics.observe("send_seconds", time.perf_counter() - started)
+        self.metrics.inc("bytes_sent_total", len(data))
+        self.metrics.inc("blocks_sent_total", codec=codec or "none")
+        chunk_log.debug("respond", "Sent chunk %s to pipe %s", message.strip(), id, tag="RESPOND")
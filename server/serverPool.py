@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import signal
+import socket
+import threading
+
+import log
+import catalog
+import sockopts
+import serverCore
+
+logger = log.get_logger(__name__)
+
+
+class PreforkServer:
+    """
+    Multi-process TCP server.
+
+    The parent builds the catalog and config once, then forks WORKERS
+    processes that each run SocketServer.serve_forever on the same port:
+        - USE_REUSEPORT=False: the parent binds one listening socket and
+          every worker inherits it.
+        - USE_REUSEPORT=True: every worker binds its own socket with
+          SO_REUSEPORT and the kernel balances new connections.
+
+    Data pipes: each worker listens on its own data port
+    (DATA_PORT + bank * WORKERS + index) and OPEN returns that port, so the
+    pipes of a session always reach the worker that owns its control
+    connection. The bank alternates between generations so a new worker
+    never collides with the draining worker it replaces.
+
+    Signals (parent):
+        - SIGHUP: reload config/catalog, start a new generation of workers
+          and let the old generation drain its running sessions.
+        - SIGINT/SIGTERM: drain all workers and exit.
+    """
+
+    WORKERS = os.cpu_count() or 1
+    USE_REUSEPORT = False
+
+    # Các thuộc tính SocketServer có thể ghi đè bằng file config (JSON)
+    CONFIG_KEYS = (
+        "HOST",
+        "PORT",
+        "DATA_PORT",
+        "PIPES",
+        "MAX_PIPES",
+        "MIN_BLOCK_SIZE",
+        "MAX_BLOCK_SIZE",
+        "RESOURCE_PATH",
+        "MESSAGE_SIZE",
+        "GLOBAL_RATE",
+        "CLIENT_RATE",
+        "CLIENT_WEIGHTS",
+        "METRICS_ADDRESS",
+        "METRICS_FILE",
+        "SOCKET_PROFILE",
+        "SOCKET_OPTIONS",
+        "MAX_SESSIONS",
+        "MAX_QUEUED",
+        "QUEUE_TIMEOUT",
+        "MAX_INFLIGHT_BYTES",
+        "MAX_QUEUED_REQUESTS",
+        "RETRY_AFTER",
+        "IO_THREADS",
+        "READAHEAD",
+        "COMPRESSION_CACHE_BYTES",
+    )
+
+    def __init__(self, workers=None, config_path=None, use_reuseport=None, overrides=None):
+        self.workers = workers or self.WORKERS
+        self.config_path = config_path
+        # Giá trị từ dòng lệnh: luôn thắng file config, kể cả khi reload
+        self.overrides = overrides or {}
+        if use_reuseport is not None:
+            self.USE_REUSEPORT = use_reuseport
+        if self.USE_REUSEPORT and not hasattr(socket, "SO_REUSEPORT"):
+            logger.info("SO_REUSEPORT is not available, sharing one socket")
+            self.USE_REUSEPORT = False
+
+        self.config = {}
+        self.catalog = None
+        self.listen_socket = None
+        self.children = {}  # pid -> (generation, worker index)
+        self.generation = 0
+        self.running = True
+        self.reload_requested = False
+
+    # ==============================================================================================
+    def load_config(self):
+        """
+        Read the shared config (if any) and rebuild the catalog snapshot.
+        """
+        config = {key: getattr(serverCore.SocketServer, key) for key in self.CONFIG_KEYS}
+        if self.config_path:
+            try:
+                with open(self.config_path, "r") as file:
+                    overrides = json.load(file)
+                for key in self.CONFIG_KEYS:
+                    if key in overrides:
+                        config[key] = overrides[key]
+            except Exception as e:
+                logger.error(f"Could not read config {self.config_path}: {e}")
+        for key in self.CONFIG_KEYS:
+            if key in self.overrides:
+                config[key] = self.overrides[key]
+        self.config = config
+
+        # Catalog dùng chung: quét một lần ở tiến trình cha, worker dùng bản snapshot
+        self.catalog = catalog.Catalog(self.config["RESOURCE_PATH"], auto_refresh=False)
+        logger.info(f"Catalog loaded: {len(self.catalog)} resources")
+
+    def create_listen_socket(self):
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.USE_REUSEPORT:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sockopts.apply(server_socket, "control", self.config["SOCKET_PROFILE"], self.config["SOCKET_OPTIONS"])
+        server_socket.bind((self.config["HOST"], self.config["PORT"]))
+        server_socket.listen()
+        return server_socket
+
+    # ==============================================================================================
+    def spawn_worker(self, index):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (self.generation, index)
+            return pid
+
+        # ------------------------------ WORKER PROCESS ------------------------------
+        exit_code = 0
+        try:
+            # Áp config lên class trong tiến trình con trước khi khởi tạo server
+            for key, value in self.config.items():
+                setattr(serverCore.SocketServer, key, value)
+            # Giới hạn toàn server được chia đều cho các worker. CLIENT_RATE giữ nguyên (mỗi worker):
+            # 1 phiên chỉ ở 1 worker, chia ra thì client 1 phiên chỉ còn CLIENT_RATE / WORKERS
+            serverCore.SocketServer.GLOBAL_RATE = self.config["GLOBAL_RATE"] / self.workers
+            serverCore.SocketServer.MAX_INFLIGHT_BYTES = self.config["MAX_INFLIGHT_BYTES"] // self.workers
+            server = serverCore.SocketServer()
+            server.catalog = self.catalog
+
+            def handle_drain(signum, frame):
+                server.draining.set()
+
+            signal.signal(signal.SIGTERM, handle_drain)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+            if self.USE_REUSEPORT:
+                listen_socket = self.create_listen_socket()
+            else:
+                listen_socket = self.listen_socket.dup()
+
+            bank = self.generation % 2
+            server.DATA_PORT = self.config["DATA_PORT"] + bank * self.workers + index
+            self.worker_metrics(server, bank * self.workers + index)
+            data_socket = server.create_data_socket()
+
+            logger.info(f"Worker {index} (pid {os.getpid()}) started")
+            server.serve_forever(listen_socket, data_socket)
+
+            # serve_forever trả về khi drain; chờ các phiên đang chạy kết thúc
+            for thread in threading.enumerate():
+                if thread is not threading.current_thread() and not thread.daemon:
+                    thread.join()
+        except Exception as e:
+            logger.error(f"Worker {index}: {e}")
+            exit_code = 1
+        finally:
+            log.shutdown()
+            os._exit(exit_code)
+
+    def worker_metrics(self, server, slot):
+        """
+        Give each worker its own metrics endpoint and snapshot file:
+        port + slot, "<path>.<slot>" for unix sockets and snapshot files.
+        """
+        address = self.config["METRICS_ADDRESS"]
+        if address:
+            if address.startswith("unix:"):
+                server.METRICS_ADDRESS = f"{address}.{slot}"
+            else:
+                host, port = address.rsplit(":", 1)
+                server.METRICS_ADDRESS = f"{host}:{int(port) + slot}"
+        if self.config["METRICS_FILE"]:
+            server.METRICS_FILE = f"{self.config['METRICS_FILE']}.{slot}"
+
+    def spawn_generation(self):
+        self.generation += 1
+        for index in range(self.workers):
+            self.spawn_worker(index)
+
+    def signal_generation(self, generation, signum):
+        for pid, (child_generation, _) in list(self.children.items()):
+            if child_generation <= generation:
+                try:
+                    os.kill(pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    # ==============================================================================================
+    def reload(self):
+        """
+        Graceful reload: new workers start serving before the old ones drain.
+        """
+        logger.info("Reloading config and catalog...")
+        old_generation = self.generation
+        self.load_config()
+        if not self.USE_REUSEPORT:
+            # Giữ socket cũ nếu địa chỉ không đổi để không rớt kết nối đang chờ accept
+            host, port = self.listen_socket.getsockname()
+            if (host, port) != (self.config["HOST"], self.config["PORT"]):
+                self.listen_socket.close()
+                self.listen_socket = self.create_listen_socket()
+        self.spawn_generation()
+        self.signal_generation(old_generation, signal.SIGTERM)
+
+    def reap_children(self):
+        """
+        Collect exited workers and replace the ones that died unexpectedly.
+        """
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation, index = self.children.pop(pid, (None, None))
+            if self.running and generation == self.generation and status != 0:
+                logger.error(f"Worker {pid} exited unexpectedly, restarting it")
+                self.spawn_worker(index)
+
+    def start(self):
+        if not hasattr(os, "fork"):
+            logger.info("fork() is not available, running a single process server")
+            serverCore.SocketServer().create_server()
+            return
+
+        self.load_config()
+        if not self.USE_REUSEPORT:
+            self.listen_socket = self.create_listen_socket()
+
+        def handle_reload(signum, frame):
+            self.reload_requested = True
+
+        def handle_stop(signum, frame):
+            self.running = False
+
+        signal.signal(signal.SIGHUP, handle_reload)
+        signal.signal(signal.SIGINT, handle_stop)
+        signal.signal(signal.SIGTERM, handle_stop)
+
+        self.spawn_generation()
+        logger.info(
+            f"Pre-fork server listening on {self.config['HOST']}:{self.config['PORT']}"
+            f" with {self.workers} workers"
+        )
+        if self.config["CLIENT_RATE"] and self.workers > 1:
+            logger.info(
+                f"CLIENT_RATE is per worker: a client with sessions on several workers may get up to "
+                f"{self.workers} x {self.config['CLIENT_RATE']} bytes/s"
+            )
+
+        try:
+            while self.running:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self.reap_children()
+                time.sleep(0.5)
+        finally:
+            logger.info("Stopping workers...")
+            self.signal_generation(self.generation, signal.SIGTERM)
+            while self.children:
+                self.reap_children()
+                time.sleep(0.2)
+            if self.listen_socket is not None:
+                self.listen_socket.close()
+            logger.info("Pre-fork server stopped")
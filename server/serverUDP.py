@@ -1,8 +1,42 @@
 import socket
 import os
 import zlib
+import time
+import base64
+import struct
+import secrets
+import catalog
+import compression
+import delta
+import diskio
+import log
+import metrics
+import ratelimit
+import sockopts
+import tracing
+import utils
+
+logger = log.get_logger(__name__)
+# Dòng log cho từng datagram: chỉ ở mức DEBUG và tối đa 1 dòng/giây
+chunk_log = log.Throttle(logger)
 
 class SocketServerUDP:
+    # Bản delta đã tính được tải như 1 file ảo "@delta/<id>" qua SIZE/GET/RESEND
+    DELTA_PREFIX = "@delta/"
+    DELTA_DIR = "./.delta_cache/"
+    # Thời gian giữ bản delta và các phần chữ ký đang tải lên (giây)
+    DELTA_TTL = 300
+    # SUBSCRIBE: chu kỳ quét thư mục resource khi có subscriber, thời hạn đăng ký (client gia hạn định kỳ)
+    CATALOG_POLL = 0.2
+    SUBSCRIBE_TTL = 60
+    # Stream ghép kênh (OPEN/MGET): header nhị phân của datagram dữ liệu và số datagram tối đa mỗi MGET
+    MUX_MARKER = 0xFF
+    MUX_HEADER = struct.Struct("!BHIIc")  # marker, stream id, seq, crc32, tag codec
+    MAX_STREAM_ID = 0xFFFF  # stream id là số 16 bit trong MUX_HEADER
+    MUX_BATCH = 64
+    # Chu kỳ dọn trạng thái của client đã rời đi (bandwidth scheduler, delta), kể cả khi server luôn bận
+    PRUNE_INTERVAL = 10
+
     """ ============================================================
         args: 
             HOST: server ip  
@@ -11,18 +45,73 @@ class SocketServerUDP:
             BUFFER_SIZE: thông tin nhận được 
             TIMEOUT: thời gian client 
             PIPE: số thread
+            GLOBAL_RATE: giới hạn băng thông toàn server (bytes/s, 0 = không giới hạn)
+            CLIENT_RATE: giới hạn băng thông mỗi client IP (bytes/s, 0 = không giới hạn)
+            CLIENT_WEIGHTS: {client IP: trọng số} khi chia băng thông giữa các phiên (mặc định 1)
+            METRICS_ADDRESS: "host:port" (HTTP /metrics, /stats) hoặc "unix:/path.sock", None = tắt
+            METRICS_FILE: file JSON ghi snapshot metrics định kỳ, None = tắt
+            SOCKET_PROFILE: profile tuỳ chỉnh socket (os, lan, wan-high-bdp, loopback)
+            SOCKET_OPTIONS: option ghi đè theo role, vd {"datagram": {"rcvbuf": 8388608}}
+            MAX_SESSIONS: số client (địa chỉ) được phục vụ cùng lúc, 0 = không giới hạn
+            MAX_QUEUED: số GET/RESEND chờ băng thông tối đa, 0 = không giới hạn
+            QUEUE_TIMEOUT: request chờ lâu hơn (giây) thì bỏ, client đã gửi lại RESEND
+            RETRY_AFTER: số giây client nên chờ khi nhận BUSY
+            IO_THREADS: số luồng đọc đĩa (diskio.py)
+            READAHEAD: số byte kernel được yêu cầu đọc trước sau mỗi lần đọc
+            OFFLOAD: gửi các loạt datagram của stream ghép kênh bằng UDP GSO (Linux), tự tắt nếu không hỗ trợ
     ============================================================ """
-    def __init__(self, HOST=socket.gethostbyname(socket.gethostname()), PORT=12345, RESOURCE_PATH="resources", BUFFER_SIZE=512, TIMEOUT=5):
+    def __init__(self, HOST=socket.gethostbyname(socket.gethostname()), PORT=12345, RESOURCE_PATH="resources", BUFFER_SIZE=512, TIMEOUT=5, GLOBAL_RATE=0, CLIENT_RATE=0, CLIENT_WEIGHTS=None, METRICS_ADDRESS=None, METRICS_FILE=None, METRICS_INTERVAL=10, SOCKET_PROFILE=sockopts.DEFAULT_PROFILE, SOCKET_OPTIONS=None, MAX_SESSIONS=256, MAX_QUEUED=4096, QUEUE_TIMEOUT=5, RETRY_AFTER=1, IO_THREADS=diskio.IO_THREADS, READAHEAD=diskio.READAHEAD, OFFLOAD=False):
         self.HOST = HOST
         self.PORT = PORT
         self.RESOURCE_PATH = RESOURCE_PATH
         self.BUFFER_SIZE = BUFFER_SIZE
         self.TIMEOUT = TIMEOUT
+        sockopts.validate(SOCKET_PROFILE, SOCKET_OPTIONS)
+        self.SOCKET_PROFILE = SOCKET_PROFILE
+        self.SOCKET_OPTIONS = SOCKET_OPTIONS
+        self.OFFLOAD = OFFLOAD
+        self.gso = False  # kiểm tra lúc start()
         os.makedirs(self.RESOURCE_PATH, exist_ok=True)
 
-        self.CODE = {"LIST": "LIST", "GET": "GET", "SIZE": "SIZE", "CONNECT": "CONNECT", "RESEND": "RESEND", "CHECK": "CHECK"}
-
-        print("[STATUS] Initializing the server...")
+        # Chia băng thông: token bucket + hàng đợi công bằng cho các GET/RESEND phải chờ
+        self.scheduler = ratelimit.BandwidthScheduler(GLOBAL_RATE, CLIENT_RATE, client_weights=CLIENT_WEIGHTS)
+        self.pending = ratelimit.FairQueue()
+
+        # Admission control: quá giới hạn thì trả BUSY|<retry_after> thay vì phục vụ chậm cho mọi người
+        self.MAX_SESSIONS = MAX_SESSIONS
+        self.MAX_QUEUED = MAX_QUEUED
+        self.QUEUE_TIMEOUT = QUEUE_TIMEOUT
+        self.RETRY_AFTER = RETRY_AFTER
+
+        # Metrics: counter/histogram trên hot path, gauge chỉ tính khi có người đọc
+        self.metrics = metrics.Registry()
+        self.metrics.gauge("active_sessions", lambda: len(self.scheduler.session_meters))
+        self.metrics.gauge("pending_requests", lambda: len(self.pending))
+        self.metrics.gauge("bandwidth", self.scheduler.snapshot)
+        self.metrics_exporter = None
+
+        # Đọc đĩa trên các luồng riêng, datagram đọc qua cache window + đọc trước
+        self.disk = diskio.DiskIO(IO_THREADS, READAHEAD, metrics=self.metrics)
+        self.metrics.gauge("disk", self.disk.snapshot)
+        if METRICS_ADDRESS or METRICS_FILE:
+            self.metrics_exporter = metrics.MetricsExporter(self.metrics, METRICS_ADDRESS, METRICS_FILE, METRICS_INTERVAL)
+
+        self.CODE = {"LIST": "LIST", "GET": "GET", "SIZE": "SIZE", "CONNECT": "CONNECT", "RESEND": "RESEND", "CHECK": "CHECK", "PING": "PING", "DSIG": "DSIG", "HASH": "HASH", "SUBSCRIBE": "SUBSCRIBE", "OPEN": "OPEN", "MGET": "MGET"}
+
+        # Chỉ mục resource: SHA-256 cho content store phía client và thay đổi cho subscriber
+        self.catalog = catalog.Catalog(self.RESOURCE_PATH, auto_refresh=False)
+        self.subscribers = {}  # client_address -> [version đã gửi, hạn đăng ký]
+        self.last_poll = 0.0
+        self.last_prune = time.monotonic()
+
+        # Delta sync: (client_address, upload_id) -> chữ ký đang nhận, id -> (đường dẫn, thời điểm tạo)
+        self.delta_uploads = {}
+        self.deltas = {}
+        os.makedirs(self.DELTA_DIR, exist_ok=True)
+        for name in os.listdir(self.DELTA_DIR):
+            os.remove(os.path.join(self.DELTA_DIR, name))
+
+        logger.info("Initializing the server...")
 
      # *********************************************************************************************** # 
 
@@ -65,8 +154,8 @@ class SocketServerUDP:
             client_address: Địa chỉ client.
     ============================================================ """
     def send_file_size(self, server_socket, file_name, client_address):
-        file_path = os.path.join(self.RESOURCE_PATH, file_name)
-        if not os.path.exists(file_path):
+        file_path = self.resource_path(file_name)
+        if file_path is None or not os.path.exists(file_path):
             server_socket.sendto(b"ERROR|File not found.", client_address)
             return
         file_size = os.path.getsize(file_path)
@@ -75,86 +164,607 @@ class SocketServerUDP:
      # *********************************************************************************************** # 
 
     """ ============================================================
-        Gửi resource chunk cho client.
+        Gửi SHA-256 của resource: HASH|<size>|<sha256>.
 
         Args:
             server_socket: Socket server.
+            file_name: Tên file.
             client_address: Địa chỉ client.
     ============================================================ """
-    def send_file_chunk(self, server_socket, file_name, seq_num, client_address):
-        file_path = os.path.join(self.RESOURCE_PATH, file_name)
-        if not os.path.exists(file_path):
+    def send_file_hash(self, server_socket, file_name, client_address):
+        file_path = self.resource_path(file_name)
+        if file_path is None or not os.path.isfile(file_path):
             server_socket.sendto(b"ERROR|File not found.", client_address)
             return
+        with tracing.span("server.hash", file=file_name):
+            digest = self.catalog.digest(file_path)
+        server_socket.sendto(f"HASH|{os.path.getsize(file_path)}|{digest}".encode(), client_address)
 
-        chunk_size = self.BUFFER_SIZE - 20  
-        offset = seq_num * chunk_size
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Mở 1 stream ghép kênh: OPEN|<stream>|<file>[|hash].
+
+        Trả lời OPENED|<stream>|<size>[|<sha256>], size -1 nếu không có
+        file. Client gửi OPEN của cả danh sách file cùng lúc rồi lấy dữ
+        liệu bằng MGET|<stream>|<file>|<codec>|<seq>|<count>; mỗi datagram
+        dữ liệu mang MUX_HEADER (stream id, seq, crc32, tag codec) nên mọi
+        stream dùng chung 1 socket. Server không giữ trạng thái stream:
+        MGET mang đủ tên file và codec. Stream id phải nằm trong
+        0..MAX_STREAM_ID (16 bit), ngoài khoảng đó thì trả ERROR.
+
+        Args:
+            server_socket: Socket server.
+            message: Datagram OPEN.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def open_stream(self, server_socket, message, client_address):
+        try:
+            _, stream, file_name, *flags = message.split("|")
+            stream = int(stream)
+        except ValueError:
+            server_socket.sendto(b"ERROR|Malformed OPEN.", client_address)
+            return
+        if not 0 <= stream <= self.MAX_STREAM_ID:
+            server_socket.sendto(f"ERROR|Stream id must be 0..{self.MAX_STREAM_ID}.".encode(), client_address)
+            return
+        if not self.admit(client_address):
+            self.reject(server_socket, client_address)
+            return
+        file_path = self.resource_path(file_name)
+        if file_path is None or not os.path.isfile(file_path):
+            server_socket.sendto(f"OPENED|{stream}|-1".encode(), client_address)
+            return
+        reply = f"OPENED|{stream}|{os.path.getsize(file_path)}"
+        if "hash" in flags and not file_name.startswith(self.DELTA_PREFIX):
+            with tracing.span("server.hash", file=file_name):
+                reply += f"|{self.catalog.digest(file_path)}"
+        server_socket.sendto(reply.encode(), client_address)
 
-        with open(file_path, "rb") as f:
-            f.seek(offset)
-            chunk = f.read(chunk_size)
+    """ ============================================================
+        Tách request MGET thành các request chunk của stream.
+
+        Args:
+            message: "MGET|stream|file|codec|seq|count".
+
+        Raises:
+            ValueError: request sai định dạng hoặc stream id ngoài 0..MAX_STREAM_ID.
+
+        Returns:
+            request: (MGET, file_name, seq, client_address, codec, stream, count), được
+            phục vụ như 1 lần đọc đĩa và 1 loạt datagram (1 lần gửi GSO khi có OFFLOAD).
+    ============================================================ """
+    def parse_stream_request(self, message, client_address):
+        _, stream, file_name, codec, seq_num, count = message.split("|")
+        stream, seq_num = int(stream), int(seq_num)
+        if not 0 <= stream <= self.MAX_STREAM_ID or seq_num < 0:
+            raise ValueError(f"stream {stream} or seq {seq_num} out of range")
+        if codec not in compression.CODECS:
+            codec = None
+        count = max(1, min(int(count), self.MUX_BATCH))
+        return (self.CODE["MGET"], file_name, seq_num, client_address, codec, stream, count)
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Đăng ký nhận thay đổi của catalog: SUBSCRIBE|[version].
+
+        Server trả lời SUBSCRIBED|<version> rồi gửi các thay đổi sau
+        version của client: CHANGE|<version>|<added|removed|modified>|<name>|<size>,
+        hoặc RESET|<version> khi không còn giữ (client LIST lại). Datagram
+        có thể mất: client thấy version bị nhảy thì SUBSCRIBE lại với
+        version cuối đã nhận. Đăng ký hết hạn sau SUBSCRIBE_TTL giây nếu
+        client không gửi lại SUBSCRIBE.
+
+        Args:
+            server_socket: Socket server.
+            message: Datagram SUBSCRIBE.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def subscribe(self, server_socket, message, client_address):
+        since = message.split("|", 1)[1].strip() if "|" in message else ""
+        try:
+            version = int(since) if since else None
+        except ValueError:
+            server_socket.sendto(b"ERROR|Malformed SUBSCRIBE.", client_address)
+            return
+        if client_address not in self.subscribers:
+            logger.info(f"Client {client_address} subscribed to catalog changes")
+        self.catalog.refresh()
+        current = self.catalog.version
+        expires = time.monotonic() + self.SUBSCRIBE_TTL
+        self.subscribers[client_address] = [current if version is None else version, expires]
+        server_socket.sendto(f"SUBSCRIBED|{current}".encode(), client_address)
+        self.push_changes(server_socket, client_address)
+
+    def push_changes(self, server_socket, client_address):
+        subscriber = self.subscribers[client_address]
+        changes = self.catalog.changes_since(subscriber[0])
+        if changes is None:
+            subscriber[0] = self.catalog.version
+            server_socket.sendto(f"RESET|{subscriber[0]}".encode(), client_address)
+            return
+        for version, op, name, size in changes:
+            server_socket.sendto(f"CHANGE|{version}|{op}|{name}|{size}".encode(), client_address)
+            self.metrics.inc("catalog_changes_pushed_total", op=op)
+            subscriber[0] = version
+
+    """ ============================================================
+        Quét lại thư mục resource mỗi CATALOG_POLL giây khi có
+        subscriber và gửi các thay đổi mới.
+    ============================================================ """
+    def poll_catalog(self, server_socket):
+        now = time.monotonic()
+        if not self.subscribers or now - self.last_poll < self.CATALOG_POLL:
+            return
+        self.last_poll = now
+        for client_address, (_, expires) in list(self.subscribers.items()):
+            if now > expires:
+                del self.subscribers[client_address]
+                logger.info(f"Catalog subscription of {client_address} expired")
+        self.catalog.refresh()
+        for client_address in self.subscribers:
+            self.push_changes(server_socket, client_address)
 
-            if not chunk:
-                server_socket.sendto(b"EOF", client_address)
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Đường dẫn của resource hoặc của bản delta "@delta/<id>".
+
+        Args:
+            file_name: Tên file client gửi trong SIZE/GET/RESEND.
+
+        Returns:
+            file_path: None nếu bản delta không còn (đã hết hạn).
+    ============================================================ """
+    def resource_path(self, file_name):
+        if file_name.startswith(self.DELTA_PREFIX):
+            entry = self.deltas.get(file_name[len(self.DELTA_PREFIX):])
+            return entry[0] if entry else None
+        # Tên do client gửi: không cho ra ngoài RESOURCE_PATH ("../", đường dẫn tuyệt đối)
+        return utils.resource_file(self.RESOURCE_PATH, file_name)
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Nhận chữ ký các block của bản cũ phía client (delta sync).
+
+        DSIG|upload_id|file|local_size|block_size|index|count|<base64>
+        Mỗi phần được xác nhận bằng DSACK|upload_id|index. Khi đủ count
+        phần, server tính bản delta (delta.py), lưu ra đĩa và trả lời
+        DELTA|upload_id|@delta/<id>|<delta_size>|<file_size>; client tải
+        bản delta bằng SIZE/GET/RESEND như một file thường. Phần gửi lại
+        sau khi đã xong nhận lại đúng câu trả lời DELTA.
+
+        Args:
+            server_socket: Socket server.
+            message: Datagram DSIG.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def receive_signatures(self, server_socket, message, client_address):
+        try:
+            _, upload_id, file_name, local_size, block_size, index, count, payload = message.split("|", 7)
+            local_size, block_size, index, count = (int(f) for f in (local_size, block_size, index, count))
+            part = base64.b64decode(payload)
+        except ValueError:
+            server_socket.sendto(b"ERROR|Malformed DSIG.", client_address)
+            return
+        key = (client_address, upload_id)
+        upload = self.delta_uploads.get(key)
+        if upload is None:
+            upload = {"parts": {}, "reply": None}
+            self.delta_uploads[key] = upload
+        upload["updated"] = time.monotonic()
+
+        if upload["reply"] is None:
+            upload["parts"][index] = part
+            if len(upload["parts"]) < count:
+                server_socket.sendto(f"DSACK|{upload_id}|{index}".encode(), client_address)
                 return
+            signature_blob = b"".join(upload["parts"].get(i, b"") for i in range(count))
+            upload["parts"] = {}
+            upload["reply"] = self.build_delta(file_name, local_size, block_size, signature_blob, upload_id)
+        server_socket.sendto(upload["reply"], client_address)
+
+    def build_delta(self, file_name, local_size, block_size, signature_blob, upload_id):
+        file_path = None if file_name.startswith(self.DELTA_PREFIX) else self.resource_path(file_name)
+        if file_path is None or not os.path.isfile(file_path):
+            return b"ERROR|File not found."
+
+        delta_id = secrets.token_hex(8)
+        delta_path = os.path.join(self.DELTA_DIR, delta_id)
+        try:
+            with open(delta_path, "wb") as out, tracing.span("server.delta", file=file_name) as delta_span:
+                copied, literal = delta.encode(file_path, local_size, block_size, signature_blob, out.write)
+                delta_span.set(copied=copied, literal=literal)
+        except ValueError as e:
+            os.remove(delta_path)
+            return f"ERROR|{e}".encode()
+
+        self.deltas[delta_id] = (delta_path, time.monotonic())
+        self.metrics.inc("delta_syncs_total")
+        self.metrics.inc("delta_literal_bytes_total", literal)
+        self.metrics.inc("delta_copied_bytes_total", copied)
+        logger.info(f"Delta of {file_name}: {literal} bytes to send, {copied} bytes reused from the client copy")
+        return (
+            f"DELTA|{upload_id}|{self.DELTA_PREFIX}{delta_id}"
+            f"|{os.path.getsize(delta_path)}|{os.path.getsize(file_path)}"
+        ).encode()
 
-            checksum = self.calculate_checksum(chunk)
-            packet = f"{seq_num}:{checksum}:".encode() + chunk
-            server_socket.sendto(packet, client_address)
+    """ ============================================================
+        Mỗi PRUNE_INTERVAL giây dọn session rảnh khỏi scheduler và các bản delta hết hạn.
+        UDP không có lúc kết thúc phiên: mỗi địa chỉ từng gửi request đều có meter và weight
+        trong scheduler, nên phải dọn định kỳ chứ không chỉ khi socket rảnh (timeout).
+    ============================================================ """
+    def prune_state(self):
+        now = time.monotonic()
+        if now - self.last_prune < self.PRUNE_INTERVAL:
+            return
+        self.last_prune = now
+        self.scheduler.prune_idle()
+        self.prune_deltas()
+
+    """ ============================================================
+        Xoá các bản delta và phần chữ ký quá DELTA_TTL giây.
+    ============================================================ """
+    def prune_deltas(self):
+        now = time.monotonic()
+        for key, upload in list(self.delta_uploads.items()):
+            if now - upload["updated"] > self.DELTA_TTL:
+                del self.delta_uploads[key]
+        for delta_id, (delta_path, created) in list(self.deltas.items()):
+            if now - created > self.DELTA_TTL:
+                del self.deltas[delta_id]
+                if os.path.exists(delta_path):
+                    os.remove(delta_path)
 
      # *********************************************************************************************** # 
 
     """ ============================================================
-        Gửi resource chunk bị lỗi cho client.
+        Gửi resource chunk cho client.
+
+        Dữ liệu có sẵn trong cache window (diskio.py) thì gửi ngay; nếu
+        không, window được đọc trên luồng disk và datagram được gửi từ
+        luồng đó khi đọc xong, vòng lặp chính không chờ đĩa.
 
         Args:
             server_socket: Socket server.
             client_address: Địa chỉ client.
+            resend: True với RESEND (chỉ khác ở metrics).
+            stream: id stream ghép kênh (MGET), None với GET/RESEND.
+            count: số chunk liên tiếp từ seq_num (MGET).
     ============================================================ """
-    def resend_file_chunk(self, server_socket, file_name, seq_num, client_address):
-        file_path = os.path.join(self.RESOURCE_PATH, file_name)
-        if not os.path.exists(file_path):
-            server_socket.sendto(b"ERROR|File not found.", client_address)
+    def send_file_chunk(
+        self, server_socket, file_name, seq_num, client_address, codec=None, resend=False, stream=None, count=1
+    ):
+        file_path = self.resource_path(file_name)
+        if file_path is None or not os.path.exists(file_path):
+            error = b"ERROR|File not found." if stream is None else f"MERR|{stream}|File not found.".encode()
+            server_socket.sendto(error, client_address)
             return
 
         chunk_size = self.BUFFER_SIZE - 20  
         offset = seq_num * chunk_size
+        length = chunk_size * count
 
-        with open(file_path, "rb") as f:
-            f.seek(offset)
-            chunk = f.read(chunk_size)
+        chunk = self.disk.cached(file_path, offset, length)
+        if chunk is not None:
+            self.deliver_chunk(
+                server_socket, file_name, seq_num, chunk, client_address, codec, resend, stream, count
+            )
+            return
 
-            if not chunk:
-                server_socket.sendto(b"EOF", client_address)
-                return
+        def done(read):
+            try:
+                self.deliver_chunk(
+                    server_socket, file_name, seq_num, read.result(), client_address, codec, resend, stream, count
+                )
+            except Exception as e:
+                logger.error(f"Could not send chunk {seq_num} of {file_name}: {e}")
+
+        self.disk.fetch(file_path, offset, length).add_done_callback(done)
+
+    def deliver_chunk(
+        self, server_socket, file_name, seq_num, chunk, client_address, codec, resend, stream=None, count=1
+    ):
+        if stream is not None:
+            chunk_size = self.BUFFER_SIZE - 20
+            pieces = [chunk[i : i + chunk_size] for i in range(0, len(chunk), chunk_size)]
+            packets = [
+                self.build_stream_packet(file_name, stream, seq_num + index, piece, codec)
+                for index, piece in enumerate(pieces)
+            ]
+            if len(pieces) < count:
+                # Stream ghép kênh: payload rỗng thay cho EOF (file đã ngắn lại)
+                packets.append(self.build_stream_packet(file_name, stream, seq_num + len(pieces), b"", codec))
+            self.send_packets(server_socket, packets, client_address)
+            return
+        if not chunk:
+            server_socket.sendto(b"EOF", client_address)
+            return
+
+        self.send_packet(server_socket, self.build_packet(file_name, seq_num, chunk, codec), client_address)
+        if resend:
+            self.metrics.inc("retransmits_total")
+            chunk_log.debug("resend", "Resent chunk %s for %s", seq_num, file_name, tag="RESEND")
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Gửi 1 datagram dữ liệu và ghi nhận metrics.
 
-            checksum = self.calculate_checksum(chunk)
-            packet = f"{seq_num}:{checksum}:".encode() + chunk
+        Args:
+            server_socket: Socket server.
+            packet: Datagram đã đóng gói.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def send_packet(self, server_socket, packet, client_address):
+        started = time.perf_counter()
+        with tracing.span("send", bytes=len(packet)):
             server_socket.sendto(packet, client_address)
+        self.metrics.observe("send_seconds", time.perf_counter() - started)
+        self.metrics.inc("bytes_sent_total", len(packet))
+        self.metrics.inc("datagrams_sent_total")
+        self.metrics.inc("send_calls_total")
+
+    """ ============================================================
+        Gửi 1 loạt datagram cho cùng client: với GSO các datagram cùng
+        kích thước đi chung 1 lần sendmsg, kernel tự cắt ra.
 
-        print(f"Resent chunk {seq_num} for {file_name}")
+        Args:
+            server_socket: Socket server.
+            packets: Các datagram theo thứ tự seq.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def send_packets(self, server_socket, packets, client_address):
+        if not self.gso or len(packets) == 1:
+            for packet in packets:
+                self.send_packet(server_socket, packet, client_address)
+            return
+        nbytes = sum(len(packet) for packet in packets)
+        started = time.perf_counter()
+        try:
+            with tracing.span("send", bytes=nbytes, datagrams=len(packets)):
+                calls = sockopts.send_segments(server_socket, packets, client_address)
+        except OSError as e:
+            # vd. EIO khi card mạng không tính được checksum cho GSO: tắt hẳn, gửi từng datagram
+            logger.warning(f"GSO send failed ({e}), sending one datagram per call from now on")
+            self.gso = False
+            for packet in packets:
+                self.send_packet(server_socket, packet, client_address)
+            return
+        self.metrics.observe("send_seconds", time.perf_counter() - started)
+        self.metrics.inc("bytes_sent_total", nbytes)
+        self.metrics.inc("datagrams_sent_total", len(packets))
+        self.metrics.inc("send_calls_total", calls)
 
      # *********************************************************************************************** # 
 
     """ ============================================================
-        Xử lý request gồm CONNECT, LIST, SIZE, GET, RESEND.
+        Đóng gói 1 chunk thành datagram.
+
+        Args:
+            file_name: Tên file (để bỏ qua nén với file đã nén sẵn).
+            seq_num: Số thứ tự chunk.
+            chunk: Dữ liệu gốc.
+            codec: Codec client gửi kèm GET (None nếu client không thương lượng).
+
+        Returns:
+            packet: "seq:checksum:" + chunk, hoặc "seq:checksum:tag:" + payload khi có nén.
+    ============================================================ """
+    def build_packet(self, file_name, seq_num, chunk, codec=None):
+        if codec is None:
+            with tracing.span("checksum"):
+                checksum = self.calculate_checksum(chunk)
+            return f"{seq_num}:{checksum}:".encode() + chunk
+
+        with tracing.span("compress", codec=codec):
+            used_codec, payload = compression.compress_block(codec, file_name, chunk)
+        with tracing.span("checksum"):
+            checksum = self.calculate_checksum(payload)
+        tag = compression.WIRE_TAGS[used_codec]
+        return f"{seq_num}:{checksum}:{tag}:".encode() + payload
+
+    """ ============================================================
+        Đóng gói 1 chunk của stream ghép kênh: MUX_HEADER + payload.
+    ============================================================ """
+    def build_stream_packet(self, file_name, stream, seq_num, chunk, codec=None):
+        used_codec, payload = compression.NO_COMPRESSION, chunk
+        if codec is not None and chunk:
+            with tracing.span("compress", codec=codec):
+                used_codec, payload = compression.compress_block(codec, file_name, chunk)
+        with tracing.span("checksum"):
+            checksum = self.calculate_checksum(payload)
+        tag = compression.WIRE_TAGS[used_codec].encode()
+        return self.MUX_HEADER.pack(self.MUX_MARKER, stream, seq_num, checksum, tag) + payload
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Gửi resource chunk bị lỗi cho client.
+
+        Args:
+            server_socket: Socket server.
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def resend_file_chunk(self, server_socket, file_name, seq_num, client_address, codec=None):
+        self.send_file_chunk(server_socket, file_name, seq_num, client_address, codec, resend=True)
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Tách request GET/RESEND.
+
+        Args:
+            message: "CMD|file|seq" hoặc "CMD|file|seq|codec".
+
+        Returns:
+            (file_name, seq_num, codec): codec là None nếu không có hoặc không hỗ trợ.
+    ============================================================ """
+    def parse_chunk_request(self, message):
+        parts = message.split("|")
+        file_name, seq_num = parts[1], int(parts[2])
+        codec = None
+        if len(parts) > 3 and (parts[3] in compression.CODECS or parts[3] == compression.NO_COMPRESSION):
+            codec = parts[3]
+        return file_name, seq_num, codec
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Gửi chunk theo giới hạn băng thông.
+
+        Khi có giới hạn, request được đưa vào hàng đợi công bằng theo
+        địa chỉ client và chỉ được phục vụ khi token bucket cho phép, nên
+        một client GET liên tục không chiếm hết vòng lặp nhận.
+
+        Args:
+            server_socket: Socket server.
+            request: (command, file_name, seq_num, client_address, codec, stream, count).
+
+        Returns:
+            accepted: False nếu request bị từ chối (đã trả BUSY).
+    ============================================================ """
+    def schedule_chunk(self, server_socket, request):
+        client_address = request[3]
+        if not self.admit(client_address):
+            self.reject(server_socket, client_address, request[2])
+            return False
+        if not self.scheduler.limited:
+            # Không giới hạn: phục vụ ngay, vẫn ghi nhận tốc độ đạt được
+            self.scheduler.try_acquire(client_address[0], client_address, self.BUFFER_SIZE * request[6])
+            self.serve_chunk(server_socket, request)
+            return True
+        if self.MAX_QUEUED and len(self.pending) >= self.MAX_QUEUED:
+            self.reject(server_socket, client_address, request[2])
+            return False
+        self.pending.push(
+            client_address[0],
+            client_address,
+            (time.monotonic(), request),
+            self.BUFFER_SIZE * request[6],
+            self.scheduler.weight(client_address[0], client_address),
+        )
+        self.drain_pending(server_socket)
+        return True
+
+    def drain_pending(self, server_socket):
+        while len(self.pending):
+            item = self.pending.pop(self.scheduler.try_acquire)
+            if item is None:
+                return
+            queued_at, request = item
+            # Client đã hết chờ và gửi RESEND: bỏ request cũ thay vì gửi trùng
+            if time.monotonic() - queued_at > self.QUEUE_TIMEOUT:
+                self.metrics.inc("requests_expired_total")
+                continue
+            try:
+                self.serve_chunk(server_socket, request)
+            except Exception as e:
+                # Request hỏng đã qua hàng đợi: chỉ từ chối request này
+                self.reject_malformed(server_socket, request[3], e)
+
+    """ ============================================================
+        Kiểm tra client có được phục vụ: client mới chỉ được nhận khi
+        số phiên đang hoạt động chưa tới MAX_SESSIONS.
+
+        Args:
+            client_address: Địa chỉ client.
+    ============================================================ """
+    def admit(self, client_address):
+        sessions = self.scheduler.session_meters
+        if not self.MAX_SESSIONS or client_address in sessions or len(sessions) < self.MAX_SESSIONS:
+            return True
+        # Vòng lặp bận liên tục thì không tới được nhánh timeout để dọn phiên cũ
+        self.scheduler.prune_idle()
+        return len(sessions) < self.MAX_SESSIONS
+
+    """ ============================================================
+        Trả BUSY|<retry_after>[|<seq>] cho request không được phục vụ.
+
+        Args:
+            server_socket: Socket server.
+            client_address: Địa chỉ client.
+            seq_num: seq của GET/RESEND bị từ chối.
+    ============================================================ """
+    def reject(self, server_socket, client_address, seq_num=None):
+        self.metrics.inc("requests_rejected_total")
+        chunk_log.debug("busy", "Server busy, rejected request from %s", client_address, tag="BUSY")
+        reply = f"BUSY|{self.RETRY_AFTER}" + (f"|{seq_num}" if seq_num is not None else "")
+        server_socket.sendto(reply.encode(), client_address)
+
+    """ ============================================================
+        Trả ERROR cho datagram không xử lý được và ghi log lý do.
+
+        Args:
+            server_socket: Socket server.
+            client_address: Địa chỉ client, None nếu recvfrom() lỗi.
+            error: Exception khi xử lý datagram.
+    ============================================================ """
+    def reject_malformed(self, server_socket, client_address, error):
+        if client_address is None:
+            # recvfrom() lỗi (vd ICMP port unreachable trên Windows): không có ai để trả lời
+            logger.warning(f"Receiving a request failed: {error!r}")
+            return
+        self.metrics.inc("requests_failed_total")
+        logger.warning(f"Malformed request from {client_address}: {error!r}")
+        try:
+            server_socket.sendto(b"ERROR|Malformed request.", client_address)
+        except OSError:
+            pass
+
+    def serve_chunk(self, server_socket, request):
+        command, file_name, seq_num, client_address, codec, stream, count = request
+        with tracing.span("server.datagram", command=command, file=file_name, seq=seq_num):
+            if command == self.CODE["RESEND"]:
+                self.resend_file_chunk(server_socket, file_name, seq_num, client_address, codec)
+            else:
+                self.send_file_chunk(
+                    server_socket, file_name, seq_num, client_address, codec, stream=stream, count=count
+                )
+
+     # *********************************************************************************************** # 
+
+    """ ============================================================
+        Xử lý request gồm CONNECT, LIST, SIZE, GET, RESEND, OPEN, MGET.
 
         Args:
             server_socket: Socket server.
     ============================================================ """
     def handle_requests(self, server_socket):
-        print("[STATUS] Waiting for client connection...")
+        logger.info("Waiting for client connection...")
 
         while True:
+            client_address = None
             try:
+                # Còn request chờ băng thông thì chỉ chờ datagram mới trong thời gian ngắn
+                # Có subscriber thì thức dậy mỗi CATALOG_POLL giây để quét thay đổi
+                server_socket.settimeout(
+                    0.005 if len(self.pending) else self.CATALOG_POLL if self.subscribers else self.TIMEOUT
+                )
+
                 # nhận tin nhắn từ client
                 data, client_address = server_socket.recvfrom(self.BUFFER_SIZE)
                 message = data.decode().strip()
+                opcode = message.split("|")[0]
+                self.metrics.inc("requests_total", opcode=opcode if opcode in self.CODE else "unknown")
 
                 # nếu tin nhắn là CONNECT thì thông báo kết nối
-                if message == self.CODE["CONNECT"]:
-                    print(f"[STATUS] Client {client_address} connected!")
-                    server_socket.sendto(b"WELCOME", client_address)
+                # CONNECT|zstd,zlib -> thương lượng nén, trả về WELCOME|<codec>
+                if message.split("|")[0] == self.CODE["CONNECT"]:
+                    if not self.admit(client_address):
+                        self.reject(server_socket, client_address)
+                        continue
+                    logger.info(f"Client {client_address} connected!")
+                    if "|" in message:
+                        codec = compression.negotiate(message.split("|", 1)[1])
+                        server_socket.sendto(f"WELCOME|{codec}".encode(), client_address)
+                    else:
+                        server_socket.sendto(b"WELCOME", client_address)
+
+                # nếu tin nhắn là PING thì trả lời keep-alive
+                elif message == self.CODE["PING"]:
+                    server_socket.sendto(b"PONG", client_address)
 
                 # nếu tin nhắn là LIST thì gửi resource list cho client
                 elif message.startswith(self.CODE["LIST"]):
@@ -165,32 +775,69 @@ class SocketServerUDP:
                     file_name = message.split("|")[1]
                     self.send_file_size(server_socket, file_name, client_address)
 
+                # nếu tin nhắn là HASH thì gửi SHA-256 của resource cho client
+                elif opcode == self.CODE["HASH"]:
+                    self.send_file_hash(server_socket, message.split("|", 1)[-1], client_address)
+
                 # Kiểm tra sự tồn tại của file
                 elif message.startswith("CHECK|"):
                     _, file_name = message.split("|", 1)
-                    if os.path.exists(os.path.join(self.RESOURCE_PATH, file_name)):
+                    file_path = self.resource_path(file_name)
+                    if file_path is not None and os.path.exists(file_path):
                         server_socket.sendto("EXISTS".encode(), client_address)
                     else:
                         server_socket.sendto("NOT_FOUND".encode(), client_address)
 
                 # nếu tin nhắn là GET thì gửi resource chunk cho client
+                # GET|file|seq hoặc GET|file|seq|codec (codec đã thương lượng lúc CONNECT)
                 elif message.startswith(self.CODE["GET"]):
-                    _, file_name, seq_num = message.split("|")
-                    seq_num = int(seq_num)
-                    self.send_file_chunk(server_socket, file_name, seq_num, client_address)
+                    with tracing.span("parse"):
+                        file_name, seq_num, codec = self.parse_chunk_request(message)
+                    self.schedule_chunk(server_socket, (self.CODE["GET"], file_name, seq_num, client_address, codec, None, 1))
                 
                 # nếu tin nhắn là RESEND thì gửi resource chunk bị lỗi cho client
                 elif message.startswith(self.CODE["RESEND"]): 
-                    _, file_name, seq_num = message.split("|")
-                    seq_num = int(seq_num)
-                    self.resend_file_chunk(server_socket, file_name, seq_num, client_address)
+                    with tracing.span("parse"):
+                        file_name, seq_num, codec = self.parse_chunk_request(message)
+                    self.schedule_chunk(server_socket, (self.CODE["RESEND"], file_name, seq_num, client_address, codec, None, 1))
+
+                # nếu tin nhắn là OPEN thì mở stream ghép kênh, trả về kích thước file
+                elif opcode == self.CODE["OPEN"]:
+                    self.open_stream(server_socket, message, client_address)
+
+                # nếu tin nhắn là MGET thì gửi 1 loạt chunk liên tiếp của stream
+                elif opcode == self.CODE["MGET"]:
+                    try:
+                        with tracing.span("parse"):
+                            request = self.parse_stream_request(message, client_address)
+                    except ValueError:
+                        server_socket.sendto(b"ERROR|Malformed MGET.", client_address)
+                        continue
+                    self.schedule_chunk(server_socket, request)
+
+                # nếu tin nhắn là SUBSCRIBE thì đăng ký nhận thay đổi của catalog
+                elif opcode == self.CODE["SUBSCRIBE"]:
+                    self.subscribe(server_socket, message, client_address)
+
+                # nếu tin nhắn là DSIG thì nhận chữ ký bản cũ để tính delta
+                elif opcode == self.CODE["DSIG"]:
+                    self.receive_signatures(server_socket, message, client_address)
 
                 # năm tin nhắn khác thì báo lỗi
                 else:
                     server_socket.sendto(b"ERROR|Unknown command.", client_address)
 
             except socket.timeout:
-                print("No client activity. Server is still waiting...")
+                if not len(self.pending):
+                    logger.debug("No client activity. Server is still waiting...")
+            except Exception as e:
+                # Datagram hỏng (số sai, UTF-8 sai, codec lạ, stream id quá lớn...) chỉ bị từ chối,
+                # server vẫn phục vụ các client khác
+                self.reject_malformed(server_socket, client_address, e)
+
+            self.drain_pending(server_socket)
+            self.poll_catalog(server_socket)
+            self.prune_state()
 
     # *********************************************************************************************** # 
 
@@ -199,11 +846,25 @@ class SocketServerUDP:
     ============================================================ """
     def start(self):
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server_socket:
+            # Buffer nhận lớn để không rớt datagram khi nhiều client gửi GET dồn dập
+            sockopts.apply(server_socket, "datagram", self.SOCKET_PROFILE, self.SOCKET_OPTIONS)
             server_socket.bind((self.HOST, self.PORT))
             server_socket.settimeout(self.TIMEOUT)
+            if self.OFFLOAD:
+                self.gso = sockopts.enable_gso(server_socket)
+                if self.gso:
+                    logger.info("UDP segmentation offload (GSO) enabled")
+                else:
+                    logger.warning("UDP segmentation offload not supported here, sending one datagram per call")
 
-            print(f"[STATUS] Server started at {self.HOST}:{self.PORT}")
-            self.handle_requests(server_socket)
+            logger.info(f"Server started at {self.HOST}:{self.PORT}")
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.start()
+            try:
+                self.handle_requests(server_socket)
+            finally:
+                if self.metrics_exporter is not None:
+                    self.metrics_exporter.stop()
 
     # *********************************************************************************************** # 
 
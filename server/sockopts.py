@@ -0,0 +1,237 @@
+"""
+Socket option profiles.
+
+Every socket belongs to one role:
+    - control: TCP connection of small request/reply messages.
+    - data: TCP pipe carrying the blocks.
+    - datagram: UDP socket.
+
+A profile gives the options of each role; overrides (same shape, e.g.
+{"data": {"rcvbuf": 8388608}}) replace single options of the profile.
+
+    - os: leave everything to the operating system.
+    - lan: no Nagle delay on TCP, bigger UDP buffers for bursts. TCP
+      buffers are left to the kernel autotuning, which setting SO_RCVBUF
+      would switch off.
+    - wan-high-bdp: TCP buffers sized for ~1 Gbit/s at 100 ms RTT,
+      keepalive on the long lived control connection.
+    - loopback: large buffers, the path has no loss and a 64 KB MTU.
+
+Buffer sizes above net.core.rmem_max / wmem_max are capped by the kernel;
+the first capped value of each role is logged.
+
+UDP segmentation offload (Linux >= 4.18 for GSO, 5.0 for GRO): with
+UDP_SEGMENT one sendmsg carries up to GSO_MAX_SEGMENTS datagrams of the
+same size (the last may be shorter), cut by the kernel or the NIC; with
+UDP_GRO the kernel may hand several datagrams of one flow to a single
+recvmsg, with their size in a control message. enable_gso()/enable_gro()
+report whether the socket accepts them, send_segments()/recv_segments()
+fall back to one datagram per call otherwise.
+"""
+
+import sys
+import struct
+import socket
+import threading
+
+import log
+
+logger = log.get_logger(__name__)
+
+MB = 1024 * 1024
+
+ROLES = ("control", "data", "datagram")
+
+OPTIONS = {
+    "sndbuf": (socket.SOL_SOCKET, socket.SO_SNDBUF),
+    "rcvbuf": (socket.SOL_SOCKET, socket.SO_RCVBUF),
+    "nodelay": (socket.IPPROTO_TCP, socket.TCP_NODELAY),
+    "keepalive": (socket.SOL_SOCKET, socket.SO_KEEPALIVE),
+}
+BUFFERS = ("sndbuf", "rcvbuf")
+LINUX = sys.platform.startswith("linux")
+TCP_ONLY = ("nodelay",)
+
+PROFILES = {
+    "os": {},
+    "lan": {
+        "control": {"nodelay": 1},
+        "data": {"nodelay": 1},
+        "datagram": {"sndbuf": 1 * MB, "rcvbuf": 2 * MB},
+    },
+    "wan-high-bdp": {
+        "control": {"nodelay": 1, "keepalive": 1},
+        "data": {"nodelay": 1, "sndbuf": 16 * MB, "rcvbuf": 16 * MB},
+        "datagram": {"sndbuf": 4 * MB, "rcvbuf": 8 * MB},
+    },
+    "loopback": {
+        "control": {"nodelay": 1},
+        "data": {"nodelay": 1, "sndbuf": 4 * MB, "rcvbuf": 4 * MB},
+        "datagram": {"sndbuf": 4 * MB, "rcvbuf": 4 * MB},
+    },
+}
+DEFAULT_PROFILE = "lan"
+
+# Chỉ cảnh báo 1 lần cho mỗi (role, option) bị kernel giới hạn
+_warned = set()
+_warned_lock = threading.Lock()
+
+
+def options(role, profile=DEFAULT_PROFILE, overrides=None):
+    """
+    Options of `role` in `profile` with `overrides` applied.
+    Raises ValueError for an unknown profile, role or option.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown socket profile {profile!r} (choose from {', '.join(PROFILES)})")
+    if role not in ROLES:
+        raise ValueError(f"Unknown socket role {role!r}")
+    result = dict(PROFILES[profile].get(role, {}))
+    result.update((overrides or {}).get(role, {}))
+    for name in result:
+        if name not in OPTIONS:
+            raise ValueError(f"Unknown socket option {name!r} (choose from {', '.join(OPTIONS)})")
+    return result
+
+
+def validate(profile, overrides=None):
+    for role in ROLES:
+        options(role, profile, overrides)
+    for role in overrides or {}:
+        if role not in ROLES:
+            raise ValueError(f"Unknown socket role {role!r}")
+
+
+def apply(sock, role, profile=DEFAULT_PROFILE, overrides=None):
+    """
+    Set the options of `role` on `sock`.
+
+    Call before connect()/listen(): the TCP window scale is agreed in the
+    handshake from the receive buffer at that time, and accepted sockets
+    inherit the options of the listening socket. An option the platform
+    refuses is logged and skipped, never raised.
+    """
+    for name, value in options(role, profile, overrides).items():
+        if name in TCP_ONLY and sock.type != socket.SOCK_STREAM:
+            continue
+        level, optname = OPTIONS[name]
+        try:
+            sock.setsockopt(level, optname, int(value))
+        except OSError as e:
+            warn_once(role, name, f"Could not set {name}={value} on {role} socket: {e}")
+            continue
+        if name in BUFFERS:
+            actual = sock.getsockopt(level, optname)
+            if LINUX:
+                # Linux trả về gấp đôi giá trị đã đặt (phần cho bookkeeping của kernel)
+                actual //= 2
+            if actual < int(value):
+                warn_once(
+                    role,
+                    name,
+                    f"{role} {name} capped at {actual} bytes (asked {value}), "
+                    f"raise net.core.{'r' if name == 'rcvbuf' else 'w'}mem_max to allow more",
+                )
+
+
+# ==================================================================================================
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+GSO_MAX_SEGMENTS = 64
+# Tổng kích thước 1 lần gửi GSO: giới hạn của 1 datagram IPv4
+GSO_MAX_BYTES = 65507
+GRO_BUFFER = 65535
+
+
+def enable_gso(sock):
+    """
+    True when `sock` can send GSO batches (checked once at startup).
+    """
+    if not LINUX:
+        return False
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+        return True
+    except OSError:
+        return False
+
+
+def enable_gro(sock, on=True):
+    """
+    Turn UDP_GRO on (or off) for `sock`; False when unsupported.
+    """
+    if not LINUX:
+        return False
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1 if on else 0)
+        return True
+    except OSError:
+        return False
+
+
+def send_segments(sock, packets, address):
+    """
+    Send `packets` to `address` with as few GSO sendmsg calls as possible:
+    a run of packets of the same size (the last one may be shorter) goes
+    out in one call. Returns the number of system calls made.
+    """
+    calls = 0
+    index = 0
+    while index < len(packets):
+        size = len(packets[index])
+        end = index + 1
+        limit = min(len(packets), index + GSO_MAX_SEGMENTS, index + max(1, GSO_MAX_BYTES // size))
+        while end < limit and len(packets[end]) == size:
+            end += 1
+        if end < limit and len(packets[end]) < size:
+            end += 1  # đoạn cuối ngắn hơn vẫn đi chung được
+        if end - index == 1:
+            sock.sendto(packets[index], address)
+        else:
+            sock.sendmsg(
+                [b"".join(packets[index:end])], [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", size))], 0, address
+            )
+        calls += 1
+        index = end
+    return calls
+
+
+def recv_segments(sock, bufsize=GRO_BUFFER):
+    """
+    recvmsg on a UDP_GRO socket: ([datagrams], address), the coalesced
+    buffer cut back into the datagrams the sender sent.
+    """
+    data, ancdata, _, address = sock.recvmsg(bufsize, socket.CMSG_SPACE(4))
+    for level, kind, value in ancdata:
+        if level == SOL_UDP and kind == UDP_GRO:
+            size = struct.unpack("=i", value[:4])[0]
+            if 0 < size < len(data):
+                return [data[i : i + size] for i in range(0, len(data), size)], address
+    return [data], address
+
+
+def warn_once(role, name, message):
+    with _warned_lock:
+        if (role, name) in _warned:
+            return
+        _warned.add((role, name))
+    logger.warning(message)
+
+
+def parse_overrides(items, base=None):
+    """
+    Parse command line overrides "ROLE.OPTION=VALUE" (sizes accept K/M suffixes)
+    on top of `base`, e.g. ["data.rcvbuf=8M", "control.nodelay=0"].
+    """
+    overrides = {role: dict(values) for role, values in (base or {}).items()}
+    for item in items or ():
+        key, sep, text = item.partition("=")
+        role, dot, name = key.partition(".")
+        if not sep or not dot:
+            raise ValueError(f"Socket option {item!r} is not ROLE.OPTION=VALUE")
+        text = text.strip().upper()
+        scale = {"K": 1024, "M": MB}.get(text[-1:], 1)
+        value = int(float(text[:-1] if scale > 1 else text) * scale)
+        overrides.setdefault(role, {})[name] = value
+    return overrides
@@ -45,6 +45,21 @@ def check_file_exist(filename):
     return os.path.exists(filename)
 
 
+def resource_file(directory, name):
+    """
+    Real path of the file `name` inside `directory`, or None when the name
+    leads outside of it ("../x", an absolute path, a symlink pointing out).
+    """
+    root = os.path.realpath(directory)
+    try:
+        path = os.path.realpath(os.path.join(root, name))
+    except ValueError:  # ký tự NUL trong tên
+        return None
+    if path == root or os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
 def count_files_with_prefix(directory, prefix):
     count = 0
     for filename in os.listdir(directory):
@@ -83,3 +98,16 @@ def standardize_str(s, n):
     while len(s) < n:
         s += " "
     return s
+
+
+def recv_exact(sock, n):
+    """
+    Receive exactly n bytes from a stream socket.
+    """
+    buffer = bytearray()
+    while len(buffer) < n:
+        data = sock.recv(n - len(buffer))
+        if not data:
+            raise ConnectionError("Connection closed while receiving data")
+        buffer += data
+    return bytes(buffer)
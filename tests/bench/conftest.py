@@ -0,0 +1,16 @@
+"""
+The bench scripts import their siblings by name (import bench), so the
+tests import them the same way with bench/ on sys.path.
+"""
+
+import os
+import sys
+
+BENCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "bench"))
+
+# Không để module trùng tên đã import từ thư mục khác che mất script của bench/
+for name, module in list(sys.modules.items()):
+    path = getattr(module, "__file__", None) or ""
+    if os.path.exists(os.path.join(BENCH_DIR, f"{name}.py")) and os.path.dirname(path) != BENCH_DIR:
+        del sys.modules[name]
+sys.path.insert(0, BENCH_DIR)
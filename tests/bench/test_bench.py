@@ -0,0 +1,39 @@
+import os
+
+import bench
+
+
+def test_size_and_list_parsing():
+    assert bench.parse_size("64K") == 64 * 1024
+    assert bench.parse_size("1.5MB") == 3 * 512 * 1024
+    assert bench.parse_size("100") == 100
+    assert bench.parse_list("1, 10,,50") == [1, 10, 50]
+    assert bench.parse_list("64K,1M", bench.parse_size) == [64 * 1024, 1024 * 1024]
+
+
+def test_percentile_picks_the_nearest_rank():
+    assert bench.percentile([], 50) is None
+    assert bench.percentile([5, 1, 3, 2, 4], 50) == 3
+    assert bench.percentile(range(101), 99) == 99
+
+
+def test_generated_resources_have_the_asked_size(tmp_path):
+    name = bench.generate_resource(str(tmp_path), 3 * 1024 * 1024 + 7, "text")
+    path = tmp_path / name
+    assert os.path.getsize(path) == 3 * 1024 * 1024 + 7
+    assert path.read_bytes().startswith(b"2024-01-01")
+    mtime = path.stat().st_mtime_ns
+    assert bench.generate_resource(str(tmp_path), 3 * 1024 * 1024 + 7, "text") == name
+    assert path.stat().st_mtime_ns == mtime  # dùng lại file đã có
+
+
+def test_counter_total_sums_every_label_set():
+    stats = {
+        "counters": [
+            {"name": "bytes_sent_total", "labels": {"codec": "zlib"}, "value": 10},
+            {"name": "bytes_sent_total", "labels": {"codec": "none"}, "value": 5},
+            {"name": "requests_total", "labels": {}, "value": 1},
+        ]
+    }
+    assert bench.counter_total(stats, "bytes_sent_total") == 15
+    assert bench.counter_total(None, "bytes_sent_total") is None
@@ -0,0 +1,31 @@
+import loadgen
+
+
+def step(concurrency, throughput, error_rate=0.0, p99=0.1):
+    return {
+        "concurrency": concurrency,
+        "throughput_mbps": throughput,
+        "error_rate": error_rate,
+        "latency_p99": p99,
+    }
+
+
+def saturation(steps, *argv):
+    generator = loadgen.LoadGenerator(loadgen.parse_args(list(argv)))
+    return generator.find_saturation(steps)
+
+
+def test_parse_mix():
+    assert loadgen.parse_mix("64K:8, 1M:2,log.txt") == [("64K", 8.0), ("1M", 2.0), ("log.txt", 1.0)]
+
+
+def test_saturation_when_more_clients_stop_buying_throughput():
+    steps = [step(1, 10), step(10, 80), step(50, 84), step(100, 85)]
+    concurrency, reason = saturation(steps)
+    assert concurrency == 50 and reason.startswith("throughput +5.0%")
+
+
+def test_saturation_on_errors_or_latency():
+    assert saturation([step(1, 10), step(10, 80, error_rate=0.05)])[0] == 10
+    assert saturation([step(1, 10), step(10, 80, p99=3.0)], "--max-p99", "2")[0] == 10
+    assert saturation([step(1, 10), step(10, 80)]) == (None, "not reached")
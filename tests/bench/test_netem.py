@@ -0,0 +1,45 @@
+import pytest
+
+import netem
+
+
+def test_spec_parsing():
+    impairment = netem.Impairment.parse("loss=0.05, delay=20ms,jitter=0.5s,rate=10M")
+    assert impairment.describe() == {
+        "loss": 0.05,
+        "dup": 0.0,
+        "reorder": 0.0,
+        "delay": 0.02,
+        "jitter": 0.5,
+        "gap": 0.01,
+        "rate": 10_000_000,
+        "queue": 1 << 20,
+    }
+    with pytest.raises(ValueError):
+        netem.Impairment.parse("latency=20ms")
+    assert netem.parse_mapping("127.0.0.2:6969=127.0.0.1:6969") == (("127.0.0.2", 6969), ("127.0.0.1", 6969))
+
+
+def test_same_seed_drops_the_same_datagrams():
+    impairment = netem.Impairment(loss=0.3, dup=0.1, reorder=0.1, delay=0.01, jitter=0.005)
+    runs = []
+    for _ in range(2):
+        link = netem.Link(impairment, seed=7)
+        runs.append([link.schedule_datagram(100, index * 0.001) for index in range(200)])
+    assert runs[0] == runs[1]
+    assert 30 < link.stats["dropped"] < 90 and link.stats["duplicated"] and link.stats["reordered"]
+
+
+def test_bandwidth_cap_spaces_packets_and_drops_at_the_queue():
+    link = netem.Link(netem.Impairment(rate=1000, queue=1500))
+    assert link.schedule_datagram(500, 0.0) == [0.5]
+    assert link.schedule_datagram(500, 0.0) == [1.0]
+    assert link.schedule_datagram(500, 0.0) == [1.5]
+    assert link.schedule_datagram(500, 0.0) == []  # 1500 byte đang chờ: hàng đợi đầy
+    assert link.stats["queue_drops"] == 1
+
+
+def test_stream_pieces_never_overtake_each_other():
+    link = netem.Link(netem.Impairment(delay=0.05, jitter=0.05), seed=3)
+    departures = [link.schedule_stream(1000, index * 0.001) for index in range(100)]
+    assert departures == sorted(departures)
@@ -0,0 +1,16 @@
+"""
+The client scripts import their siblings by name (import log), so the
+tests import them the same way with client/ on sys.path.
+"""
+
+import os
+import sys
+
+CLIENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "client"))
+
+# client/ và server/ có module trùng tên (log, utils, delta...): bỏ bản đã import từ thư mục kia
+for name, module in list(sys.modules.items()):
+    path = getattr(module, "__file__", None) or ""
+    if os.path.exists(os.path.join(CLIENT_DIR, f"{name}.py")) and os.path.dirname(path) != CLIENT_DIR:
+        del sys.modules[name]
+sys.path.insert(0, CLIENT_DIR)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import aioclient
+
+
+class FakeDownloader(aioclient.AsyncDownloader):
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.lookups = []
+        self.downloads = []
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def resource_sizes(self, names):
+        self.lookups.append(list(names))
+        return {name: self.sizes[name] for name in names if name in self.sizes}
+
+    async def download(self, name, dest, size=None, progress=None):
+        self.downloads.append((name, size))
+        return f"{dest}/{name}"
+
+
+def test_async_downloader_is_abstract():
+    with pytest.raises(TypeError):
+        aioclient.AsyncDownloader()
+
+    class NoSizes(aioclient.AsyncDownloader):
+        async def connect(self):
+            pass
+
+        async def close(self):
+            pass
+
+        async def download(self, name, dest, size=None, progress=None):
+            pass
+
+    with pytest.raises(TypeError):
+        NoSizes()
+
+
+def test_download_many_looks_up_sizes_once():
+    client = FakeDownloader({"a.bin": 1, "b.bin": 2})
+    paths = asyncio.run(client.download_many(["a.bin", ("c.bin", 3), "b.bin", "missing.bin"], "out"))
+
+    assert paths == ["out/a.bin", "out/c.bin", "out/b.bin", "out/missing.bin"]
+    assert client.lookups == [["a.bin", "b.bin", "missing.bin"]]
+    # Tên không có trong kết quả được download() tự hỏi lại
+    assert sorted(client.downloads) == [("a.bin", 1), ("b.bin", 2), ("c.bin", 3), ("missing.bin", None)]
+
+
+def test_tcp_client_caches_the_resource_list():
+    client = aioclient.AsyncTCPClient("127.0.0.1")
+    listings = [[("resources/a.bin", 10), ("resources/b.bin", 20)]]
+    requests = []
+
+    async def request(message):
+        requests.append(message)
+        return repr(listings[-1])
+
+    client.request = request
+
+    async def lookups():
+        assert await client.resource_sizes(["a.bin"]) == {"a.bin": 10}
+        assert await client.resource_sizes(["a.bin", "b.bin"]) == {"a.bin": 10, "b.bin": 20}
+        assert len(requests) == 1
+        # Tên chưa thấy: LIST lại vì file có thể vừa được thêm trên server
+        listings.append(listings[0] + [("resources/new.bin", 30)])
+        assert await client.resource_sizes(["new.bin"]) == {"new.bin": 30}
+        assert len(requests) == 2
+
+    asyncio.run(lookups())
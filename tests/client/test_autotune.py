@@ -0,0 +1,40 @@
+import autotune
+
+MB = 1024 * 1024
+
+
+def test_hill_climbing_keeps_gains_and_undoes_losses():
+    tuner = autotune.Autotuner(pipes=4, block_size=MB, max_pipes=16, min_block=MB // 4, max_block=8 * MB)
+
+    tuner.evaluate(100)  # điểm xuất phát, thử thêm pipe
+    assert tuner.settings() == (6, MB)
+    tuner.evaluate(200)  # tốt hơn GAIN: giữ và đi tiếp cùng hướng
+    assert tuner.settings() == (9, MB)
+    tuner.evaluate(150)  # kém hơn: quay lại 6 pipe, thử block lớn hơn
+    assert tuner.settings() == (6, 2 * MB)
+    assert tuner.best == (200, 6, MB)
+
+
+def test_moves_stay_within_the_server_limits():
+    tuner = autotune.Autotuner(pipes=8, block_size=MB, max_pipes=8, min_block=MB, max_block=MB)
+    tuner.evaluate(100)
+    # Không thể thêm pipe hay đổi block: chỉ còn bớt pipe
+    assert tuner.settings() == (6, MB)
+
+
+def test_fixed_block_size_is_not_tuned():
+    tuner = autotune.Autotuner(4, MB, max_pipes=16, min_block=1, max_block=8 * MB, tune_block=False)
+    tuner.move_index = tuner.MOVES.index("block_up")
+    tuner.evaluate(100)
+    # block_up không đổi gì khi block cố định: chuyển sang bớt pipe
+    assert tuner.settings() == (3, MB)
+
+
+def test_tick_waits_for_a_full_epoch():
+    tuner = autotune.Autotuner(pipes=1, block_size=MB, max_pipes=4, min_block=MB, max_block=MB)
+    tuner.record(MB)
+    tuner.active = tuner.EPOCH
+    assert not tuner.tick()  # mới 1 block, cần BLOCKS_PER_PIPE
+    tuner.record(MB)
+    assert tuner.tick()
+    assert tuner.settings() == (2, MB)
@@ -0,0 +1,40 @@
+import pytest
+
+import clientCore
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.discarded = []
+
+    def discard(self, filename):
+        self.discarded.append(filename)
+
+
+def test_failures_are_bounded_per_file():
+    client = clientCore.SocketClient()
+    for _ in range(client.FILE_RETRIES - 1):
+        client.count_failure("a.bin", "SHA-256 mismatch")
+    client.count_failure("b.bin", "corrupt block")
+
+    with pytest.raises(clientCore.DownloadFailed):
+        client.count_failure("a.bin", "SHA-256 mismatch")
+    # Bỏ file thì đếm lại từ đầu nếu nó có version mới; file khác giữ số lần của nó
+    assert client.failures == {"b.bin": 1}
+
+
+def test_give_up_skips_the_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = clientCore.SocketClient()
+    client.failed_files = set()
+    client.paused = {"a.bin": object()}
+    client.scheduler = FakeScheduler()
+    download_dir = tmp_path / client.DOWNLOAD_DIR
+    download_dir.mkdir()
+    (download_dir / "a.bin.part").write_bytes(b"partial")
+
+    client.give_up("a.bin", clientCore.DownloadFailed("a.bin failed 3 times"))
+
+    assert not (download_dir / "a.bin.part").exists()
+    assert client.failed_files == {"a.bin"} and not client.paused
+    assert client.scheduler.discarded == ["a.bin"]
@@ -0,0 +1,19 @@
+import json
+
+import client
+
+
+def test_flags_override_the_config_file(tmp_path):
+    config_file = tmp_path / "client.json"
+    config_file.write_text(json.dumps({"HOST": "10.0.0.5", "PIPES": 8}))
+    args = client.parse_args(["--config", str(config_file), "--pipes", "2", "--mode", "tcp", "a.bin", "b.bin"])
+
+    config = {**client.load_config(args.config), **client.flag_overrides(args)}
+    assert config == {"HOST": "10.0.0.5", "PIPES": 2}
+    assert args.mode == "tcp" and args.files == ["a.bin", "b.bin"]
+
+
+def test_invalid_settings_exit_before_connecting():
+    assert client.main(client.parse_args(["--mode", "tcp", "a.bin"])) == 2  # không có --host
+    assert client.main(client.parse_args(["--schedule", "random"])) == 2
+    assert client.main(client.parse_args(["--sockopt", "data.window=1"])) == 2
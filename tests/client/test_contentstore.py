@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+import pytest
+
+import contentstore
+
+
+def test_digest_cache_rereads_only_changed_files(tmp_path, monkeypatch):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"first")
+    cache = contentstore.DigestCache()
+    reads = []
+    file_digest = contentstore.file_digest
+    monkeypatch.setattr(contentstore, "file_digest", lambda p: reads.append(p) or file_digest(p))
+
+    assert cache.digest(str(path)) == hashlib.sha256(b"first").hexdigest()
+    assert cache.digest(str(path)) == hashlib.sha256(b"first").hexdigest()
+    assert len(reads) == 1
+
+    # Cùng kích thước, nội dung khác: mtime đổi nên phải đọc lại
+    path.write_bytes(b"other")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.digest(str(path)) == hashlib.sha256(b"other").hexdigest()
+    assert len(reads) == 2
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_store_links_a_known_object(tmp_path):
+    store = contentstore.ContentStore(str(tmp_path / "store"))
+    download = tmp_path / "a.bin"
+    download.write_bytes(b"content")
+
+    assert store.add(sha256(b"content"), str(download))
+    assert store.link(sha256(b"content"), str(tmp_path / "out" / "copy.bin"), size=7)
+    assert (tmp_path / "out" / "copy.bin").read_bytes() == b"content"
+    assert not store.link(sha256(b"other"), str(tmp_path / "out" / "other.bin"))
+
+
+def test_store_refuses_content_that_does_not_match(tmp_path):
+    store = contentstore.ContentStore(str(tmp_path / "store"))
+    download = tmp_path / "a.bin"
+    download.write_bytes(b"content")
+
+    assert not store.add(sha256(b"expected"), str(download))
+    assert store.size() == 0
+    with pytest.raises(ValueError):
+        store.object_path("../../etc/passwd")
+
+
+def test_store_evicts_the_least_recently_used_object(tmp_path):
+    store = contentstore.ContentStore(str(tmp_path / "store"), max_bytes=11)
+    for index, data in enumerate((b"first", b"second")):
+        path = tmp_path / f"{index}.bin"
+        path.write_bytes(data)
+        store.add(sha256(data), str(path))
+        os.utime(store.object_path(sha256(data)) + contentstore.USED_SUFFIX, (index + 1, index + 1))
+
+    path = tmp_path / "third.bin"
+    path.write_bytes(b"third")
+    store.add(sha256(b"third"), str(path))
+
+    # Vượt max_bytes: object dùng lâu nhất ("first") bị bỏ
+    kept = sorted(os.path.basename(path) for _, _, path in store.objects())
+    assert kept == sorted([sha256(b"second"), sha256(b"third")])
@@ -0,0 +1,55 @@
+import threading
+import time
+import types
+
+import pytest
+
+import mirrors
+
+MB = mirrors.MB
+
+
+def make_source(name, rate=None):
+    client_session = types.SimpleNamespace(host=name, port=6969)
+    source = mirrors.Source(None, client_session)
+    source.rate = rate
+    return source
+
+
+def make_set(*ranges):
+    mirror_set = mirrors.MirrorSet.__new__(mirrors.MirrorSet)
+    mirror_set.condition = threading.Condition()
+    mirror_set.queue = list(ranges)
+    mirror_set.active = []
+    return mirror_set
+
+
+def test_parse_address():
+    assert mirrors.parse_address("10.0.0.5", 6969) == ("10.0.0.5", 6969)
+    assert mirrors.parse_address(" mirror.local:7000 ", 6969) == ("mirror.local", 7000)
+    with pytest.raises(ValueError):
+        mirrors.parse_address("host:port", 6969)
+
+
+def test_segments_follow_the_source_rate():
+    mirror_set = make_set((0, 100 * MB - 1))
+    new, fast, slow = make_source("new"), make_source("fast", 10 * MB), make_source("slow", 1)
+
+    assert mirror_set.next_segment(new).size == mirror_set.START_SEGMENT
+    assert mirror_set.next_segment(fast).size == 10 * MB * mirror_set.SEGMENT_SECONDS
+    assert mirror_set.next_segment(slow).size == mirror_set.MIN_SEGMENT
+    assert mirror_set.queue == [(4 * MB + 20 * MB + 1 * MB, 100 * MB - 1)]
+
+
+def test_idle_source_copies_a_straggler():
+    mirror_set = make_set((0, MB - 1))
+    slow, fast = make_source("slow"), make_source("fast")
+    segment = mirror_set.next_segment(slow)
+    segment.owners[slow] = time.monotonic()
+    segment.expected = 10.0
+
+    assert mirror_set.next_segment(fast) is None  # chưa chậm quá SLOW_FACTOR lần
+    segment.owners[slow] -= mirror_set.SLOW_FACTOR * segment.expected + 1
+    assert mirror_set.next_segment(fast) is segment
+    segment.done = True
+    assert mirror_set.next_segment(fast) is False
@@ -0,0 +1,19 @@
+import types
+
+import multiplex
+
+
+def test_header_matches_the_server_format():
+    # Cùng vector với tests/server/test_serverUDP.py
+    packet = bytes.fromhex("ff010200000007422c6a152d") + b"payload"
+    assert multiplex.HEADER.unpack_from(packet) == (multiplex.MARKER, 0x0102, 7, 0x422C6A15, b"-")
+    assert packet[multiplex.HEADER.size :] == b"payload"
+
+
+def test_stream_ids_wrap_within_16_bits():
+    client = types.SimpleNamespace(BUFFER_SIZE=1024, codec=None, TIMEOUT=5, scheduler=None)
+    mux = multiplex.Multiplexer(client, None, ("127.0.0.1", 12345))
+    mux.next_id = 65534
+    mux.streams = {65535: None, 0: None}
+
+    assert mux.new_id() == 1
@@ -0,0 +1,65 @@
+import pytest
+
+import scheduler
+
+ENTRIES = [
+    {"name": "big.zip", "size_bytes": 900},
+    {"name": "report.pdf", "size_bytes": 300, "priority": 10},
+    {"name": "cat.png", "size_bytes": 100, "deadline": 60},
+    {"name": "dog.png", "size_bytes": 100, "deadline": 30, "priority": 1},
+]
+
+
+def names(entries):
+    return [entry["name"] for entry in entries]
+
+
+def test_parse_line_reads_annotations():
+    assert scheduler.parse_line("report.pdf priority=10") == ("report.pdf", {"priority": 10})
+    assert scheduler.parse_line("cat.png deadline=30") == ("cat.png", {"deadline": 30.0})
+    assert scheduler.parse_line("my file.txt") == ("my file.txt", {})
+    assert scheduler.parse_line("odd.txt priority=high") == ("odd.txt", {})
+    assert scheduler.parse_line("dog.png deadline=18:30")[1]["deadline"][0] == "at"
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        ("fifo", ["big.zip", "report.pdf", "cat.png", "dog.png"]),
+        ("smallest", ["cat.png", "dog.png", "report.pdf", "big.zip"]),
+        ("priority", ["report.pdf", "dog.png", "big.zip", "cat.png"]),
+        ("deadline", ["dog.png", "cat.png", "report.pdf", "big.zip"]),
+    ],
+)
+def test_policies(policy, expected):
+    queue = scheduler.Scheduler(policy)
+    assert names(queue.order(ENTRIES)) == expected
+
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(ValueError):
+        scheduler.Scheduler("random")
+
+
+def test_only_large_remainders_are_preempted():
+    queue = scheduler.Scheduler("priority")
+    queue.order(ENTRIES[:1])
+    entries = ENTRIES[:2]
+
+    assert queue.more_urgent(entries, "big.zip", scheduler.PREEMPT_BYTES) is None
+    assert queue.more_urgent(entries, "big.zip", scheduler.PREEMPT_BYTES + 1)["name"] == "report.pdf"
+    assert queue.more_urgent(entries, "report.pdf", scheduler.PREEMPT_BYTES + 1) is None
+
+
+def test_report_measures_wait_and_completion():
+    queue = scheduler.Scheduler()
+    queue.order(ENTRIES[:2])
+    queue.start("big.zip")
+    queue.pause("big.zip")
+    queue.finish("big.zip")
+    queue.discard("report.pdf")
+
+    (stats,) = queue.report()
+    assert stats["file"] == "big.zip" and stats["preempted"] == 1
+    assert 0 <= stats["wait"] <= stats["completion"]
+    assert not queue.jobs and queue.report() == []
@@ -0,0 +1,21 @@
+import session
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    backoff = session.Backoff(initial=1, maximum=5)
+    delays = [backoff.next_delay() for _ in range(5)]
+    # Jitter: mỗi lần chờ nằm trong [0.5, 1] x (1, 2, 4, 5, 5)
+    for delay, base in zip(delays, (1, 2, 4, 5, 5)):
+        assert base * 0.5 <= delay <= base
+    backoff.reset()
+    assert backoff.attempt == 0
+
+
+def test_backoff_waits_at_least_the_retry_after():
+    backoff = session.Backoff(initial=0.1)
+    assert 3 <= backoff.wait_time(minimum=3) <= 4.5
+
+
+def test_server_busy_reads_retry_after():
+    assert session.ServerBusy.parse(["BUSY", "2.5"]).retry_after == 2.5
+    assert session.ServerBusy.parse(["BUSY"]).retry_after == session.Backoff.INITIAL
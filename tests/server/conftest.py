@@ -0,0 +1,16 @@
+"""
+The server scripts import their siblings by name (import log), so the
+tests import them the same way with server/ on sys.path.
+"""
+
+import os
+import sys
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "server"))
+
+# client/ và server/ có module trùng tên (log, utils, delta...): bỏ bản đã import từ thư mục kia
+for name, module in list(sys.modules.items()):
+    path = getattr(module, "__file__", None) or ""
+    if os.path.exists(os.path.join(SERVER_DIR, f"{name}.py")) and os.path.dirname(path) != SERVER_DIR:
+        del sys.modules[name]
+sys.path.insert(0, SERVER_DIR)
@@ -0,0 +1,67 @@
+import threading
+
+import admission
+
+
+def test_admit_queues_then_rejects():
+    control = admission.Admission(max_sessions=1, max_queued=1)
+    assert control.admit() == admission.ADMITTED
+    assert control.admit() == admission.QUEUED
+    assert control.admit() == admission.REJECTED
+    assert control.snapshot()["active"] == 1 and control.snapshot()["queued"] == 1
+
+
+def test_queued_connection_gets_the_freed_slot():
+    control = admission.Admission(max_sessions=1, max_queued=1, queue_timeout=5)
+    control.admit()
+    control.admit()
+
+    timer = threading.Timer(0.05, control.leave)
+    timer.start()
+    assert control.wait()
+    timer.join()
+    assert control.active == 1 and control.queued == 0
+
+
+def test_queued_connection_gives_up():
+    control = admission.Admission(max_sessions=1, max_queued=1, queue_timeout=0.05)
+    control.admit()
+    control.admit()
+    assert not control.wait()
+    assert control.queued == 0
+
+    control = admission.Admission(max_sessions=1, max_queued=1, queue_timeout=5)
+    control.admit()
+    control.admit()
+    assert not control.wait(stop=lambda: True)
+
+
+def test_new_connection_does_not_jump_the_queue():
+    control = admission.Admission(max_sessions=1, max_queued=2)
+    control.admit()
+    control.admit()
+    control.leave()
+    # Còn kết nối đang chờ: kết nối mới phải xếp hàng sau nó
+    assert control.admit() == admission.QUEUED
+
+
+def test_reserve_waits_for_room():
+    control = admission.Admission(max_inflight_bytes=100)
+    assert control.reserve(60) == 60
+    # Block lớn hơn cả giới hạn chỉ chờ các block khác xong
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(control.reserve(500)))
+    waiter.start()
+    waiter.join(0.05)
+    assert not granted
+
+    control.release(60)
+    waiter.join(5)
+    assert granted == [100] and control.inflight == 100
+
+
+def test_unlimited_reserve_is_free():
+    control = admission.Admission()
+    assert control.reserve(10**9) == 0
+    control.release(0)
+    assert control.inflight == 0
@@ -0,0 +1,47 @@
+import os
+
+import catalog
+
+
+def test_rescan_records_one_change_per_file(tmp_path):
+    (tmp_path / "kept.txt").write_text("kept")
+    (tmp_path / "edited.txt").write_text("old")
+    (tmp_path / "gone.txt").write_text("gone")
+    resources = catalog.Catalog(str(tmp_path), auto_refresh=False)
+    assert resources.version == 0 and len(resources) == 3
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "new.txt").write_text("new")
+    (tmp_path / "edited.txt").write_text("edited")
+    os.remove(tmp_path / "gone.txt")
+    resources.refresh()
+
+    changes = resources.changes_since(0)
+    assert sorted((op, name, size) for _, op, name, size in changes) == [
+        ("added", "sub/new.txt", 3),
+        ("modified", "edited.txt", 6),
+        ("removed", "gone.txt", 0),
+    ]
+    assert resources.version == 3
+    assert resources.changes_since(3) == []
+    assert [change[0] for change in resources.changes_since(2)] == [3]
+
+
+def test_changes_out_of_history_ask_for_a_new_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog.Catalog, "HISTORY", 2)
+    resources = catalog.Catalog(str(tmp_path), auto_refresh=False)
+    for index in range(3):
+        (tmp_path / f"{index}.txt").write_text("x")
+        resources.refresh()
+
+    assert resources.changes_since(0) is None  # version 1 đã bị bỏ khỏi lịch sử
+    assert [change[0] for change in resources.changes_since(1)] == [2, 3]
+    assert resources.changes_since(7) is None
+
+
+def test_wait_changes_returns_the_new_version(tmp_path):
+    resources = catalog.Catalog(str(tmp_path), auto_refresh=False)
+    assert resources.wait_changes(0, timeout=0.01) == 0
+    (tmp_path / "new.txt").write_text("x")
+    resources.refresh()
+    assert resources.wait_changes(0, timeout=0.01) == 1
@@ -0,0 +1,81 @@
+import os
+import random
+
+import pytest
+
+import compression
+
+BLOCK = compression.CompressionCache.MIN_CACHED_BLOCK
+
+
+@pytest.fixture
+def resource(tmp_path):
+    # Văn bản ngẫu nhiên trên 16 ký tự: nén được khoảng một nửa, các block khác nhau
+    rng = random.Random(26)
+    path = tmp_path / "resource.txt"
+    path.write_bytes(bytes(rng.choice(b"abcdefghijklmnop") for _ in range(3 * BLOCK)))
+    return str(path)
+
+
+def read_block(path, index):
+    with open(path, "rb") as file:
+        file.seek(index * BLOCK)
+        return file.read(BLOCK)
+
+
+def entry_path(cache, path, index):
+    return os.path.join(cache.cache_dir, cache._key(path, "zlib", index * BLOCK, BLOCK)[2])
+
+
+def test_negotiate_picks_a_local_codec():
+    assert compression.negotiate("brotli, zlib") == "zlib"
+    assert compression.negotiate(["brotli"]) == compression.NO_COMPRESSION
+
+
+def test_compress_block_skips_incompressible_files():
+    data = b"a" * 4096
+    assert compression.compress_block("zlib", "archive.zip", data) == (compression.NO_COMPRESSION, data)
+    codec, payload = compression.compress_block("zlib", "notes.txt", data)
+    assert codec == "zlib" and compression.decompress(codec, payload) == data
+
+
+def test_cache_serves_the_stored_block(tmp_path, resource):
+    cache = compression.CompressionCache(str(tmp_path / "cache"), max_bytes=0)
+    data = read_block(resource, 0)
+
+    codec, payload = cache.get_block("zlib", resource, 0, data)
+    assert codec == "zlib" and compression.decompress(codec, payload) == data
+    assert os.path.exists(entry_path(cache, resource, 0))
+    assert cache.get_block("zlib", resource, 0, data) == (codec, payload)
+
+
+def test_cache_evicts_the_least_recently_used_block(tmp_path, resource):
+    cache = compression.CompressionCache(str(tmp_path / "cache"), max_bytes=0)
+    blocks = [read_block(resource, index) for index in range(3)]
+    for index, data in enumerate(blocks):
+        cache.get_block("zlib", resource, index * BLOCK, data)
+    paths = [entry_path(cache, resource, index) for index in range(3)]
+    for index, path in enumerate(paths):
+        os.utime(path, (1000 * (index + 1), 1000 * (index + 1)))
+
+    # Dùng lại block 0: block 1 trở thành block lâu nhất không dùng
+    cache.get_block("zlib", resource, 0, blocks[0])
+    cache.max_bytes = cache.total - 1
+    with cache.lock:
+        cache.evict()
+
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert cache.total <= cache.max_bytes * cache.LOW_WATER
+
+
+def test_cache_drops_blocks_of_an_older_version(tmp_path, resource):
+    cache = compression.CompressionCache(str(tmp_path / "cache"), max_bytes=0)
+    cache.get_block("zlib", resource, 0, read_block(resource, 0))
+    old_entry = entry_path(cache, resource, 0)
+
+    with open(resource, "ab") as file:
+        file.write(b"more")
+    cache.get_block("zlib", resource, 0, read_block(resource, 0))
+
+    assert not os.path.exists(old_entry)
+    assert os.listdir(cache.cache_dir) == [os.path.basename(entry_path(cache, resource, 0))]
@@ -0,0 +1,70 @@
+import io
+import os
+import random
+
+import pytest
+
+import delta
+
+
+def make_delta(old_path, new_path, block_size):
+    chunks = []
+    signatures = delta.signatures(old_path, block_size)
+    stats = delta.encode(new_path, os.path.getsize(old_path), block_size, signatures, chunks.append)
+    return b"".join(chunks), stats
+
+
+@pytest.fixture
+def versions(tmp_path):
+    rng = random.Random(41)
+    old = bytes(rng.getrandbits(8) for _ in range(200 * 1024))
+    # Bản mới: chèn ở đầu (lệch mọi offset), sửa ở giữa, cắt bớt ở cuối
+    new = b"inserted" + old[: 90 * 1024] + b"changed" * 100 + old[100 * 1024 : 180 * 1024]
+    old_path, new_path = tmp_path / "old.bin", tmp_path / "new.bin"
+    old_path.write_bytes(old)
+    new_path.write_bytes(new)
+    return str(old_path), str(new_path), new
+
+
+def test_block_size_grows_with_the_file():
+    assert delta.block_size_for(0) == delta.MIN_BLOCK
+    assert delta.block_size_for(64 * 1024 * 1024) == 8 * 1024
+    assert delta.block_size_for(1 << 40) == delta.MAX_BLOCK
+
+
+def test_signature_delta_patch_round_trip(tmp_path, versions):
+    old_path, new_path, new = versions
+    stream, (copied, literal) = make_delta(old_path, new_path, delta.MIN_BLOCK)
+
+    out_path = str(tmp_path / "rebuilt.bin")
+    assert delta.apply(old_path, delta.file_reader(io.BytesIO(stream)), out_path) == (copied, literal)
+    assert open(out_path, "rb").read() == new
+    assert copied + literal == len(new)
+    # Phần lớn bản mới được chép từ bản cũ, không gửi lại
+    assert copied > 150 * 1024 and len(stream) < 20 * 1024
+
+
+def test_unchanged_file_is_a_single_copy(tmp_path, versions):
+    old_path, _, _ = versions
+    stream, (copied, literal) = make_delta(old_path, old_path, 4096)
+    assert literal == 0
+    # Các block liền nhau được gộp thành 1 lệnh copy
+    assert stream[:1] == b"C" and len(stream) == 1 + delta.COPY.size + 1 + delta.END.size
+
+
+def test_patch_against_another_old_copy_is_rejected(tmp_path, versions):
+    old_path, new_path, _ = versions
+    stream, _ = make_delta(old_path, new_path, delta.MIN_BLOCK)
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"x" * 200 * 1024)
+
+    with pytest.raises(ValueError):
+        delta.apply(str(other), delta.file_reader(io.BytesIO(stream)), str(tmp_path / "rebuilt.bin"))
+
+
+def test_truncated_stream_is_rejected(tmp_path, versions):
+    old_path, new_path, _ = versions
+    stream, _ = make_delta(old_path, new_path, delta.MIN_BLOCK)
+
+    with pytest.raises(ValueError):
+        delta.apply(old_path, delta.file_reader(io.BytesIO(stream[:-10])), str(tmp_path / "rebuilt.bin"))
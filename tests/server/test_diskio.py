@@ -0,0 +1,55 @@
+import diskio
+
+
+def queue(disk, *reads):
+    for path, offset, length in reads:
+        disk.pending.append(diskio.Read(path, offset, length))
+
+
+def ranges(batch):
+    return [(read.path, read.offset, read.length) for read in batch]
+
+
+def test_take_batch_coalesces_touching_reads_of_one_file():
+    disk = diskio.DiskIO(threads=0)
+    queue(disk, ("f", 0, 100), ("g", 0, 100), ("f", 100, 100), ("f", 300, 100), ("f", 200, 100), ("f", 50, 20))
+
+    # ("f", 300) chỉ chạm khoảng đã gộp sau khi ("f", 200) được thêm: vòng lặp chạy lại
+    assert ranges(disk.take_batch()) == [
+        ("f", 0, 100), ("f", 100, 100), ("f", 200, 100), ("f", 50, 20), ("f", 300, 100)
+    ]
+    assert ranges(disk.pending) == [("g", 0, 100)]
+
+
+def test_take_batch_respects_max_coalesce(monkeypatch):
+    monkeypatch.setattr(diskio, "MAX_COALESCE", 150)
+    disk = diskio.DiskIO(threads=0)
+    queue(disk, ("f", 0, 100), ("f", 100, 100), ("f", 20, 50))
+
+    assert ranges(disk.take_batch()) == [("f", 0, 100), ("f", 20, 50)]
+    assert ranges(disk.pending) == [("f", 100, 100)]
+
+
+def test_execute_splits_one_read_between_the_requests(tmp_path):
+    path = tmp_path / "resource.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    disk = diskio.DiskIO(threads=0)
+    # Read cuối vượt quá cuối file: chỉ nhận phần còn lại
+    queue(disk, (str(path), 0, 300), (str(path), 300, 300), (str(path), 600, 500))
+
+    batch = disk.take_batch()
+    disk.execute(batch)
+
+    data = path.read_bytes()
+    assert [read.future.result() for read in batch] == [data[0:300], data[300:600], data[600:]]
+    assert disk.snapshot()["reads"] == 1 and disk.snapshot()["coalesced"] == 2
+
+
+def test_window_cache_serves_small_reads(tmp_path):
+    path = tmp_path / "resource.bin"
+    path.write_bytes(bytes(range(256)) * 16)
+    disk = diskio.DiskIO(threads=1, window=1024)
+
+    assert disk.cached(str(path), 10, 20) is None
+    assert disk.fetch(str(path), 10, 20).result(5) == path.read_bytes()[10:30]
+    assert disk.cached(str(path), 100, 20) == path.read_bytes()[100:120]
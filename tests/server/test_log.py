@@ -0,0 +1,57 @@
+import io
+import sys
+
+import pytest
+
+import log
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    yield stream
+    log.setup(stream=sys.stdout)
+
+
+def lines(stream):
+    log.shutdown()  # ghi hết các record còn trong hàng đợi
+    return stream.getvalue().splitlines()
+
+
+def test_lines_are_tagged_by_level_or_extra(output, tmp_path):
+    log_file = tmp_path / "server.log"
+    log.setup(level="INFO", stream=output, log_file=str(log_file))
+    logger = log.get_logger("test")
+    logger.debug("hidden")
+    logger.info("Server started")
+    logger.info("Downloaded a.bin", extra={"tag": "SUCCESS"})
+    logger.error("Broken")
+
+    assert lines(output) == ["[STATUS] Server started", "[SUCCESS] Downloaded a.bin", "[ERROR] Broken"]
+    assert log_file.read_text().splitlines()[0].endswith("[STATUS] Server started")
+
+
+def test_quiet_keeps_warnings_and_errors(output):
+    log.setup(level="DEBUG", quiet=True, stream=output)
+    logger = log.get_logger("test")
+    logger.info("progress")
+    logger.warning("slow client")
+
+    assert lines(output) == ["[WARNING] slow client"]
+
+
+def test_throttle_counts_the_skipped_lines(output):
+    log.setup(level="DEBUG", stream=output)
+    throttle = log.Throttle(log.get_logger("test"), interval=60)
+    for seq in range(3):
+        throttle.debug("chunk", "Sent chunk %d", seq, tag="CHUNK")
+    throttle.debug("busy", "Rejected a request")
+    # Hết interval: dòng kế tiếp được ghi kèm số dòng đã bỏ qua
+    throttle.state["chunk"] = (0.0, throttle.state["chunk"][1])
+    throttle.debug("chunk", "Sent chunk %d", 3, tag="CHUNK")
+
+    assert lines(output) == [
+        "[CHUNK] Sent chunk 0",
+        "[DEBUG] Rejected a request",
+        "[CHUNK] Sent chunk 3 (+2 similar)",
+    ]
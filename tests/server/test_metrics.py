@@ -0,0 +1,44 @@
+import metrics
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = metrics.Histogram(bounds=(0.1, 1.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+    assert histogram.snapshot()["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
+
+
+def test_registry_counts_per_label_set():
+    registry = metrics.Registry()
+    registry.inc("requests_total", opcode="GET")
+    registry.inc("requests_total", 2, opcode="GET")
+    registry.inc("requests_total", opcode="LIST")
+    registry.gauge("sessions", lambda: 3)
+    registry.gauge("broken", lambda: 1 / 0)
+
+    snapshot = registry.snapshot()
+    counters = {counter["labels"]["opcode"]: counter["value"] for counter in snapshot["counters"]}
+    assert counters == {"GET": 3, "LIST": 1}
+    assert snapshot["gauges"]["sessions"] == 3
+    assert snapshot["gauges"]["broken"].startswith("error:")
+
+
+def test_prometheus_exposition():
+    registry = metrics.Registry()
+    registry.inc("requests_total", opcode="GET")
+    with registry.time("read_seconds"):
+        pass
+    registry.gauge("sessions", lambda: 2)
+    registry.gauge("bandwidth", lambda: {"not": "a number"})
+
+    lines = registry.prometheus().splitlines()
+    assert 'requests_total{opcode="GET"} 1' in lines
+    assert 'read_seconds_bucket{le="+Inf"} 1' in lines
+    assert "read_seconds_count 1" in lines
+    assert "sessions 2" in lines
+    assert not any(line.startswith("bandwidth") for line in lines)
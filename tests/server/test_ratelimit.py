@@ -0,0 +1,106 @@
+import time
+
+import ratelimit
+
+
+def test_token_bucket_goes_into_debt_and_refills():
+    bucket = ratelimit.TokenBucket(rate=1000)
+    now = bucket.updated
+    assert bucket.ready()
+
+    bucket.consume(1500)
+    assert not bucket.ready()
+    assert bucket.wait_time() == 0.5
+
+    bucket.refill(now + 0.5)
+    assert bucket.ready()
+    bucket.refill(now + 10)
+    assert bucket.tokens == bucket.burst == 1000
+
+
+def test_unlimited_token_bucket_is_always_ready():
+    bucket = ratelimit.TokenBucket()
+    bucket.consume(10**9)
+    assert bucket.ready()
+    assert bucket.wait_time() == 0
+
+
+def drain(queue, allowed=lambda client, session, cost: True):
+    items = []
+    while len(queue):
+        item = queue.pop(allowed)
+        if item is None:
+            break
+        items.append(item)
+    return items
+
+
+def test_fair_queue_alternates_between_sessions():
+    queue = ratelimit.FairQueue()
+    for index in range(3):
+        queue.push("a", "a1", f"a{index}", 100)
+    for index in range(3):
+        queue.push("b", "b1", f"b{index}", 100)
+
+    assert drain(queue) == ["a0", "b0", "a1", "b1", "a2", "b2"]
+    assert not queue.queues
+
+
+def test_fair_queue_follows_weights():
+    queue = ratelimit.FairQueue()
+    for index in range(4):
+        queue.push("heavy", "h", f"h{index}", 100, weight=2.0)
+        queue.push("light", "l", f"l{index}", 100)
+
+    # Finish tag của phiên trọng số 2 tăng chậm gấp đôi: 50, 100, 150, 200 so với 100, 200, ...
+    assert drain(queue) == ["h0", "h1", "l0", "h2", "h3", "l1", "l2", "l3"]
+
+
+def test_fair_queue_skips_clients_without_bandwidth():
+    queue = ratelimit.FairQueue()
+    queue.push("slow", "s", "s0", 100)
+    queue.push("fast", "f", "f0", 100)
+    queue.push("fast", "f", "f1", 100)
+
+    assert drain(queue, lambda client, session, cost: client != "slow") == ["f0", "f1"]
+    assert len(queue) == 1
+    assert queue.pop(lambda client, session, cost: True) == "s0"
+
+
+def test_try_acquire_respects_the_client_cap():
+    scheduler = ratelimit.BandwidthScheduler(client_rate=1000)
+    assert scheduler.try_acquire("10.0.0.1", ("10.0.0.1", 1), 1500)
+    # Bucket đang nợ: client này phải chờ, client khác vẫn được gửi
+    assert not scheduler.try_acquire("10.0.0.1", ("10.0.0.1", 1), 100)
+    assert scheduler.try_acquire("10.0.0.2", ("10.0.0.2", 1), 100)
+
+
+def test_unlimited_scheduler_only_records():
+    scheduler = ratelimit.BandwidthScheduler()
+    scheduler.acquire("10.0.0.1", "s1", 4096)
+    assert scheduler.session_meters["s1"].total_bytes == 4096
+    assert scheduler.global_meter.total_bytes == 4096
+
+
+def test_prune_idle_forgets_sessions_and_their_clients():
+    scheduler = ratelimit.BandwidthScheduler(client_weights={"10.0.0.1": 2.0})
+    now = time.monotonic()
+    for port in range(50):
+        scheduler.record("10.0.0.1", ("10.0.0.1", port), 100, now - 120)
+    scheduler.record("10.0.0.2", ("10.0.0.2", 1), 100, now)
+    assert scheduler.weights[("10.0.0.1", 0)] == 2.0
+
+    scheduler.prune_idle(idle=60)
+
+    assert list(scheduler.session_meters) == [("10.0.0.2", 1)]
+    assert list(scheduler.weights) == [("10.0.0.2", 1)]
+    assert list(scheduler.client_meters) == ["10.0.0.2"]
+
+
+def test_forget_keeps_a_client_bucket_in_debt():
+    scheduler = ratelimit.BandwidthScheduler(client_rate=1000)
+    scheduler.try_acquire("10.0.0.1", "s1", 5000)
+    scheduler.forget("s1")
+
+    assert "s1" not in scheduler.session_meters
+    assert not scheduler.client_buckets["10.0.0.1"].ready()
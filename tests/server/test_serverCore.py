@@ -0,0 +1,74 @@
+import socket
+
+import pytest
+
+import serverCore
+import utils
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # RESOURCE_PATH và cache nén là đường dẫn tương đối
+    (tmp_path / "resources").mkdir()
+    return serverCore.SocketServer()
+
+
+def tcp_pair():
+    # create_pipes đọc IP của client từ getpeername(): cần socket TCP thật
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        client = socket.create_connection(listener.getsockname())
+        conn, _ = listener.accept()
+    return conn, client
+
+
+def open_session(server, offered="", token=""):
+    master, client = tcp_pair()
+    with master, client:
+        session = server.create_pipes(master, offered, token)
+        reply = client.recv(server.MESSAGE_SIZE).decode().strip().split("|")
+    return session, reply
+
+
+def hello(server, text):
+    pipe_conn, client = tcp_pair()
+    client.sendall(utils.standardize_str(text, server.MESSAGE_SIZE).encode())
+    server.attach_pipe(pipe_conn, ("127.0.0.1", 0))
+    return pipe_conn, client
+
+
+def test_open_registers_a_session_and_announces_the_data_port(server):
+    session, reply = open_session(server, "zlib")
+    data_port, codec, token = reply[:3]
+    assert int(data_port) == server.DATA_PORT and codec == "zlib"
+    assert server.sessions[token] is session and session.codec == "zlib"
+    assert session.client == "127.0.0.1"
+    assert reply[6].split(",") == list(server.FEATURES)
+
+
+def test_reopen_with_a_token_reuses_the_session(server):
+    session, reply = open_session(server)
+    server.SESSION_LINGER = 60
+    server.release_session(session)
+
+    again, reply_again = open_session(server, token=reply[2])
+    assert again is session and session.linger_timer is None
+    assert reply_again[2] == reply[2]
+
+    # Token không còn hợp lệ: phiên mới
+    other, reply_other = open_session(server, token="stale")
+    assert other is not session and reply_other[2] != reply[2]
+
+
+def test_pipes_are_routed_by_token(server):
+    session, reply = open_session(server)
+    pipe_conn, client = hello(server, f"PIPE\r\n{reply[2]}\r\n1")
+    assert session.get_pipe(1, timeout=1) is pipe_conn
+    client.close()
+    session.close()
+
+
+def test_pipe_with_an_unknown_token_is_closed(server):
+    pipe_conn, client = hello(server, "PIPE\r\nstale\r\n0")
+    assert pipe_conn.fileno() == -1
+    assert client.recv(1) == b""
+    client.close()
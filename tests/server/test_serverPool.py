@@ -0,0 +1,30 @@
+import json
+
+import serverCore
+import serverPool
+
+
+def test_command_line_beats_config_file_beats_defaults(tmp_path):
+    resources = tmp_path / "resources"
+    resources.mkdir()
+    (resources / "a.txt").write_text("a")
+    config_path = tmp_path / "server.json"
+    config = {"PORT": 7000, "CLIENT_RATE": 1000, "RESOURCE_PATH": str(resources), "BOGUS": 1}
+    config_path.write_text(json.dumps(config))
+
+    pool = serverPool.PreforkServer(workers=2, config_path=str(config_path), overrides={"PORT": 7100})
+    pool.load_config()
+
+    assert pool.config["PORT"] == 7100
+    assert pool.config["CLIENT_RATE"] == 1000
+    assert pool.config["MAX_PIPES"] == serverCore.SocketServer.MAX_PIPES
+    assert "BOGUS" not in pool.config
+    assert len(pool.catalog) == 1
+
+
+def test_unreadable_config_keeps_the_defaults(tmp_path):
+    config_path = tmp_path / "server.json"
+    config_path.write_text("{not json")
+    pool = serverPool.PreforkServer(config_path=str(config_path), overrides={"RESOURCE_PATH": str(tmp_path)})
+    pool.load_config()
+    assert pool.config["PORT"] == serverCore.SocketServer.PORT
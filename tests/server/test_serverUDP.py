@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+import compression
+import serverUDP
+
+CLIENT = ("127.0.0.1", 40000)
+
+
+class FakeSocket:
+    """
+    Feeds datagrams to handle_requests() and records the replies.
+    """
+
+    def __init__(self, datagrams):
+        self.datagrams = list(datagrams)
+        self.sent = []
+
+    def settimeout(self, timeout):
+        pass
+
+    def recvfrom(self, size):
+        if not self.datagrams:
+            raise KeyboardInterrupt  # hết datagram: thoát vòng lặp của server
+        return self.datagrams.pop(0), CLIENT
+
+    def sendto(self, data, address):
+        self.sent.append(data)
+
+
+def serve(server, *datagrams):
+    server_socket = FakeSocket(datagrams)
+    with pytest.raises(KeyboardInterrupt):
+        server.handle_requests(server_socket)
+    return server_socket.sent
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # DELTA_DIR là đường dẫn tương đối
+    resources = tmp_path / "resources"
+    resources.mkdir()
+    (resources / "file.bin").write_bytes(bytes(range(256)) * 64)
+    return serverUDP.SocketServerUDP(HOST="127.0.0.1", PORT=0, RESOURCE_PATH=str(resources))
+
+
+def test_prune_state_forgets_idle_addresses_while_busy(server):
+    old = time.monotonic() - 120
+    for port in range(20):
+        server.scheduler.record("127.0.0.1", ("127.0.0.1", port), 512, old)
+
+    server.prune_state()
+    assert len(server.scheduler.session_meters) == 20  # chưa tới PRUNE_INTERVAL
+
+    server.last_prune -= server.PRUNE_INTERVAL
+    server.prune_state()
+    assert not server.scheduler.session_meters
+    assert not server.scheduler.weights
+
+
+def test_names_outside_the_resource_directory_are_refused(server, tmp_path):
+    (tmp_path / "secret.txt").write_text("secret")
+    replies = serve(
+        server,
+        b"SIZE|../secret.txt",
+        b"HASH|../secret.txt",
+        b"CHECK|" + str(tmp_path / "secret.txt").encode(),
+        b"OPEN|1|../secret.txt",
+        b"SIZE|file.bin",
+    )
+    assert replies == [
+        b"ERROR|File not found.",
+        b"ERROR|File not found.",
+        b"NOT_FOUND",
+        b"OPENED|1|-1",
+        b"SIZE|16384",
+    ]
+
+
+def test_malformed_datagrams_get_an_error_and_the_server_goes_on(server):
+    replies = serve(server, b"\xff\xfe", b"GET|file.bin|first", b"SIZE", b"PING")
+    assert replies == [b"ERROR|Malformed request."] * 3 + [b"PONG"]
+
+
+def test_stream_packet_header(server):
+    packet = server.build_stream_packet("file.bin", 0x0102, 7, b"payload")
+    # Cùng vector với tests/client/test_multiplex.py: hai bên phải giữ cùng định dạng header
+    assert packet == bytes.fromhex("ff010200000007422c6a152d") + b"payload"
+
+    chunk = b"compressible " * 100
+    packet = server.build_stream_packet("file.txt", 9, 3, chunk, codec="zlib")
+    marker, stream, seq, checksum, tag = server.MUX_HEADER.unpack_from(packet)
+    payload = packet[server.MUX_HEADER.size :]
+    assert (marker, stream, seq, tag) == (server.MUX_MARKER, 9, 3, b"z")
+    assert checksum == server.calculate_checksum(payload)
+    assert compression.decompress("zlib", payload) == chunk
+
+
+def test_stream_ids_must_fit_the_header(server):
+    replies = serve(
+        server,
+        b"OPEN|70000|file.bin",
+        b"OPEN|-1|file.bin",
+        b"OPEN|65535|file.bin",
+        b"MGET|70000|file.bin|zlib|0|1",
+        b"MGET|1|file.bin|zlib|-1|1",
+    )
+    assert replies == [
+        b"ERROR|Stream id must be 0..65535.",
+        b"ERROR|Stream id must be 0..65535.",
+        b"OPENED|65535|16384",
+        b"ERROR|Malformed MGET.",
+        b"ERROR|Malformed MGET.",
+    ]
+
+
+def test_parse_stream_request_bounds_the_batch(server):
+    request = server.parse_stream_request(f"MGET|5|file.bin|brotli|2|{10**6}", CLIENT)
+    assert request == ("MGET", "file.bin", 2, CLIENT, None, 5, server.MUX_BATCH)
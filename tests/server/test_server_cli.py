@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+import server
+
+
+def test_flags_override_the_config_file(tmp_path):
+    config_file = tmp_path / "server.json"
+    config_file.write_text(json.dumps({"PORT": 7000, "RESOURCE_PATH": "/srv/files"}))
+    args = server.parse_args(["--mode", "udp", "--config", str(config_file), "--port", "7100", "--quiet"])
+
+    config = {**server.load_config(args.config), **server.flag_overrides(args)}
+    assert args.mode == "udp" and args.quiet
+    assert config == {"PORT": 7100, "RESOURCE_PATH": "/srv/files"}
+
+
+def test_client_weights_add_to_the_config_file():
+    weights = server.parse_weights(["10.0.0.5=4", " 10.0.0.6 = 0.5"], {"10.0.0.7": 2})
+    assert weights == {"10.0.0.5": 4.0, "10.0.0.6": 0.5, "10.0.0.7": 2}
+
+
+@pytest.mark.parametrize("item", ["10.0.0.5", "10.0.0.5=0", "=2", "10.0.0.5=heavy"])
+def test_invalid_client_weights_are_refused(item):
+    with pytest.raises(ValueError):
+        server.parse_weights([item])
@@ -0,0 +1,80 @@
+import socket
+import struct
+
+import pytest
+
+import sockopts
+
+
+def test_overrides_replace_single_options():
+    assert sockopts.options("data", "lan", {"data": {"rcvbuf": 8 * sockopts.MB}}) == {
+        "nodelay": 1,
+        "rcvbuf": 8 * sockopts.MB,
+    }
+    assert sockopts.options("control", "os") == {}
+
+
+@pytest.mark.parametrize(
+    "profile, overrides",
+    [("fast", None), ("lan", {"pipe": {"rcvbuf": 1}}), ("lan", {"data": {"window": 1}})],
+)
+def test_validate_refuses_unknown_names(profile, overrides):
+    with pytest.raises(ValueError):
+        sockopts.validate(profile, overrides)
+
+
+def test_apply_sets_the_datagram_buffer():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        before = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        # nodelay chỉ dành cho TCP: bị bỏ qua thay vì lỗi trên socket UDP
+        sockopts.apply(sock, "datagram", "lan", {"datagram": {"rcvbuf": before // 4, "nodelay": 1}})
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < before
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.calls = []
+
+    def sendto(self, data, address):
+        self.calls.append([data])
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        (level, kind, value), = ancdata
+        size = struct.unpack("=H", value)[0]
+        data = buffers[0]
+        self.calls.append([data[i : i + size] for i in range(0, len(data), size)])
+
+
+def test_send_segments_batches_runs_of_equal_size():
+    packets = [b"a" * 100] * 5 + [b"b" * 40] + [b"c" * 100] * 2 + [b"d" * 10, b"e" * 50]
+    sock = RecordingSocket()
+
+    # Đoạn ngắn hơn chỉ đi chung ở cuối 1 lần gửi, datagram lẻ được gửi thường
+    assert sockopts.send_segments(sock, packets, ("127.0.0.1", 9)) == 3
+    assert [len(call) for call in sock.calls] == [6, 3, 1]
+    assert [packet for call in sock.calls for packet in call] == packets
+
+
+def test_recv_segments_cuts_a_coalesced_buffer():
+    class GroSocket:
+        def recvmsg(self, bufsize, ancbufsize):
+            control = [(sockopts.SOL_UDP, sockopts.UDP_GRO, struct.pack("=i", 100))]
+            return b"x" * 250, control, 0, ("127.0.0.1", 9)
+
+    datagrams, address = sockopts.recv_segments(GroSocket())
+    assert [len(datagram) for datagram in datagrams] == [100, 100, 50]
+    assert address == ("127.0.0.1", 9)
+
+
+def test_gso_batches_arrive_as_separate_datagrams():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver, socket.socket(
+        socket.AF_INET, socket.SOCK_DGRAM
+    ) as sender:
+        if not sockopts.enable_gso(sender):
+            pytest.skip("UDP GSO not supported here")
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(2)
+        packets = [bytes([index]) * 500 for index in range(4)] + [b"end"]
+
+        assert sockopts.send_segments(sender, packets, receiver.getsockname()) == 1
+        assert [receiver.recv(2048) for _ in packets] == packets
@@ -0,0 +1,43 @@
+import json
+
+import tracing
+
+
+def test_disabled_tracer_hands_out_the_noop_span():
+    tracer = tracing.Tracer()
+    with tracer.span("disk.read", bytes=1) as span:
+        span.set(codec="zlib")
+    assert span is tracing.NOOP and not tracer.events
+
+
+def test_nested_spans_follow_their_root(tmp_path):
+    tracer = tracing.Tracer()
+    tracer.configure(str(tmp_path / "trace.json"), sample=0.0)
+    with tracer.span("server.request"):
+        with tracer.span("disk.read"):
+            pass
+    assert not tracer.events  # root không được lấy mẫu: bỏ cả request
+
+    tracer.sample = 1.0
+    with tracer.span("server.request", file="a.bin") as root:
+        with tracer.span("disk.read") as read:
+            read.set(bytes=4096)
+    assert [event["name"] for event in tracer.events] == ["disk.read", "server.request"]
+    assert tracer.events[0]["args"] == {"bytes": 4096}
+    assert root.args == {"file": "a.bin"}
+
+
+def test_export_writes_a_chrome_trace(tmp_path):
+    tracer = tracing.Tracer()
+    tracer.configure(str(tmp_path / "trace.json"))
+    tracer.MAX_EVENTS = 1
+    for _ in range(3):
+        with tracer.span("checksum"):
+            pass
+    tracer.export()
+
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in spans] == ["checksum"]
+    assert trace["otherData"]["dropped_events"] == 2
+    assert any(event["ph"] == "M" for event in trace["traceEvents"])
@@ -0,0 +1,19 @@
+import os
+
+import utils
+
+
+def test_resource_file_stays_inside_the_directory(tmp_path):
+    root = tmp_path / "resources"
+    (root / "sub").mkdir(parents=True)
+    (root / "sub" / "in.txt").write_text("in")
+    (tmp_path / "secret.txt").write_text("out")
+    os.symlink(tmp_path / "secret.txt", root / "link.txt")
+
+    assert utils.resource_file(str(root), "sub/in.txt") == os.path.realpath(root / "sub" / "in.txt")
+    assert utils.resource_file(str(root), "sub/../sub/in.txt") == os.path.realpath(root / "sub" / "in.txt")
+    assert utils.resource_file(str(root), "../secret.txt") is None
+    assert utils.resource_file(str(root), str(tmp_path / "secret.txt")) is None
+    assert utils.resource_file(str(root), "link.txt") is None
+    assert utils.resource_file(str(root), ".") is None
+    assert utils.resource_file(str(root), "bad\0name") is None